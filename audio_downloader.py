@@ -0,0 +1,349 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlparse
+
+# --- Configuration ---
+# How many byte ranges of one file are downloaded at the same time.
+DOWNLOAD_CONNECTIONS = int(os.environ.get("DOWNLOAD_CONNECTIONS", "4").strip("'\""))
+# The size of each byte range. Finished ranges are recorded, so at most one range per
+# connection is downloaded again after an interruption.
+DOWNLOAD_CHUNK_MB = float(os.environ.get("DOWNLOAD_CHUNK_MB", "8").strip("'\""))
+# How many times a single range (or a single-stream download) is retried before giving up.
+DOWNLOAD_RETRIES = int(os.environ.get("DOWNLOAD_RETRIES", "3").strip("'\""))
+# Where partial downloads and their resume sidecars are kept until they complete.
+DOWNLOAD_PARTIAL_DIR = os.environ.get("DOWNLOAD_PARTIAL_DIR", ".").strip("'\"")
+
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3'
+# (connect, read) timeouts. A stalled CDN fails the range instead of hanging forever.
+TIMEOUT = (10, 60)
+STREAM_CHUNK_SIZE = 1024 * 1024
+
+# A shared session so the range requests reuse pooled keep-alive connections.
+_session = requests.Session()
+_session.headers.update({'User-Agent': USER_AGENT})
+_adapter = HTTPAdapter(pool_connections=DOWNLOAD_CONNECTIONS, pool_maxsize=DOWNLOAD_CONNECTIONS)
+_session.mount('http://', _adapter)
+_session.mount('https://', _adapter)
+
+# Per-host throughput and retry counters for this process.
+_host_stats = {}
+_stats_lock = threading.Lock()
+
+class RangeNotSupported(Exception):
+    """Raised when a server answers a Range request with the whole file."""
+
+class RangeCancelled(Exception):
+    """Raised in a range download that's stopped because another range failed."""
+
+def _record_stats(url, bytes_downloaded=0, seconds=0.0, retries=0, downloads=0):
+    host = urlparse(url).netloc.lower()
+    with _stats_lock:
+        stats = _host_stats.setdefault(host, {'downloads': 0, 'bytes': 0, 'seconds': 0.0, 'retries': 0})
+        stats['downloads'] += downloads
+        stats['bytes'] += bytes_downloaded
+        stats['seconds'] += seconds
+        stats['retries'] += retries
+
+def get_download_stats():
+    """
+    Returns the download counters per host, including the average throughput.
+
+    Returns:
+        dict: {host: {'downloads', 'bytes', 'seconds', 'retries', 'mb_per_second'}}
+    """
+    with _stats_lock:
+        report = {}
+        for host, stats in _host_stats.items():
+            mb_per_second = (stats['bytes'] / 1024 / 1024) / stats['seconds'] if stats['seconds'] else 0.0
+            report[host] = dict(stats, mb_per_second=round(mb_per_second, 2))
+        return report
+
+def probe_audio(url):
+    """
+    Sends a HEAD request to learn the final URL, size, range support and validators.
+    Returns a dict; fields the server didn't provide are None.
+    """
+    try:
+        response = _session.head(url, allow_redirects=True, timeout=TIMEOUT)
+        response.raise_for_status()
+    except requests.exceptions.RequestException as e:
+        logging.warning(f"HEAD request failed ({e}). Falling back to a single-stream download.")
+        return {'url': url, 'size': None, 'ranges': False, 'etag': None, 'last_modified': None}
+    length = response.headers.get('Content-Length')
+    return {
+        'url': response.url or url,
+        'size': int(length) if length and length.isdigit() else None,
+        'ranges': response.headers.get('Accept-Ranges', '').lower() == 'bytes',
+        'etag': response.headers.get('ETag'),
+        'last_modified': response.headers.get('Last-Modified'),
+    }
+
+def fetch_leading_bytes(url, count):
+    """
+    Returns the first `count` bytes of a remote file (fewer if it's shorter),
+    or None if they can't be fetched. Only that much is read even if the server
+    ignores the Range header.
+    """
+    headers = {'Range': f"bytes=0-{count - 1}"}
+    try:
+        with _session.get(url, headers=headers, stream=True, timeout=TIMEOUT) as response:
+            response.raise_for_status()
+            data = b''
+            for chunk in response.iter_content(chunk_size=min(count, STREAM_CHUNK_SIZE)):
+                data += chunk
+                if len(data) >= count:
+                    break
+            return data[:count]
+    except requests.exceptions.RequestException as e:
+        logging.warning(f"Could not read the start of {url[:50]}: {e}")
+        return None
+
+def _partial_paths(url):
+    """Returns the partial file and sidecar paths for a URL. They're stable, so a rerun can resume."""
+    key = hashlib.sha1(url.encode('utf-8')).hexdigest()[:16]
+    base = os.path.join(DOWNLOAD_PARTIAL_DIR, f"download_{key}")
+    return f"{base}.part", f"{base}.part.json"
+
+def _load_sidecar(sidecar_path, probe):
+    """Returns the finished chunk indexes from a sidecar, or an empty set if it doesn't match the remote file."""
+    if not os.path.exists(sidecar_path):
+        return set()
+    try:
+        with open(sidecar_path, 'r') as f:
+            sidecar = json.load(f)
+    except Exception:
+        return set()
+    if (sidecar.get('size') != probe['size'] or sidecar.get('etag') != probe['etag']
+            or sidecar.get('last_modified') != probe['last_modified']):
+        logging.info("Remote audio changed since the partial download. Starting over.")
+        return set()
+    return set(sidecar.get('done', []))
+
+def _save_sidecar(sidecar_path, probe, done):
+    tmp_path = f"{sidecar_path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump({
+            'url': probe['url'],
+            'size': probe['size'],
+            'etag': probe['etag'],
+            'last_modified': probe['last_modified'],
+            'done': sorted(done),
+        }, f)
+    os.replace(tmp_path, sidecar_path)
+
+def _fetch_range(url, part_path, start, end, stop=None):
+    """
+    Downloads bytes [start, end] into the partial file at the same offset.
+    If the `stop` event is set, it gives up between chunks with RangeCancelled.
+    """
+    headers = {'Range': f"bytes={start}-{end}"}
+    with _session.get(url, headers=headers, stream=True, timeout=TIMEOUT) as response:
+        response.raise_for_status()
+        if response.status_code != 206:
+            raise RangeNotSupported(f"server answered {response.status_code} to a Range request")
+        written = 0
+        with open(part_path, 'r+b') as f:
+            f.seek(start)
+            for chunk in response.iter_content(chunk_size=STREAM_CHUNK_SIZE):
+                if stop is not None and stop.is_set():
+                    raise RangeCancelled(f"range {start}-{end} was stopped")
+                f.write(chunk)
+                written += len(chunk)
+    if written != end - start + 1:
+        raise requests.exceptions.ContentDecodingError(f"range {start}-{end} was cut short ({written} bytes)")
+    return written
+
+def _download_segmented(probe, part_path, sidecar_path):
+    """
+    Downloads the file as fixed-size byte ranges over DOWNLOAD_CONNECTIONS pooled
+    connections. Each finished range is recorded in the sidecar, so an
+    interrupted download only fetches the missing ranges next time. When a
+    range fails for good, the ranges in flight stop and the queued ones are
+    cancelled, so the error comes back without the rest of the file.
+
+    Returns:
+        tuple: (bytes downloaded, retries used)
+    """
+    size = probe['size']
+    chunk_size = max(1, int(DOWNLOAD_CHUNK_MB * 1024 * 1024))
+    chunks = [(index, start, min(start + chunk_size, size) - 1) for index, start in enumerate(range(0, size, chunk_size))]
+
+    done = _load_sidecar(sidecar_path, probe)
+    if not done or not os.path.exists(part_path):
+        done = set()
+        with open(part_path, 'wb') as f:
+            f.truncate(size)
+    elif done:
+        logging.info(f"Resuming download: {len(done)} of {len(chunks)} range(s) already on disk.")
+
+    lock = threading.Lock()
+    counters = {'bytes': 0, 'retries': 0}
+    stop = threading.Event()
+
+    def fetch_chunk(index, start, end):
+        for attempt in range(DOWNLOAD_RETRIES + 1):
+            if stop.is_set():
+                return
+            try:
+                written = _fetch_range(probe['url'], part_path, start, end, stop)
+                with lock:
+                    done.add(index)
+                    counters['bytes'] += written
+                    _save_sidecar(sidecar_path, probe, done)
+                return
+            except RangeCancelled:
+                return
+            except RangeNotSupported:
+                raise
+            except requests.exceptions.RequestException as e:
+                if attempt == DOWNLOAD_RETRIES:
+                    raise
+                with lock:
+                    counters['retries'] += 1
+                delay = 2 ** attempt
+                logging.warning(f"Range {start}-{end} failed ({e}). Retrying in {delay} seconds...")
+                stop.wait(delay)
+
+    pending = [chunk for chunk in chunks if chunk[0] not in done]
+    with ThreadPoolExecutor(max_workers=min(DOWNLOAD_CONNECTIONS, max(1, len(pending)))) as executor:
+        futures = [executor.submit(fetch_chunk, *chunk) for chunk in pending]
+        try:
+            for future in as_completed(futures):
+                future.result()
+        except BaseException:
+            # The finished ranges stay in the sidecar for the next attempt.
+            stop.set()
+            for future in futures:
+                future.cancel()
+            raise
+    return counters['bytes'], counters['retries']
+
+def _download_single_stream(url, part_path):
+    """
+    Downloads the whole file in one request, retrying from the start on failure.
+
+    Returns:
+        tuple: (bytes downloaded, retries used)
+    """
+    for attempt in range(DOWNLOAD_RETRIES + 1):
+        try:
+            written = 0
+            with _session.get(url, stream=True, timeout=TIMEOUT) as response:
+                response.raise_for_status()
+                with open(part_path, 'wb') as f:
+                    for chunk in response.iter_content(chunk_size=STREAM_CHUNK_SIZE):
+                        f.write(chunk)
+                        written += len(chunk)
+            return written, attempt
+        except requests.exceptions.RequestException as e:
+            if attempt == DOWNLOAD_RETRIES:
+                raise
+            delay = 2 ** attempt
+            logging.warning(f"Audio download failed ({e}). Retrying in {delay} seconds...")
+            time.sleep(delay)
+
+def stream_audio(url, buffer):
+    """
+    Streams an audio file into a writable file object, such as a spooled buffer.
+
+    If the connection drops, the download continues from the bytes already in
+    the buffer with a Range request; a server that answers with the whole file
+    instead makes it start over.
+
+    Args:
+        url (str): The audio URL.
+        buffer (file object): Receives the audio. It's left positioned at the end.
+
+    Returns:
+        str: The Content-Type the server reported, or None.
+
+    Raises:
+        requests.exceptions.RequestException: If the download fails after all retries.
+    """
+    started = time.time()
+    start_offset = buffer.tell()
+    content_type = None
+    for attempt in range(DOWNLOAD_RETRIES + 1):
+        offset = buffer.tell() - start_offset
+        headers = {'Range': f"bytes={offset}-"} if offset else {}
+        try:
+            with _session.get(url, headers=headers, stream=True, timeout=TIMEOUT) as response:
+                response.raise_for_status()
+                if offset and response.status_code != 206:
+                    buffer.seek(start_offset)
+                    buffer.truncate()
+                content_type = content_type or response.headers.get('Content-Type')
+                for chunk in response.iter_content(chunk_size=STREAM_CHUNK_SIZE):
+                    buffer.write(chunk)
+            break
+        except requests.exceptions.RequestException as e:
+            if attempt == DOWNLOAD_RETRIES:
+                _record_stats(url, buffer.tell() - start_offset, time.time() - started, attempt)
+                raise
+            delay = 2 ** attempt
+            logging.warning(f"Audio download failed ({e}). Resuming in {delay} seconds...")
+            time.sleep(delay)
+
+    _record_stats(url, buffer.tell() - start_offset, time.time() - started, attempt, downloads=1)
+    return content_type
+
+def download_audio(url, dest_path):
+    """
+    Downloads an audio file to dest_path.
+
+    The size and range support are probed with HEAD first. If the server
+    supports byte ranges and the file spans more than one chunk, the ranges are
+    fetched in parallel and progress is kept in a sidecar so a failed download
+    resumes instead of restarting. Otherwise (or if the server ignores Range)
+    the file is downloaded as a single stream.
+
+    Args:
+        url (str): The audio URL.
+        dest_path (str): Where to write the finished file.
+
+    Raises:
+        requests.exceptions.RequestException: If the download fails after all retries.
+    """
+    started = time.time()
+    part_path, sidecar_path = _partial_paths(url)
+    part_dir = os.path.dirname(part_path)
+    if part_dir and not os.path.exists(part_dir):
+        os.makedirs(part_dir, exist_ok=True)
+
+    probe = probe_audio(url)
+    chunk_size = DOWNLOAD_CHUNK_MB * 1024 * 1024
+    downloaded, retries = 0, 0
+    try:
+        if probe['ranges'] and probe['size'] and probe['size'] > chunk_size and DOWNLOAD_CONNECTIONS > 1:
+            try:
+                logging.info(f"Downloading {probe['size'] / 1024 / 1024:.1f} MB in parallel byte ranges...")
+                downloaded, retries = _download_segmented(probe, part_path, sidecar_path)
+            except RangeNotSupported as e:
+                logging.warning(f"Server ignored the Range header ({e}). Falling back to a single-stream download.")
+                downloaded, retries = _download_single_stream(probe['url'], part_path)
+        else:
+            downloaded, retries = _download_single_stream(probe['url'], part_path)
+    except requests.exceptions.RequestException:
+        _record_stats(url, downloaded, time.time() - started, retries)
+        raise
+
+    os.replace(part_path, dest_path)
+    if os.path.exists(sidecar_path):
+        os.remove(sidecar_path)
+
+    elapsed = time.time() - started
+    _record_stats(url, downloaded, elapsed, retries, downloads=1)
+    host = urlparse(url).netloc.lower()
+    stats = get_download_stats()[host]
+    logging.info(
+        f"Downloaded {downloaded / 1024 / 1024:.1f} MB in {elapsed:.1f}s "
+        f"({downloaded / 1024 / 1024 / elapsed if elapsed else 0:.2f} MB/s, {retries} retries). "
+        f"{host} totals: {stats['downloads']} download(s), {stats['mb_per_second']} MB/s, {stats['retries']} retries."
+    )
@@ -0,0 +1,262 @@
+import os
+import shutil
+import logging
+import subprocess
+import numpy as np
+
+# --- Configuration ---
+# Set AUDIO_PREPROCESS="on" to shrink episodes before they are uploaded to Gemini: the audio is
+# downmixed to mono, resampled to speech rate, long silences are cut and it's re-encoded as Opus.
+AUDIO_PREPROCESS = os.environ.get("AUDIO_PREPROCESS", "off").strip("'\"").lower() in ('1', 'true', 'yes', 'on')
+# The sample rate and bitrate of the compact upload. 16 kHz mono is plenty for speech.
+PREPROCESS_SAMPLE_RATE = int(os.environ.get("PREPROCESS_SAMPLE_RATE", "16000").strip("'\""))
+PREPROCESS_BITRATE = os.environ.get("PREPROCESS_BITRATE", "24k").strip("'\"")
+# Only silences longer than this are cut, and this much of each is kept around the speech,
+# so natural pauses between sentences are left alone.
+SILENCE_MIN_SECONDS = float(os.environ.get("SILENCE_MIN_SECONDS", "1.0").strip("'\""))
+SILENCE_PAD_SECONDS = float(os.environ.get("SILENCE_PAD_SECONDS", "0.25").strip("'\""))
+# A frame counts as silent if it's less than this many dB above the episode's noise floor.
+SILENCE_MARGIN_DB = float(os.environ.get("SILENCE_MARGIN_DB", "10").strip("'\""))
+
+# Energy is measured over 30 ms frames.
+FRAME_SECONDS = 0.03
+# The quietest 10% of frames approximate the noise floor of the recording.
+NOISE_FLOOR_PERCENTILE = 10
+# Frames at or below this level are silent no matter how quiet the recording is.
+ABSOLUTE_SILENCE_DB = -60.0
+# Decoded audio is processed in blocks of this many frames (about a minute), so memory stays flat.
+BLOCK_FRAMES = 2000
+# How long to wait for an ffmpeg process to exit once its input has ended (or it was killed).
+FFMPEG_EXIT_SECONDS = 60
+
+def is_available():
+    """Checks if preprocessing is switched on and ffmpeg is there to decode and encode."""
+    if not AUDIO_PREPROCESS:
+        return False
+    if not shutil.which('ffmpeg'):
+        logging.warning("AUDIO_PREPROCESS is on but ffmpeg is not installed. Uploading the original audio.")
+        return False
+    return True
+
+def _frame_length(sample_rate):
+    return max(1, int(round(sample_rate * FRAME_SECONDS)))
+
+def frame_energies_db(samples, frame_length):
+    """
+    Returns the energy of each full frame in dBFS.
+
+    Args:
+        samples (np.ndarray): Mono int16 samples.
+        frame_length (int): Samples per frame.
+
+    Returns:
+        np.ndarray: One float per frame.
+    """
+    frame_count = len(samples) // frame_length
+    if frame_count == 0:
+        return np.empty(0)
+    frames = samples[:frame_count * frame_length].astype(np.float32).reshape(frame_count, frame_length) / 32768.0
+    return 10.0 * np.log10(np.mean(frames * frames, axis=1) + 1e-10)
+
+def speech_intervals(energies_db, frame_seconds=FRAME_SECONDS, min_silence_seconds=None, pad_seconds=None, margin_db=None):
+    """
+    Decides which frames to keep.
+
+    A frame is silent if it's below the noise floor plus `margin_db` (or below
+    ABSOLUTE_SILENCE_DB). Only runs of silence longer than `min_silence_seconds`
+    are removed, and `pad_seconds` of each removed run is kept next to the
+    speech on both sides.
+
+    Args:
+        energies_db (np.ndarray): Per-frame energies from frame_energies_db().
+
+    Returns:
+        list: (first frame, end frame) pairs of the frames to keep, end exclusive.
+    """
+    if min_silence_seconds is None:
+        min_silence_seconds = SILENCE_MIN_SECONDS
+    if pad_seconds is None:
+        pad_seconds = SILENCE_PAD_SECONDS
+    if margin_db is None:
+        margin_db = SILENCE_MARGIN_DB
+
+    frame_count = len(energies_db)
+    if frame_count == 0:
+        return []
+    noise_floor = np.percentile(energies_db, NOISE_FLOOR_PERCENTILE)
+    silent = (energies_db < noise_floor + margin_db) | (energies_db <= ABSOLUTE_SILENCE_DB)
+
+    # Start and end of every run of silent frames.
+    edges = np.diff(np.concatenate(([0], silent.astype(np.int8), [0])))
+    run_starts = np.flatnonzero(edges == 1)
+    run_ends = np.flatnonzero(edges == -1)
+
+    min_frames = int(np.ceil(min_silence_seconds / frame_seconds))
+    pad_frames = int(round(pad_seconds / frame_seconds))
+    keep = np.ones(frame_count, dtype=bool)
+    for start, end in zip(run_starts, run_ends):
+        if end - start < min_frames:
+            continue
+        cut_start = start if start == 0 else start + pad_frames
+        cut_end = end if end == frame_count else end - pad_frames
+        if cut_end > cut_start:
+            keep[cut_start:cut_end] = False
+
+    edges = np.diff(np.concatenate(([0], keep.astype(np.int8), [0])))
+    return list(zip(np.flatnonzero(edges == 1).tolist(), np.flatnonzero(edges == -1).tolist()))
+
+def build_time_map(intervals, frame_seconds=FRAME_SECONDS):
+    """
+    Turns the kept frame intervals into a time map.
+
+    Returns:
+        list: (processed start, original start, duration) tuples in seconds, in order.
+    """
+    time_map = []
+    processed = 0.0
+    for start, end in intervals:
+        duration = (end - start) * frame_seconds
+        time_map.append((round(processed, 3), round(start * frame_seconds, 3), round(duration, 3)))
+        processed += duration
+    return time_map
+
+def to_original_time(seconds, time_map):
+    """Maps a position in the preprocessed audio back to the same moment in the original episode."""
+    if not time_map:
+        return seconds
+    for processed_start, original_start, duration in time_map:
+        if seconds < processed_start + duration:
+            return original_start + max(0.0, seconds - processed_start)
+    processed_start, original_start, duration = time_map[-1]
+    return original_start + seconds - processed_start
+
+def _decode(audio_path, sample_rate):
+    """Starts ffmpeg decoding the audio to mono int16 PCM at `sample_rate` on stdout."""
+    return subprocess.Popen(
+        ['ffmpeg', '-nostdin', '-v', 'error', '-i', audio_path, '-vn',
+         '-ac', '1', '-ar', str(sample_rate), '-f', 's16le', '-'],
+        stdout=subprocess.PIPE
+    )
+
+def _iter_blocks(process, frame_length):
+    """Yields the decoded samples in blocks of whole frames (the last block may be partial)."""
+    block_bytes = BLOCK_FRAMES * frame_length * 2
+    while True:
+        data = process.stdout.read(block_bytes)
+        if not data:
+            break
+        yield np.frombuffer(data[:len(data) - len(data) % 2], dtype=np.int16)
+
+def _finish(process):
+    process.stdout.close()
+    if process.wait(timeout=FFMPEG_EXIT_SECONDS) != 0:
+        raise subprocess.CalledProcessError(process.returncode, process.args)
+
+def _stop(process):
+    """Closes the pipes of an ffmpeg process, kills it if it's still running and reaps it."""
+    for stream in (process.stdin, process.stdout):
+        if stream is not None:
+            try:
+                stream.close()
+            except (OSError, ValueError):
+                pass
+    if process.poll() is None:
+        process.kill()
+    try:
+        process.wait(timeout=FFMPEG_EXIT_SECONDS)
+    except subprocess.TimeoutExpired:
+        logging.warning(f"ffmpeg (pid {process.pid}) did not exit after being killed.")
+
+def preprocess_audio(audio_path, output_path):
+    """
+    Writes a compact speech-only copy of an episode for upload.
+
+    The audio is decoded twice by ffmpeg as a stream of 16 kHz mono samples.
+    The first pass measures the energy of every 30 ms frame with NumPy, the
+    second pass pipes only the frames worth keeping into an Opus encoder. At no
+    point is the whole episode held in memory.
+
+    Args:
+        audio_path (str): The downloaded episode.
+        output_path (str): Where to write the compact audio (an .ogg file).
+
+    Returns:
+        dict: The output path, the time map (see build_time_map) and the
+              original/processed seconds and bytes.
+
+    Raises:
+        subprocess.CalledProcessError: If ffmpeg fails.
+    """
+    sample_rate = PREPROCESS_SAMPLE_RATE
+    frame_length = _frame_length(sample_rate)
+    frame_seconds = frame_length / sample_rate
+
+    # Pass 1: frame energies.
+    process = _decode(audio_path, sample_rate)
+    energies = []
+    total_samples = 0
+    try:
+        for block in _iter_blocks(process, frame_length):
+            total_samples += len(block)
+            energies.append(frame_energies_db(block, frame_length))
+        _finish(process)
+    except BaseException:
+        _stop(process)
+        raise
+    energies = np.concatenate(energies) if energies else np.empty(0)
+    intervals = speech_intervals(energies, frame_seconds)
+
+    # Pass 2: encode the kept frames.
+    encoder = subprocess.Popen(
+        ['ffmpeg', '-nostdin', '-v', 'error', '-y', '-f', 's16le', '-ac', '1', '-ar', str(sample_rate), '-i', '-',
+         '-c:a', 'libopus', '-b:a', PREPROCESS_BITRATE, '-application', 'voip', output_path],
+        stdin=subprocess.PIPE
+    )
+    process = None
+    try:
+        process = _decode(audio_path, sample_rate)
+        frame_offset = 0
+        interval_index = 0
+        for block in _iter_blocks(process, frame_length):
+            block_frames = len(block) // frame_length
+            block_end = frame_offset + block_frames
+            while interval_index < len(intervals) and intervals[interval_index][0] < block_end:
+                start, end = intervals[interval_index]
+                first = max(start, frame_offset) - frame_offset
+                last = min(end, block_end) - frame_offset
+                encoder.stdin.write(block[first * frame_length:last * frame_length].tobytes())
+                if end > block_end:
+                    break
+                interval_index += 1
+            frame_offset = block_end
+        encoder.stdin.close()
+        _finish(process)
+        if encoder.wait(timeout=FFMPEG_EXIT_SECONDS) != 0:
+            raise subprocess.CalledProcessError(encoder.returncode, encoder.args)
+    except BaseException:
+        # Without this, an encoder still waiting for the end of its input would never exit.
+        _stop(encoder)
+        if process is not None:
+            _stop(process)
+        raise
+
+    time_map = build_time_map(intervals, frame_seconds)
+    return {
+        'path': output_path,
+        'time_map': time_map,
+        'original_seconds': total_samples / sample_rate,
+        'processed_seconds': sum(duration for _, _, duration in time_map),
+        'original_bytes': os.path.getsize(audio_path),
+        'processed_bytes': os.path.getsize(output_path),
+    }
+
+def log_savings(result):
+    """Logs how much upload and audio time preprocessing saved for one episode."""
+    bytes_saved = result['original_bytes'] - result['processed_bytes']
+    seconds_saved = result['original_seconds'] - result['processed_seconds']
+    logging.info(
+        f"Preprocessed audio: {result['original_bytes'] / 1024 / 1024:.1f} MB -> "
+        f"{result['processed_bytes'] / 1024 / 1024:.1f} MB ({bytes_saved / 1024 / 1024:.1f} MB saved), "
+        f"{result['original_seconds'] / 60:.1f} -> {result['processed_seconds'] / 60:.1f} minutes "
+        f"({seconds_saved:.0f} seconds of silence cut)."
+    )
@@ -0,0 +1,155 @@
+"""
+Benchmarks the per-call overhead of Google Drive uploads against a local fake
+Drive server: the old way (credentials read and the service built on every
+call) against the cached credentials and service of google_drive_uploader.
+
+Usage:
+    python bench_drive_client.py [--calls 50] [--size-kb 64]
+
+The fake server answers the Drive v3 calls the app makes (resumable and
+multipart uploads, file listings) over keep-alive HTTP/1.1 and counts the
+TCP connections it accepts. No Google account or network access is needed.
+"""
+import os
+import json
+import time
+import shutil
+import socket
+import argparse
+import logging
+import tempfile
+import threading
+import functools
+import statistics
+import urllib.parse
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+from google.oauth2.credentials import Credentials
+from googleapiclient import discovery
+from googleapiclient.discovery import build
+import google_drive_uploader
+
+class FakeDriveHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    connections = 0
+
+    def setup(self):
+        # The handler writes headers and body separately; without this, Nagle's algorithm and the
+        # client's delayed ACK stall every response on a kept-alive connection by ~40 ms.
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        super().setup()
+        FakeDriveHandler.connections += 1
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, body, headers=None):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _read_body(self):
+        self.rfile.read(int(self.headers.get('Content-Length') or 0))
+
+    def do_POST(self):
+        self._read_body()
+        if 'uploadType=resumable' in self.path:
+            host = self.headers['Host']
+            self._reply({}, {'Location': f"http://{host}/upload/session/{time.monotonic_ns()}"})
+        else:
+            self._reply({'id': 'file-id', 'modifiedTime': '2024-01-01T00:00:00.000Z'})
+
+    def do_PUT(self):
+        self._read_body()
+        self._reply({'id': 'file-id'})
+
+    def do_PATCH(self):
+        self._read_body()
+        self._reply({'id': 'file-id', 'modifiedTime': '2024-01-01T00:00:00.000Z'})
+
+    def do_GET(self):
+        self._reply({'files': []})
+
+def _media_url_to_fake_server(media_path_url, base_url):
+    """The client only swaps the host of upload URLs for the endpoint's, keeping https; the fake server is plain http."""
+    base = urllib.parse.urlparse(base_url)
+    return urllib.parse.urlunparse(urllib.parse.urlparse(media_path_url)._replace(scheme=base.scheme, netloc=base.netloc))
+
+def _fake_credentials():
+    return Credentials(token='fake-token', refresh_token='fake-refresh', client_id='id', client_secret='secret',
+                       token_uri='http://127.0.0.1/token', expiry=datetime.utcnow() + timedelta(hours=1))
+
+def legacy_upload(file_path, endpoint):
+    """What every Drive call did before: read token.json and build the service."""
+    creds = Credentials.from_authorized_user_file('token.json', google_drive_uploader.SCOPES)
+    service = build('drive', 'v3', credentials=creds, client_options={'api_endpoint': endpoint}, cache_discovery=False)
+    from googleapiclient.http import MediaFileUpload
+    media = MediaFileUpload(file_path, mimetype='application/epub+zip', resumable=True)
+    service.files().create(body={'name': os.path.basename(file_path), 'parents': ['folder']},
+                           media_body=media, fields='id').execute()
+
+def time_calls(call, calls):
+    timings = []
+    for _ in range(calls):
+        started = time.perf_counter()
+        call()
+        timings.append(time.perf_counter() - started)
+    return timings
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--calls', type=int, default=50, help="Uploads per variant.")
+    parser.add_argument('--size-kb', type=int, default=64, help="Size of the uploaded file.")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeDriveHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    endpoint = f"http://127.0.0.1:{server.server_port}/"
+
+    work_dir = tempfile.mkdtemp(prefix='bench_drive_')
+    cwd = os.getcwd()
+    os.chdir(work_dir)
+    try:
+        with open('token.json', 'w') as f:
+            f.write(_fake_credentials().to_json())
+        file_path = os.path.join(work_dir, 'episode.epub')
+        with open(file_path, 'wb') as f:
+            f.write(os.urandom(args.size_kb * 1024))
+
+        patch.object(discovery, '_fix_up_media_path_base_url', _media_url_to_fake_server).start()
+        patch.object(google_drive_uploader, '_load_credentials', _fake_credentials).start()
+        print(f"{'variant':<24} {'median ms':>10} {'p90 ms':>8} {'connections':>12}")
+        results = {}
+        FakeDriveHandler.connections = 0
+        results['rebuilt per call'] = time_calls(lambda: legacy_upload(file_path, endpoint), args.calls)
+        connections = {'rebuilt per call': FakeDriveHandler.connections}
+
+        FakeDriveHandler.connections = 0
+        cached_build = functools.partial(build, client_options={'api_endpoint': endpoint})
+        with patch.object(google_drive_uploader, 'build', cached_build):
+            results['cached client'] = time_calls(
+                lambda: google_drive_uploader.upload_file_to_drive(file_path, 'folder'), args.calls
+            )
+        connections['cached client'] = FakeDriveHandler.connections
+
+        for name, timings in results.items():
+            timings = sorted(timings)
+            print(
+                f"{name:<24} {statistics.median(timings) * 1000:>10.1f} "
+                f"{timings[int(len(timings) * 0.9) - 1] * 1000:>8.1f} {connections[name]:>12}"
+            )
+    finally:
+        patch.stopall()
+        os.chdir(cwd)
+        shutil.rmtree(work_dir)
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
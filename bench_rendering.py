@@ -0,0 +1,76 @@
+"""
+Benchmarks rendering an episode: render time and peak memory of each output
+format, for a long transcript.
+
+Usage:
+    python bench_rendering.py [transcript.txt] [--hours 3] [--runs 5]
+
+Without a transcript file, a synthetic conversation of --hours hours (150
+words a minute) is used. Peak memory is what tracemalloc sees allocated on
+top of the document while one format is rendered, so a renderer that copies
+the transcript shows up as a multiple of its size.
+"""
+import os
+import time
+import shutil
+import argparse
+import logging
+import tempfile
+import statistics
+import tracemalloc
+import episode_document
+import epub_generator  # noqa: F401 (registers the 'epub' renderer)
+import md_generator  # noqa: F401 (registers the 'markdown' renderer)
+from bench_transcript_compaction import synthetic_transcript
+
+def bench_renderer(name, document, directory, runs):
+    render = episode_document.RENDERERS[name]
+    file_path = os.path.join(directory, f"episode.{'md' if name == 'markdown' else name}")
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        if not render(document, file_path):
+            print(f"{name:<10} failed")
+            return
+        timings.append(time.perf_counter() - started)
+
+    tracemalloc.start()
+    render(document, file_path)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    transcript_mb = len(document['transcript'].encode('utf-8')) / 1024 / 1024
+    print(
+        f"{name:<10} {statistics.median(timings) * 1000:>9.1f} {peak / 1024 / 1024:>9.1f} "
+        f"{peak / 1024 / 1024 / transcript_mb:>11.1f}x {os.path.getsize(file_path) / 1024:>9.0f}"
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('transcript', nargs='?', help="A transcript text file (a synthetic one if not given).")
+    parser.add_argument('--hours', type=float, default=3, help="Length of the synthetic transcript.")
+    parser.add_argument('--runs', type=int, default=5, help="Timed renders per format.")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    if args.transcript:
+        with open(args.transcript, encoding='utf-8') as f:
+            transcript = f.read()
+    else:
+        transcript = synthetic_transcript(minutes=int(args.hours * 60))
+    document = episode_document.build_document(
+        "Benchmark episode", "Benchmark podcast", "A summary.\nOver two lines.",
+        [f"Point {i}" for i in range(10)], [f"Quote {i}" for i in range(10)], [f"Source {i}" for i in range(5)],
+        transcript
+    )
+    print(f"Transcript: {len(transcript) / 1024:.0f} KB, {len(transcript.split())} words")
+
+    directory = tempfile.mkdtemp(prefix='bench_render_')
+    try:
+        print(f"{'format':<10} {'median ms':>9} {'peak MB':>9} {'transcripts':>12} {'file KB':>9}")
+        for name in sorted(episode_document.RENDERERS):
+            bench_renderer(name, document, directory, args.runs)
+    finally:
+        shutil.rmtree(directory)
+
+if __name__ == "__main__":
+    main()
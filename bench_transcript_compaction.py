@@ -0,0 +1,94 @@
+"""
+Benchmarks transcript compaction: how much smaller it makes a transcript, what
+it costs, and (with --live) how it changes the latency of the summary call.
+
+Usage:
+    python bench_transcript_compaction.py [transcript.txt ...] [--live] [--runs N]
+
+Without transcript files, a synthetic two-hour conversation is used. --live
+calls Gemini (GEMINI_API_KEY must be set) with compaction on and off.
+"""
+import argparse
+import random
+import statistics
+import time
+import logging
+import gemini_client
+import llm_processor
+import transcript_compactor
+
+FILLERS = ["um,", "uh,", "you know", "Um,", "uh"]
+SPONSOR_READ = "This episode is brought to you by Acme. Go to acme.com/podcast and use code PODCAST for 20% off your first order."
+
+def synthetic_transcript(minutes=120, seed=7):
+    """Builds a diarized conversation of about `minutes` minutes (150 words a minute) with fillers, stutters and ads."""
+    rng = random.Random(seed)
+    vocabulary = ("battery phone launch price chip camera policy company market review screen company "
+                  "software update feature people really think about going years market").split()
+    lines = []
+    words = 0
+    speakers = ["Nilay", "David", "Alex"]
+    while words < minutes * 150:
+        if rng.random() < 0.01:
+            lines.append(f"Nilay: {SPONSOR_READ}")
+            continue
+        sentence = []
+        for _ in range(rng.randint(6, 18)):
+            word = rng.choice(vocabulary)
+            if rng.random() < 0.06:
+                sentence.append(rng.choice(FILLERS))
+            if rng.random() < 0.03:
+                sentence.append(f"{word},")
+            sentence.append(word)
+        words += len(sentence)
+        label = f"**{rng.choice(speakers)}:**"
+        lines.append(f"{label} {' '.join(sentence).capitalize()}.\n")
+    return '\n'.join(lines)
+
+def bench_compaction(name, transcript):
+    started = time.perf_counter()
+    result = transcript_compactor.compact_transcript(transcript, drop_sponsor_reads=True)
+    elapsed = time.perf_counter() - started
+    print(
+        f"{name}: {len(transcript) / 1024:.0f} KB, {result['original_tokens']} -> {result['compacted_tokens']} tokens "
+        f"({(1 - result['ratio']) * 100:.1f}% smaller, {result['sponsor_reads_dropped']} sponsor reads), "
+        f"compacted in {elapsed * 1000:.1f} ms"
+    )
+    return result
+
+def bench_summary_latency(name, transcript, runs):
+    """Times process_transcript_with_llm with compaction off and on."""
+    for compaction in (False, True):
+        transcript_compactor.TRANSCRIPT_COMPACTION = compaction
+        timings = []
+        for _ in range(runs):
+            started = time.perf_counter()
+            if llm_processor.process_transcript_with_llm(transcript, name) is None:
+                print(f"  summary failed (compaction {'on' if compaction else 'off'})")
+                continue
+            timings.append(time.perf_counter() - started)
+        if timings:
+            print(f"  summary latency, compaction {'on ' if compaction else 'off'}: "
+                  f"median {statistics.median(timings):.1f} s over {len(timings)} run(s)")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('transcripts', nargs='*', help="Transcript text files (a synthetic one if none are given).")
+    parser.add_argument('--live', action='store_true', help="Also time real Gemini summary calls.")
+    parser.add_argument('--runs', type=int, default=3, help="Summary calls per setting with --live.")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    samples = [(path, open(path, encoding='utf-8').read()) for path in args.transcripts]
+    if not samples:
+        samples = [("synthetic 2h conversation", synthetic_transcript())]
+
+    for name, transcript in samples:
+        bench_compaction(name, transcript)
+        if args.live:
+            if not gemini_client.configure():
+                return
+            bench_summary_latency(name, transcript, args.runs)
+
+if __name__ == "__main__":
+    main()
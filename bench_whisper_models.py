@@ -0,0 +1,85 @@
+"""
+Benchmarks offline Whisper transcription: load time, real-time factor and peak
+memory for each model size, on the same piece of audio.
+
+Usage:
+    python bench_whisper_models.py episode.mp3 [--models tiny,base,small] [--seconds 600]
+
+Each model runs in its own process, so its load time and memory are measured
+from a clean start. A real-time factor of 0.1 means an hour of audio takes six
+minutes. Needs faster-whisper and ffmpeg.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import subprocess
+import tempfile
+import chunked_transcription
+
+def _clip(audio_path, seconds):
+    """Cuts the first `seconds` of the audio into a temp file, so every model hears the same clip."""
+    fd, clip_path = tempfile.mkstemp(prefix='bench_', suffix='.wav')
+    os.close(fd)
+    subprocess.run(
+        ['ffmpeg', '-nostdin', '-v', 'error', '-y', '-t', str(seconds), '-i', audio_path, '-ac', '1', '-ar', '16000', clip_path],
+        check=True
+    )
+    return clip_path
+
+def _run_one(audio_path, seconds):
+    """Runs in a child process with WHISPER_MODEL already set; prints one JSON line of results."""
+    import whisper_transcriber
+    started = time.perf_counter()
+    whisper_transcriber.get_model()
+    load_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    transcript = whisper_transcriber.transcribe_file(audio_path, seconds)
+    elapsed = time.perf_counter() - started
+    print(json.dumps({
+        'load_seconds': load_seconds,
+        'transcribe_seconds': elapsed,
+        'real_time_factor': elapsed / seconds,
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        'workers': whisper_transcriber.worker_count(),
+        'words': len(transcript.split()),
+    }))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('audio', help="An episode to transcribe.")
+    parser.add_argument('--models', default='tiny,base,small', help="Comma-separated model sizes.")
+    parser.add_argument('--seconds', type=float, default=600, help="How much of the episode to transcribe.")
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        _run_one(args.audio, args.seconds)
+        return
+
+    duration = chunked_transcription.get_audio_duration(args.audio)
+    seconds = min(args.seconds, duration) if duration else args.seconds
+    clip_path = _clip(args.audio, seconds)
+    try:
+        print(f"{'model':<10} {'load s':>8} {'RTF':>7} {'peak MB':>9} {'workers':>8} {'words':>7}")
+        for model in [name.strip() for name in args.models.split(',') if name.strip()]:
+            result = subprocess.run(
+                [sys.executable, __file__, clip_path, '--seconds', str(seconds), '--child'],
+                env={**os.environ, 'WHISPER_MODEL': model}, capture_output=True, text=True
+            )
+            if result.returncode != 0:
+                print(f"{model:<10} failed: {result.stderr.strip().splitlines()[-1] if result.stderr.strip() else result.returncode}")
+                continue
+            stats = json.loads(result.stdout.strip().splitlines()[-1])
+            print(
+                f"{model:<10} {stats['load_seconds']:>8.1f} {stats['real_time_factor']:>7.3f} "
+                f"{stats['peak_rss_mb']:>9.0f} {stats['workers']:>8} {stats['words']:>7}"
+            )
+    finally:
+        os.remove(clip_path)
+
+if __name__ == "__main__":
+    main()
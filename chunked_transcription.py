@@ -0,0 +1,393 @@
+import os
+import re
+import time
+import json
+import shutil
+import hashlib
+import logging
+import tempfile
+import subprocess
+import audio_preprocessor
+from collections import Counter
+from difflib import SequenceMatcher
+from concurrent.futures import ThreadPoolExecutor
+
+# --- Configuration ---
+# Episodes longer than this are split into segments that are transcribed in parallel.
+# Set it to "0" to always send the whole file in one request.
+TRANSCRIBE_CHUNK_ABOVE_MINUTES = float(os.environ.get("TRANSCRIBE_CHUNK_ABOVE_MINUTES", "45").strip("'\""))
+# The length of each segment, and how much of the next segment is repeated at its end,
+# so a sentence cut at a boundary is heard in full by one of the two requests.
+TRANSCRIBE_SEGMENT_MINUTES = float(os.environ.get("TRANSCRIBE_SEGMENT_MINUTES", "20").strip("'\""))
+TRANSCRIBE_SEGMENT_OVERLAP_SECONDS = float(os.environ.get("TRANSCRIBE_SEGMENT_OVERLAP_SECONDS", "15").strip("'\""))
+# How many segments are transcribed at the same time.
+TRANSCRIBE_SEGMENT_CONCURRENCY = int(os.environ.get("TRANSCRIBE_SEGMENT_CONCURRENCY", "3").strip("'\""))
+# How many times a failed segment is retried on its own before the episode is given up.
+TRANSCRIBE_SEGMENT_RETRIES = int(os.environ.get("TRANSCRIBE_SEGMENT_RETRIES", "2").strip("'\""))
+# Finished segment transcripts are kept here until the whole episode is done, so a rerun
+# after a failure only transcribes the segments that are missing.
+TRANSCRIPT_SEGMENT_CACHE_DIR = os.environ.get("TRANSCRIPT_SEGMENT_CACHE_DIR", "transcript_segments").strip("'\"")
+# The segments of an episode that hasn't been retried for this long are removed, so an
+# episode that keeps failing doesn't leave them behind for good.
+TRANSCRIPT_SEGMENT_CACHE_DAYS = float(os.environ.get("TRANSCRIPT_SEGMENT_CACHE_DAYS", "7").strip("'\""))
+
+# Bump this when the segment prompt changes so old cached segments are not reused.
+SEGMENT_PROMPT_VERSION = 1
+# How many lines at the end of one segment and the start of the next are compared when stitching.
+STITCH_WINDOW_LINES = 12
+# How similar two lines must be to count as the same line heard twice in the overlap.
+STITCH_MIN_RATIO = 0.6
+# Short lines ("Yeah.", "Right.") appear everywhere, so they are never used as stitching anchors.
+STITCH_MIN_WORDS = 4
+
+# "Nilay: text", "**Nilay:** text" or "**Guest 1**: text"
+SPEAKER_LINE = re.compile(r'^\s*\**\s*([^:*\[\]\n]{1,40}?)\s*\**\s*:\s*\**\s*(.*)$')
+
+def get_audio_duration(audio_path, episode=None):
+    """
+    Returns the length of an episode in seconds: the feed's itunes:duration if
+    it has one, otherwise what ffprobe reports. Returns None if neither is available.
+    """
+    if episode and episode.get('duration'):
+        return float(episode['duration'])
+    ffprobe = shutil.which('ffprobe')
+    if not ffprobe:
+        return None
+    try:
+        result = subprocess.run(
+            [ffprobe, '-v', 'error', '-show_entries', 'format=duration',
+             '-of', 'default=noprint_wrappers=1:nokey=1', audio_path],
+            capture_output=True, text=True, timeout=60, check=True
+        )
+        return float(result.stdout.strip())
+    except (subprocess.SubprocessError, ValueError) as e:
+        logging.warning(f"Could not read the audio duration with ffprobe: {e}")
+        return None
+
+def should_segment(audio_seconds):
+    """Checks if an episode is long enough to be split, and ffmpeg is there to split it."""
+    if TRANSCRIBE_CHUNK_ABOVE_MINUTES <= 0 or not audio_seconds:
+        return False
+    if audio_seconds <= TRANSCRIBE_CHUNK_ABOVE_MINUTES * 60:
+        return False
+    if not shutil.which('ffmpeg'):
+        logging.warning("ffmpeg is not installed, so this long episode will be transcribed in one request.")
+        return False
+    return True
+
+def plan_segments(audio_seconds, segment_seconds=None, overlap_seconds=None):
+    """
+    Splits a recording into overlapping time ranges.
+
+    Each segment starts `segment_seconds` after the previous one and runs
+    `overlap_seconds` into the next. A tail shorter than the overlap is folded
+    into the last segment instead of becoming a tiny segment of its own.
+
+    Returns:
+        list: (start seconds, length seconds) tuples.
+    """
+    if segment_seconds is None:
+        segment_seconds = TRANSCRIBE_SEGMENT_MINUTES * 60
+    if overlap_seconds is None:
+        overlap_seconds = TRANSCRIBE_SEGMENT_OVERLAP_SECONDS
+
+    starts = []
+    start = 0.0
+    while start < audio_seconds:
+        starts.append(start)
+        start += segment_seconds
+    if len(starts) > 1 and audio_seconds - starts[-1] <= overlap_seconds:
+        starts.pop()
+
+    segments = []
+    for index, start in enumerate(starts):
+        if index + 1 < len(starts):
+            end = min(audio_seconds, starts[index + 1] + overlap_seconds)
+        else:
+            end = audio_seconds
+        segments.append((start, end - start))
+    return segments
+
+def _cut_segment(audio_path, start, length, out_path):
+    """
+    Cuts a time range out of the audio with ffmpeg, copying the stream and re-encoding only if that fails.
+
+    The re-encoded copy is MP3, so it's written next to `out_path` with an .mp3 extension.
+
+    Returns:
+        str: The path of the segment file.
+    """
+    base = ['ffmpeg', '-nostdin', '-v', 'error', '-y', '-ss', f"{start:.3f}", '-t', f"{length:.3f}", '-i', audio_path, '-vn']
+    try:
+        subprocess.run(base + ['-c', 'copy', out_path], capture_output=True, timeout=600, check=True)
+        return out_path
+    except subprocess.CalledProcessError:
+        if os.path.exists(out_path):
+            os.remove(out_path)
+    mp3_path = os.path.splitext(out_path)[0] + '.mp3'
+    subprocess.run(base + ['-c:a', 'libmp3lame', '-b:a', '64k', mp3_path], capture_output=True, timeout=600, check=True)
+    return mp3_path
+
+def _episode_cache_dir(audio_url):
+    return os.path.join(TRANSCRIPT_SEGMENT_CACHE_DIR, hashlib.sha1(audio_url.encode('utf-8')).hexdigest()[:16])
+
+def _remove_stale_segment_caches(now=None):
+    """Removes the cached segments of episodes that weren't retried for TRANSCRIPT_SEGMENT_CACHE_DAYS."""
+    if TRANSCRIPT_SEGMENT_CACHE_DAYS <= 0 or not os.path.isdir(TRANSCRIPT_SEGMENT_CACHE_DIR):
+        return
+    cutoff = (now or time.time()) - TRANSCRIPT_SEGMENT_CACHE_DAYS * 86400
+    for name in os.listdir(TRANSCRIPT_SEGMENT_CACHE_DIR):
+        episode_dir = os.path.join(TRANSCRIPT_SEGMENT_CACHE_DIR, name)
+        try:
+            if os.path.isdir(episode_dir) and os.path.getmtime(episode_dir) < cutoff:
+                shutil.rmtree(episode_dir, ignore_errors=True)
+                logging.info(f"Removed the stale cached segments in {episode_dir}.")
+        except OSError:
+            pass
+
+def _segment_cache_path(audio_url, audio_size, start, length, prompt, cache_tag):
+    """The cache file of one segment. The key covers everything that changes its transcript."""
+    key = json.dumps([audio_url, audio_size, round(start, 3), round(length, 3), prompt, cache_tag, SEGMENT_PROMPT_VERSION])
+    return os.path.join(_episode_cache_dir(audio_url), hashlib.sha256(key.encode('utf-8')).hexdigest()[:32] + '.txt')
+
+def _segment_upload_key(audio_url, audio_size, start, length):
+    """Identifies a segment's audio in the Gemini upload registry, so a retried segment isn't uploaded again."""
+    key = json.dumps(['segment', audio_url, audio_size, round(start, 3), round(length, 3)])
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+def _read_cached_segment(cache_path):
+    try:
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+def _write_cached_segment(cache_path, text):
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    tmp_path = f"{cache_path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(tmp_path, cache_path)
+
+def _format_offset(seconds):
+    seconds = int(seconds)
+    return f"{seconds // 3600:d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+def _segment_prompt(prompt, index, count, start, time_map=None):
+    # With silences cut, the segment starts later in the original episode than in the upload.
+    original_start = audio_preprocessor.to_original_time(start, time_map)
+    return (
+        f"{prompt.strip()}\n"
+        f"This audio is part {index + 1} of {count} of a longer recording and starts at {_format_offset(original_start)}. "
+        f"It may begin or end in the middle of a sentence; transcribe exactly what is heard. "
+        f"Label speakers by name whenever the conversation makes their names clear."
+    )
+
+def transcribe_in_segments(audio_path, audio_url, audio_seconds, transcribe_file, prompt, cache_tags=('',), time_map=None,
+                           models=None):
+    """
+    Transcribes a long recording as overlapping segments in parallel and stitches the results.
+
+    Segments are cut with ffmpeg into a temporary directory and handed to
+    `transcribe_file` at most TRANSCRIBE_SEGMENT_CONCURRENCY at a time. A
+    failed segment is retried on its own.
+
+    Finished segments are cached on disk. If the episode still fails, its cache
+    is kept on purpose, so the next run only transcribes what is missing. It's
+    removed once the whole episode is stitched, or after
+    TRANSCRIPT_SEGMENT_CACHE_DAYS if the episode isn't retried.
+
+    Args:
+        audio_path (str): The downloaded audio file.
+        audio_url (str): The episode's audio URL (part of the cache key).
+        audio_seconds (float): The length of the recording.
+        transcribe_file (callable): Takes (path, prompt, upload_key=..., models=...) and returns the
+            transcript text, appending the model that answered to `models`.
+        prompt (str): The transcription instructions.
+        cache_tags (list): The model names (or anything else that changes the output) whose cached
+            segments may be reused, best first. A new segment is cached under the model that made it.
+        time_map (list): Maps the audio back to the original episode if silences were cut.
+        models (list): If given, the models that transcribed the segments are appended to it.
+
+    Returns:
+        str: The stitched transcript.
+
+    Raises:
+        Exception: If a segment still fails after its retries.
+    """
+    _remove_stale_segment_caches()
+    segments = plan_segments(audio_seconds)
+    audio_size = os.path.getsize(audio_path)
+    logging.info(
+        f"Transcribing {audio_seconds / 60:.0f} minutes of audio as {len(segments)} overlapping segment(s), "
+        f"{TRANSCRIBE_SEGMENT_CONCURRENCY} at a time..."
+    )
+
+    def transcribe_segment(index, start, length, work_dir):
+        segment_prompt = _segment_prompt(prompt, index, len(segments), start, time_map)
+        for cache_tag in cache_tags:
+            cached = _read_cached_segment(_segment_cache_path(audio_url, audio_size, start, length, segment_prompt, cache_tag))
+            if cached is not None:
+                logging.info(f"Segment {index + 1}/{len(segments)} was transcribed in an earlier run. Reusing it.")
+                if models is not None:
+                    models.append(cache_tag)
+                return cached
+
+        segment_path = os.path.join(work_dir, f"segment_{index:03d}{os.path.splitext(audio_path)[1] or '.mp3'}")
+        segment_path = _cut_segment(audio_path, start, length, segment_path)
+        upload_key = _segment_upload_key(audio_url, audio_size, start, length)
+        try:
+            for attempt in range(TRANSCRIBE_SEGMENT_RETRIES + 1):
+                try:
+                    segment_models = []
+                    text = transcribe_file(segment_path, segment_prompt, upload_key=upload_key, models=segment_models)
+                    if not text:
+                        raise ValueError("empty transcript")
+                    cache_tag = segment_models[-1] if segment_models else cache_tags[0]
+                    _write_cached_segment(
+                        _segment_cache_path(audio_url, audio_size, start, length, segment_prompt, cache_tag), text
+                    )
+                    if models is not None:
+                        models.append(cache_tag)
+                    logging.info(f"Segment {index + 1}/{len(segments)} transcribed.")
+                    return text
+                except Exception as e:
+                    if attempt == TRANSCRIBE_SEGMENT_RETRIES:
+                        raise
+                    delay = 5 * 2 ** attempt
+                    logging.warning(f"Segment {index + 1}/{len(segments)} failed ({e}). Retrying it in {delay} seconds...")
+                    time.sleep(delay)
+        finally:
+            os.remove(segment_path)
+
+    with tempfile.TemporaryDirectory(prefix='segments_') as work_dir:
+        with ThreadPoolExecutor(max_workers=max(1, min(TRANSCRIBE_SEGMENT_CONCURRENCY, len(segments)))) as executor:
+            futures = [executor.submit(transcribe_segment, index, start, length, work_dir)
+                       for index, (start, length) in enumerate(segments)]
+            # Wait for every segment before raising, so the ones that succeeded are all cached.
+            errors = [future.exception() for future in futures]
+            failed = [index for index, error in enumerate(errors) if error is not None]
+            if failed:
+                logging.error(
+                    f"{len(failed)} of {len(segments)} segment(s) failed; the rest are cached for the next run."
+                )
+                raise errors[failed[0]]
+            transcripts = [future.result() for future in futures]
+
+    stitched = stitch_transcripts(transcripts)
+    shutil.rmtree(_episode_cache_dir(audio_url), ignore_errors=True)
+    return stitched
+
+def _parse_line(line):
+    """Splits a transcript line into (speaker label or None, spoken text)."""
+    match = SPEAKER_LINE.match(line)
+    if match:
+        return match.group(1).strip(), match.group(2).strip()
+    return None, line.strip()
+
+def _normalize_words(text):
+    return re.sub(r'[^a-z0-9]+', ' ', text.lower()).strip()
+
+def _overlap_matches(previous_lines, next_lines):
+    """
+    Finds lines at the end of one segment that were heard again at the start of the next.
+
+    Returns:
+        list: (index in previous_lines, index in next_lines, ratio) for every matching pair.
+    """
+    tail_start = max(0, len(previous_lines) - STITCH_WINDOW_LINES)
+    head = next_lines[:STITCH_WINDOW_LINES]
+    head_words = [_normalize_words(_parse_line(line)[1]) for line in head]
+
+    matches = []
+    for i in range(tail_start, len(previous_lines)):
+        words = _normalize_words(_parse_line(previous_lines[i])[1])
+        if len(words.split()) < STITCH_MIN_WORDS:
+            continue
+        for j, other in enumerate(head_words):
+            if len(other.split()) < STITCH_MIN_WORDS:
+                continue
+            ratio = SequenceMatcher(None, words, other).ratio()
+            if ratio >= STITCH_MIN_RATIO:
+                matches.append((i, j, ratio))
+    return matches
+
+def _speaker_mapping(previous_lines, next_lines, matches):
+    """
+    Works out how the next segment's speaker labels map onto the labels used so
+    far, from the labels on lines both segments heard. A label is only renamed
+    if that doesn't merge it into another speaker of the next segment.
+    """
+    votes = {}
+    for i, j, _ in matches:
+        previous_label = _parse_line(previous_lines[i])[0]
+        next_label = _parse_line(next_lines[j])[0]
+        if previous_label and next_label:
+            votes.setdefault(next_label, Counter())[previous_label] += 1
+
+    mapping = {label: counter.most_common(1)[0][0] for label, counter in votes.items()}
+    mapping = {label: target for label, target in mapping.items() if label != target}
+    next_labels = {_parse_line(line)[0] for line in next_lines} - {None}
+    return {
+        label: target for label, target in mapping.items()
+        if target not in next_labels or target in mapping
+    }
+
+def _rename_speaker(line, mapping):
+    label = _parse_line(line)[0]
+    if label in mapping:
+        return line.replace(label, mapping[label], 1)
+    return line
+
+def _longer_line(previous_line, next_line):
+    """Picks the more complete of two versions of a line, keeping the earlier segment's speaker label."""
+    previous_label, previous_text = _parse_line(previous_line)
+    next_label, next_text = _parse_line(next_line)
+    if len(next_text) <= len(previous_text):
+        return previous_line
+    if previous_label and next_label:
+        return _rename_speaker(next_line, {next_label: previous_label})
+    return next_line
+
+def stitch_transcripts(transcripts):
+    """
+    Joins segment transcripts into one, removing the text heard twice in the
+    overlaps and keeping speaker labels consistent.
+
+    For each boundary, the last lines of the transcript so far are matched
+    against the first lines of the next segment. Everything before the last
+    matching line comes from the earlier segment. Everything after it comes
+    from the later one. Of the matching line itself, the longer version is
+    kept, so a sentence cut off at a boundary is heard in full.
+
+    The labels on the matching lines tell us which speaker is which, e.g.
+    "Speaker 1" in the next segment is "Nilay". The next segment is relabelled
+    before it's appended, so the mapping carries through the whole episode.
+
+    Args:
+        transcripts (list): Segment transcripts in order.
+
+    Returns:
+        str: The stitched transcript.
+    """
+    lines = []
+    for index, transcript in enumerate(transcripts):
+        next_lines = [line for line in (transcript or '').splitlines() if line.strip()]
+        if not lines:
+            lines = next_lines
+            continue
+
+        matches = _overlap_matches(lines, next_lines)
+        mapping = _speaker_mapping(lines, next_lines, matches)
+        if mapping:
+            logging.info(f"Segment {index + 1}: relabelled speakers {mapping}.")
+            next_lines = [_rename_speaker(line, mapping) for line in next_lines]
+
+        if matches:
+            # The latest anchor in the earlier segment; ties go to the closest match.
+            i, j, _ = max(matches, key=lambda match: (match[0], match[2]))
+            lines = lines[:i] + [_longer_line(lines[i], next_lines[j])] + next_lines[j + 1:]
+        else:
+            logging.warning(f"No overlapping text found before segment {index + 1}. Joining the segments as they are.")
+            lines = lines + next_lines
+    return '\n\n'.join(lines)
@@ -0,0 +1,268 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import logging
+import threading
+from ebooklib import epub
+import episode_document
+import epub_generator
+import google_drive_uploader
+
+# --- Configuration ---
+# Set DIGEST_MODE to "daily" or "weekly" to also collect every processed episode as a chapter of
+# one rolling anthology ePub for the day (or ISO week), uploaded to Drive once per run.
+DIGEST_MODE = os.environ.get("DIGEST_MODE", "off").strip("'\"").lower()
+# Where the rendered episode fragments and the digests are kept between runs.
+DIGEST_DIR = os.environ.get("DIGEST_DIR", "digests").strip("'\"")
+# How many past days (or weeks) of fragments and digests to keep on disk.
+DIGEST_KEEP_PERIODS = int(os.environ.get("DIGEST_KEEP_PERIODS", "7").strip("'\""))
+# Set to "off" to upload only the digest, not each episode's own ePub. The episode ePubs are
+# still written to the output folder either way.
+DIGEST_UPLOAD_EPISODES = os.environ.get("DIGEST_UPLOAD_EPISODES", "on").strip("'\"").lower() in ('1', 'true', 'yes', 'on')
+
+FRAGMENT_MANIFEST = 'fragment.json'
+DIGEST_MANIFEST = 'digest.json'
+
+_manifest_lock = threading.Lock()
+
+def is_enabled():
+    return DIGEST_MODE in ('daily', 'weekly')
+
+def current_period(now=None):
+    """The digest the episodes processed now belong to: '2024-05-17' (daily) or '2024-W20' (weekly)."""
+    now = time.localtime(now)
+    return time.strftime('%G-W%V' if DIGEST_MODE == 'weekly' else '%Y-%m-%d', now)
+
+def fragment_path(episode_id, period=None):
+    """The directory an episode's digest fragment is rendered into."""
+    key = hashlib.sha1(str(episode_id).encode('utf-8')).hexdigest()[:16]
+    return os.path.join(DIGEST_DIR, period or current_period(), 'fragments', key)
+
+def render_fragment(document, directory):
+    """
+    Renders an episode's chapters for the digest into `directory`: an
+    overview page (summary, major points, quotes and sources) and the
+    transcript in parts, each a complete XHTML file, plus fragment.json
+    listing them. Registered as the 'digest' renderer.
+
+    The fragment is written to a temp directory first and then moved into
+    place, so a digest never picks up a half-written one.
+
+    Returns:
+        bool: True if the fragment was written.
+    """
+    tmp_dir = f"{directory}.{os.getpid()}.tmp"
+    try:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+
+        def overview():
+            yield f"<h1>{epub_generator.escape_text(document['title'])}</h1>"
+            yield f"<p><i>{epub_generator.escape_text(document['podcast_name'])}</i></p>"
+            yield from epub_generator.summary_body(document, 'h2')
+            yield from epub_generator.list_body(
+                "Major Points", document['major_points'], "No major points were identified.", 'h2')
+            yield from epub_generator.quotes_body(document, 'h2')
+            yield from epub_generator.list_body(
+                "Sources Referenced", document['sources'], "No sources were referenced.", 'h2')
+
+        chapters = [('overview.xhtml', document['title'], 'Overview', overview())]
+        for number, (start, end, label) in enumerate(epub_generator.plan_transcript_parts(document['transcript']), 1):
+            chapters.append((
+                f"transcript_{number:03d}.xhtml", f"{document['title']} ({number})",
+                f"Transcript {number}" + (f": {label}" if label else ''),
+                epub_generator.transcript_body(document, start, end, 'h2' if number == 1 else None)
+            ))
+
+        for file_name, title, _, body in chapters:
+            with open(os.path.join(tmp_dir, file_name), 'wb') as f:
+                f.write(epub_generator.xhtml_document(title, body))
+        with open(os.path.join(tmp_dir, FRAGMENT_MANIFEST), 'w', encoding='utf-8') as f:
+            json.dump({
+                'title': document['title'],
+                'podcast_name': document['podcast_name'],
+                'chapters': [{'file': file_name, 'title': title, 'toc': toc} for file_name, title, toc, _ in chapters],
+            }, f)
+
+        shutil.rmtree(directory, ignore_errors=True)
+        os.replace(tmp_dir, directory)
+        return True
+    except Exception as e:
+        logging.error(f"An error occurred while rendering the digest fragment {directory}: {e}", exc_info=True)
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        return False
+
+episode_document.register_renderer('digest', render_fragment)
+
+def _period_dir(fragment_dir):
+    return os.path.dirname(os.path.dirname(fragment_dir))
+
+def _read_manifest(period_dir):
+    path = os.path.join(period_dir, DIGEST_MANIFEST)
+    if not os.path.exists(path):
+        return {'episodes': [], 'revision': 0, 'built_revision': 0, 'published_revision': 0, 'drive_file_id': None}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def _write_manifest(period_dir, manifest):
+    path = os.path.join(period_dir, DIGEST_MANIFEST)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, path)
+
+def add_episode(fragment_dir, episode_id):
+    """
+    Adds an episode's rendered fragment to its digest. An episode already in
+    the digest (e.g. processed again) keeps its place and gets the new fragment.
+    """
+    period_dir = _period_dir(fragment_dir)
+    with _manifest_lock:
+        manifest = _read_manifest(period_dir)
+        fragment = os.path.basename(fragment_dir)
+        if not any(entry['fragment'] == fragment for entry in manifest['episodes']):
+            manifest['episodes'].append({'episode_id': episode_id, 'fragment': fragment})
+        manifest['revision'] += 1
+        _write_manifest(period_dir, manifest)
+    logging.info(f"Added episode {episode_id} to the {os.path.basename(period_dir)} digest.")
+
+def digest_path(period):
+    """Where the digest ePub of a period is written."""
+    return os.path.join(DIGEST_DIR, period, f"Podcast Digest {period}.epub")
+
+class StoredChapter(epub.EpubHtml):
+    """A chapter whose XHTML was rendered earlier and is read from disk only when the book is written."""
+
+    def __init__(self, path, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+
+    def get_content(self, default=None):
+        with open(self.path, 'rb') as f:
+            return f.read()
+
+def build_digest(period=None):
+    """
+    Assembles the digest ePub of a period from the fragments cached on disk.
+    No episode is rendered again; each chapter is copied from its fragment
+    file as the book is written.
+
+    Returns:
+        str: The path of the digest ePub, or None if it has no episodes.
+    """
+    period = period or current_period()
+    period_dir = os.path.join(DIGEST_DIR, period)
+    with _manifest_lock:
+        manifest = _read_manifest(period_dir)
+    if not manifest['episodes']:
+        return None
+
+    book = epub.EpubBook()
+    book.set_identifier(f"urn:uuid:podcast-digest-{period}")
+    book.set_title(f"Podcast Digest {period}")
+    book.set_language('en')
+    book.add_author("Podcast Digest")
+
+    toc = []
+    spine = ['nav']
+    for number, entry in enumerate(manifest['episodes'], start=1):
+        fragment_dir = os.path.join(period_dir, 'fragments', entry['fragment'])
+        try:
+            with open(os.path.join(fragment_dir, FRAGMENT_MANIFEST), 'r', encoding='utf-8') as f:
+                fragment = json.load(f)
+        except Exception as e:
+            logging.error(f"Skipping episode {entry['episode_id']} in the digest: its fragment can't be read ({e}).")
+            continue
+        links = []
+        for chapter_info in fragment['chapters']:
+            file_name = f"episode_{number:03d}_{chapter_info['file']}"
+            chapter = StoredChapter(
+                os.path.join(fragment_dir, chapter_info['file']), title=chapter_info['title'], file_name=file_name, lang='en'
+            )
+            book.add_item(chapter)
+            spine.append(chapter)
+            links.append(epub.Link(file_name, chapter_info['toc'], file_name.rsplit('.', 1)[0]))
+        toc.append((epub.Section(f"{fragment['podcast_name']}: {fragment['title']}", links[0].href), links))
+
+    book.toc = tuple(toc)
+    book.add_item(epub.EpubNcx())
+    book.add_item(epub.EpubNav())
+    book.spine = spine
+
+    file_path = digest_path(period)
+    # No page list: building one parses every chapter, and the chapters have no page markers.
+    epub.write_epub(file_path, book, {'epub3_pages': False})
+    logging.info(f"Digest ePub with {len(toc)} episode(s) written: {file_path}")
+    return file_path
+
+def _remove_old_periods():
+    if not os.path.isdir(DIGEST_DIR):
+        return
+    periods = sorted(name for name in os.listdir(DIGEST_DIR) if os.path.isdir(os.path.join(DIGEST_DIR, name)))
+    for name in periods[:-DIGEST_KEEP_PERIODS] if DIGEST_KEEP_PERIODS > 0 else []:
+        shutil.rmtree(os.path.join(DIGEST_DIR, name), ignore_errors=True)
+        logging.info(f"Removed the old digest {name}.")
+
+def _publish_period(period, folder_id):
+    """
+    The manifest's built_revision is the revision last written to the local
+    ePub, and published_revision the one last uploaded, so a digest built
+    while Drive wasn't configured is still uploaded once it is.
+    """
+    period_dir = os.path.join(DIGEST_DIR, period)
+    with _manifest_lock:
+        manifest = _read_manifest(period_dir)
+    revision = manifest['revision']
+    built = manifest.get('built_revision', 0) == revision
+    if built and (not folder_id or manifest['published_revision'] == revision):
+        return True
+
+    file_path = digest_path(period)
+    if not (built and os.path.exists(file_path)):
+        file_path = build_digest(period)
+    uploaded = False
+    if file_path and folder_id and manifest['published_revision'] != revision:
+        file_id = google_drive_uploader.replace_file_on_drive(file_path, folder_id, manifest.get('drive_file_id'))
+        if file_id:
+            manifest['drive_file_id'] = file_id
+            uploaded = True
+
+    with _manifest_lock:
+        current = _read_manifest(period_dir)
+        # Episodes added while the digest was being built are picked up by the next run.
+        current['built_revision'] = revision
+        if uploaded:
+            current['drive_file_id'] = manifest['drive_file_id']
+            current['published_revision'] = revision
+        _write_manifest(period_dir, current)
+    return not folder_id or uploaded or not file_path
+
+def publish_digests(folder_id=None):
+    """
+    Rebuilds every digest that episodes were added to since it was last
+    built, and uploads every digest Drive doesn't have the latest version of,
+    updating the copy uploaded by earlier runs. Called once at the end of a
+    run. A failed upload is retried on the next run, as is one skipped because
+    no folder was given.
+
+    Args:
+        folder_id (str): The Google Drive folder, or None to only build the digests locally.
+
+    Returns:
+        bool: True if every digest is up to date (on Drive, if a folder is given).
+    """
+    if not os.path.isdir(DIGEST_DIR):
+        return True
+    ok = True
+    for period in sorted(os.listdir(DIGEST_DIR)):
+        if not os.path.isdir(os.path.join(DIGEST_DIR, period)):
+            continue
+        try:
+            ok = _publish_period(period, folder_id) and ok
+        except Exception as e:
+            logging.error(f"An error occurred while publishing the {period} digest: {e}", exc_info=True)
+            ok = False
+    _remove_old_periods()
+    return ok
@@ -0,0 +1,159 @@
+import re
+import logging
+import hashlib
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+# Analytics and redirect services that podcast hosts chain in front of the real
+# audio URL, e.g. https://dts.podtrac.com/redirect.mp3/chtbl.com/track/ABC/traffic.megaphone.fm/X.mp3
+# Stripping them leaves the URL of the actual file, which is the same in every feed carrying it.
+TRACKING_PREFIXES = re.compile(
+    r'^(?:'
+    r'dts\.podtrac\.com/redirect\.[a-z0-9]+/'
+    r'|(?:www\.)?podtrac\.com/pts/redirect\.[a-z0-9]+/'
+    r'|chtbl\.com/track/[^/]+/'
+    r'|chrt\.fm/track/[^/]+/'
+    r'|pdst\.fm/e/'
+    r'|op3\.dev/e(?:,[^/]*)?/'
+    r'|pfx\.vpixl\.com/[^/]+/'
+    r'|arttrk\.com/p/[^/]+/'
+    r'|mgln\.ai/e/[^/]+/'
+    r'|verifi\.podscribe\.com/rss/p/'
+    r'|prfx\.byspotify\.com/e/'
+    r'|claritaspod\.com/measure/'
+    r'|media\.blubrry\.com/[^/]+/'
+    r')',
+    re.IGNORECASE
+)
+SCHEME = re.compile(r'^[a-z]+://', re.IGNORECASE)
+# Query parameters that only say where a download came from (or bust caches). Every other
+# parameter is kept, since some hosts identify the file by it, e.g. /play?id=111.
+TRACKING_PARAMS = re.compile(
+    r'^(?:utm_[a-z]+|src|source|ref|from|feed|updated|fbclid|gclid|mc_[a-z]+|aw[a-z]*id|_)$',
+    re.IGNORECASE
+)
+# Fingerprints strong enough to skip an episode processed in an earlier run. A URL alone isn't:
+# it may be a generic endpoint reused for another episode.
+CROSS_RUN_PREFIXES = ('len:', 'dur:', 'urltitle:', 'urllen:')
+
+def normalize_enclosure_url(url):
+    """
+    Reduces an enclosure URL to the identity of the underlying audio file:
+    tracking/redirect prefixes, scheme, tracking query parameters and the
+    fragment are removed, the remaining query parameters are sorted, and the
+    host is lowercased.
+    """
+    if not url:
+        return None
+    remainder = SCHEME.sub('', url.strip())
+    while True:
+        stripped = TRACKING_PREFIXES.sub('', remainder, count=1)
+        if stripped == remainder:
+            break
+        remainder = SCHEME.sub('', stripped)
+    parts = urlsplit(f"//{remainder}")
+    query = sorted(
+        (name, value) for name, value in parse_qsl(parts.query, keep_blank_values=True)
+        if not TRACKING_PARAMS.match(name)
+    )
+    return f"{parts.netloc.lower()}{parts.path}" + (f"?{urlencode(query)}" if query else '')
+
+def _title_hash(title):
+    """Hashes a title after dropping case, punctuation and whitespace differences."""
+    normalized = re.sub(r'[^a-z0-9]+', '', (title or '').lower())
+    return hashlib.sha1(normalized.encode('utf-8')).hexdigest()[:16] if normalized else None
+
+def fingerprint_keys(episode):
+    """
+    Returns the keys under which an episode is indexed for deduplication.
+
+    Two episodes are the same if they share any key:
+      - the normalized enclosure URL (same file, syndicated in another feed), or
+      - the title hash together with the enclosure length or the duration
+        (same episode republished under a new GUID or a new URL).
+
+    The URL is also combined with the title hash and with the length, for
+    matching against earlier runs, where the URL alone isn't enough (see
+    collapse_duplicates()).
+
+    Args:
+        episode (dict): A compact episode record from podcast_fetcher.
+
+    Returns:
+        list: Fingerprint strings (may be empty if the record has nothing usable).
+    """
+    keys = []
+    url = normalize_enclosure_url(episode.get('audio_url'))
+    title_hash = _title_hash(episode.get('title'))
+    if url:
+        keys.append(f"url:{url}")
+        if title_hash:
+            keys.append(f"urltitle:{url}:{title_hash}")
+        if episode.get('enclosure_length'):
+            keys.append(f"urllen:{url}:{episode['enclosure_length']}")
+    if title_hash:
+        if episode.get('enclosure_length'):
+            keys.append(f"len:{episode['enclosure_length']}:{title_hash}")
+        if episode.get('duration'):
+            keys.append(f"dur:{episode['duration']}:{title_hash}")
+    return keys
+
+def collapse_duplicates(episodes, store):
+    """
+    Collapses duplicate episodes before they are transcribed.
+
+    Within a run, the first episode seen becomes canonical and later copies are
+    attached to it under 'aliases', so main can still publish artifacts for
+    every feed from the one transcript and summary. Episodes that strongly match
+    an episode processed in an earlier run (the same title with the same length,
+    duration or URL, or the same URL and length) are kept with 'duplicate_of' set
+    to its ID; main publishes their files from that episode's cached transcript
+    and summary instead of transcribing them again. A match on the URL alone isn't
+    trusted across runs; such episodes are processed.
+
+    Args:
+        episodes (list): New episode records, in feed order.
+        store (episode_store.EpisodeStore): Holds the fingerprint index and aliases.
+
+    Returns:
+        list: The canonical episodes and the repeats of earlier ones, in the same order.
+    """
+    canonical_by_key = {}
+    canonical_episodes = []
+    for episode in episodes:
+        keys = fingerprint_keys(episode)
+
+        canonical = next((canonical_by_key[key] for key in keys if key in canonical_by_key), None)
+        if canonical is not None:
+            logging.info(
+                f"'{episode['title']}' from '{episode['podcast_title']}' is a duplicate of "
+                f"'{canonical['title']}' from '{canonical['podcast_title']}'. It will be processed once."
+            )
+            canonical.setdefault('aliases', []).append(episode)
+            for key in keys:
+                canonical_by_key.setdefault(key, canonical)
+            continue
+
+        processed_id = store.find_processed_by_fingerprint([key for key in keys if key.startswith(CROSS_RUN_PREFIXES)])
+        if processed_id:
+            logging.info(
+                f"'{episode['title']}' from '{episode['podcast_title']}' was already processed as episode "
+                f"{processed_id}. Its files will be published from that episode's transcript and summary."
+            )
+            episode['duplicate_of'] = processed_id
+            canonical_episodes.append(episode)
+            continue
+        weak_match = store.find_processed_by_fingerprint([key for key in keys if key.startswith('url:')])
+        if weak_match:
+            logging.info(
+                f"'{episode['title']}' from '{episode['podcast_title']}' has the audio URL of processed episode "
+                f"{weak_match}, but not its title or length. Processing it."
+            )
+
+        for key in keys:
+            canonical_by_key.setdefault(key, episode)
+        canonical_episodes.append(episode)
+
+    collapsed = len(episodes) - len(canonical_episodes)
+    if collapsed:
+        logging.info(f"Collapsed {collapsed} duplicate episode(s); {len(canonical_episodes)} left to process.")
+    return canonical_episodes
@@ -0,0 +1,76 @@
+import time
+import logging
+
+# The renderers render_document() can use, by name. Each is called with (document, file_path)
+# and returns True if the file was written. epub_generator and md_generator register theirs.
+RENDERERS = {}
+
+def register_renderer(name, render):
+    """Makes `render` available to render_document() as `name` (e.g. 'epub', 'markdown')."""
+    RENDERERS[name] = render
+
+def build_document(title, podcast_name, summary, major_points, quotes, sources, transcript, date=None):
+    """
+    Builds the document every output format is rendered from, once per episode.
+
+    The transcript is kept as the one string it arrived as; renderers walk it
+    with iter_lines() rather than making copies of it.
+
+    Args:
+        title (str): The title of the episode.
+        podcast_name (str): The name of the podcast.
+        summary (str): The summary generated by the LLM.
+        major_points (list): A list of major points from the LLM.
+        quotes (list): A list of important quotes from the LLM.
+        sources (list): A list of sources referenced, from the LLM.
+        transcript (str): The full transcript of the episode.
+        date (str): The processing date (YYYY-MM-DD), today by default.
+
+    Returns:
+        dict: The episode document.
+    """
+    return {
+        'title': title,
+        'podcast_name': podcast_name,
+        'date': date or time.strftime("%Y-%m-%d"),
+        'summary': summary or '',
+        'major_points': list(major_points or []),
+        'quotes': list(quotes or []),
+        'sources': list(sources or []),
+        'transcript': transcript or '',
+    }
+
+def iter_lines(text, start=0, end=None):
+    """
+    Yields the lines of `text` (or of text[start:end]) one by one, without
+    splitting the whole text into a list first.
+    """
+    end = len(text) if end is None else end
+    while True:
+        newline = text.find('\n', start, end)
+        if newline == -1:
+            yield text[start:end]
+            return
+        yield text[start:newline]
+        start = newline + 1
+
+def render_document(document, outputs):
+    """
+    Renders one episode document into several formats.
+
+    Args:
+        document (dict): The document from build_document().
+        outputs (dict): {renderer name: file path}, e.g. {'epub': 'a.epub', 'markdown': 'a.md'}.
+
+    Returns:
+        dict: {renderer name: True if the file was written}.
+    """
+    results = {}
+    for name, file_path in outputs.items():
+        render = RENDERERS.get(name)
+        if render is None:
+            logging.error(f"No renderer is registered for '{name}'. Skipping {file_path}.")
+            results[name] = False
+            continue
+        results[name] = render(document, file_path)
+    return results
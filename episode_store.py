@@ -0,0 +1,253 @@
+import os
+import sys
+import sqlite3
+import logging
+import threading
+from datetime import datetime, timezone
+
+# --- Configuration ---
+# The legacy flat log of processed episode IDs. It's imported into the store once.
+PROCESSED_LOG_FILE = os.environ.get("PROCESSED_LOG_FILE", "processed_episodes.log").strip("'\"")
+# The SQLite database that replaces the flat log. Defaults to the same folder as the log,
+# so a persistent volume configured for PROCESSED_LOG_FILE covers it too.
+PROCESSED_DB_FILE = os.environ.get("PROCESSED_DB_FILE", os.path.splitext(PROCESSED_LOG_FILE)[0] + ".db").strip("'\"")
+
+# Stage statuses an episode moves through. Only 'processed' counts as done.
+STATUS_TRANSCRIBED = 'transcribed'
+STATUS_SUMMARIZED = 'summarized'
+STATUS_RENDERED = 'rendered'
+STATUS_PROCESSED = 'processed'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS episodes (
+    episode_id TEXT PRIMARY KEY,
+    feed_url TEXT,
+    published TEXT,
+    status TEXT NOT NULL,
+    updated_at TEXT NOT NULL,
+    synced INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_episodes_unsynced ON episodes (synced) WHERE synced = 0;
+CREATE TABLE IF NOT EXISTS fingerprints (
+    fingerprint TEXT PRIMARY KEY,
+    episode_id TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS aliases (
+    alias_id TEXT PRIMARY KEY,
+    canonical_id TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+class EpisodeStore:
+    """
+    An embedded SQLite store of episodes and how far each got through the pipeline.
+
+    Membership checks are a primary-key lookup instead of re-reading a log file,
+    and every row carries a `synced` flag so only new IDs need to be pushed to
+    Google Drive. It also holds the dedupe fingerprint index and the alias
+    mapping between duplicate episodes. The store can be used as a drop-in
+    replacement for the old set of processed IDs (`episode_id in store`), and
+    is safe to share between threads.
+    """
+
+    def __init__(self, path=None, legacy_log_path=None):
+        self.path = path or PROCESSED_DB_FILE
+        dir_name = os.path.dirname(self.path)
+        if dir_name and not os.path.exists(dir_name):
+            os.makedirs(dir_name, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(_SCHEMA)
+
+        # One-time import of the flat log written by older versions.
+        legacy_log_path = legacy_log_path or PROCESSED_LOG_FILE
+        if not self.get_meta('legacy_log_imported') and os.path.exists(legacy_log_path):
+            imported = self.import_log(legacy_log_path)
+            logging.info(f"Imported {imported} episode ID(s) from legacy log {legacy_log_path}.")
+            self.set_meta('legacy_log_imported', legacy_log_path)
+
+    def __contains__(self, episode_id):
+        return self.is_processed(episode_id)
+
+    def is_processed(self, episode_id):
+        """Checks if an episode has completed the whole pipeline."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM episodes WHERE episode_id = ? AND status = ?", (episode_id, STATUS_PROCESSED)
+            ).fetchone()
+        return row is not None
+
+    def get_status(self, episode_id):
+        """Returns the last recorded stage of an episode, or None if it's unknown."""
+        with self._lock:
+            row = self._conn.execute("SELECT status FROM episodes WHERE episode_id = ?", (episode_id,)).fetchone()
+        return row[0] if row else None
+
+    def set_status(self, episode_id, status, feed_url=None, published=None):
+        """
+        Records the stage an episode has reached. Feed and publish time are kept
+        from earlier calls if not given. A processed episode is never moved back
+        to an earlier stage.
+        """
+        now = datetime.now(timezone.utc).isoformat()
+        with self._lock, self._conn:
+            self._conn.execute(
+                """
+                INSERT INTO episodes (episode_id, feed_url, published, status, updated_at, synced)
+                VALUES (?, ?, ?, ?, ?, 0)
+                ON CONFLICT (episode_id) DO UPDATE SET
+                    feed_url = COALESCE(excluded.feed_url, episodes.feed_url),
+                    published = COALESCE(excluded.published, episodes.published),
+                    status = CASE WHEN episodes.status = ? THEN episodes.status ELSE excluded.status END,
+                    updated_at = excluded.updated_at,
+                    synced = CASE WHEN episodes.status = ? THEN episodes.synced ELSE 0 END
+                """,
+                (episode_id, feed_url, published, status, now, STATUS_PROCESSED, STATUS_PROCESSED)
+            )
+
+    def mark_processed(self, episode_id, feed_url=None, published=None):
+        """Marks an episode as fully processed; it will be included in the next Drive sync."""
+        self.set_status(episode_id, STATUS_PROCESSED, feed_url, published)
+
+    def count_processed(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM episodes WHERE status = ?", (STATUS_PROCESSED,)).fetchone()[0]
+
+    def merge_processed_ids(self, episode_ids, synced=True):
+        """
+        Adds processed IDs that came from elsewhere (the legacy log or Google Drive).
+        IDs already known as processed are left untouched.
+
+        Returns:
+            int: How many IDs were new.
+        """
+        now = datetime.now(timezone.utc).isoformat()
+        with self._lock, self._conn:
+            before = self._conn.total_changes
+            self._conn.executemany(
+                """
+                INSERT INTO episodes (episode_id, status, updated_at, synced) VALUES (?, ?, ?, ?)
+                ON CONFLICT (episode_id) DO UPDATE SET status = excluded.status, synced = excluded.synced
+                WHERE episodes.status != excluded.status
+                """,
+                ((episode_id, STATUS_PROCESSED, now, 1 if synced else 0) for episode_id in episode_ids)
+            )
+            return self._conn.total_changes - before
+
+    def import_log(self, log_path):
+        """
+        Imports a flat processed_episodes.log (one ID per line).
+        Imported IDs are marked unsynced so they reach Drive on the next sync.
+        """
+        try:
+            with open(log_path, 'r') as f:
+                return self.merge_processed_ids((line.strip() for line in f if line.strip()), synced=False)
+        except Exception as e:
+            logging.error(f"Could not import processed episodes log {log_path}: {e}")
+            return 0
+
+    def get_unsynced_ids(self):
+        """Returns the processed IDs that haven't been pushed to Google Drive yet."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT episode_id FROM episodes WHERE synced = 0 AND status = ? ORDER BY updated_at",
+                (STATUS_PROCESSED,)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def mark_synced(self, episode_ids):
+        with self._lock, self._conn:
+            self._conn.executemany("UPDATE episodes SET synced = 1 WHERE episode_id = ?", ((i,) for i in episode_ids))
+
+    def iter_processed_ids(self):
+        """Yields every processed ID in sorted order (used to write a compacted log)."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT episode_id FROM episodes WHERE status = ? ORDER BY episode_id", (STATUS_PROCESSED,)
+            ).fetchall()
+        for row in rows:
+            yield row[0]
+
+    def add_fingerprints(self, episode_id, fingerprints):
+        """Indexes an episode under its dedupe fingerprints (see episode_dedupe.py). Existing keys are kept."""
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO fingerprints (fingerprint, episode_id) VALUES (?, ?)",
+                ((fingerprint, episode_id) for fingerprint in fingerprints)
+            )
+
+    def find_processed_by_fingerprint(self, fingerprints):
+        """Returns the ID of a processed episode indexed under any of the fingerprints, or None."""
+        if not fingerprints:
+            return None
+        placeholders = ', '.join('?' for _ in fingerprints)
+        with self._lock:
+            row = self._conn.execute(
+                f"""
+                SELECT f.episode_id FROM fingerprints f
+                JOIN episodes e ON e.episode_id = f.episode_id AND e.status = ?
+                WHERE f.fingerprint IN ({placeholders})
+                LIMIT 1
+                """,
+                (STATUS_PROCESSED, *fingerprints)
+            ).fetchone()
+        return row[0] if row else None
+
+    def add_alias(self, alias_id, canonical_id):
+        """Records that an episode is a duplicate of another one."""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO aliases (alias_id, canonical_id) VALUES (?, ?)", (alias_id, canonical_id)
+            )
+
+    def get_aliases(self, canonical_id):
+        """Returns the IDs of the episodes recorded as duplicates of an episode."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT alias_id FROM aliases WHERE canonical_id = ? ORDER BY alias_id", (canonical_id,)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def get_meta(self, key, default=None):
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def set_meta(self, key, value):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO meta (key, value) VALUES (?, ?) ON CONFLICT (key) DO UPDATE SET value = excluded.value",
+                (key, value)
+            )
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_store():
+    """Returns the process-wide episode store, opening it on first use."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = EpisodeStore()
+        return _store
+
+
+if __name__ == "__main__":
+    # Manually import a legacy log, e.g. `python episode_store.py /data/processed_episodes.log`.
+    if len(sys.argv) != 2:
+        print("Usage: python episode_store.py <processed_episodes.log>")
+        sys.exit(1)
+    logging.basicConfig(level=logging.INFO)
+    store = get_store()
+    print(f"Imported {store.import_log(sys.argv[1])} new episode ID(s) into {store.path}.")
@@ -1,95 +1,207 @@
 import logging
+import html
+import re
 from ebooklib import epub
 import os
+import episode_document
 
-def create_epub(title, podcast_name, summary, major_points, quotes, sources, transcript, file_path):
+# --- Configuration ---
+# The transcript is split into XHTML documents of about this size, at speaker turns, so e-readers
+# open and paginate long episodes quickly. Each part gets its own entry in the table of contents.
+EPUB_TRANSCRIPT_PART_KB = float(os.environ.get("EPUB_TRANSCRIPT_PART_KB", "64").strip("'\""))
+
+# The start of a speaker turn: "Nilay:", "**Guest 1:**" or "[00:42:10] Host:".
+TURN_START = re.compile(r'^\s*(?:\[(\d{1,2}:\d{2}(?::\d{2})?)(?:\.\d+)?\]\s*)?\**\s*([^:*\[\]\n]{1,40}?)\s*\**\s*:')
+# Control characters XML doesn't allow, which would make the chapter unreadable.
+INVALID_XML_CHARS = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+XHTML_HEAD = (
+    "<?xml version='1.0' encoding='utf-8'?>\n<!DOCTYPE html>\n"
+    '<html xmlns="http://www.w3.org/1999/xhtml" xmlns:epub="http://www.idpf.org/2007/ops" lang="{lang}" xml:lang="{lang}">\n'
+    "<head><title>{title}</title></head>\n<body>\n"
+)
+XHTML_TAIL = "\n</body>\n</html>\n"
+
+class RenderedChapter(epub.EpubHtml):
     """
-    Creates an ePub file with the analyzed content of the podcast episode.
+    A chapter whose XHTML is rendered from the episode document when the book
+    is written.
+
+    A plain EpubHtml keeps its content as one string and ebooklib parses and
+    re-serializes it on write, which for the transcript means several copies
+    of it in memory at once. This one is rendered straight to bytes instead.
+    """
+
+    def __init__(self, render_body, **kwargs):
+        super().__init__(**kwargs)
+        self.render_body = render_body
+
+    def get_content(self, default=None):
+        return xhtml_document(self.title, self.render_body(), self.lang or 'en')
+
+def xhtml_document(title, body, lang='en'):
+    """Wraps the pieces of a chapter body into a complete XHTML document, as UTF-8 bytes."""
+    head = XHTML_HEAD.format(lang=lang, title=html.escape(title))
+    return b''.join(piece.encode('utf-8') for piece in (head, *body, XHTML_TAIL))
+
+def escape_text(text):
+    """Escapes text for an XHTML text node."""
+    return INVALID_XML_CHARS.sub('', html.escape(text, quote=False))
+
+def summary_body(document, tag='h1'):
+    yield f"<{tag}>Summary</{tag}><p>"
+    yield '<br/>'.join(escape_text(line) for line in episode_document.iter_lines(document['summary']))
+    yield "</p>"
+
+def list_body(heading, items, empty, tag='h1'):
+    yield f"<{tag}>{heading}</{tag}><ul>"
+    for item in items or [empty]:
+        yield f"<li>{escape_text(item)}</li>"
+    yield "</ul>"
+
+def quotes_body(document, tag='h1'):
+    yield f"<{tag}>Important Quotes</{tag}>"
+    if not document['quotes']:
+        yield "<p>No notable quotes were identified.</p>"
+    for quote in document['quotes']:
+        yield f"<blockquote><p><i>&#8220;{escape_text(quote)}&#8221;</i></p></blockquote>"
+
+def plan_transcript_parts(transcript, max_chars=None):
+    """
+    Splits the transcript into parts of about `max_chars` for separate XHTML
+    documents, breaking at speaker turns. A turn longer than a whole part is
+    broken between its lines.
 
     Args:
-        title (str): The title of the episode.
-        podcast_name (str): The name of the podcast.
-        summary (str): The summary generated by the LLM.
-        major_points (list): A list of major points from the LLM.
-        quotes (list): A list of important quotes from the LLM.
-        sources (list): A list of sources referenced, from the LLM.
-        transcript (str): The full transcript of the episode.
+        transcript (str): The transcript.
+        max_chars (int): The part size, EPUB_TRANSCRIPT_PART_KB by default.
+
+    Returns:
+        list: (start, end, label) per part: its character range in the transcript
+              and a table of contents label from its first turn ("00:42:10 Nilay",
+              "Nilay"), or None if it has no labelled turn.
+    """
+    max_chars = max_chars or int(EPUB_TRANSCRIPT_PART_KB * 1024)
+    parts = []
+    start, size, label = 0, 0, None
+    offset = 0
+    for line in episode_document.iter_lines(transcript):
+        turn = TURN_START.match(line)
+        if size and size + len(line) > max_chars and (turn or size >= max_chars):
+            parts.append((start, offset, label))
+            start, size, label = offset, 0, None
+        if turn and label is None:
+            label = ' '.join(filter(None, turn.groups()))
+        size += len(line) + 1
+        offset += len(line) + 1
+    parts.append((start, len(transcript), label))
+    return parts
+
+def transcript_body(document, start, end, tag=None):
+    """The paragraphs of one transcript part, under a "Full Transcript" heading if a `tag` is given."""
+    if tag:
+        yield f"<{tag}>Full Transcript</{tag}>\n"
+    for line in episode_document.iter_lines(document['transcript'], start, end):
+        if line.strip():
+            yield f"<p>{escape_text(line)}</p>\n"
+
+def render_epub(document, file_path):
+    """
+    Writes an episode document as an ePub file.
+
+    The book has five chapters: the summary, the major points, the quotes,
+    the sources and the full transcript. The transcript is split into parts
+    of EPUB_TRANSCRIPT_PART_KB (see plan_transcript_parts()), one paragraph
+    per line. Each chapter and part is rendered only when ebooklib writes it
+    to the zip, so at most one of them is in memory at a time.
+
+    Args:
+        document (dict): The document from episode_document.build_document().
         file_path (str): The full path where the ePub file should be saved.
+
+    Returns:
+        bool: True if the file was written.
     """
     try:
         # --- Book Setup ---
         book = epub.EpubBook()
         book.set_identifier(f"urn:uuid:{os.path.basename(file_path)}")
-        book.set_title(title)
+        book.set_title(document['title'])
         book.set_language('en')
-        book.add_author(podcast_name)
-
-        # --- Chapter 1: Summary ---
-        summary_content = f"<h1>Summary</h1><p>{summary.replace('\n', '<br/>')}</p>"
-        chap_summary = epub.EpubHtml(title='Summary', file_name='chap_01.xhtml', lang='en')
-        chap_summary.content = summary_content
-
-        # --- Chapter 2: Major Points ---
-        points_html = "<h1>Major Points</h1><ul>"
-        if major_points:
-            for point in major_points:
-                points_html += f"<li>{point}</li>"
-        else:
-            points_html += "<li>No major points were identified.</li>"
-        points_html += "</ul>"
-        chap_points = epub.EpubHtml(title='Major Points', file_name='chap_02.xhtml', lang='en')
-        chap_points.content = points_html
-
-        # --- Chapter 3: Important Quotes ---
-        quotes_html = "<h1>Important Quotes</h1>"
-        if quotes:
-            for quote in quotes:
-                quotes_html += f"<blockquote><p><i>&ldquo;{quote}&rdquo;</i></p></blockquote>"
-        else:
-            quotes_html += "<p>No notable quotes were identified.</p>"
-        chap_quotes = epub.EpubHtml(title='Quotes', file_name='chap_03.xhtml', lang='en')
-        chap_quotes.content = quotes_html
-
-        # --- Chapter 4: Sources Referenced ---
-        sources_html = "<h1>Sources Referenced</h1><ul>"
-        if sources:
-            for source in sources:
-                sources_html += f"<li>{source}</li>"
+        book.add_author(document['podcast_name'])
+
+        # --- Chapters ---
+        chapters = [
+            ('Summary', 'summary', lambda: summary_body(document)),
+            ('Major Points', 'major_points', lambda: list_body(
+                "Major Points", document['major_points'], "No major points were identified.")),
+            ('Quotes', 'quotes', lambda: quotes_body(document)),
+            ('Sources', 'sources', lambda: list_body(
+                "Sources Referenced", document['sources'], "No sources were referenced.")),
+        ]
+        items = []
+        toc = []
+        for number, (title, uid, render_body) in enumerate(chapters, start=1):
+            file_name = f"chap_{number:02d}.xhtml"
+            chapter = RenderedChapter(render_body, title=title, file_name=file_name, lang='en')
+            book.add_item(chapter)
+            items.append(chapter)
+            toc.append(epub.Link(file_name, title, uid))
+
+        # --- Transcript, in parts ---
+        parts = plan_transcript_parts(document['transcript'])
+        part_links = []
+        for number, (start, end, label) in enumerate(parts, start=1):
+            file_name = 'chap_05.xhtml' if number == 1 else f"chap_05_{number:03d}.xhtml"
+            chapter = RenderedChapter(
+                lambda start=start, end=end, tag='h1' if number == 1 else None: transcript_body(document, start, end, tag),
+                title='Transcript' if number == 1 else f"Transcript ({number})", file_name=file_name, lang='en'
+            )
+            book.add_item(chapter)
+            items.append(chapter)
+            part_links.append(epub.Link(file_name, f"{number}. {label}" if label else f"Part {number}", f"transcript_{number}"))
+        if len(parts) == 1:
+            toc.append(epub.Link('chap_05.xhtml', 'Transcript', 'transcript'))
         else:
-            sources_html += "<li>No sources were referenced.</li>"
-        sources_html += "</ul>"
-        chap_sources = epub.EpubHtml(title='Sources', file_name='chap_04.xhtml', lang='en')
-        chap_sources.content = sources_html
-        
-        # --- Chapter 5: Full Transcript ---
-        transcript_content = f"<h1>Full Transcript</h1><p>{transcript.replace('\n', '<br/>')}</p>"
-        chap_transcript = epub.EpubHtml(title='Transcript', file_name='chap_05.xhtml', lang='en')
-        chap_transcript.content = transcript_content
+            toc.append((epub.Section('Transcript', 'chap_05.xhtml'), part_links))
 
         # --- Assemble the Book ---
-        book.add_item(chap_summary)
-        book.add_item(chap_points)
-        book.add_item(chap_quotes)
-        book.add_item(chap_sources)
-        book.add_item(chap_transcript)
-
-        book.toc = (
-            epub.Link('chap_01.xhtml', 'Summary', 'summary'),
-            epub.Link('chap_02.xhtml', 'Major Points', 'major_points'),
-            epub.Link('chap_03.xhtml', 'Quotes', 'quotes'),
-            epub.Link('chap_04.xhtml', 'Sources', 'sources'),
-            epub.Link('chap_05.xhtml', 'Transcript', 'transcript')
-        )
-
+        book.toc = tuple(toc)
         book.add_item(epub.EpubNcx())
         book.add_item(epub.EpubNav())
-
-        book.spine = ['nav', chap_summary, chap_points, chap_quotes, chap_sources, chap_transcript]
+        book.spine = ['nav', *items]
 
         # --- Write the ePub File ---
-        epub.write_epub(file_path, book, {})
+        dir_name = os.path.dirname(file_path)
+        if dir_name and not os.path.exists(dir_name):
+            os.makedirs(dir_name, exist_ok=True)
+        # No page list: building one re-parses every chapter, and the chapters have no page markers.
+        epub.write_epub(file_path, book, {'epub3_pages': False})
         logging.info(f"ePub successfully created: {file_path}")
+        return True
 
     except Exception as e:
         logging.error(f"An error occurred during ePub generation: {e}", exc_info=True)
+        return False
 
+episode_document.register_renderer('epub', render_epub)
+
+def create_epub(title, podcast_name, summary, major_points, quotes, sources, transcript, file_path):
+    """
+    Creates an ePub file with the analyzed content of the podcast episode.
+
+    Args:
+        title (str): The title of the episode.
+        podcast_name (str): The name of the podcast.
+        summary (str): The summary generated by the LLM.
+        major_points (list): A list of major points from the LLM.
+        quotes (list): A list of important quotes from the LLM.
+        sources (list): A list of sources referenced, from the LLM.
+        transcript (str): The full transcript of the episode.
+        file_path (str): The full path where the ePub file should be saved.
+
+    Returns:
+        bool: True if the file was written.
+    """
+    document = episode_document.build_document(title, podcast_name, summary, major_points, quotes, sources, transcript)
+    return render_epub(document, file_path)
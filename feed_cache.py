@@ -0,0 +1,122 @@
+import os
+import json
+import logging
+import hashlib
+import threading
+
+# --- Configuration ---
+# The file where per-feed HTTP validators (ETag / Last-Modified) are persisted between runs.
+# On Railway, put this on the same persistent volume as PROCESSED_LOG_FILE.
+FEED_CACHE_FILE = os.environ.get("FEED_CACHE_FILE", "feed_cache.json").strip("'\"")
+
+def hash_body(body):
+    """Returns a stable hash of a raw feed body (bytes)."""
+    return hashlib.sha256(body).hexdigest()
+
+class FeedCache:
+    """
+    A small on-disk cache of what each feed looked like the last time we fetched it.
+
+    For every feed URL we keep the ETag and Last-Modified validators, a hash and
+    the size of the last body, the recent episodes parsed out of it, and the
+    feed's high-water mark (the newest publish time we have seen). That lets
+    the fetcher send a conditional GET and, on a 304 or an identical body, reuse
+    the stored episodes instead of running the parser again.
+
+    The cache is shared between the fetcher's worker threads, so every access
+    goes through a lock. Statistics are kept per instance, i.e. per run.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or FEED_CACHE_FILE
+        self._lock = threading.Lock()
+        self._entries = {}
+        self.stats = {'not_modified': 0, 'unchanged_bodies': 0, 'parses_skipped': 0, 'bytes_saved': 0}
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, 'r') as f:
+                    self._entries = json.load(f)
+            except Exception as e:
+                logging.error(f"Could not read feed cache {self.path}, starting with an empty cache: {e}")
+                self._entries = {}
+
+    def conditional_headers(self, feed_url):
+        """Returns the If-None-Match / If-Modified-Since headers to send for a feed."""
+        headers = {}
+        with self._lock:
+            entry = self._entries.get(feed_url)
+        if entry:
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def get_episodes(self, feed_url):
+        """Returns the episodes stored for a feed, or None if the feed is not cached."""
+        with self._lock:
+            entry = self._entries.get(feed_url)
+        if not entry or 'episodes' not in entry:
+            return None
+        return entry['episodes']
+
+    def get_high_water_mark(self, feed_url):
+        """Returns the newest publish time (ISO string) seen in a feed, or None."""
+        with self._lock:
+            entry = self._entries.get(feed_url)
+        return entry.get('high_water_mark') if entry else None
+
+    def has_body(self, feed_url, body_hash):
+        """Checks if the body we just downloaded is identical to the cached one."""
+        with self._lock:
+            entry = self._entries.get(feed_url)
+        return bool(entry) and entry.get('body_hash') == body_hash and 'episodes' in entry
+
+    def record_not_modified(self, feed_url):
+        """Counts a 304 response. The bytes saved are the size of the last full body."""
+        with self._lock:
+            entry = self._entries.get(feed_url, {})
+            self.stats['not_modified'] += 1
+            self.stats['parses_skipped'] += 1
+            self.stats['bytes_saved'] += entry.get('content_length', 0)
+
+    def record_unchanged_body(self, feed_url):
+        """Counts a full download whose body matched the cached hash."""
+        with self._lock:
+            self.stats['unchanged_bodies'] += 1
+            self.stats['parses_skipped'] += 1
+
+    def update(self, feed_url, etag, last_modified, body_hash, content_length, episodes, high_water_mark=None):
+        """Stores the validators, parsed episodes and high-water mark of a freshly downloaded feed."""
+        with self._lock:
+            self._entries[feed_url] = {
+                'etag': etag,
+                'last_modified': last_modified,
+                'body_hash': body_hash,
+                'content_length': content_length,
+                'episodes': episodes,
+                'high_water_mark': high_water_mark,
+            }
+
+    def save(self):
+        """Writes the cache to disk atomically, so a crash never leaves a half-written file."""
+        try:
+            dir_name = os.path.dirname(self.path)
+            if dir_name and not os.path.exists(dir_name):
+                os.makedirs(dir_name, exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with self._lock:
+                with open(tmp_path, 'w') as f:
+                    json.dump(self._entries, f)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            logging.error(f"Failed to save feed cache to {self.path}: {e}")
+
+    def log_stats(self):
+        """Logs how much work the cache saved during this run."""
+        logging.info(
+            f"Feed cache: {self.stats['not_modified']} not modified (304), "
+            f"{self.stats['unchanged_bodies']} unchanged bodies, "
+            f"{self.stats['parses_skipped']} parses skipped, "
+            f"{self.stats['bytes_saved'] / 1024:.1f} KB of downloads saved."
+        )
@@ -0,0 +1,254 @@
+import os
+import io
+import logging
+import feedparser
+import xml.etree.ElementTree as ET
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+# --- Configuration ---
+# Podcast feeds list the newest episodes first, so once we hit a few episodes in a row
+# that are older than what we care about, the rest of the back catalogue can be skipped.
+# A small run (rather than stopping at the first old entry) tolerates slightly unsorted feeds.
+FEED_STOP_AFTER_STALE = int(os.environ.get("FEED_STOP_AFTER_STALE", "3").strip("'\""))
+
+ITUNES_NS = '{http://www.itunes.com/dtds/podcast-1.0.dtd}'
+MEDIA_NS = '{http://search.yahoo.com/mrss/}'
+AUDIO_EXTENSIONS = ['.mp3', '.m4a', '.wav', '.aac', '.ogg']
+
+class FeedParseError(Exception):
+    """Raised when a feed can't be read by the streaming parser (not RSS, or malformed)."""
+
+def _parse_duration(value):
+    """
+    Converts an itunes:duration value ("3600", "59:30" or "1:02:03") to seconds.
+    Returns None if the value can't be understood.
+    """
+    if not value:
+        return None
+    try:
+        seconds = 0
+        for part in value.strip().split(':'):
+            seconds = seconds * 60 + int(float(part))
+        return seconds
+    except ValueError:
+        return None
+
+def _parse_int(value):
+    """Parses an integer attribute such as an enclosure length, or returns None."""
+    try:
+        return int(value) if value else None
+    except ValueError:
+        return None
+
+def _to_utc(published):
+    """Normalizes a parsed date to an aware UTC datetime without microseconds."""
+    if published.tzinfo is None:
+        published = published.replace(tzinfo=timezone.utc)
+    return published.astimezone(timezone.utc).replace(microsecond=0)
+
+def _make_record(episode_id, title, podcast_title, published, audio_url, audio_type, enclosure_length, duration):
+    """
+    Builds the compact episode record passed through the rest of the pipeline.
+    Only the fields we actually use are kept, instead of feedparser's full
+    `links` / `media_content` structures.
+    """
+    return {
+        'id': episode_id,
+        'title': title or 'No Title',
+        'podcast_title': podcast_title or 'Unknown Podcast',
+        'published': published.isoformat(),
+        'audio_url': audio_url,
+        'audio_type': audio_type,
+        'enclosure_length': enclosure_length,
+        'duration': duration,
+    }
+
+def iter_rss_episodes(body):
+    """
+    Lazily yields the episodes of an RSS 2.0 feed, one <item> at a time.
+
+    Each item element is discarded as soon as it has been read, so memory stays
+    flat regardless of how long the back catalogue is, and the caller can stop
+    iterating early without the rest of the document ever being parsed.
+
+    Args:
+        body (bytes): The raw feed XML.
+
+    Yields:
+        tuple: (published datetime in UTC or None, compact episode record or None).
+               The record is None for items without a usable ID or date.
+
+    Raises:
+        FeedParseError: If the document isn't well-formed RSS.
+    """
+    podcast_title = None
+    channel = None
+    depth = 0
+    try:
+        for event, elem in ET.iterparse(io.BytesIO(body), events=('start', 'end')):
+            if event == 'start':
+                depth += 1
+                if depth == 1 and elem.tag != 'rss':
+                    raise FeedParseError(f"root element is <{elem.tag}>, not <rss>")
+                if depth == 2 and elem.tag == 'channel':
+                    channel = elem
+                continue
+
+            depth -= 1
+            # The channel title is a direct child of <channel> (depth 2 after the end event).
+            if depth == 2 and elem.tag == 'title' and podcast_title is None:
+                podcast_title = (elem.text or '').strip()
+                continue
+            if depth != 2 or elem.tag != 'item':
+                continue
+
+            yield _read_item(elem, podcast_title)
+
+            # Drop the finished item so the tree never holds more than one episode.
+            elem.clear()
+            if channel is not None:
+                channel.remove(elem)
+    except ET.ParseError as e:
+        raise FeedParseError(str(e)) from e
+
+def _read_item(item, podcast_title):
+    """Extracts a compact record from a single RSS <item> element."""
+    title = (item.findtext('title') or '').strip()
+    episode_id = (item.findtext('guid') or '').strip()
+    pub_date = item.findtext('pubDate')
+    if not pub_date:
+        return None, None
+    try:
+        published = _to_utc(parsedate_to_datetime(pub_date.strip()))
+    except (TypeError, ValueError) as e:
+        # feedparser understands many more date formats, so let it handle this feed.
+        raise FeedParseError(f"unrecognized pubDate '{pub_date}'") from e
+
+    if not episode_id:
+        logging.warning(f"Episode '{title}' is missing a unique ID. Skipping.")
+        return published, None
+
+    audio_url, audio_type, enclosure_length = None, None, None
+    enclosure = item.find('enclosure')
+    if enclosure is not None and enclosure.get('url'):
+        audio_url = enclosure.get('url')
+        audio_type = enclosure.get('type')
+        enclosure_length = _parse_int(enclosure.get('length'))
+    else:
+        media_content = item.find(f'{MEDIA_NS}content')
+        if media_content is not None and media_content.get('url'):
+            audio_url = media_content.get('url')
+            audio_type = media_content.get('type')
+            enclosure_length = _parse_int(media_content.get('fileSize'))
+        else:
+            link = (item.findtext('link') or '').strip()
+            if any(link.lower().endswith(ext) for ext in AUDIO_EXTENSIONS):
+                audio_url = link
+
+    duration = _parse_duration(item.findtext(f'{ITUNES_NS}duration'))
+    record = _make_record(episode_id, title, podcast_title, published, audio_url, audio_type, enclosure_length, duration)
+    return published, record
+
+def _feedparser_audio(entry):
+    """Finds the audio URL, type and length in a feedparser entry (enclosure, extension, media_content)."""
+    links = entry.get('links', [])
+    for link in links:
+        if link.get('rel') == 'enclosure' and link.get('href'):
+            return link['href'], link.get('type'), _parse_int(link.get('length'))
+    for link in links:
+        href = link.get('href', '')
+        if any(href.lower().endswith(ext) for ext in AUDIO_EXTENSIONS):
+            return href, link.get('type'), None
+    media_contents = entry.get('media_content', [])
+    if media_contents and media_contents[0].get('url'):
+        return media_contents[0]['url'], media_contents[0].get('type'), _parse_int(media_contents[0].get('filesize'))
+    return None, None, None
+
+def _parse_with_feedparser(feed_url, body, stop_before, observed=None):
+    """
+    The fallback path: parses the whole feed with feedparser, which copes with
+    malformed (bozo) feeds, Atom, and unusual date formats.
+    """
+    parsed_feed = feedparser.parse(body)
+
+    if parsed_feed.bozo:
+        logging.warning(f"Feed may be ill-formed: {feed_url}. Bozo flag was set, but attempting to process anyway.")
+
+    logging.debug(f"Feed parsed. Found {len(parsed_feed.entries)} total entries.")
+    podcast_title = parsed_feed.feed.get('title', 'Unknown Podcast')
+
+    recent_episodes = []
+    for entry in parsed_feed.entries:
+        published_time_struct = entry.get('published_parsed')
+        if not published_time_struct:
+            continue
+
+        episode_pub_time_utc = datetime(*published_time_struct[:6], tzinfo=timezone.utc)
+        if observed is not None:
+            observed.append(episode_pub_time_utc)
+
+        # A unique ID for the episode, usually a URL or a generated string.
+        episode_id = entry.get('id')
+        if not episode_id:
+            logging.warning(f"Episode '{entry.get('title')}' is missing a unique ID. Skipping.")
+            continue
+
+        if episode_pub_time_utc > stop_before:
+            audio_url, audio_type, enclosure_length = _feedparser_audio(entry)
+            duration = _parse_duration(entry.get('itunes_duration'))
+            recent_episodes.append(_make_record(
+                episode_id, entry.get('title'), podcast_title, episode_pub_time_utc,
+                audio_url, audio_type, enclosure_length, duration
+            ))
+    return recent_episodes
+
+def parse_recent_episodes(feed_url, body, stop_before, max_stale=None, observed=None):
+    """
+    Returns the episodes of a feed published after `stop_before`, newest first
+    as they appear in the feed.
+
+    The streaming parser is tried first and stops reading after `max_stale`
+    consecutive episodes at or before `stop_before`. If the feed isn't RSS or
+    isn't well-formed, the whole body is handed to feedparser instead.
+
+    Args:
+        feed_url (str): The RSS feed URL (used for logging).
+        body (bytes): The raw feed XML.
+        stop_before (datetime): Episodes published at or before this are ignored.
+        max_stale (int): How many old episodes in a row end the scan.
+        observed (list): If given, every publish datetime read is appended to it
+                         (used by feed_scheduler to learn the feed's cadence).
+
+    Returns:
+        list: Compact episode records.
+    """
+    if max_stale is None:
+        max_stale = FEED_STOP_AFTER_STALE
+
+    recent_episodes = []
+    stale_run = 0
+    scanned = 0
+    try:
+        for published, record in iter_rss_episodes(body):
+            scanned += 1
+            if published is None:
+                continue
+            if observed is not None:
+                observed.append(published)
+            if published > stop_before:
+                stale_run = 0
+                if record is not None:
+                    recent_episodes.append(record)
+                continue
+            stale_run += 1
+            if stale_run >= max_stale:
+                logging.debug(f"Stopped reading {feed_url} after {scanned} entries (reached older episodes).")
+                break
+    except FeedParseError as e:
+        logging.warning(f"Streaming parser could not read {feed_url} ({e}). Falling back to feedparser.")
+        if observed is not None:
+            observed.clear()
+        return _parse_with_feedparser(feed_url, body, stop_before, observed)
+
+    return recent_episodes
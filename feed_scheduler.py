@@ -0,0 +1,194 @@
+import os
+import json
+import heapq
+import logging
+import statistics
+import time
+from datetime import datetime, timedelta, timezone
+
+# --- Configuration ---
+# Where the learned publish history and last poll time of every feed are kept between runs.
+FEED_SCHEDULE_FILE = os.environ.get("FEED_SCHEDULE_FILE", "feed_schedule.json").strip("'\"")
+# A feed is polled this many times per publishing interval (a daily show with 4 is polled every 6 hours).
+POLLS_PER_EPISODE = float(os.environ.get("POLLS_PER_EPISODE", "4").strip("'\""))
+# Bounds on how often any single feed is polled.
+MIN_POLL_MINUTES = float(os.environ.get("MIN_POLL_MINUTES", "30").strip("'\""))
+MAX_POLL_HOURS = float(os.environ.get("MAX_POLL_HOURS", "24").strip("'\""))
+# Used until we have seen at least two episodes of a feed.
+DEFAULT_POLL_HOURS = float(os.environ.get("DEFAULT_POLL_HOURS", "6").strip("'\""))
+
+# How many recent publish times are kept per feed to estimate its cadence.
+HISTORY_SIZE = 10
+# A feed counts as idle once it's this many publishing intervals overdue; idle feeds are polled half as often.
+IDLE_AFTER_INTERVALS = 3
+# How long after an expected release we check, to give the host time to publish.
+RELEASE_GRACE = timedelta(minutes=10)
+
+class FeedScheduler:
+    """
+    Decides when each feed should be polled, based on how often it publishes.
+
+    For every feed we remember its most recent publish times and the last time
+    it was polled. The median gap between episodes is the feed's cadence; the
+    poll interval is a fraction of that, clamped to [MIN_POLL_MINUTES,
+    MAX_POLL_HOURS]. If the next episode is expected before the next regular
+    poll, an extra poll is scheduled just after the expected release.
+
+    Due times are kept in a heap, so finding the next feed to poll is cheap and
+    the main loop can sleep until exactly that moment.
+    """
+
+    def __init__(self, feed_urls, path=None):
+        self.path = path or FEED_SCHEDULE_FILE
+        self._state = {}
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, 'r') as f:
+                    self._state = json.load(f)
+            except Exception as e:
+                logging.error(f"Could not read feed schedule {self.path}, starting fresh: {e}")
+                self._state = {}
+
+        self._heap = []
+        now = datetime.now(timezone.utc)
+        for feed_url in dict.fromkeys(feed_urls):
+            self._state.setdefault(feed_url, {'publish_times': [], 'last_polled': None})
+            # Feeds we've never polled are due right away.
+            due = self._next_due(feed_url, now) if self._state[feed_url]['last_polled'] else now
+            heapq.heappush(self._heap, (due, feed_url))
+        # Forget feeds that are no longer subscribed.
+        for feed_url in list(self._state):
+            if feed_url not in feed_urls:
+                del self._state[feed_url]
+
+    def _publish_times(self, feed_url):
+        return [datetime.fromisoformat(t) for t in self._state[feed_url]['publish_times']]
+
+    def cadence(self, feed_url):
+        """Returns the median time between a feed's episodes, or None if we haven't seen enough."""
+        times = sorted(self._publish_times(feed_url))
+        gaps = [later - earlier for earlier, later in zip(times, times[1:]) if later > earlier]
+        if not gaps:
+            return None
+        return statistics.median(gaps)
+
+    def poll_interval(self, feed_url, now=None):
+        """Returns how long to wait between regular polls of a feed."""
+        now = now or datetime.now(timezone.utc)
+        min_interval = timedelta(minutes=MIN_POLL_MINUTES)
+        max_interval = timedelta(hours=MAX_POLL_HOURS)
+        cadence = self.cadence(feed_url)
+        if cadence is None:
+            interval = timedelta(hours=DEFAULT_POLL_HOURS)
+        else:
+            interval = cadence / POLLS_PER_EPISODE
+            last_published = max(self._publish_times(feed_url))
+            if now - last_published > cadence * IDLE_AFTER_INTERVALS:
+                interval *= 2
+        return max(min_interval, min(max_interval, interval))
+
+    def _next_due(self, feed_url, now):
+        """Works out when a feed should next be polled, counting from its last poll."""
+        last_polled = datetime.fromisoformat(self._state[feed_url]['last_polled'])
+        due = last_polled + self.poll_interval(feed_url, now)
+        cadence = self.cadence(feed_url)
+        if cadence is not None:
+            expected_release = max(self._publish_times(feed_url)) + cadence + RELEASE_GRACE
+            earliest = last_polled + timedelta(minutes=MIN_POLL_MINUTES)
+            if earliest <= expected_release < due:
+                due = expected_release
+        return due
+
+    def pop_due(self, now=None):
+        """Removes and returns every feed whose poll is due, in due order."""
+        now = now or datetime.now(timezone.utc)
+        due_feeds = []
+        while self._heap and self._heap[0][0] <= now:
+            due_feeds.append(heapq.heappop(self._heap)[1])
+        return due_feeds
+
+    def record_poll(self, feed_urls, observations, now=None):
+        """
+        Records that feeds were polled, learns from the publish times seen, and
+        puts the feeds back on the heap with their new due times.
+
+        Args:
+            feed_urls (list): The feeds that were just polled.
+            observations (dict): Maps a feed URL to the publish datetimes seen while parsing it.
+        """
+        now = now or datetime.now(timezone.utc)
+        for feed_url in feed_urls:
+            state = self._state.setdefault(feed_url, {'publish_times': [], 'last_polled': None})
+            seen = set(state['publish_times'])
+            seen.update(t.isoformat() for t in observations.get(feed_url, []))
+            state['publish_times'] = sorted(seen, key=datetime.fromisoformat)[-HISTORY_SIZE:]
+            state['last_polled'] = now.isoformat()
+            heapq.heappush(self._heap, (self._next_due(feed_url, now), feed_url))
+
+    def seconds_until_next_due(self, now=None):
+        """Returns how long until the next feed is due (0 if one is already due)."""
+        if not self._heap:
+            return None
+        now = now or datetime.now(timezone.utc)
+        return max(0.0, (self._heap[0][0] - now).total_seconds())
+
+    def sleep_until_next_due(self):
+        """Blocks until the next feed is due, instead of waking up every second."""
+        wait = self.seconds_until_next_due()
+        if wait is None:
+            wait = MAX_POLL_HOURS * 3600
+        if wait > 0:
+            logging.info(f"Next feed poll in {wait / 60:.1f} minute(s).")
+            time.sleep(wait)
+
+    def get_schedule(self, now=None):
+        """
+        Returns the computed schedule, soonest first, for inspection.
+
+        Returns:
+            list: One dict per feed with its due time, poll interval and cadence.
+        """
+        now = now or datetime.now(timezone.utc)
+        schedule = []
+        for due, feed_url in sorted(self._heap):
+            cadence = self.cadence(feed_url)
+            schedule.append({
+                'feed_url': feed_url,
+                'next_poll': due.isoformat(),
+                'poll_interval_hours': round(self.poll_interval(feed_url, now).total_seconds() / 3600, 2),
+                'cadence_hours': round(cadence.total_seconds() / 3600, 2) if cadence else None,
+                'last_polled': self._state[feed_url]['last_polled'],
+            })
+        return schedule
+
+    def log_schedule(self):
+        """Logs the upcoming polls, one line per feed."""
+        for item in self.get_schedule():
+            cadence = f"{item['cadence_hours']}h" if item['cadence_hours'] is not None else "unknown"
+            logging.info(
+                f"Schedule: {item['feed_url']} | next poll {item['next_poll']} | "
+                f"every {item['poll_interval_hours']}h | publishes every {cadence}"
+            )
+
+    def save(self):
+        """Writes the learned publish history to disk atomically."""
+        try:
+            dir_name = os.path.dirname(self.path)
+            if dir_name and not os.path.exists(dir_name):
+                os.makedirs(dir_name, exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(self._state, f, indent=2)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            logging.error(f"Failed to save feed schedule to {self.path}: {e}")
+
+
+if __name__ == "__main__":
+    # Prints the schedule learned so far, e.g. `python feed_scheduler.py`.
+    try:
+        with open(FEED_SCHEDULE_FILE, 'r') as f:
+            known_feeds = list(json.load(f))
+    except FileNotFoundError:
+        known_feeds = []
+    print(json.dumps(FeedScheduler(known_feeds).get_schedule(), indent=2))
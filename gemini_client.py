@@ -0,0 +1,318 @@
+import os
+import re
+import time
+import random
+import logging
+import threading
+import google.generativeai as genai
+from google.api_core import exceptions as google_exceptions
+from dotenv import load_dotenv
+
+# --- Configuration ---
+# Per-model limits for Gemini calls (the API's quotas are per model). Every request waits for a
+# slot, so parallel transcriptions and summaries share the quota instead of racing into 429s.
+GEMINI_REQUESTS_PER_MINUTE = float(os.environ.get("GEMINI_REQUESTS_PER_MINUTE", "150").strip("'\""))
+GEMINI_TOKENS_PER_MINUTE = float(os.environ.get("GEMINI_TOKENS_PER_MINUTE", "1000000").strip("'\""))
+# How often a failed call is retried, and the bounds of the jittered exponential backoff.
+GEMINI_MAX_RETRIES = int(os.environ.get("GEMINI_MAX_RETRIES", "5").strip("'\""))
+GEMINI_BACKOFF_BASE_SECONDS = float(os.environ.get("GEMINI_BACKOFF_BASE_SECONDS", "2").strip("'\""))
+GEMINI_BACKOFF_MAX_SECONDS = float(os.environ.get("GEMINI_BACKOFF_MAX_SECONDS", "60").strip("'\""))
+
+# The token estimate for a request whose size we can't tell up front (e.g. an audio file).
+# The bucket is corrected with the real count from the response.
+DEFAULT_REQUEST_TOKENS = 8000
+# Errors worth retrying besides rate limits: the service being briefly overloaded or slow.
+TRANSIENT_ERRORS = (
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.InternalServerError,
+    google_exceptions.DeadlineExceeded,
+)
+# Words and punctuation marks, for estimating the tokens of text locally.
+TOKEN_PIECE = re.compile(r'\w+|[^\w\s]')
+RETRY_HINT = re.compile(r'retry in ([\d.]+)\s*s|retry_delay\s*\{\s*seconds:\s*(\d+)', re.IGNORECASE)
+
+class TokenBucket:
+    """
+    A token bucket that refills at `per_minute` per minute up to `per_minute`.
+
+    reserve() always takes what it asks for, letting the balance go negative,
+    and tells the caller how long to wait until the balance is paid back.
+    Callers are therefore served in the order they arrive.
+    """
+
+    def __init__(self, per_minute):
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+        self.tokens = per_minute
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount, now=None):
+        """Takes `amount` tokens and returns the seconds to wait before using them."""
+        now = time.monotonic() if now is None else now
+        self._refill(now)
+        self.tokens -= min(amount, self.capacity)
+        return max(0.0, -self.tokens / self.rate) if self.rate else 0.0
+
+    def peek(self, amount, now=None):
+        """Returns the seconds a reservation of `amount` would wait, without taking anything."""
+        now = time.monotonic() if now is None else now
+        tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate) - min(amount, self.capacity)
+        return max(0.0, -tokens / self.rate) if self.rate else 0.0
+
+    def drain(self, seconds, now=None):
+        """Empties the bucket so that nothing gets through for `seconds`."""
+        now = time.monotonic() if now is None else now
+        self._refill(now)
+        self.tokens = min(self.tokens, -seconds * self.rate)
+
+class RateLimiter:
+    """Applies a requests-per-minute and a tokens-per-minute bucket to every call, and keeps the metrics."""
+
+    METRICS = ('requests', 'rate_limited', 'retries', 'waits', 'wait_seconds', 'queue_depth', 'max_queue_depth')
+
+    def __init__(self, requests_per_minute=None, tokens_per_minute=None):
+        self._lock = threading.Lock()
+        self.requests = TokenBucket(GEMINI_REQUESTS_PER_MINUTE if requests_per_minute is None else requests_per_minute)
+        self.tokens = TokenBucket(GEMINI_TOKENS_PER_MINUTE if tokens_per_minute is None else tokens_per_minute)
+        self.metrics = dict.fromkeys(self.METRICS, 0)
+
+    def acquire(self, tokens):
+        """Blocks until a request of about `tokens` tokens fits in both buckets."""
+        with self._lock:
+            wait = max(self.requests.reserve(1), self.tokens.reserve(tokens))
+            self.metrics['requests'] += 1
+            if wait > 0:
+                self.metrics['waits'] += 1
+                self.metrics['wait_seconds'] += wait
+                self.metrics['queue_depth'] += 1
+                self.metrics['max_queue_depth'] = max(self.metrics['max_queue_depth'], self.metrics['queue_depth'])
+        if wait > 0:
+            logging.debug(f"Gemini rate limiter: waiting {wait:.1f}s for a slot.")
+            time.sleep(wait)
+            with self._lock:
+                self.metrics['queue_depth'] -= 1
+
+    def expected_wait(self, tokens):
+        """How long a request of about `tokens` tokens would wait for a slot right now."""
+        with self._lock:
+            return max(self.requests.peek(1), self.tokens.peek(tokens))
+
+    def settle(self, estimated_tokens, actual_tokens):
+        """Corrects the token bucket once the real size of a request is known."""
+        with self._lock:
+            self.tokens.tokens -= actual_tokens - estimated_tokens
+
+    def record_failure(self, seconds, rate_limited, retrying):
+        """
+        Counts a failed call. After a 429, every caller is held back for
+        `seconds`, so one rate limit doesn't turn into a retry storm.
+        """
+        with self._lock:
+            if retrying:
+                self.metrics['retries'] += 1
+            if rate_limited:
+                self.metrics['rate_limited'] += 1
+                self.requests.drain(seconds)
+
+    def get_metrics(self):
+        with self._lock:
+            return dict(self.metrics)
+
+_limiters = {}
+_models = {}
+_configured = False
+_client_lock = threading.Lock()
+
+def configure():
+    """
+    Configures the Gemini SDK with GEMINI_API_KEY, once per process.
+
+    Returns:
+        bool: False if the API key is missing.
+    """
+    global _configured
+    with _client_lock:
+        if _configured:
+            return True
+        load_dotenv()
+        api_key = os.getenv("GEMINI_API_KEY")
+        if not api_key:
+            logging.error("GEMINI_API_KEY environment variable not found.")
+            return False
+        genai.configure(api_key=api_key)
+        _configured = True
+        return True
+
+def get_limiter(model_name):
+    """Returns the rate limiter of a model."""
+    with _client_lock:
+        if model_name not in _limiters:
+            _limiters[model_name] = RateLimiter()
+        return _limiters[model_name]
+
+def expected_wait(model_name, tokens):
+    """How long a request of about `tokens` tokens to a model would wait for a slot right now."""
+    return get_limiter(model_name).expected_wait(tokens)
+
+def get_model(model_name):
+    """Returns the shared GenerativeModel for a model name."""
+    with _client_lock:
+        if model_name not in _models:
+            _models[model_name] = genai.GenerativeModel(model_name)
+        return _models[model_name]
+
+def estimate_text_tokens(text):
+    """
+    Estimates the tokens of a text without calling the API.
+
+    Like Gemini's tokenizer, it counts a token per punctuation mark and per
+    common word, and splits long words into pieces of about eight characters.
+    """
+    return sum(1 + (len(piece) - 1) // 8 for piece in TOKEN_PIECE.findall(text))
+
+def estimate_tokens(contents):
+    """Estimates the input tokens of a request; parts that aren't text (e.g. audio) count DEFAULT_REQUEST_TOKENS."""
+    parts = contents if isinstance(contents, (list, tuple)) else [contents]
+    estimate = 0
+    for part in parts:
+        estimate += estimate_text_tokens(part) if isinstance(part, str) else DEFAULT_REQUEST_TOKENS
+    return max(1, estimate)
+
+def _is_rate_limit(error):
+    if isinstance(error, (google_exceptions.ResourceExhausted, google_exceptions.TooManyRequests)):
+        return True
+    return "429" in str(error) or "ResourceExhausted" in type(error).__name__
+
+def _retry_hint(error):
+    """Returns the delay the server asked for, in seconds, if it gave one."""
+    for detail in getattr(error, 'details', None) or []:
+        retry_delay = getattr(detail, 'retry_delay', None)
+        if retry_delay is not None and getattr(retry_delay, 'seconds', None) is not None:
+            return float(retry_delay.seconds) + getattr(retry_delay, 'nanos', 0) / 1e9
+    match = RETRY_HINT.search(str(error))
+    if match:
+        return float(match.group(1) or match.group(2))
+    return None
+
+def _backoff_delay(attempt, hint=None):
+    """Full-jitter exponential backoff, but never shorter than the server's retry hint."""
+    delay = random.uniform(0, min(GEMINI_BACKOFF_MAX_SECONDS, GEMINI_BACKOFF_BASE_SECONDS * 2 ** attempt))
+    if hint is not None:
+        delay = max(delay, hint) + random.uniform(0, 1)
+    return delay
+
+def generate_content(model_name, contents, estimated_tokens=None, **kwargs):
+    """
+    Calls generate_content through the shared rate limiter, with retries.
+
+    Rate limits (429) and transient server errors are retried up to
+    GEMINI_MAX_RETRIES times with jittered exponential backoff, waiting at
+    least as long as the server's retry hint. A 429 also pauses every other
+    caller in the process for the same time.
+
+    Args:
+        model_name (str): The Gemini model to use.
+        contents: What to send (a prompt string, or a list of parts such as [file, prompt]).
+        estimated_tokens (int): The expected size of the request; estimated from the contents if not given.
+        **kwargs: Passed on to GenerativeModel.generate_content (e.g. generation_config).
+                  With stream=True, use stream_content() instead, which settles the tokens at the end.
+
+    Returns:
+        The Gemini response.
+
+    Raises:
+        Exception: The last error, if every attempt failed, or any non-retryable error.
+    """
+    model = get_model(model_name)
+    limiter = get_limiter(model_name)
+    if estimated_tokens is None:
+        estimated_tokens = estimate_tokens(contents)
+
+    for attempt in range(GEMINI_MAX_RETRIES + 1):
+        limiter.acquire(estimated_tokens)
+        try:
+            response = model.generate_content(contents, **kwargs)
+        except Exception as e:
+            rate_limited = _is_rate_limit(e)
+            if not (rate_limited or isinstance(e, TRANSIENT_ERRORS)) or attempt == GEMINI_MAX_RETRIES:
+                limiter.record_failure(0, rate_limited, retrying=False)
+                raise
+            delay = _backoff_delay(attempt, _retry_hint(e))
+            limiter.record_failure(delay, rate_limited, retrying=True)
+            reason = "rate limit hit (429)" if rate_limited else f"error ({type(e).__name__})"
+            logging.warning(f"Gemini API {reason}. Retrying in {delay:.1f} seconds...")
+            if not rate_limited:
+                # After a 429 the drained bucket makes the next acquire() wait instead.
+                time.sleep(delay)
+            continue
+
+        if not kwargs.get('stream'):
+            _settle_usage(limiter, response, estimated_tokens)
+        return response
+
+def _settle_usage(limiter, response, estimated_tokens):
+    usage = getattr(response, 'usage_metadata', None)
+    total_tokens = getattr(usage, 'total_token_count', None)
+    if isinstance(total_tokens, int):
+        limiter.settle(estimated_tokens, total_tokens)
+
+def stream_content(model_name, contents, estimated_tokens=None, usage=None, **kwargs):
+    """
+    Like generate_content(), but yields the response text piece by piece while Gemini writes it.
+
+    The request is rate limited and retried like generate_content() until the
+    stream starts; an error in the middle of the stream is raised to the
+    caller, who keeps whatever arrived before it. If `usage` is a dict, the
+    final prompt_token_count and candidates_token_count are put in it.
+
+    Yields:
+        str: The text of each streamed chunk.
+    """
+    if estimated_tokens is None:
+        estimated_tokens = estimate_tokens(contents)
+    response = generate_content(model_name, contents, estimated_tokens, stream=True, **kwargs)
+    for chunk in response:
+        try:
+            text = chunk.text
+        except ValueError:
+            # A chunk without text, e.g. the last one carrying only the finish reason.
+            continue
+        if text:
+            yield text
+    # The usage is only final once the whole stream has been read.
+    _settle_usage(get_limiter(model_name), response, estimated_tokens)
+    if usage is not None:
+        metadata = getattr(response, 'usage_metadata', None)
+        for name in ('prompt_token_count', 'candidates_token_count'):
+            value = getattr(metadata, name, None)
+            if isinstance(value, int):
+                usage[name] = value
+
+def get_metrics():
+    """
+    Returns the rate limiters' counters for this process, summed over all models.
+
+    Returns:
+        dict: requests, rate_limited (429s), retries, waits, wait_seconds,
+              queue_depth (callers waiting now) and max_queue_depth.
+    """
+    with _client_lock:
+        limiters = list(_limiters.values())
+    totals = dict.fromkeys(RateLimiter.METRICS, 0)
+    for limiter in limiters:
+        for name, value in limiter.get_metrics().items():
+            totals[name] = max(totals[name], value) if name == 'max_queue_depth' else totals[name] + value
+    return totals
+
+def log_metrics():
+    """Logs the rate limiter's counters."""
+    metrics = get_metrics()
+    logging.info(
+        f"Gemini: {metrics['requests']} request(s), {metrics['rate_limited']} rate limited (429), "
+        f"{metrics['retries']} retried, {metrics['waits']} waited {metrics['wait_seconds']:.1f}s in total "
+        f"for a slot (max queue depth {metrics['max_queue_depth']})."
+    )
@@ -0,0 +1,163 @@
+import os
+import json
+import time
+import logging
+import threading
+from datetime import datetime, timedelta, timezone
+import google.generativeai as genai
+
+# --- Configuration ---
+# Uploaded audio is checked for readiness after FILE_POLL_FIRST_SECONDS, then at doubling
+# intervals of at most FILE_POLL_MAX_SECONDS, until FILE_READY_TIMEOUT_SECONDS have passed.
+FILE_POLL_FIRST_SECONDS = float(os.environ.get("FILE_POLL_FIRST_SECONDS", "0.5").strip("'\""))
+FILE_POLL_MAX_SECONDS = float(os.environ.get("FILE_POLL_MAX_SECONDS", "8").strip("'\""))
+FILE_READY_TIMEOUT_SECONDS = float(os.environ.get("FILE_READY_TIMEOUT_SECONDS", "600").strip("'\""))
+# Where the uploads that may be reused are remembered, and for how long they're kept.
+# The File API deletes uploads after 48 hours on its own, so this must stay below that.
+GEMINI_UPLOADS_FILE = os.environ.get("GEMINI_UPLOADS_FILE", "gemini_uploads.json").strip("'\"")
+GEMINI_UPLOAD_TTL_HOURS = float(os.environ.get("GEMINI_UPLOAD_TTL_HOURS", "6").strip("'\""))
+
+def wait_until_active(audio_file, timeout=None):
+    """
+    Polls an uploaded file until Gemini has finished processing it.
+
+    The first check comes quickly, because short clips are usually ready
+    within a second; after that the interval doubles up to FILE_POLL_MAX_SECONDS.
+
+    Args:
+        audio_file: The File returned by genai.upload_file.
+        timeout (float): Seconds to wait in total (FILE_READY_TIMEOUT_SECONDS by default).
+
+    Returns:
+        The File, in the ACTIVE state.
+
+    Raises:
+        TimeoutError: If the file is still processing at the deadline.
+        ValueError: If processing failed.
+    """
+    deadline = time.monotonic() + (FILE_READY_TIMEOUT_SECONDS if timeout is None else timeout)
+    delay = FILE_POLL_FIRST_SECONDS
+    started = time.monotonic()
+    while audio_file.state.name == "PROCESSING":
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise TimeoutError(f"Gemini was still processing {audio_file.name} after {time.monotonic() - started:.0f} seconds")
+        logging.info("Waiting for audio file to be processed by Gemini...")
+        time.sleep(min(delay, remaining))
+        audio_file = genai.get_file(audio_file.name)
+        delay = min(delay * 2, FILE_POLL_MAX_SECONDS)
+
+    if audio_file.state.name != "ACTIVE":
+        raise ValueError(f"Gemini file processing failed (state is {audio_file.state.name})")
+    logging.info(f"Audio file is active after {time.monotonic() - started:.1f} seconds of processing.")
+    return audio_file
+
+def delete_remote_file(name):
+    """Deletes an upload from the File API, logging instead of raising on failure."""
+    try:
+        genai.delete_file(name)
+        logging.info(f"Cleaned up remote Gemini File API upload: {name}")
+    except Exception as e:
+        logging.error(f"Failed to delete remote Gemini file: {e}")
+
+class UploadRegistry:
+    """
+    Remembers the audio uploaded to the File API, keyed by audio fingerprint.
+
+    A retry after a failed generation, or a segment that's transcribed again,
+    can then reuse the upload instead of sending the file again. Once the audio
+    is transcribed the upload is deleted and forgotten (see
+    transcriber._transcribe_audio_file()). Entries left behind by failures expire
+    after GEMINI_UPLOAD_TTL_HOURS, and cleanup_expired() deletes their remote files.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or GEMINI_UPLOADS_FILE
+        self._lock = threading.Lock()
+        self._entries = {}
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, 'r') as f:
+                    self._entries = json.load(f)
+            except Exception as e:
+                logging.error(f"Could not read upload registry {self.path}, starting fresh: {e}")
+                self._entries = {}
+
+    def get(self, key):
+        """Returns the active upload registered under a key, or None if there is none."""
+        if not key:
+            return None
+        now = datetime.now(timezone.utc)
+        with self._lock:
+            entry = self._entries.get(key)
+        if not entry or datetime.fromisoformat(entry['expires_at']) <= now:
+            return None
+        try:
+            audio_file = genai.get_file(entry['name'])
+        except Exception as e:
+            logging.info(f"Registered upload {entry['name']} is gone ({e}). It will be uploaded again.")
+            self.forget(key)
+            return None
+        if audio_file.state.name != "ACTIVE":
+            self.forget(key)
+            return None
+        logging.info(f"Reusing audio uploaded to Gemini earlier: {entry['name']}")
+        return audio_file
+
+    def put(self, key, audio_file):
+        """Registers an active upload so later calls on the same audio can reuse it."""
+        expires_at = datetime.now(timezone.utc) + timedelta(hours=GEMINI_UPLOAD_TTL_HOURS)
+        with self._lock:
+            self._entries[key] = {'name': audio_file.name, 'expires_at': expires_at.isoformat()}
+        self.save()
+
+    def forget(self, key):
+        """Drops the entry for a key, e.g. once its upload is deleted."""
+        with self._lock:
+            self._entries.pop(key, None)
+        self.save()
+
+    def cleanup_expired(self, now=None):
+        """
+        Deletes the remote files of expired entries and forgets them.
+
+        Returns:
+            int: How many uploads were removed.
+        """
+        now = now or datetime.now(timezone.utc)
+        with self._lock:
+            expired = {key: entry for key, entry in self._entries.items()
+                       if datetime.fromisoformat(entry['expires_at']) <= now}
+            for key in expired:
+                del self._entries[key]
+        if not expired:
+            return 0
+        for entry in expired.values():
+            delete_remote_file(entry['name'])
+        self.save()
+        return len(expired)
+
+    def save(self):
+        """Writes the registry to disk atomically."""
+        try:
+            dir_name = os.path.dirname(self.path)
+            if dir_name and not os.path.exists(dir_name):
+                os.makedirs(dir_name, exist_ok=True)
+            tmp_path = f"{self.path}.{threading.get_ident()}.tmp"
+            with self._lock:
+                with open(tmp_path, 'w') as f:
+                    json.dump(self._entries, f, indent=2)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            logging.error(f"Failed to save upload registry to {self.path}: {e}")
+
+_registry = None
+_registry_lock = threading.Lock()
+
+def get_registry():
+    """Returns the process-wide upload registry."""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = UploadRegistry()
+        return _registry
@@ -6,18 +6,40 @@
 
 import os
 import io
+import json
+import threading
+from datetime import datetime, timedelta, timezone
+import httplib2
+import google_auth_httplib2
+import google.auth.credentials
 from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
-from googleapiclient.http import MediaFileUpload, MediaIoBaseDownload
+from googleapiclient.http import MediaFileUpload, MediaIoBaseDownload, MediaIoBaseUpload
 import logging
 
 # If modifying these scopes, delete the file token.json.
 SCOPES = ['https://www.googleapis.com/auth/drive.file']
 
-def get_credentials():
+# The processed episode IDs live on Drive as one compacted log plus small delta files.
+PROCESSED_LOG_NAME = 'processed_episodes.log'
+PROCESSED_DELTA_PREFIX = 'processed_episodes.delta.'
+# How many delta files may pile up before they're folded back into the main log.
+PROCESSED_DELTA_COMPACT_AFTER = int(os.environ.get("PROCESSED_DELTA_COMPACT_AFTER", "20").strip("'\""))
+# Access tokens are refreshed this long before they expire, so no request goes out with one about to lapse.
+TOKEN_REFRESH_MARGIN = timedelta(minutes=5)
+# Seconds before a Drive request with no answer fails.
+DRIVE_HTTP_TIMEOUT = 120
+
+_credentials = None
+_credentials_lock = threading.Lock()
+_auth_request = None
+# Each thread gets its own Drive service, since httplib2 connections can't be shared between threads.
+_thread_services = threading.local()
+
+def _load_credentials():
     """
     Handles user authentication for the Google Drive API.
     It looks for a 'token.json' file which stores the user's access and refresh tokens.
@@ -49,7 +71,7 @@ def get_credentials():
     # If there are no (valid) credentials available, let the user log in.
     if not creds or not creds.valid:
         if creds and creds.expired and creds.refresh_token:
-            creds.refresh(Request())
+            creds.refresh(_get_auth_request())
         else:
             # IMPORTANT: You need a 'credentials.json' file from Google Cloud.
             # See the README for how to get this.
@@ -60,10 +82,100 @@ def get_credentials():
             creds = flow.run_local_server(port=0)
         
         # Save the credentials for the next run
-        with open('token.json', 'w') as token:
-            token.write(creds.to_json())
+        _save_token(creds)
     return creds
 
+def _get_auth_request():
+    """The transport token refreshes go through, reusing one HTTP session."""
+    global _auth_request
+    if _auth_request is None:
+        _auth_request = Request()
+    return _auth_request
+
+def _save_token(creds):
+    with open('token.json', 'w') as token:
+        token.write(creds.to_json())
+
+def _expires_soon(creds):
+    if not creds.expiry:
+        return False
+    # google-auth keeps the expiry as a naive UTC time.
+    return creds.expiry - TOKEN_REFRESH_MARGIN <= datetime.now(timezone.utc).replace(tzinfo=None)
+
+def get_credentials():
+    """
+    Returns the process-wide Google Drive credentials.
+
+    token.json is read (and the login flow run if needed) only the first
+    time. After that, the access token is refreshed only when it's within
+    TOKEN_REFRESH_MARGIN of expiring (or when Drive rejects it, see
+    _SharedCredentials), by one thread at a time, and token.json is rewritten
+    only then.
+
+    Returns:
+        Credentials: The credentials, or None if there are none.
+    """
+    global _credentials
+    with _credentials_lock:
+        if _credentials is None:
+            _credentials = _load_credentials()
+        elif _credentials.refresh_token and (not _credentials.token or _expires_soon(_credentials)):
+            _refresh_locked("it's about to expire")
+        return _credentials
+
+def _refresh_locked(reason):
+    """Refreshes the shared credentials and saves them. Must be called holding _credentials_lock."""
+    logging.info(f"Refreshing the Google Drive access token: {reason}...")
+    _credentials.refresh(_get_auth_request())
+    _save_token(_credentials)
+
+def _refresh_rejected_token(rejected_token):
+    """Refreshes the shared credentials after Drive rejected `rejected_token`, unless another thread already has."""
+    with _credentials_lock:
+        if _credentials is not None and _credentials.refresh_token and _credentials.token == rejected_token:
+            _refresh_locked("Google Drive rejected it")
+
+class _SharedCredentials(google.auth.credentials.Credentials):
+    """
+    Authorizes one thread's Drive requests with the process-wide credentials.
+
+    AuthorizedHttp refreshes its credentials by itself, before a request when
+    they're invalid and after a 401. Through this wrapper, both go through
+    _credentials_lock like every other refresh, so the token is refreshed by
+    one thread and token.json is rewritten.
+    """
+
+    def before_request(self, request, method, url, headers):
+        creds = get_credentials()
+        # Remembered so a 401 can tell whether this token is still the current one.
+        self.token = creds.token
+        creds.apply(headers, token=self.token)
+
+    def refresh(self, request):
+        _refresh_rejected_token(self.token)
+
+def get_service():
+    """
+    Returns the Drive API service for the calling thread.
+
+    The service is built once per thread, so the API description is parsed
+    once instead of on every call, and its HTTP connection to Drive is kept
+    open and reused between calls.
+
+    Returns:
+        Resource: The Drive v3 service, or None without credentials.
+    """
+    creds = get_credentials()
+    if not creds:
+        return None
+    service = getattr(_thread_services, 'service', None)
+    if service is None or _thread_services.credentials is not creds:
+        http = google_auth_httplib2.AuthorizedHttp(_SharedCredentials(), http=httplib2.Http(timeout=DRIVE_HTTP_TIMEOUT))
+        service = build('drive', 'v3', http=http, cache_discovery=False)
+        _thread_services.service = service
+        _thread_services.credentials = creds
+    return service
+
 def upload_file_to_drive(file_path, folder_id):
     """
     Uploads a file to a specific folder in Google Drive.
@@ -73,13 +185,11 @@ def upload_file_to_drive(file_path, folder_id):
         folder_id (str): The ID of the Google Drive folder to upload to.
     """
     try:
-        creds = get_credentials()
-        if not creds:
+        service = get_service()
+        if not service:
             logging.error("Could not obtain Google Drive credentials. Skipping upload.")
             return
 
-        service = build('drive', 'v3', credentials=creds)
-
         file_name = os.path.basename(file_path)
         file_metadata = {
             'name': file_name,
@@ -113,110 +223,197 @@ def upload_file_to_drive(file_path, folder_id):
         return False
 
 
-def download_processed_log_from_drive(local_path, folder_id):
+def replace_file_on_drive(file_path, folder_id, file_id=None):
     """
-    Downloads the processed_episodes.log from Google Drive to local_path,
-    merging with the local log if it already exists.
+    Uploads a file that changes over time, such as the digest ePub, updating
+    the existing Drive copy in place instead of creating a new file each time.
+
+    Args:
+        file_path (str): The path to the file to upload.
+        folder_id (str): The ID of the Google Drive folder for a new copy.
+        file_id (str): The ID of the existing Drive copy, if there is one.
+
+    Returns:
+        str: The ID of the Drive copy, or None if the upload failed.
     """
     try:
-        creds = get_credentials()
-        if not creds:
+        service = get_service()
+        if not service:
+            logging.error("Could not obtain Google Drive credentials. Skipping upload.")
+            return None
+        file_name = os.path.basename(file_path)
+        mimetype = 'application/epub+zip' if file_name.lower().endswith('.epub') else 'application/octet-stream'
+        media = MediaFileUpload(file_path, mimetype=mimetype, resumable=True)
+        if file_id:
+            try:
+                service.files().update(fileId=file_id, media_body=media, fields='id').execute()
+                logging.info(f"File '{file_name}' updated on Google Drive (ID: {file_id}).")
+                return file_id
+            except HttpError as error:
+                if error.resp.status != 404:
+                    raise
+                logging.warning(f"The Drive copy of '{file_name}' is gone. Uploading it again.")
+                media = MediaFileUpload(file_path, mimetype=mimetype, resumable=True)
+
+        file = service.files().create(
+            body={'name': file_name, 'parents': [folder_id]}, media_body=media, fields='id'
+        ).execute()
+        logging.info(f"File '{file_name}' uploaded with ID: {file.get('id')}")
+        return file.get('id')
+
+    except HttpError as error:
+        logging.error(f'An HTTP error occurred with Google Drive API: {error}')
+        return None
+    except Exception as e:
+        logging.error(f'An error occurred during Google Drive upload: {e}')
+        return None
+
+
+def _list_processed_log_files(service, folder_id):
+    """Lists the compacted processed log and every delta file in the Drive folder."""
+    query = (
+        f"(name = '{PROCESSED_LOG_NAME}' or name contains '{PROCESSED_DELTA_PREFIX}') "
+        f"and '{folder_id}' in parents and trashed = false"
+    )
+    files = []
+    page_token = None
+    while True:
+        results = service.files().list(
+            q=query, fields="nextPageToken, files(id, name, modifiedTime)", pageToken=page_token
+        ).execute()
+        files.extend(results.get('files', []))
+        page_token = results.get('nextPageToken')
+        if not page_token:
+            return files
+
+
+def _download_ids(service, file_id):
+    """Downloads a processed log file from Drive and returns the IDs in it."""
+    # Download the file content using MediaIoBaseDownload to avoid json parsing error in execute()
+    request = service.files().get_media(fileId=file_id)
+    fh = io.BytesIO()
+    downloader = MediaIoBaseDownload(fh, request)
+    done = False
+    while not done:
+        status, done = downloader.next_chunk()
+    drive_content = fh.getvalue().decode('utf-8')
+    return [line.strip() for line in drive_content.split('\n') if line.strip()]
+
+
+def sync_processed_store_from_drive(store, folder_id):
+    """
+    Merges the processed episode IDs stored on Google Drive into the local episode store.
+
+    Drive holds one compacted processed_episodes.log plus small delta files, one per
+    upload. Only files that are new or changed since the last sync are downloaded;
+    the IDs and modified times of files already merged are remembered in the store.
+
+    Args:
+        store (episode_store.EpisodeStore): The local episode store.
+        folder_id (str): The ID of the Google Drive folder holding the log.
+    """
+    try:
+        service = get_service()
+        if not service:
             logging.error("Could not obtain Google Drive credentials for downloading log.")
             return False
-
-        service = build('drive', 'v3', credentials=creds)
-        
-        # Search for processed_episodes.log in the specified folder
-        query = f"name = 'processed_episodes.log' and '{folder_id}' in parents and trashed = false"
-        results = service.files().list(q=query, fields="files(id)").execute()
-        files = results.get('files', [])
-        
+        files = _list_processed_log_files(service, folder_id)
         if not files:
-            logging.info("processed_episodes.log not found on Google Drive. This is normal for a first run.")
+            logging.info("No processed episodes log found on Google Drive. This is normal for a first run.")
             return False
 
-        file_id = files[0]['id']
-        logging.info(f"Found processed_episodes.log on Google Drive with ID: {file_id}. Downloading...")
-        
-        # Download the file content using MediaIoBaseDownload to avoid json parsing error in execute()
-        request = service.files().get_media(fileId=file_id)
-        fh = io.BytesIO()
-        downloader = MediaIoBaseDownload(fh, request)
-        done = False
-        while not done:
-            status, done = downloader.next_chunk()
-            
-        drive_content = fh.getvalue().decode('utf-8')
-        drive_ids = {line.strip() for line in drive_content.split('\n') if line.strip()}
-        
-        # Merge with existing local file if it exists
-        local_ids = set()
-        if os.path.exists(local_path):
-            try:
-                with open(local_path, 'r') as f:
-                    local_ids = {line.strip() for line in f if line.strip()}
-            except Exception as e:
-                logging.error(f"Error reading local processed log: {e}")
-                
-        merged_ids = drive_ids.union(local_ids)
-        
-        # Ensure directory exists for local_path if it's nested (e.g. /data/processed_episodes.log)
-        dir_name = os.path.dirname(local_path)
-        if dir_name and not os.path.exists(dir_name):
-            os.makedirs(dir_name)
-            
-        # Write merged IDs back to local path
-        with open(local_path, 'w') as f:
-            f.write('\n'.join(sorted(merged_ids)) + '\n')
-            
-        logging.info(f"Successfully downloaded and merged {len(merged_ids)} processed episode IDs from Google Drive.")
+        merged_files = json.loads(store.get_meta('drive_merged_files', '{}'))
+        new_ids = 0
+        downloaded = 0
+        for file in files:
+            if merged_files.get(file['id']) == file.get('modifiedTime'):
+                continue
+            new_ids += store.merge_processed_ids(_download_ids(service, file['id']))
+            merged_files[file['id']] = file.get('modifiedTime')
+            downloaded += 1
+
+        # Forget files that were deleted by a compaction elsewhere.
+        current_ids = {file['id'] for file in files}
+        merged_files = {file_id: modified for file_id, modified in merged_files.items() if file_id in current_ids}
+        store.set_meta('drive_merged_files', json.dumps(merged_files))
+
+        logging.info(f"Downloaded {downloaded} of {len(files)} processed log file(s) from Google Drive; {new_ids} new episode ID(s) merged.")
         return True
-        
+
     except Exception as e:
         logging.error(f"Error downloading processed episodes log from Google Drive: {e}")
         return False
 
 
-def upload_processed_log_to_drive(local_path, folder_id):
+def upload_processed_delta_to_drive(store, folder_id):
     """
-    Uploads or updates the processed_episodes.log on Google Drive with local contents.
+    Uploads the processed episode IDs that Drive doesn't have yet as a small delta file.
+
+    Each call only sends the new IDs instead of the whole history. Once
+    PROCESSED_DELTA_COMPACT_AFTER delta files have piled up, they are folded
+    back into processed_episodes.log and deleted.
+
+    Args:
+        store (episode_store.EpisodeStore): The local episode store.
+        folder_id (str): The ID of the Google Drive folder holding the log.
     """
     try:
-        if not os.path.exists(local_path):
-            logging.warning(f"Local processed log {local_path} does not exist. Skipping upload.")
-            return False
-            
-        creds = get_credentials()
-        if not creds:
+        episode_ids = store.get_unsynced_ids()
+        if not episode_ids:
+            return True
+
+        service = get_service()
+        if not service:
             logging.error("Could not obtain Google Drive credentials for uploading log.")
             return False
 
-        service = build('drive', 'v3', credentials=creds)
-        
-        # Search for processed_episodes.log in the specified folder
-        query = f"name = 'processed_episodes.log' and '{folder_id}' in parents and trashed = false"
-        results = service.files().list(q=query, fields="files(id)").execute()
-        files = results.get('files', [])
-        
-        media = MediaFileUpload(local_path, mimetype='text/plain', resumable=True)
-        
-        if files:
-            file_id = files[0]['id']
-            logging.info(f"Updating existing processed_episodes.log on Google Drive (ID: {file_id})...")
-            service.files().update(fileId=file_id, media_body=media).execute()
-        else:
-            logging.info("Creating new processed_episodes.log on Google Drive...")
-            file_metadata = {
-                'name': 'processed_episodes.log',
-                'parents': [folder_id]
-            }
-            service.files().create(body=file_metadata, media_body=media, fields='id').execute()
-            
-        logging.info("Successfully uploaded processed episodes log to Google Drive.")
+        delta_name = f"{PROCESSED_DELTA_PREFIX}{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S%fZ')}.log"
+        media = MediaIoBaseUpload(io.BytesIO(('\n'.join(episode_ids) + '\n').encode('utf-8')), mimetype='text/plain')
+        file_metadata = {'name': delta_name, 'parents': [folder_id]}
+        created = service.files().create(body=file_metadata, media_body=media, fields='id, modifiedTime').execute()
+        store.mark_synced(episode_ids)
+
+        # Our own delta doesn't need to be downloaded again on the next sync.
+        merged_files = json.loads(store.get_meta('drive_merged_files', '{}'))
+        merged_files[created['id']] = created.get('modifiedTime')
+        store.set_meta('drive_merged_files', json.dumps(merged_files))
+        logging.info(f"Uploaded {len(episode_ids)} processed episode ID(s) to Google Drive as {delta_name}.")
+
+        files = _list_processed_log_files(service, folder_id)
+        if sum(1 for file in files if file['name'].startswith(PROCESSED_DELTA_PREFIX)) >= PROCESSED_DELTA_COMPACT_AFTER:
+            _compact_processed_log(service, store, folder_id, files)
         return True
-        
+
     except Exception as e:
         logging.error(f"Error uploading processed episodes log to Google Drive: {e}")
         return False
 
-    
\ No newline at end of file
+
+def _compact_processed_log(service, store, folder_id, files):
+    """
+    Rewrites processed_episodes.log on Drive from the local store and deletes the
+    delta files it now covers. Deltas we haven't merged yet (e.g. written by
+    another instance since our last sync) are left alone.
+    """
+    merged_files = json.loads(store.get_meta('drive_merged_files', '{}'))
+    content = ''.join(f"{episode_id}\n" for episode_id in store.iter_processed_ids())
+    media = MediaIoBaseUpload(io.BytesIO(content.encode('utf-8')), mimetype='text/plain')
+
+    main_logs = [file for file in files if file['name'] == PROCESSED_LOG_NAME]
+    if main_logs:
+        logging.info(f"Compacting processed episodes log on Google Drive (ID: {main_logs[0]['id']})...")
+        result = service.files().update(fileId=main_logs[0]['id'], media_body=media, fields='id, modifiedTime').execute()
+    else:
+        logging.info("Creating compacted processed_episodes.log on Google Drive...")
+        file_metadata = {'name': PROCESSED_LOG_NAME, 'parents': [folder_id]}
+        result = service.files().create(body=file_metadata, media_body=media, fields='id, modifiedTime').execute()
+    merged_files[result['id']] = result.get('modifiedTime')
+
+    deleted = 0
+    for file in files:
+        if file['name'].startswith(PROCESSED_DELTA_PREFIX) and merged_files.get(file['id']) == file.get('modifiedTime'):
+            service.files().delete(fileId=file['id']).execute()
+            merged_files.pop(file['id'], None)
+            deleted += 1
+    store.set_meta('drive_merged_files', json.dumps(merged_files))
+    logging.info(f"Compacted processed episodes log on Google Drive; removed {deleted} delta file(s).")
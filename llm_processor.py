@@ -1,48 +1,55 @@
-import logging
-import time
 import os
-import google.generativeai as genai
+import re
+import logging
 import json
-from dotenv import load_dotenv
+import hashlib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import gemini_client
+import transcript_cache
+import transcript_compactor
+import model_router
 
-def process_transcript_with_llm(transcript_text, episode_title):
-    """
-    Processes the transcript text using the Google Gemini API to generate a structured
-    summary, major points, important quotes, and sources.
+# Use gemini-2.5-flash (paid account upgraded)
+SUMMARY_MODEL = 'gemini-2.5-flash'
 
-    Args:
-        transcript_text (str): The full transcript of the podcast episode.
-        episode_title (str): The title of the podcast episode.
-
-    Returns:
-        dict: A dictionary containing the summary, major points, quotes, and sources,
-              or None if an error occurs.
-    """
-    load_dotenv()
-    api_key = os.getenv("GEMINI_API_KEY")
-    if not api_key:
-        logging.error("GEMINI_API_KEY environment variable not found.")
-        return None
+# --- Configuration ---
+# Transcripts estimated above this many tokens are summarized map-reduce style: the transcript is
+# cut into chunks of about SUMMARY_CHUNK_TOKENS at speaker turns, the points, quotes and sources of
+# each chunk are extracted in parallel, and one final call merges them. "0" always uses one call.
+SUMMARY_MAP_REDUCE_ABOVE_TOKENS = int(os.environ.get("SUMMARY_MAP_REDUCE_ABOVE_TOKENS", "60000").strip("'\""))
+SUMMARY_CHUNK_TOKENS = int(os.environ.get("SUMMARY_CHUNK_TOKENS", "15000").strip("'\""))
+# How many chunks are sent to Gemini at once (the shared rate limit still applies).
+SUMMARY_MAP_CONCURRENCY = int(os.environ.get("SUMMARY_MAP_CONCURRENCY", "4").strip("'\""))
+# No single summary request sends more than this many (estimated) tokens. Longer transcripts are
+# summarized in parts, and the notes merged by the final call are trimmed to fit. "0" means no limit.
+SUMMARY_TOKEN_BUDGET = int(os.environ.get("SUMMARY_TOKEN_BUDGET", "120000").strip("'\""))
 
-    response_text = None
-    try:
-        genai.configure(api_key=api_key)
-        # Use gemini-2.5-flash (paid account upgraded)
-        model = genai.GenerativeModel('gemini-2.5-flash')
+# Finished summaries are kept here, so rerunning an episode (after a Drive failure, or to render
+# it again with a new template) costs no Gemini call. On Railway, put this on the persistent volume.
+SUMMARY_CACHE_DIR = os.environ.get("SUMMARY_CACHE_DIR", "summary_cache").strip("'\"")
+# The cache is trimmed to this size, least recently used first, and summaries that haven't been
+# used for SUMMARY_CACHE_TTL_DAYS are dropped ("0" keeps them). SUMMARY_CACHE_MAX_MB="0" disables it.
+SUMMARY_CACHE_MAX_MB = float(os.environ.get("SUMMARY_CACHE_MAX_MB", "50").strip("'\""))
+SUMMARY_CACHE_TTL_DAYS = float(os.environ.get("SUMMARY_CACHE_TTL_DAYS", "180").strip("'\""))
+# Set to "on" to ignore cached summaries and ask Gemini again (the new summaries are still cached).
+SUMMARY_CACHE_BYPASS = os.environ.get("SUMMARY_CACHE_BYPASS", "off").strip("'\"").lower() in ('1', 'true', 'yes', 'on')
 
-        prompt = f"""
-        You are an expert podcast analyst. Your task is to analyze the following podcast transcript for the episode titled "{episode_title}" and provide a structured summary.
+# Bump this whenever the summary prompts or SUMMARY_SCHEMA change, so cached summaries are not reused.
+SUMMARY_PROMPT_VERSION = 1
 
-        Transcript:
-        ---
-        {transcript_text} 
-        ---
+# The part of the budget kept for the instructions around the transcript or the notes.
+PROMPT_OVERHEAD_TOKENS = 1000
 
-        Your response MUST be a single, valid JSON object and nothing else. Do not include any explanatory text or markdown formatting.
+# A new speaker turn starts with a short label and a colon, e.g. "Nilay:" or "**Speaker 2:**".
+SPEAKER_TURN = re.compile(r'^\s*\**\s*[^:*\[\]\n]{1,40}?\s*\**\s*:')
+SENTENCE_END = re.compile(r'(?<=[.!?])\s+')
 
+SUMMARY_FORMAT = """
         Here is an example of the exact format required:
         ```json
-        {{
+        {
           "summary": "This is a concise, one-paragraph summary of the entire podcast episode.",
           "major_points": [
             "This is the first major point or takeaway from the episode.",
@@ -57,46 +64,454 @@ def process_transcript_with_llm(transcript_text, episode_title):
             "First source mentioned, like a book or a person.",
             "Second source mentioned. If none, return an empty list [] here."
           ]
-        }}
+        }
         ```
-        """
+"""
+
+# The same structure as a response schema, for requests that constrain Gemini's output to it.
+SUMMARY_SCHEMA = {
+    'type': 'OBJECT',
+    'properties': {
+        'summary': {'type': 'STRING'},
+        'major_points': {'type': 'ARRAY', 'items': {'type': 'STRING'}},
+        'quotes': {'type': 'ARRAY', 'items': {'type': 'STRING'}},
+        'sources': {'type': 'ARRAY', 'items': {'type': 'STRING'}},
+    },
+    'required': ['summary', 'major_points', 'quotes', 'sources'],
+}
+
+def missing_fields(content_data, schema=SUMMARY_SCHEMA):
+    """Returns the required fields that are missing or have the wrong type (all of them if it's not a dict)."""
+    if not isinstance(content_data, dict):
+        return list(schema['required'])
+    expected_types = {'STRING': str, 'ARRAY': list, 'OBJECT': dict}
+    return [field for field in schema['required']
+            if not isinstance(content_data.get(field), expected_types[schema['properties'][field]['type']])]
+
+class StreamedJsonObject:
+    """
+    Parses a JSON object while it is still arriving, one top-level field at a time.
+
+    feed() takes the next piece of the response and returns the names of the
+    fields it completed, so they can be used before the rest is in. If the
+    response ends before `complete` is set, it was cut short, and `fields`
+    holds everything that arrived intact. Only the text of the field still
+    arriving is buffered; `received` counts the characters fed in total.
+    """
+
+    def __init__(self):
+        self.fields = {}
+        self.complete = False
+        self.received = 0
+        self._buffer = ''
+        self._started = False
+        self._decoder = json.JSONDecoder()
+
+    def _skip(self, position, characters=' \t\r\n'):
+        while position < len(self._buffer) and self._buffer[position] in characters:
+            position += 1
+        return position
 
-        # Call Gemini with basic retry logic to handle potential 429 Rate Limits
-        max_retries = 3
-        delay = 5
-        response = None
-        for attempt in range(max_retries):
+    def feed(self, text):
+        """Adds the next piece of the response and returns the names of the fields it completed."""
+        self.received += len(text)
+        self._buffer += text
+        completed = []
+        if not self._started:
+            # Anything before the object, such as a ```json fence, is ignored.
+            start = self._buffer.find('{')
+            if start == -1:
+                return completed
+            self._buffer = self._buffer[start + 1:]
+            self._started = True
+
+        consumed = 0
+        while not self.complete:
+            position = self._skip(consumed, ' \t\r\n,')
+            if position >= len(self._buffer):
+                break
+            if self._buffer[position] == '}':
+                self.complete = True
+                break
             try:
-                response = model.generate_content(prompt)
+                key, position = self._decoder.raw_decode(self._buffer, position)
+                position = self._skip(position)
+                if self._buffer[position:position + 1] != ':':
+                    break
+                value, end = self._decoder.raw_decode(self._buffer, self._skip(position + 1))
+            except ValueError:
+                # The field is still arriving (or is malformed, in which case it never completes).
+                break
+            # A value is only known to be whole once something follows it ("12" could still become "123").
+            if not isinstance(key, str) or self._skip(end) >= len(self._buffer):
                 break
-            except Exception as e:
-                if "429" in str(e) or "ResourceExhausted" in type(e).__name__:
-                    if attempt == max_retries - 1:
-                        raise
-                    logging.warning(f"Gemini API rate limit hit (429). Retrying in {delay} seconds...")
-                    time.sleep(delay)
-                    delay *= 2
-                else:
-                    raise
-
-        if response:
-            response_text = response.text
-        
-        # Clean up potential markdown formatting (like ```json) from the response.
-        if response_text.strip().startswith("```json"):
-            response_text = response_text.strip()[7:-3].strip()
-            
-        # Parse the cleaned text string into a Python dictionary.
-        content_data = json.loads(response_text)
+            self.fields[key] = value
+            completed.append(key)
+            consumed = end
+        # Drop the completed fields, so each feed only copies and decodes the one still arriving.
+        if consumed:
+            self._buffer = self._buffer[consumed:]
+        return completed
+
+def _stream_json(prompt, schema, on_field=None, models=None):
+    """
+    Streams a response constrained to `schema` and parses it as it arrives.
+    The model that answered is appended to `models`, if given.
+
+    Returns:
+        dict: The fields that arrived intact. A stream that breaks off keeps
+              the fields completed before the break.
+    """
+    generation_config = {'response_mime_type': 'application/json', 'response_schema': schema}
+    parser = StreamedJsonObject()
+    prompt_tokens = gemini_client.estimate_text_tokens(prompt)
+    model_name = model_router.choose('summary', SUMMARY_MODEL, tokens=prompt_tokens)
+    if models is not None:
+        models.append(model_name)
+    usage = {}
+    started = time.monotonic()
+    try:
+        # Rate limiting and retries are handled by the shared client.
+        for text in gemini_client.stream_content(model_name, prompt, usage=usage, generation_config=generation_config):
+            for field in parser.feed(text):
+                if on_field:
+                    on_field(field, parser.fields[field])
+    except Exception as e:
+        model_router.observe('summary', model_name, started, prompt_tokens, usage=usage, failed=True)
+        if not parser.fields:
+            raise
+        logging.warning(f"The Gemini response stream broke off ({e}). Keeping the {len(parser.fields)} field(s) received.")
+        return parser.fields
+    if not parser.complete:
+        logging.warning(f"The Gemini response was cut short after {parser.received} characters.")
+    model_router.observe(
+        'summary', model_name, started, prompt_tokens, usage=usage,
+        failed=not parser.complete or bool(missing_fields(parser.fields, schema))
+    )
+    return parser.fields
+
+def _generate_json(prompt, schema=SUMMARY_SCHEMA, on_field=None, models=None):
+    """
+    Requests JSON matching `schema` and fills in any fields missing from a truncated or malformed answer.
+
+    The repair pass asks again for the missing fields only, with the fields
+    that did arrive as context, instead of regenerating the whole answer.
+    The models that answered are appended to `models`, if given.
+
+    Returns:
+        dict: Every required field of `schema`.
+
+    Raises:
+        ValueError: If fields are still missing after the repair pass.
+    """
+    content_data = _stream_json(prompt, schema, on_field, models)
+    missing = missing_fields(content_data, schema)
+    if missing:
+        logging.warning(f"Gemini's response is missing {', '.join(missing)}. Requesting only those fields again.")
+        repair_schema = {
+            'type': 'OBJECT',
+            'properties': {field: schema['properties'][field] for field in missing},
+            'required': missing,
+        }
+        received = {field: value for field, value in content_data.items() if field not in missing}
+        repair_prompt = (
+            f"{prompt}\n"
+            f"        Part of the answer was already received: {json.dumps(received, ensure_ascii=False)}\n"
+            f"        Return only the remaining fields: {', '.join(missing)}.\n"
+        )
+        content_data.update(_stream_json(repair_prompt, repair_schema, on_field, models))
+        missing = missing_fields(content_data, schema)
+        if missing:
+            raise ValueError(f"Gemini's response is still missing {', '.join(missing)} after the repair pass")
+    return {field: content_data[field] for field in schema['properties'] if field in content_data}
+
+def _split_long_text(text, max_tokens):
+    """Splits a single oversized turn at sentence ends, or between words if a sentence is too long on its own."""
+    pieces, current, current_tokens = [], [], 0
+    for sentence in SENTENCE_END.split(text):
+        units = [sentence] if gemini_client.estimate_text_tokens(sentence) <= max_tokens else sentence.split(' ')
+        for unit in units:
+            unit_tokens = gemini_client.estimate_text_tokens(unit)
+            if current and current_tokens + unit_tokens > max_tokens:
+                pieces.append(' '.join(current))
+                current, current_tokens = [], 0
+            current.append(unit)
+            current_tokens += unit_tokens
+    if current:
+        pieces.append(' '.join(current))
+    return pieces
+
+def _available_tokens(preferred=None):
+    """The tokens one request may carry besides its instructions, within SUMMARY_TOKEN_BUDGET."""
+    if SUMMARY_TOKEN_BUDGET <= 0:
+        return preferred
+    available = max(1, SUMMARY_TOKEN_BUDGET - PROMPT_OVERHEAD_TOKENS)
+    return min(preferred, available) if preferred else available
+
+def split_transcript(transcript_text, max_tokens=None):
+    """
+    Splits a transcript into chunks of at most `max_tokens` (estimated), cutting only between speaker turns.
+
+    A turn that is longer than a whole chunk on its own is split at sentence ends.
+
+    Args:
+        transcript_text (str): The diarized transcript.
+        max_tokens (int): The budget per chunk (SUMMARY_CHUNK_TOKENS, within SUMMARY_TOKEN_BUDGET, by default).
+
+    Returns:
+        list: The chunks, in order.
+    """
+    max_tokens = max_tokens or _available_tokens(SUMMARY_CHUNK_TOKENS)
+    turns = []
+    for line in transcript_text.splitlines():
+        if not line.strip():
+            continue
+        if SPEAKER_TURN.match(line) or not turns:
+            turns.append(line.strip())
+        else:
+            turns[-1] = f"{turns[-1]}\n{line.strip()}"
+
+    chunks, current, current_tokens = [], [], 0
+    for turn in turns:
+        turn_tokens = gemini_client.estimate_text_tokens(turn)
+        pieces = [turn] if turn_tokens <= max_tokens else _split_long_text(turn, max_tokens)
+        for piece in pieces:
+            piece_tokens = gemini_client.estimate_text_tokens(piece)
+            if current and current_tokens + piece_tokens > max_tokens:
+                chunks.append('\n\n'.join(current))
+                current, current_tokens = [], 0
+            current.append(piece)
+            current_tokens += piece_tokens
+    if current:
+        chunks.append('\n\n'.join(current))
+    return chunks
+
+def _should_map_reduce(transcript_text):
+    transcript_tokens = gemini_client.estimate_text_tokens(transcript_text)
+    if transcript_tokens > _available_tokens(transcript_tokens):
+        return True
+    if SUMMARY_MAP_REDUCE_ABOVE_TOKENS <= 0:
+        return False
+    return transcript_tokens > SUMMARY_MAP_REDUCE_ABOVE_TOKENS
 
+def _extract_chunk(chunk, index, count, episode_title, models=None):
+    """The map step: asks for the summary, points, quotes and sources of one part of the episode."""
+    prompt = f"""
+        You are an expert podcast analyst. The following is part {index + 1} of {count} of the transcript of the podcast episode titled "{episode_title}".
+        Extract what matters in this part only. Other parts are analyzed separately and merged later.
+
+        Transcript part:
+        ---
+        {chunk}
+        ---
+
+        Fill in "summary" (two or three sentences about this part), "major_points", "quotes" (verbatim) and
+        "sources" (books, people, articles, studies or links mentioned; an empty list if there are none).
+        """
+    extraction = _generate_json(prompt, models=models)
+    logging.info(f"Extracted part {index + 1}/{count} of the transcript.")
+    return extraction
+
+def _unique(items):
+    """Drops repeated entries (ignoring case, punctuation and spacing), keeping the first."""
+    seen = set()
+    unique_items = []
+    for item in items:
+        if not isinstance(item, str) or not item.strip():
+            continue
+        normalized = re.sub(r'[^\w]+', ' ', item.casefold()).strip()
+        if normalized in seen:
+            continue
+        seen.add(normalized)
+        unique_items.append(item.strip())
+    return unique_items
+
+def merge_extractions(extractions):
+    """
+    Combines the per-chunk extractions into one summary dict without calling the LLM.
+
+    Used as the input of the reduce step, and as the result if the reduce step fails.
+    """
+    return {
+        'summary': ' '.join(e.get('summary', '').strip() for e in extractions if e.get('summary')),
+        'major_points': _unique(point for e in extractions for point in e.get('major_points', [])),
+        'quotes': _unique(quote for e in extractions for quote in e.get('quotes', [])),
+        'sources': _unique(source for e in extractions for source in e.get('sources', [])),
+    }
+
+def _fit_notes(notes, max_tokens):
+    """Drops the last entries of the longest lists until the notes fit in `max_tokens`."""
+    notes = {key: list(values) for key, values in notes.items()}
+    while gemini_client.estimate_text_tokens(json.dumps(notes, ensure_ascii=False)) > max_tokens:
+        longest = max(notes, key=lambda key: len(notes[key]))
+        if not notes[longest]:
+            break
+        notes[longest].pop()
+    return notes
+
+def _reduce_extractions(extractions, episode_title, on_field=None, models=None):
+    """The reduce step: merges and dedupes the chunk extractions into the final summary."""
+    merged = merge_extractions(extractions)
+    notes = {key: merged[key] for key in ('major_points', 'quotes', 'sources')}
+    available = _available_tokens()
+    if available:
+        notes = _fit_notes(notes, available - gemini_client.estimate_text_tokens(merged['summary']))
+    part_summaries = '\n'.join(f"Part {i + 1}: {e.get('summary', '')}" for i, e in enumerate(extractions))
+    prompt = f"""
+        You are an expert podcast analyst. The podcast episode titled "{episode_title}" was analyzed in {len(extractions)} parts.
+        Combine the notes below into a structured summary of the whole episode.
+        Write one paragraph summarizing the entire episode. Merge points that say the same thing, keep the most
+        important points, the most memorable quotes (verbatim) and every distinct source.
+
+        Part summaries:
+        ---
+        {part_summaries}
+        ---
+
+        Notes:
+        ---
+        {json.dumps(notes, ensure_ascii=False, indent=1)}
+        ---
+
+        {SUMMARY_FORMAT}
+        """
+    try:
+        return _generate_json(prompt, on_field=on_field, models=models)
+    except Exception as e:
+        logging.error(f"Failed to merge the transcript parts with Gemini ({e}). Using the parts merged locally.")
+        return merged
+
+def _summarize_map_reduce(transcript_text, episode_title, on_field=None, models=None):
+    chunks = split_transcript(transcript_text)
+    logging.info(
+        f"Transcript is about {gemini_client.estimate_text_tokens(transcript_text)} tokens. Summarizing it as "
+        f"{len(chunks)} part(s), {SUMMARY_MAP_CONCURRENCY} at a time..."
+    )
+    with ThreadPoolExecutor(max_workers=max(1, min(SUMMARY_MAP_CONCURRENCY, len(chunks)))) as executor:
+        futures = [executor.submit(_extract_chunk, chunk, index, len(chunks), episode_title, models)
+                   for index, chunk in enumerate(chunks)]
+        extractions = [future.result() for future in futures]
+    return _reduce_extractions(extractions, episode_title, on_field, models)
+
+_summary_cache = None
+_summary_cache_lock = threading.Lock()
+
+def get_summary_cache():
+    """Returns the process-wide summary cache."""
+    global _summary_cache
+    with _summary_cache_lock:
+        if _summary_cache is None:
+            _summary_cache = transcript_cache.TranscriptCache(
+                SUMMARY_CACHE_DIR, int(SUMMARY_CACHE_MAX_MB * 1024 * 1024),
+                max_age_seconds=SUMMARY_CACHE_TTL_DAYS * 24 * 3600, label="Summary cache"
+            )
+        return _summary_cache
+
+def _prepare_transcript(transcript_text, log=True):
+    """Compacts the transcript for the LLM, if TRANSCRIPT_COMPACTION is on."""
+    if not transcript_compactor.TRANSCRIPT_COMPACTION:
+        return transcript_text
+    compacted = transcript_compactor.compact_transcript(transcript_text)
+    if log:
+        transcript_compactor.log_reduction(compacted)
+    return compacted['text']
+
+def summary_cache_key(prepared_transcript, episode_title, model=SUMMARY_MODEL):
+    """
+    Builds the cache key of a summary from everything that goes into the
+    request: the model that made it, the prompt version, the episode title
+    and a hash of the (compacted) transcript.
+    """
+    transcript_hash = hashlib.sha256(prepared_transcript.encode('utf-8')).hexdigest()
+    return transcript_cache.derive_key(transcript_hash, model, SUMMARY_PROMPT_VERSION, episode_title)
+
+def cache_summary(transcript_text, episode_title, content_data, model=SUMMARY_MODEL):
+    """Stores a summary made elsewhere (e.g. together with the transcript, by `model`) as if it came from process_transcript_with_llm()."""
+    cache_key = summary_cache_key(_prepare_transcript(transcript_text, log=False), episode_title, model)
+    get_summary_cache().put(cache_key, json.dumps(content_data, ensure_ascii=False))
+
+def _cached_summary(prepared_transcript, episode_title, on_field=None):
+    """
+    Looks up a summary made by SUMMARY_MODEL, or by the light model while
+    routing may use it (see model_router.cache_models()).
+    """
+    cache = get_summary_cache()
+    if not cache.enabled or SUMMARY_CACHE_BYPASS:
+        return None
+    for model in model_router.cache_models(SUMMARY_MODEL):
+        cached = cache.get(summary_cache_key(prepared_transcript, episode_title, model))
+        if not cached:
+            continue
+        try:
+            content_data = json.loads(cached)
+        except json.JSONDecodeError:
+            continue
+        if not missing_fields(content_data):
+            break
+    else:
+        return None
+    logging.info(f"Found a cached summary by {model} for this transcript. Skipping the Gemini call.")
+    if on_field:
+        for field, value in content_data.items():
+            on_field(field, value)
+    return content_data
+
+def process_transcript_with_llm(transcript_text, episode_title, on_field=None):
+    """
+    Processes the transcript text using the Google Gemini API to generate a structured
+    summary, major points, important quotes, and sources.
+
+    The response is constrained to SUMMARY_SCHEMA and streamed; each field is
+    parsed as soon as it's complete. If the response is cut short or a field
+    is malformed, only the missing fields are requested again. The transcript
+    is compacted first (see transcript_compactor.py). Transcripts above
+    SUMMARY_MAP_REDUCE_ABOVE_TOKENS, or too long for SUMMARY_TOKEN_BUDGET, are
+    summarized in parallel parts that are merged in a final call. Summaries
+    are cached on disk (see SUMMARY_CACHE_DIR), so the same transcript is
+    never summarized twice.
+
+    Args:
+        transcript_text (str): The full transcript of the podcast episode.
+        episode_title (str): The title of the podcast episode.
+        on_field (callable): Called with (field name, value) as each field of the summary arrives.
+
+    Returns:
+        dict: A dictionary containing the summary, major points, quotes, and sources,
+              or None if an error occurs.
+    """
+    try:
+        transcript_text = _prepare_transcript(transcript_text)
+        content_data = _cached_summary(transcript_text, episode_title, on_field)
+        if content_data:
+            return content_data
+
+        if not gemini_client.configure():
+            return None
+
+        models = []
+        if _should_map_reduce(transcript_text):
+            content_data = _summarize_map_reduce(transcript_text, episode_title, on_field, models)
+        else:
+            prompt = f"""
+        You are an expert podcast analyst. Your task is to analyze the following podcast transcript for the episode titled "{episode_title}" and provide a structured summary.
+
+        Transcript:
+        ---
+        {transcript_text}
+        ---
+        {SUMMARY_FORMAT}
+        """
+            content_data = _generate_json(prompt, on_field=on_field, models=models)
+
+        # Cached under the model that made it, so a light-model summary never stands in for the standard one.
+        cache_key = summary_cache_key(transcript_text, episode_title, model_router.result_model(SUMMARY_MODEL, models))
+        get_summary_cache().put(cache_key, json.dumps(content_data, ensure_ascii=False))
         logging.info("Gemini summary processing complete.")
         return content_data
 
-    except json.JSONDecodeError as e:
-        # This error handles cases where the LLM returns text that isn't valid JSON.
-        logging.error(f"Failed to decode JSON from Gemini response: {e}")
-        if response_text:
-            logging.error(f"--- START OF INVALID SUMMARY RESPONSE ---\n{response_text}\n--- END OF INVALID SUMMARY RESPONSE ---")
+    except ValueError as e:
+        # The response stayed incomplete even after asking again for the missing fields.
+        logging.error(f"Failed to get a complete summary from Gemini: {e}")
         return None
     except Exception as e:
         # This is a general catch-all for any other unexpected errors.
@@ -110,4 +525,3 @@ def diarize_transcript_with_llm(transcript_text):
     """
     logging.info("Transcript was already diarized natively. Skipping secondary formatting.")
     return transcript_text
-
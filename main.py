@@ -1,4 +1,5 @@
 import os
+import json
 from dotenv import load_dotenv
 # Load environment variables at the very start
 load_dotenv()
@@ -11,9 +12,16 @@ import time
 import podcast_fetcher
 import transcriber
 import llm_processor
-import epub_generator
-import md_generator
+import episode_document
+import render_executor
+import digest_builder
 import google_drive_uploader
+import feed_scheduler
+import episode_store
+import episode_dedupe
+import transcript_cache
+import gemini_client
+import model_router
 
 # --- Configuration ---
 # Set up a logger to see the application's progress and any errors.
@@ -27,33 +35,197 @@ GOOGLE_DRIVE_MD_FOLDER_ID = os.environ.get("GOOGLE_DRIVE_MD_FOLDER_ID", "").stri
 RSS_FEEDS_FILE = 'rss_feeds.txt'
 OUTPUT_DIR = 'output_epubs'
 OUTPUT_MD_DIR = 'output_md'
-PROCESSED_LOG_FILE = os.environ.get("PROCESSED_LOG_FILE", "processed_episodes.log").strip("'\"")
+# "fixed" polls every feed on the RUN_* schedule, "adaptive" polls each feed based on its publishing cadence.
+POLL_MODE = os.environ.get("POLL_MODE", "fixed").strip("'\"").lower()
 
-def _log_processed_episode(episode_id):
-    """Appends a successfully processed episode ID to the log file and syncs it to Google Drive."""
+def _record_stage(episode, status):
+    """Records how far an episode has got through the pipeline in the episode store."""
     try:
-        # Ensure parent directory of PROCESSED_LOG_FILE exists
-        dir_name = os.path.dirname(PROCESSED_LOG_FILE)
-        if dir_name and not os.path.exists(dir_name):
-            os.makedirs(dir_name, exist_ok=True)
-
-        # We open the file in 'append' mode ('a') to add the new ID to the end.
-        with open(PROCESSED_LOG_FILE, 'a') as f:
-            f.write(f"{episode_id}\n")
-        logging.info(f"Successfully logged episode {episode_id} as processed.")
+        episode_store.get_store().set_status(episode['id'], status, episode.get('feed_url'), episode.get('published'))
+    except Exception as e:
+        logging.error(f"Failed to record stage '{status}' for episode {episode['id']}: {e}")
+
+
+def _log_processed_episode(episode, canonical_id=None):
+    """
+    Marks a successfully processed episode in the episode store and syncs the new ID to Google Drive.
+    The episode is also indexed by its dedupe fingerprints, so a copy in another feed or a
+    republished version is recognized later. `canonical_id` is set for duplicates of another episode.
+    """
+    try:
+        store = episode_store.get_store()
+        store.mark_processed(episode['id'], episode.get('feed_url'), episode.get('published'))
+        store.add_fingerprints(canonical_id or episode['id'], episode_dedupe.fingerprint_keys(episode))
+        if canonical_id:
+            store.add_alias(episode['id'], canonical_id)
+        logging.info(f"Successfully logged episode {episode['id']} as processed.")
         
-        # Sync the log file to Google Drive
+        # Only the IDs Drive doesn't have yet are uploaded, not the whole history.
         if GOOGLE_DRIVE_FOLDER_ID != "YOUR_GOOGLE_DRIVE_FOLDER_ID":
-            logging.info("Syncing updated processed episodes log to Google Drive...")
-            google_drive_uploader.upload_processed_log_to_drive(PROCESSED_LOG_FILE, GOOGLE_DRIVE_FOLDER_ID)
+            logging.info("Syncing new processed episode IDs to Google Drive...")
+            google_drive_uploader.upload_processed_delta_to_drive(store, GOOGLE_DRIVE_FOLDER_ID)
     except Exception as e:
-        logging.error(f"Failed to write to processed log for episode {episode_id}: {e}")
+        logging.error(f"Failed to write to processed log for episode {episode['id']}: {e}")
+
+
+def _get_feed_urls():
+    """
+    Returns the list of feed URLs to monitor. The RSS_FEEDS environment variable
+    (comma, semicolon or newline separated) overrides the local rss_feeds.txt file.
+    """
+    rss_feeds_env = os.environ.get("RSS_FEEDS") or os.environ.get("RSS_FEED")
+    if rss_feeds_env:
+        logging.info("RSS_FEEDS environment variable found. Parsing feeds from environment...")
+        # Strip leading/trailing quotes from the whole env var string (common issue when pasting)
+        rss_feeds_env_cleaned = rss_feeds_env.strip("'\"")
+        return [url.strip().strip("'\"") for url in rss_feeds_env_cleaned.replace(",", "\n").replace(";", "\n").split("\n") if url.strip()]
+
+    try:
+        with open(RSS_FEEDS_FILE, 'r') as f:
+            return [line.strip() for line in f if line.strip()]
+    except FileNotFoundError:
+        logging.error(f"The RSS feeds file was not found at: {RSS_FEEDS_FILE}")
+        return []
 
 
-def process_podcasts():
+def _publish_episode(renderer, episode, processed_content, formatted_transcript, canonical_id=None):
+    """
+    Starts rendering the ePub and Markdown files of an episode. The render
+    executor uploads them when they're done (see _upload_episode()).
+
+    Args:
+        renderer (render_executor.RenderExecutor): Renders and uploads the files.
+        canonical_id (str): Set for duplicates of another episode.
+    """
+    # Output file names
+    sanitized_episode_title = "".join(c for c in episode['title'] if c.isalnum() or c in (' ', '.', '_')).rstrip()
+    current_date = time.strftime("%Y-%m-%d")
+    file_name = f"{current_date}_{episode['podcast_title']}_{sanitized_episode_title}.epub"
+    file_path = os.path.join(OUTPUT_DIR, file_name)
+    md_file_name = f"{current_date}_{episode['podcast_title']}_{sanitized_episode_title}.md"
+    md_file_path = os.path.join(OUTPUT_MD_DIR, md_file_name)
+
+    # Both formats are rendered from one document (see episode_document.py).
+    logging.info("Generating ePub and Markdown files...")
+    document = episode_document.build_document(
+        title=episode['title'],
+        podcast_name=episode['podcast_title'],
+        summary=processed_content['summary'],
+        major_points=processed_content['major_points'],
+        quotes=processed_content['quotes'],
+        sources=processed_content['sources'],
+        transcript=formatted_transcript,
+        date=current_date
+    )
+    outputs = {'epub': file_path, 'markdown': md_file_path}
+    if digest_builder.is_enabled() and not canonical_id:
+        # The episode's chapters for the daily or weekly digest, added to it once rendered.
+        # A duplicate from another feed would only repeat them.
+        outputs['digest'] = digest_builder.fragment_path(episode['id'])
+    renderer.submit(document, outputs, {'episode': episode, 'canonical_id': canonical_id, **outputs})
+
+
+def _cache_published_content(episode_id, processed_content, formatted_transcript):
+    """
+    Keeps the summary and transcript an episode is published with, so a republished
+    copy found in a later run (see episode_dedupe.collapse_duplicates()) gets its own
+    files without being transcribed and summarized again.
+    """
+    key = transcript_cache.derive_key('published', episode_id)
+    transcript_cache.get_cache().put(key, json.dumps({'content': processed_content, 'transcript': formatted_transcript}))
+
+
+def _cached_published_content(episode_id):
+    """
+    Returns:
+        tuple: The (processed_content, formatted_transcript) an episode was published with, or (None, None).
+    """
+    cached = transcript_cache.get_cache().get(transcript_cache.derive_key('published', episode_id))
+    if not cached:
+        return None, None
+    try:
+        published = json.loads(cached)
+        return published['content'], published['transcript']
+    except (ValueError, KeyError, TypeError) as e:
+        logging.warning(f"Ignoring the unreadable published content of episode {episode_id}: {e}")
+        return None, None
+
+
+def _upload_episode(job, results):
+    """
+    Uploads an episode's rendered files to Google Drive and marks the episode
+    as processed if everything succeeded. Runs on the render executor's upload thread.
+
+    Args:
+        job (dict): The episode, its canonical_id and the 'epub', 'markdown' (and 'digest') output paths.
+        results (dict): {'epub': rendered?, 'markdown': rendered?, 'digest': rendered?}.
+    """
+    episode = job['episode']
+    file_path, md_file_path = job['epub'], job['markdown']
+    file_name, md_file_name = os.path.basename(file_path), os.path.basename(md_file_path)
+    rendered = results.get('epub') and results.get('markdown')
+    if results.get('epub'):
+        logging.info(f"ePub file created at: {file_path}")
+    if results.get('markdown'):
+        logging.info(f"Markdown file created at: {md_file_path}")
+    if rendered:
+        _record_stage(episode, episode_store.STATUS_RENDERED)
+    skip_epub_upload = digest_builder.is_enabled() and not digest_builder.DIGEST_UPLOAD_EPISODES
+
+    # Upload ePub to Google Drive
+    epub_upload_successful = False
+    if not results.get('epub'):
+        logging.error(f"The ePub for '{episode['title']}' could not be generated. Skipping ePub upload.")
+    elif skip_epub_upload:
+        logging.info("Episode ePubs are published in the digest only. Skipping ePub upload.")
+    elif GOOGLE_DRIVE_FOLDER_ID and GOOGLE_DRIVE_FOLDER_ID != "YOUR_GOOGLE_DRIVE_FOLDER_ID":
+        logging.info("Uploading ePub to Google Drive...")
+        epub_upload_successful = google_drive_uploader.upload_file_to_drive(file_path, GOOGLE_DRIVE_FOLDER_ID)
+        if epub_upload_successful:
+            logging.info(f"Successfully uploaded '{file_name}' to Google Drive.")
+        else:
+            logging.error(f"Failed to upload '{file_name}' to Google Drive.")
+    else:
+        logging.warning("Google Drive Folder ID for ePub is not set. Skipping ePub upload.")
+
+    # Upload Markdown to Google Drive
+    md_upload_successful = False
+    if not results.get('markdown'):
+        logging.error(f"The Markdown file for '{episode['title']}' could not be generated. Skipping Markdown upload.")
+    elif GOOGLE_DRIVE_MD_FOLDER_ID and GOOGLE_DRIVE_MD_FOLDER_ID != "YOUR_GOOGLE_DRIVE_MD_FOLDER_ID" and GOOGLE_DRIVE_MD_FOLDER_ID != "your-google-drive-md-folder-id-here":
+        logging.info("Uploading Markdown to Google Drive...")
+        md_upload_successful = google_drive_uploader.upload_file_to_drive(md_file_path, GOOGLE_DRIVE_MD_FOLDER_ID)
+        if md_upload_successful:
+            logging.info(f"Successfully uploaded '{md_file_name}' to Google Drive.")
+        else:
+            logging.error(f"Failed to upload '{md_file_name}' to Google Drive.")
+    else:
+        logging.warning("Google Drive Folder ID for Markdown is not set/configured. Skipping Markdown upload.")
+
+    # The episode counts as published if both files were rendered and both uploads succeeded (or were skipped).
+    epub_ok = skip_epub_upload or (not GOOGLE_DRIVE_FOLDER_ID or GOOGLE_DRIVE_FOLDER_ID == "YOUR_GOOGLE_DRIVE_FOLDER_ID") or epub_upload_successful
+    md_ok = (not GOOGLE_DRIVE_MD_FOLDER_ID or GOOGLE_DRIVE_MD_FOLDER_ID == "YOUR_GOOGLE_DRIVE_MD_FOLDER_ID" or GOOGLE_DRIVE_MD_FOLDER_ID == "your-google-drive-md-folder-id-here") or md_upload_successful
+
+    if not (rendered and epub_ok and md_ok):
+        if 'digest' in results:
+            logging.warning(f"'{episode['title']}' was not published, so it's left out of the digest until it is.")
+        return
+    # Only published episodes go into the digest, which is uploaded once at the end of the run.
+    if results.get('digest'):
+        digest_builder.add_episode(job['digest'], episode['id'])
+    elif 'digest' in results:
+        logging.error(f"'{episode['title']}' could not be added to the digest.")
+    _log_processed_episode(episode, canonical_id=job['canonical_id'])
+
+
+def process_podcasts(feed_urls=None, observations=None):
     """
     The main function that orchestrates the entire process of fetching,
     processing, and uploading podcast episodes.
+
+    Args:
+        feed_urls (list): The feeds to check. Defaults to every configured feed.
+        observations (dict): Passed to podcast_fetcher to collect publish times per feed.
     """
     # ... (code for starting up and creating output dir remains the same) ...
     logging.info("Starting the daily podcast check...")
@@ -69,27 +241,12 @@ def process_podcasts():
     # Sync processed log from Google Drive at the beginning of the check
     if GOOGLE_DRIVE_FOLDER_ID != "YOUR_GOOGLE_DRIVE_FOLDER_ID":
         logging.info("Syncing processed episodes log from Google Drive...")
-        google_drive_uploader.download_processed_log_from_drive(PROCESSED_LOG_FILE, GOOGLE_DRIVE_FOLDER_ID)
+        google_drive_uploader.sync_processed_store_from_drive(episode_store.get_store(), GOOGLE_DRIVE_FOLDER_ID)
 
     logging.info("Fetching new podcast episodes...")
-    feeds_file = RSS_FEEDS_FILE
-    rss_feeds_env = os.environ.get("RSS_FEEDS") or os.environ.get("RSS_FEED")
-    if rss_feeds_env:
-        logging.info("RSS_FEEDS environment variable found. Parsing feeds from environment...")
-        # Strip leading/trailing quotes from the whole env var string (common issue when pasting)
-        rss_feeds_env_cleaned = rss_feeds_env.strip("'\"")
-        urls = [url.strip().strip("'\"") for url in rss_feeds_env_cleaned.replace(",", "\n").replace(";", "\n").split("\n") if url.strip()]
-        feeds_file = 'rss_feeds_temp.txt'
-        with open(feeds_file, 'w') as f:
-            f.write("\n".join(urls))
-            
-    new_episodes = podcast_fetcher.get_new_episodes(feeds_file)
-    
-    if feeds_file == 'rss_feeds_temp.txt' and os.path.exists(feeds_file):
-        try:
-            os.remove(feeds_file)
-        except Exception as e:
-            logging.error(f"Failed to clean up temporary feeds file: {e}")
+    if feed_urls is None:
+        feed_urls = _get_feed_urls()
+    new_episodes = podcast_fetcher.get_new_episodes(feed_urls=feed_urls, observations=observations)
 
     if not new_episodes:
         logging.info("Podcast check finished.")
@@ -97,25 +254,56 @@ def process_podcasts():
 
     logging.info(f"Found {len(new_episodes)} new episode(s).")
 
+    # Files are rendered in worker processes and uploaded on another thread while the next episode is transcribed.
+    renderer = render_executor.RenderExecutor(upload=_upload_episode)
     for episode in new_episodes:
         # ... (the main 'try' block for processing an episode remains the same) ...
         logging.info(f"Processing episode: '{episode['title']}' from '{episode['podcast_title']}'")
 
         try:
+            # A republished copy of an episode processed in an earlier run gets its own files
+            # from that episode's transcript and summary. If they're no longer cached, it's processed again.
+            if episode.get('duplicate_of'):
+                canonical_id = episode['duplicate_of']
+                processed_content, formatted_transcript = _cached_published_content(canonical_id)
+                if processed_content:
+                    logging.info(f"Publishing '{episode['title']}' from '{episode['podcast_title']}' (repeat of episode {canonical_id})...")
+                    _publish_episode(renderer, episode, processed_content, formatted_transcript, canonical_id=canonical_id)
+                    continue
+                logging.warning(f"The transcript and summary of episode {canonical_id} are no longer cached. Processing '{episode['title']}' again.")
+
+            # Optionally transcribe and summarize in one request. If that's off or fails,
+            # the transcription and the summary below are done as separate calls.
+            raw_transcript, processed_content = None, None
+            if transcriber.TRANSCRIBE_WITH_SUMMARY:
+                models = []
+                raw_transcript, processed_content = transcriber.transcribe_and_summarize_episode(episode, models)
+                if processed_content:
+                    # Cached like a separate summary (under the model that made it), so a rerun
+                    # of the episode costs no call at all.
+                    llm_processor.cache_summary(
+                        raw_transcript, episode['title'], processed_content,
+                        model_router.result_model(llm_processor.SUMMARY_MODEL, models)
+                    )
+
             # Transcribe the episode
-            raw_transcript = transcriber.transcribe_episode(episode)
+            if not raw_transcript:
+                raw_transcript = transcriber.transcribe_episode(episode)
             if not raw_transcript:
                 logging.warning(f"Transcription failed for '{episode['title']}'. Skipping.")
                 continue
             logging.info("Transcription successful.")
+            _record_stage(episode, episode_store.STATUS_TRANSCRIBED)
 
             # Process with LLM for Summarization
-            logging.info("Generating content summary with LLM...")
-            processed_content = llm_processor.process_transcript_with_llm(raw_transcript, episode['title'])
+            if not processed_content:
+                logging.info("Generating content summary with LLM...")
+                processed_content = llm_processor.process_transcript_with_llm(raw_transcript, episode['title'])
             if not processed_content:
                 logging.warning(f"LLM content generation failed for '{episode['title']}'. Skipping.")
                 continue
             logging.info("LLM content generation successful.")
+            _record_stage(episode, episode_store.STATUS_SUMMARIZED)
             logging.info(f"LLM generated content: {processed_content}")
 
             # Format Transcript with LLM for Diarization
@@ -125,85 +313,62 @@ def process_podcasts():
                 logging.warning(f"LLM diarization failed for '{episode['title']}'. Using raw transcript.")
                 formatted_transcript = raw_transcript
             
-            # Generate ePub
-            sanitized_episode_title = "".join(c for c in episode['title'] if c.isalnum() or c in (' ', '.', '_')).rstrip()
-            current_date = time.strftime("%Y-%m-%d")
-            file_name = f"{current_date}_{episode['podcast_title']}_{sanitized_episode_title}.epub"
-            file_path = os.path.join(OUTPUT_DIR, file_name)
-            
-            logging.info("Generating ePub file...")
-            epub_generator.create_epub(
-                title=episode['title'],
-                podcast_name=episode['podcast_title'],
-                summary=processed_content['summary'],
-                major_points=processed_content['major_points'],
-                quotes=processed_content['quotes'],
-                sources=processed_content['sources'],
-                transcript=formatted_transcript,
-                file_path=file_path
-            )
-            logging.info(f"ePub file created at: {file_path}")
-
-            # Generate Markdown
-            md_file_name = f"{current_date}_{episode['podcast_title']}_{sanitized_episode_title}.md"
-            md_file_path = os.path.join(OUTPUT_MD_DIR, md_file_name)
-            
-            logging.info("Generating Markdown file...")
-            md_generator.create_markdown(
-                title=episode['title'],
-                podcast_name=episode['podcast_title'],
-                summary=processed_content['summary'],
-                major_points=processed_content['major_points'],
-                quotes=processed_content['quotes'],
-                sources=processed_content['sources'],
-                transcript=formatted_transcript,
-                file_path=md_file_path
-            )
-            logging.info(f"Markdown file created at: {md_file_path}")
-
-            # Upload ePub to Google Drive
-            epub_upload_successful = False
-            if GOOGLE_DRIVE_FOLDER_ID and GOOGLE_DRIVE_FOLDER_ID != "YOUR_GOOGLE_DRIVE_FOLDER_ID":
-                logging.info("Uploading ePub to Google Drive...")
-                epub_upload_successful = google_drive_uploader.upload_file_to_drive(file_path, GOOGLE_DRIVE_FOLDER_ID)
-                if epub_upload_successful:
-                    logging.info(f"Successfully uploaded '{file_name}' to Google Drive.")
-                else:
-                    logging.error(f"Failed to upload '{file_name}' to Google Drive.")
-            else:
-                logging.warning("Google Drive Folder ID for ePub is not set. Skipping ePub upload.")
-
-            # Upload Markdown to Google Drive
-            md_upload_successful = False
-            if GOOGLE_DRIVE_MD_FOLDER_ID and GOOGLE_DRIVE_MD_FOLDER_ID != "YOUR_GOOGLE_DRIVE_MD_FOLDER_ID" and GOOGLE_DRIVE_MD_FOLDER_ID != "your-google-drive-md-folder-id-here":
-                logging.info("Uploading Markdown to Google Drive...")
-                md_upload_successful = google_drive_uploader.upload_file_to_drive(md_file_path, GOOGLE_DRIVE_MD_FOLDER_ID)
-                if md_upload_successful:
-                    logging.info(f"Successfully uploaded '{md_file_name}' to Google Drive.")
-                else:
-                    logging.error(f"Failed to upload '{md_file_name}' to Google Drive.")
-            else:
-                logging.warning("Google Drive Folder ID for Markdown is not set/configured. Skipping Markdown upload.")
-
-            # --- LOG PROCESSED EPISODE (THE FINAL STEP) ---
-            # Mark the episode as successfully processed if both uploads succeeded (or were skipped).
-            epub_ok = (not GOOGLE_DRIVE_FOLDER_ID or GOOGLE_DRIVE_FOLDER_ID == "YOUR_GOOGLE_DRIVE_FOLDER_ID") or epub_upload_successful
-            md_ok = (not GOOGLE_DRIVE_MD_FOLDER_ID or GOOGLE_DRIVE_MD_FOLDER_ID == "YOUR_GOOGLE_DRIVE_MD_FOLDER_ID" or GOOGLE_DRIVE_MD_FOLDER_ID == "your-google-drive-md-folder-id-here") or md_upload_successful
-            
-            if epub_ok and md_ok:
-                _log_processed_episode(episode['id'])
+            _publish_episode(renderer, episode, processed_content, formatted_transcript)
+            _cache_published_content(episode['id'], processed_content, formatted_transcript)
+
+            # Duplicates from other feeds in this run reuse the transcript and summary, but
+            # each feed still gets its own ePub and Markdown file.
+            for alias in episode.get('aliases', []):
+                logging.info(f"Publishing '{alias['title']}' from '{alias['podcast_title']}' (duplicate of '{episode['title']}')...")
+                _publish_episode(renderer, alias, processed_content, formatted_transcript, canonical_id=episode['id'])
 
         except Exception as e:
             logging.error(f"An error occurred while processing episode '{episode['title']}': {e}", exc_info=True)
 
+    logging.info("Waiting for the remaining files to be rendered and uploaded...")
+    renderer.close()
+    renderer.log_metrics()
+    if digest_builder.is_enabled():
+        drive_folder = GOOGLE_DRIVE_FOLDER_ID if GOOGLE_DRIVE_FOLDER_ID != "YOUR_GOOGLE_DRIVE_FOLDER_ID" else None
+        digest_builder.publish_digests(drive_folder)
+    transcript_cache.get_cache().log_stats()
+    llm_processor.get_summary_cache().log_stats()
+    gemini_client.log_metrics()
+    model_router.log_metrics()
     logging.info("Podcast check finished.")
 
 
+def _run_adaptive_schedule():
+    """
+    Polls each feed on its own schedule, learned from how often it publishes
+    (see feed_scheduler.py). Only the feeds that are due are fetched, and the
+    loop sleeps until the next feed is due.
+    """
+    scheduler = feed_scheduler.FeedScheduler(_get_feed_urls())
+    while True:
+        due_feeds = scheduler.pop_due()
+        if due_feeds:
+            logging.info(f"{len(due_feeds)} feed(s) due for polling.")
+            observations = {}
+            try:
+                process_podcasts(feed_urls=due_feeds, observations=observations)
+            finally:
+                scheduler.record_poll(due_feeds, observations)
+                scheduler.save()
+                scheduler.log_schedule()
+        scheduler.sleep_until_next_due()
+
+
 def main():
     """
     Main entry point of the application. Schedules the job and runs it.
     """
     logging.info("Application started. Scheduling job.")
+
+    if POLL_MODE == "adaptive":
+        logging.info("Adaptive polling enabled. Each feed is polled based on its publishing cadence.")
+        _run_adaptive_schedule()
+        return
     
     # Check if a custom interval is set in environment variables
     interval_hours = os.environ.get("RUN_INTERVAL_HOURS")
@@ -1,82 +1,102 @@
 import os
 import logging
-import time
+import episode_document
 
-def create_markdown(title, podcast_name, summary, major_points, quotes, sources, transcript, file_path):
+def _markdown_lines(document):
+    """Yields the Markdown file line by line. The transcript is yielded as is, in one piece."""
+    # Title and Header Information
+    yield f"# {document['title']}"
+    yield f"**Podcast:** {document['podcast_name']}"
+    yield f"**Date Processed:** {document['date']}"
+    yield ""
+
+    # Summary Section
+    yield "## Summary"
+    yield document['summary']
+    yield ""
+
+    # Major Takeaways
+    yield "## Major Takeaways"
+    if document['major_points']:
+        for point in document['major_points']:
+            yield f"- {point}"
+    else:
+        yield "No major points were identified."
+    yield ""
+
+    # Notable Quotes
+    yield "## Notable Quotes"
+    if document['quotes']:
+        for quote in document['quotes']:
+            yield f"> {quote}"
+            yield ""
+    else:
+        yield "No notable quotes were identified."
+        yield ""
+
+    # Sources Referenced
+    yield "## Sources Referenced"
+    if document['sources']:
+        for source in document['sources']:
+            yield f"- {source}"
+    else:
+        yield "No sources were referenced."
+    yield ""
+
+    # Full Transcript
+    yield "## Full Transcript"
+    yield document['transcript']
+
+def render_markdown(document, file_path):
     """
-    Creates a Markdown file (.md) with the analyzed content of the podcast episode.
+    Writes an episode document as a Markdown file (.md).
+
+    The file is written line by line as it's rendered, so it's never held in
+    memory as a whole.
 
     Args:
-        title (str): The title of the episode.
-        podcast_name (str): The name of the podcast.
-        summary (str): The summary generated by the LLM.
-        major_points (list): A list of major points from the LLM.
-        quotes (list): A list of important quotes from the LLM.
-        sources (list): A list of sources referenced, from the LLM.
-        transcript (str): The full transcript of the episode.
+        document (dict): The document from episode_document.build_document().
         file_path (str): The full path where the Markdown file should be saved.
+
+    Returns:
+        bool: True if the file was written.
     """
     try:
-        current_date = time.strftime("%Y-%m-%d")
-        lines = []
-        
-        # Title and Header Information
-        lines.append(f"# {title}")
-        lines.append(f"**Podcast:** {podcast_name}")
-        lines.append(f"**Date Processed:** {current_date}")
-        lines.append("")
-        
-        # Summary Section
-        lines.append("## Summary")
-        lines.append(summary)
-        lines.append("")
-        
-        # Major Takeaways
-        lines.append("## Major Takeaways")
-        if major_points:
-            for point in major_points:
-                lines.append(f"- {point}")
-        else:
-            lines.append("No major points were identified.")
-        lines.append("")
-        
-        # Notable Quotes
-        lines.append("## Notable Quotes")
-        if quotes:
-            for quote in quotes:
-                lines.append(f"> {quote}")
-                lines.append("")
-        else:
-            lines.append("No notable quotes were identified.")
-            lines.append("")
-            
-        # Sources Referenced
-        lines.append("## Sources Referenced")
-        if sources:
-            for source in sources:
-                lines.append(f"- {source}")
-        else:
-            lines.append("No sources were referenced.")
-        lines.append("")
-        
-        # Full Transcript
-        lines.append("## Full Transcript")
-        lines.append(transcript)
-        lines.append("")
-        
-        md_content = "\n".join(lines)
-        
         # Ensure parent directory of file_path exists
         dir_name = os.path.dirname(file_path)
         if dir_name and not os.path.exists(dir_name):
             os.makedirs(dir_name, exist_ok=True)
-            
+
         with open(file_path, 'w', encoding='utf-8') as f:
-            f.write(md_content)
-            
+            for line in _markdown_lines(document):
+                f.write(line)
+                f.write("\n")
+
         logging.info(f"Markdown file successfully created: {file_path}")
         return True
-        
+
     except Exception as e:
         logging.error(f"An error occurred during Markdown generation: {e}", exc_info=True)
         return False
+
+episode_document.register_renderer('markdown', render_markdown)
+
+def create_markdown(title, podcast_name, summary, major_points, quotes, sources, transcript, file_path):
+    """
+    Creates a Markdown file (.md) with the analyzed content of the podcast episode.
+
+    Args:
+        title (str): The title of the episode.
+        podcast_name (str): The name of the podcast.
+        summary (str): The summary generated by the LLM.
+        major_points (list): A list of major points from the LLM.
+        quotes (list): A list of important quotes from the LLM.
+        sources (list): A list of sources referenced, from the LLM.
+        transcript (str): The full transcript of the episode.
+        file_path (str): The full path where the Markdown file should be saved.
+
+    Returns:
+        bool: True if the file was written.
+    """
+    document = episode_document.build_document(title, podcast_name, summary, major_points, quotes, sources, transcript)
+    return render_markdown(document, file_path)
@@ -0,0 +1,233 @@
+import os
+import json
+import time
+import logging
+import threading
+from collections import Counter
+import gemini_client
+
+# --- Configuration ---
+# Set MODEL_ROUTING="on" to send small jobs (short episodes, short prompts) to GEMINI_LIGHT_MODEL,
+# which is cheaper and faster, and the rest to the model the caller would use anyway.
+MODEL_ROUTING = os.environ.get("MODEL_ROUTING", "off").strip("'\"").lower() in ('1', 'true', 'yes', 'on')
+GEMINI_LIGHT_MODEL = os.environ.get("GEMINI_LIGHT_MODEL", "gemini-2.5-flash-lite").strip("'\"")
+# The starting thresholds: audio shorter than this many minutes is transcribed by the light model,
+# and summary prompts smaller than this many tokens go to it. The ledger tunes them from there.
+ROUTE_LIGHT_AUDIO_MINUTES = float(os.environ.get("ROUTE_LIGHT_AUDIO_MINUTES", "15").strip("'\""))
+ROUTE_LIGHT_SUMMARY_TOKENS = float(os.environ.get("ROUTE_LIGHT_SUMMARY_TOKENS", "8000").strip("'\""))
+# If the chosen model would keep a call waiting longer than this for a rate-limit slot, the
+# other model takes it when its quota frees up sooner.
+ROUTE_MAX_WAIT_SECONDS = float(os.environ.get("ROUTE_MAX_WAIT_SECONDS", "20").strip("'\""))
+# Where the observed latency, token usage and failures per model are kept across runs.
+MODEL_LEDGER_FILE = os.environ.get("MODEL_LEDGER_FILE", "model_ledger.json").strip("'\"")
+
+# The work a call does is measured in audio seconds for transcription and prompt tokens for summaries.
+BASE_THRESHOLDS = {'transcription': ROUTE_LIGHT_AUDIO_MINUTES * 60, 'summary': ROUTE_LIGHT_SUMMARY_TOKENS}
+# Every good result from the light model raises its threshold a little, every failure (an error,
+# an empty or incomplete answer) lowers it sharply, within these bounds of the starting value.
+THRESHOLD_GROWTH = 1.05
+THRESHOLD_SHRINK = 0.7
+THRESHOLD_MIN_FACTOR = 0.25
+THRESHOLD_MAX_FACTOR = 4.0
+# Successful calls needed per model before its measured speed is compared with the other's.
+MIN_SAMPLES = 5
+
+class ModelLedger:
+    """
+    Remembers how each model has done at each task: calls, failures, seconds,
+    input and output tokens and units of work (audio seconds or prompt tokens).
+
+    It also holds the factor each task's light-model threshold is scaled by,
+    which record() moves after every call to the light model. The ledger is
+    saved to MODEL_LEDGER_FILE after each call, so the tuning carries over
+    between runs.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or MODEL_LEDGER_FILE
+        self._lock = threading.Lock()
+        self._data = {'models': {}, 'factors': {}}
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, 'r') as f:
+                    self._data = json.load(f)
+            except Exception as e:
+                logging.error(f"Could not read model ledger {self.path}, starting fresh: {e}")
+                self._data = {'models': {}, 'factors': {}}
+
+    def record(self, task, model, seconds, units, input_tokens=0, output_tokens=0, failed=False):
+        """Adds one call's outcome and, for the light model, moves the task's threshold."""
+        with self._lock:
+            entry = self._data['models'].setdefault(model, {}).setdefault(task, {
+                'calls': 0, 'failures': 0, 'seconds': 0.0, 'units': 0.0, 'input_tokens': 0, 'output_tokens': 0,
+            })
+            entry['calls'] += 1
+            entry['input_tokens'] += input_tokens
+            entry['output_tokens'] += output_tokens
+            if failed:
+                entry['failures'] += 1
+            elif units:
+                # Only successful calls of a known size count towards the speed.
+                entry['seconds'] += seconds
+                entry['units'] += units
+            if model == GEMINI_LIGHT_MODEL:
+                factor = self._data['factors'].get(task, 1.0) * (THRESHOLD_SHRINK if failed else THRESHOLD_GROWTH)
+                self._data['factors'][task] = min(THRESHOLD_MAX_FACTOR, max(THRESHOLD_MIN_FACTOR, factor))
+        self.save()
+
+    def factor(self, task):
+        with self._lock:
+            return self._data['factors'].get(task, 1.0)
+
+    def seconds_per_unit(self, task, model):
+        """The measured seconds per unit of work, or None until there are MIN_SAMPLES successful calls."""
+        with self._lock:
+            entry = self._data['models'].get(model, {}).get(task)
+            if not entry or entry['calls'] - entry['failures'] < MIN_SAMPLES or not entry['units']:
+                return None
+            return entry['seconds'] / entry['units']
+
+    def save(self):
+        """Writes the ledger to disk atomically."""
+        try:
+            dir_name = os.path.dirname(self.path)
+            if dir_name and not os.path.exists(dir_name):
+                os.makedirs(dir_name, exist_ok=True)
+            tmp_path = f"{self.path}.{threading.get_ident()}.tmp"
+            with self._lock:
+                with open(tmp_path, 'w') as f:
+                    json.dump(self._data, f, indent=2)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            logging.error(f"Failed to save model ledger to {self.path}: {e}")
+
+_ledger = None
+_ledger_lock = threading.Lock()
+_decisions = Counter()
+
+def get_ledger():
+    """Returns the process-wide model ledger."""
+    global _ledger
+    with _ledger_lock:
+        if _ledger is None:
+            _ledger = ModelLedger()
+        return _ledger
+
+def threshold(task):
+    """The current size below which a task goes to the light model."""
+    return BASE_THRESHOLDS[task] * get_ledger().factor(task)
+
+def _describe(task, size):
+    if size is None:
+        return "size unknown"
+    return f"{size / 60:.0f} min of audio" if task == 'transcription' else f"~{size:.0f} tokens"
+
+def choose(task, default_model, audio_seconds=None, tokens=None):
+    """
+    Picks the model for one call.
+
+    Jobs below the task's threshold go to GEMINI_LIGHT_MODEL, unless the
+    ledger shows it's not actually faster than `default_model`. Then, if the
+    pick would wait more than ROUTE_MAX_WAIT_SECONDS for a rate-limit slot
+    and the other model's quota frees up sooner, the other model is used.
+
+    Args:
+        task (str): 'transcription' or 'summary'.
+        default_model (str): The model to use without routing, and for big jobs.
+        audio_seconds (float): The length of the audio (transcription).
+        tokens (int): The estimated prompt tokens (summary).
+
+    Returns:
+        str: The model name.
+    """
+    if not MODEL_ROUTING or default_model == GEMINI_LIGHT_MODEL:
+        return default_model
+
+    ledger = get_ledger()
+    size = audio_seconds if task == 'transcription' else tokens
+    limit = threshold(task)
+    if size is None:
+        model, reason = default_model, "size unknown"
+    elif size >= limit:
+        model, reason = default_model, f"above the light-model threshold ({_describe(task, limit)})"
+    else:
+        light_speed = ledger.seconds_per_unit(task, GEMINI_LIGHT_MODEL)
+        default_speed = ledger.seconds_per_unit(task, default_model)
+        if light_speed is not None and default_speed is not None and light_speed >= default_speed:
+            model, reason = default_model, f"{GEMINI_LIGHT_MODEL} has been slower than {default_model}"
+        else:
+            model, reason = GEMINI_LIGHT_MODEL, f"below the light-model threshold ({_describe(task, limit)})"
+
+    estimated_tokens = tokens or gemini_client.DEFAULT_REQUEST_TOKENS
+    wait = gemini_client.expected_wait(model, estimated_tokens)
+    if wait > ROUTE_MAX_WAIT_SECONDS:
+        other = default_model if model == GEMINI_LIGHT_MODEL else GEMINI_LIGHT_MODEL
+        if gemini_client.expected_wait(other, estimated_tokens) < wait:
+            reason = f"{model} would wait {wait:.0f}s for a rate-limit slot"
+            model = other
+
+    _decisions[(task, model)] += 1
+    logging.info(f"Routing {task} ({_describe(task, size)}) to {model}: {reason}.")
+    return model
+
+def cache_models(default_model):
+    """
+    The models whose cached output may answer a request for `default_model`,
+    best first: the default model, then the light model while routing could
+    send the request there.
+    """
+    models = [default_model]
+    if MODEL_ROUTING and GEMINI_LIGHT_MODEL != default_model:
+        models.append(GEMINI_LIGHT_MODEL)
+    return models
+
+def result_model(default_model, models):
+    """
+    The model a result is cached under, given the models that answered the
+    calls it was made from: the light model if any of them was it.
+    """
+    return GEMINI_LIGHT_MODEL if GEMINI_LIGHT_MODEL in (models or []) else default_model
+
+def observe(task, model, started, units, response=None, usage=None, failed=False):
+    """
+    Records how a routed call went in the ledger.
+
+    Args:
+        task (str): 'transcription' or 'summary'.
+        model (str): The model that was called.
+        started (float): time.monotonic() when the call started.
+        units (float): The size of the job (audio seconds or prompt tokens), if known.
+        response: The Gemini response, for its usage metadata.
+        usage (dict): Token counts, for streamed calls ('prompt_token_count', 'candidates_token_count').
+        failed (bool): Whether the call failed or gave an unusable answer.
+    """
+    if not MODEL_ROUTING:
+        return
+    metadata = getattr(response, 'usage_metadata', None)
+    counts = {}
+    for name in ('prompt_token_count', 'candidates_token_count'):
+        value = (usage or {}).get(name, getattr(metadata, name, None))
+        counts[name] = value if isinstance(value, int) else 0
+    get_ledger().record(
+        task, model, time.monotonic() - started, units or 0,
+        counts['prompt_token_count'], counts['candidates_token_count'], failed
+    )
+
+def get_metrics():
+    """
+    Returns the routing decisions of this process.
+
+    Returns:
+        dict: {'task -> model': number of calls}.
+    """
+    return {f"{task} -> {model}": count for (task, model), count in sorted(_decisions.items())}
+
+def log_metrics():
+    """Logs the routing decisions and the current thresholds."""
+    if not MODEL_ROUTING:
+        return
+    decisions = ', '.join(f"{route}: {count}" for route, count in get_metrics().items()) or "no calls"
+    logging.info(
+        f"Model routing: {decisions}. Light-model thresholds: {threshold('transcription') / 60:.1f} min of audio, "
+        f"{threshold('summary'):.0f} summary tokens."
+    )
@@ -4,47 +4,184 @@ from dotenv import load_dotenv
 load_dotenv()
 
 import logging
-import feedparser
 from datetime import datetime, timedelta, timezone
 import time
+import threading
 import requests
+import feed_cache
+import feed_parser
+import episode_store
+import episode_dedupe
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlparse
 
 # --- Configuration ---
-# The name of the file where we'll store the IDs of processed episodes.
-PROCESSED_LOG_FILE = os.environ.get("PROCESSED_LOG_FILE", "processed_episodes.log").strip("'\"")
+# How many feeds are downloaded at the same time, and how many of those may hit the same host.
+FEED_FETCH_CONCURRENCY = int(os.environ.get("FEED_FETCH_CONCURRENCY", "8").strip("'\""))
+FEED_FETCH_PER_HOST = int(os.environ.get("FEED_FETCH_PER_HOST", "2").strip("'\""))
 
-def _load_processed_ids():
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3'
+
+# One semaphore per host, created lazily by _get_host_semaphore().
+_host_semaphores = {}
+_host_semaphores_lock = threading.Lock()
+
+def _get_host_semaphore(feed_url):
+    """
+    Returns the semaphore that caps concurrent requests to a feed's host.
+    Many of our feeds share a host (e.g. megaphone, buzzsprout), and we don't
+    want to hammer any one of them just because the global pool is large.
+    """
+    host = urlparse(feed_url).netloc.lower()
+    with _host_semaphores_lock:
+        if host not in _host_semaphores:
+            _host_semaphores[host] = threading.BoundedSemaphore(FEED_FETCH_PER_HOST)
+        return _host_semaphores[host]
+
+def _parse_new_episodes(feed_url, body, time_cutoff, cache, observed=None):
     """
-    Loads the set of already processed episode IDs from the log file.
-    Using a set provides very fast lookups.
+    Parses a changed feed body, reading only as far back as needed.
+
+    The scan stops at the feed's high-water mark (the newest publish time seen
+    on the previous parse) or at the cutoff, whichever is later. Episodes from
+    before the high-water mark that are still inside the window come from the
+    cache instead, so nothing is lost by stopping early.
+
+    Args:
+        feed_url (str): The RSS feed URL.
+        body (bytes): The raw feed XML.
+        time_cutoff (datetime): Episodes published before this are ignored.
+        cache (feed_cache.FeedCache): The validator cache for this run.
+        observed (list): Collects the publish times read from the feed, or None.
+
+    Returns:
+        tuple: (list of recent episode records, new high-water mark as an ISO string or None).
     """
-    # This is a good practice to ensure the log file exists on the first run.
-    if not os.path.exists(PROCESSED_LOG_FILE):
-        return set()
+    high_water_mark = cache.get_high_water_mark(feed_url)
+    previous_episodes = cache.get_episodes(feed_url)
+    stop_before = time_cutoff
+    if high_water_mark and previous_episodes is not None:
+        stop_before = max(time_cutoff, datetime.fromisoformat(high_water_mark))
+
+    recent_episodes = feed_parser.parse_recent_episodes(feed_url, body, stop_before, observed=observed)
+    logging.debug(f"Found {len(recent_episodes)} episode(s) newer than {stop_before.isoformat()} in {feed_url}.")
+
+    # Carry over episodes from the last parse that the scan stopped short of,
+    # dropping the ones that have since aged out of the window.
+    known_ids = {episode['id'] for episode in recent_episodes}
+    for episode in previous_episodes or []:
+        if episode['id'] not in known_ids and datetime.fromisoformat(episode['published']) > time_cutoff:
+            recent_episodes.append(episode)
+            known_ids.add(episode['id'])
+
+    for episode in recent_episodes:
+        if not high_water_mark or datetime.fromisoformat(episode['published']) > datetime.fromisoformat(high_water_mark):
+            high_water_mark = episode['published']
+    return recent_episodes, high_water_mark
+
+def _fetch_feed_episodes(feed_url, processed_ids, time_cutoff, cache, observed=None):
+    """
+    Downloads and parses a single feed, returning the episodes that are recent
+    and not already processed. This runs on a worker thread, so each feed is
+    parsed as soon as its response arrives.
+
+    The request is conditional (If-None-Match / If-Modified-Since). When the
+    server answers 304, or sends back the exact body we saw last time, the
+    episodes stored in the feed cache are reused and the parser is skipped.
+    Changed feeds go through the streaming parser in feed_parser.py.
+
+    Args:
+        feed_url (str): The RSS feed URL.
+        processed_ids (episode_store.EpisodeStore): Supports `in` for processed episode IDs.
+        time_cutoff (datetime): Episodes published before this are ignored.
+        cache (feed_cache.FeedCache): The validator cache for this run.
+        observed (list): Collects the publish times read from the feed, or None.
+
+    Returns:
+        list: Candidate episode dictionaries in feed order (may be empty).
+    """
+    logging.info(f"Parsing feed: {feed_url}")
+    candidates = []
     try:
-        with open(PROCESSED_LOG_FILE, 'r') as f:
-            # We read each line and strip any whitespace to get a clean set of IDs.
-            return {line.strip() for line in f}
+        headers = {'User-Agent': USER_AGENT}
+        headers.update(cache.conditional_headers(feed_url))
+        with _get_host_semaphore(feed_url):
+            response = requests.get(feed_url, headers=headers, timeout=15)
+
+        if response.status_code == 304:
+            logging.info(f"Feed not modified since the last run: {feed_url}")
+            cache.record_not_modified(feed_url)
+            recent_episodes = cache.get_episodes(feed_url) or []
+        else:
+            response.raise_for_status()
+            body = response.content
+            body_hash = feed_cache.hash_body(body)
+            if cache.has_body(feed_url, body_hash):
+                logging.info(f"Feed body unchanged since the last run: {feed_url}")
+                cache.record_unchanged_body(feed_url)
+                recent_episodes = cache.get_episodes(feed_url)
+                high_water_mark = cache.get_high_water_mark(feed_url)
+            else:
+                recent_episodes, high_water_mark = _parse_new_episodes(feed_url, body, time_cutoff, cache, observed)
+            cache.update(
+                feed_url,
+                etag=response.headers.get('ETag'),
+                last_modified=response.headers.get('Last-Modified'),
+                body_hash=body_hash,
+                content_length=len(body),
+                episodes=recent_episodes,
+                high_water_mark=high_water_mark
+            )
+
+        # --- DUPLICATE CHECK LOGIC ---
+        # Cached episodes may have aged out of the window since they were stored,
+        # so the cutoff is applied again along with the processed log.
+        # Duplicates across feeds are removed when the results are merged.
+        for episode_info in recent_episodes:
+            episode_pub_time_utc = datetime.fromisoformat(episode_info['published'])
+            if episode_pub_time_utc > time_cutoff and episode_info['id'] not in processed_ids:
+                candidates.append(dict(episode_info, feed_url=feed_url))
+            else:
+                logging.debug(f"Skipping '{episode_info['title']}': already processed or outside the time window.")
+    
+    except requests.exceptions.RequestException as e:
+        logging.error(f"Failed to download feed {feed_url}: {e}")
     except Exception as e:
-        logging.error(f"Could not read processed episodes log: {e}")
-        return set()
+        logging.error(f"An unexpected error occurred while processing feed {feed_url}: {e}")
+
+    return candidates
 
-def get_new_episodes(rss_feeds_file):
+def get_new_episodes(rss_feeds_file=None, feed_urls=None, observations=None):
     """
     Parses RSS feeds and returns episodes that are new (within 36 hours) and
     have not been processed before.
+
+    Args:
+        rss_feeds_file (str): A file with one feed URL per line.
+        feed_urls (list): The feed URLs to poll. Takes precedence over rss_feeds_file.
+        observations (dict): If given, filled with {feed_url: [publish datetimes]}
+                             for every feed that was parsed (see feed_scheduler.py).
+
+    Feeds are fetched concurrently on a bounded thread pool (FEED_FETCH_CONCURRENCY
+    workers, at most FEED_FETCH_PER_HOST requests per host). The results are
+    merged in the order the feeds are listed, so the output is the same as a
+    sequential run regardless of which responses arrive first. Unchanged feeds
+    are served from the persistent feed cache (see feed_cache.py).
     """
-    # ... (code to read rss_feeds_file remains the same) ...
-    try:
-        with open(rss_feeds_file, 'r') as f:
-            feeds = [line.strip() for line in f if line.strip()]
-    except FileNotFoundError:
-        logging.error(f"The RSS feeds file was not found at: {rss_feeds_file}")
-        return []
+    if feed_urls is not None:
+        feeds = list(feed_urls)
+    else:
+        try:
+            with open(rss_feeds_file, 'r') as f:
+                feeds = [line.strip() for line in f if line.strip()]
+        except FileNotFoundError:
+            logging.error(f"The RSS feeds file was not found at: {rss_feeds_file}")
+            return []
 
-    # Load the IDs of episodes we've already handled.
-    processed_ids = _load_processed_ids()
-    logging.info(f"Loaded {len(processed_ids)} previously processed episode IDs.")
+    # The episodes we've already handled. Membership checks are indexed lookups,
+    # so nothing is read into memory up front.
+    processed_ids = episode_store.get_store()
+    logging.info(f"Episode store holds {processed_ids.count_processed()} previously processed episode IDs.")
 
     new_episodes = []
     seen_ids = set() # Track episode IDs processed in this run to avoid duplicates
@@ -54,66 +191,40 @@ def get_new_episodes(rss_feeds_file):
     logging.debug(f"Current UTC time is: {now_utc.isoformat()}")
     logging.debug(f"Time cutoff for new episodes is: {time_cutoff.isoformat()}")
 
-    user_agent = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3'
-
-    for feed_url in feeds:
-        logging.info(f"Parsing feed: {feed_url}")
-        try:
-            headers = {'User-Agent': user_agent}
-            response = requests.get(feed_url, headers=headers, timeout=15)
-            response.raise_for_status()
-            feed_content = response.text
-            parsed_feed = feedparser.parse(feed_content)
-
-            if parsed_feed.bozo:
-                logging.warning(f"Feed may be ill-formed: {feed_url}. Bozo flag was set, but attempting to process anyway.")
-
-            logging.debug(f"Feed parsed. Found {len(parsed_feed.entries)} total entries.")
-            podcast_title = parsed_feed.feed.get('title', 'Unknown Podcast')
-
-            for entry in parsed_feed.entries:
-                published_time_struct = entry.get('published_parsed')
-                if not published_time_struct:
-                    continue 
-
-                episode_pub_time_utc = datetime(*published_time_struct[:6], tzinfo=timezone.utc)
-                
-                # --- DUPLICATE CHECK LOGIC ---
-                # A unique ID for the episode, usually a URL or a generated string.
-                episode_id = entry.get('id')
-                if not episode_id:
-                    logging.warning(f"Episode '{entry.get('title')}' is missing a unique ID. Skipping.")
-                    continue
-
-                logging.debug(
-                    f"Checking Episode: '{entry.get('title', 'No Title')}' | "
-                    f"Published: {episode_pub_time_utc.isoformat()} | "
-                    f"Is it new? {episode_pub_time_utc > time_cutoff} | "
-                    f"Already processed? {episode_id in processed_ids} | "
-                    f"Already seen in this run? {episode_id in seen_ids}"
-                )
-
-                # An episode is only added if it's both recent AND its ID is not in our log, AND it hasn't been added yet in this run.
-                if episode_pub_time_utc > time_cutoff and episode_id not in processed_ids and episode_id not in seen_ids:
-                    episode_info = {
-                        'id': episode_id, # We must include the ID now.
-                        'title': entry.get('title', 'No Title'),
-                        'podcast_title': podcast_title,
-                        'links': entry.get('links', []),
-                        'published': episode_pub_time_utc.isoformat(),
-                        'media_content': entry.get('media_content', [])
-                    }
-                    new_episodes.append(episode_info)
-                    seen_ids.add(episode_id)
-                    logging.info(f"Found new episode to process: '{episode_info['title']}' from '{podcast_title}'")
-        
-        except requests.exceptions.RequestException as e:
-            logging.error(f"Failed to download feed {feed_url}: {e}")
-        except Exception as e:
-            logging.error(f"An unexpected error occurred while processing feed {feed_url}: {e}")
+    # Validators and parsed episodes from the previous run, used for conditional requests.
+    cache = feed_cache.FeedCache()
+
+    # Each slot holds the candidates of the feed at the same position in `feeds`.
+    feed_results = [[] for _ in feeds]
+    if feeds:
+        max_workers = max(1, min(FEED_FETCH_CONCURRENCY, len(feeds)))
+        logging.info(f"Fetching {len(feeds)} feed(s) with up to {max_workers} concurrent request(s).")
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                executor.submit(
+                    _fetch_feed_episodes, feed_url, processed_ids, time_cutoff, cache,
+                    observations.setdefault(feed_url, []) if observations is not None else None
+                ): index
+                for index, feed_url in enumerate(feeds)
+            }
+            for future in as_completed(futures):
+                feed_results[futures[future]] = future.result()
+    cache.save()
+    cache.log_stats()
+
+    for candidates in feed_results:
+        for episode_info in candidates:
+            # An episode is only added once per run, even if several feeds carry it.
+            if episode_info['id'] in seen_ids:
+                continue
+            new_episodes.append(episode_info)
+            seen_ids.add(episode_info['id'])
+            logging.info(f"Found new episode to process: '{episode_info['title']}' from '{episode_info['podcast_title']}'")
+
+    # The same episode can appear in several feeds, or be republished with a new GUID.
+    new_episodes = episode_dedupe.collapse_duplicates(new_episodes, processed_ids)
 
     if not new_episodes:
          logging.info("No new episodes found within the time window that haven't already been processed.")
          
     return new_episodes
-
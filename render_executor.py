@@ -0,0 +1,173 @@
+import os
+import time
+import queue
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import episode_document
+import epub_generator  # noqa: F401 (registers the 'epub' renderer, also in the worker processes)
+import md_generator  # noqa: F401 (registers the 'markdown' renderer, also in the worker processes)
+import digest_builder  # noqa: F401 (registers the 'digest' renderer, also in the worker processes)
+
+# --- Configuration ---
+# Episode files (ePub, Markdown) are rendered in this many worker processes, every format of an
+# episode at the same time, while the main thread goes on with the next episode. "0" renders
+# them one after the other on the main thread.
+RENDER_WORKERS = int(os.environ.get("RENDER_WORKERS", "2").strip("'\""))
+# Rendered episodes wait for their upload in a queue of this size. When it's full, the next
+# episode waits before rendering, so rendering can't run far ahead of the uploads.
+UPLOAD_QUEUE_SIZE = int(os.environ.get("UPLOAD_QUEUE_SIZE", "4").strip("'\""))
+
+def _render_artifact(name, document, file_path):
+    """
+    Renders one file. Runs in a worker process, so an error or crash only costs this file.
+
+    Returns:
+        tuple: (True if the file was written, seconds taken).
+    """
+    started = time.perf_counter()
+    try:
+        ok = episode_document.RENDERERS[name](document, file_path)
+    except Exception as e:
+        logging.error(f"Rendering {file_path} failed: {e}", exc_info=True)
+        ok = False
+    return bool(ok), time.perf_counter() - started
+
+class RenderExecutor:
+    """
+    Renders episode files in a process pool and uploads them on a separate thread.
+
+    submit() starts rendering every format of an episode at once and puts the
+    episode in the upload queue. The upload thread takes episodes off the
+    queue in order, waits for their files and calls `upload(job, results)`,
+    where results is {renderer name: True if the file was written}. Each file
+    is rendered in its own task, so one failing format doesn't affect the
+    other. If a worker process dies, the pool is replaced.
+
+    The executor keeps per-renderer timings (see get_metrics()).
+    """
+
+    def __init__(self, upload, workers=None, queue_size=None):
+        self.upload = upload
+        self.workers = RENDER_WORKERS if workers is None else workers
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        self._queue = queue.Queue(maxsize=max(1, UPLOAD_QUEUE_SIZE if queue_size is None else queue_size))
+        self._metrics = {}
+        self._metrics_lock = threading.Lock()
+        self._uploader = threading.Thread(target=self._upload_loop, name='uploader', daemon=True)
+        self._uploader.start()
+
+    def _get_pool(self):
+        with self._pool_lock:
+            if self._pool is None:
+                # Spawned workers start clean instead of inheriting this process's threads and locks.
+                self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'))
+            return self._pool
+
+    def _reset_pool(self, pool):
+        with self._pool_lock:
+            if self._pool is pool:
+                logging.warning("A rendering worker process died. Starting a new pool.")
+                pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+
+    def _start(self, name, document, file_path):
+        """Returns the future of one file and the pool rendering it (None when rendering inline)."""
+        if self.workers <= 0:
+            future = Future()
+            future.set_result(_render_artifact(name, document, file_path))
+            return future, None
+        for _ in range(2):
+            pool = self._get_pool()
+            try:
+                return pool.submit(_render_artifact, name, document, file_path), pool
+            except BrokenProcessPool:
+                self._reset_pool(pool)
+        raise BrokenProcessPool("Could not start a rendering worker")
+
+    def submit(self, document, outputs, job=None):
+        """
+        Starts rendering one episode document and queues it for upload.
+
+        Blocks while the upload queue is full.
+
+        Args:
+            document (dict): The document from episode_document.build_document().
+            outputs (dict): {renderer name: file path}.
+            job: Passed to the upload callback as is, e.g. the episode.
+        """
+        futures = {}
+        for name, file_path in outputs.items():
+            try:
+                futures[name] = self._start(name, document, file_path)
+            except Exception as e:
+                logging.error(f"Could not start rendering {file_path}: {e}")
+                futures[name] = (Future(), None)
+                futures[name][0].set_exception(e)
+        self._queue.put((job, futures))
+
+    def _collect(self, name, future, pool):
+        try:
+            ok, seconds = future.result()
+        except BrokenProcessPool:
+            logging.error(f"Rendering '{name}' failed: its worker process died.")
+            ok, seconds = False, 0.0
+            self._reset_pool(pool)
+        except Exception as e:
+            logging.error(f"Rendering '{name}' failed: {e}")
+            ok, seconds = False, 0.0
+        with self._metrics_lock:
+            entry = self._metrics.setdefault(name, {'rendered': 0, 'failed': 0, 'seconds': 0.0, 'max_seconds': 0.0})
+            entry['rendered' if ok else 'failed'] += 1
+            entry['seconds'] += seconds
+            entry['max_seconds'] = max(entry['max_seconds'], seconds)
+        return ok
+
+    def _upload_loop(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                job, futures = item
+                results = {name: self._collect(name, future, pool) for name, (future, pool) in futures.items()}
+                self.upload(job, results)
+            except Exception as e:
+                logging.error(f"An error occurred while uploading rendered files: {e}", exc_info=True)
+            finally:
+                self._queue.task_done()
+
+    def join(self):
+        """Waits until every submitted episode has been rendered and uploaded."""
+        self._queue.join()
+
+    def close(self):
+        """Finishes the queued work, then stops the upload thread and the worker processes."""
+        self._queue.put(None)
+        self._uploader.join()
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown()
+                self._pool = None
+
+    def get_metrics(self):
+        """
+        Returns the rendering counters per renderer.
+
+        Returns:
+            dict: {renderer name: {'rendered', 'failed', 'seconds' (total), 'max_seconds'}}.
+        """
+        with self._metrics_lock:
+            return {name: dict(entry) for name, entry in self._metrics.items()}
+
+    def log_metrics(self):
+        """Logs how many files each renderer wrote and how long they took."""
+        for name, entry in sorted(self.get_metrics().items()):
+            runs = entry['rendered'] + entry['failed']
+            logging.info(
+                f"Rendering '{name}': {entry['rendered']} written, {entry['failed']} failed, "
+                f"{entry['seconds'] / runs if runs else 0:.2f} s average, {entry['max_seconds']:.2f} s slowest."
+            )
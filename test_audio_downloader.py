@@ -0,0 +1,151 @@
+import unittest
+from unittest.mock import patch
+import logging
+import io
+import os
+import re
+import tempfile
+import threading
+import time
+import requests
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import audio_downloader
+
+# --- Test Configuration ---
+logging.basicConfig(level=logging.ERROR)
+
+AUDIO = bytes(range(256)) * 4096  # 1 MB of fake audio
+
+
+class _AudioHandler(BaseHTTPRequestHandler):
+    """Serves AUDIO, honoring Range headers unless the server is told to ignore them."""
+    honor_ranges = True
+    requested_ranges = []
+    failing_start = None
+    range_delay = 0
+
+    def log_message(self, *args):
+        pass
+
+    def _send_headers(self, status, length, start=None, end=None):
+        self.send_response(status)
+        self.send_header('Content-Length', str(length))
+        self.send_header('Accept-Ranges', 'bytes')
+        if start is not None:
+            self.send_header('Content-Range', f"bytes {start}-{end}/{len(AUDIO)}")
+        self.end_headers()
+
+    def do_HEAD(self):
+        self._send_headers(200, len(AUDIO))
+
+    def do_GET(self):
+        match = re.match(r'bytes=(\d+)-(\d+)', self.headers.get('Range', ''))
+        if match and self.honor_ranges:
+            start, end = int(match.group(1)), int(match.group(2))
+            type(self).requested_ranges.append((start, end))
+            if start == self.failing_start:
+                self.send_error(500)
+                return
+            time.sleep(self.range_delay)
+            self._send_headers(206, end - start + 1, start, end)
+            self.wfile.write(AUDIO[start:end + 1])
+        else:
+            self._send_headers(200, len(AUDIO))
+            self.wfile.write(AUDIO)
+
+
+class TestAudioDownloader(unittest.TestCase):
+    """
+    Tests the segmented downloader against a local HTTP server: parallel ranges,
+    resuming from the sidecar, and the single-stream fallback.
+    """
+
+    def setUp(self):
+        _AudioHandler.honor_ranges = True
+        _AudioHandler.requested_ranges = []
+        _AudioHandler.failing_start = None
+        _AudioHandler.range_delay = 0
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), _AudioHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.server.server_port}/episode.mp3"
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.dest = os.path.join(self.tmp_dir.name, 'episode.mp3')
+        self.patches = [
+            patch('audio_downloader.DOWNLOAD_PARTIAL_DIR', self.tmp_dir.name),
+            patch('audio_downloader.DOWNLOAD_CHUNK_MB', 0.25),
+        ]
+        for p in self.patches:
+            p.start()
+
+    def tearDown(self):
+        for p in self.patches:
+            p.stop()
+        self.server.shutdown()
+        self.server.server_close()
+        self.tmp_dir.cleanup()
+
+    def _read_dest(self):
+        with open(self.dest, 'rb') as f:
+            return f.read()
+
+    def test_parallel_ranges(self):
+        """The file is fetched as four ranges and reassembled byte for byte."""
+        audio_downloader.download_audio(self.url, self.dest)
+
+        self.assertEqual(self._read_dest(), AUDIO)
+        self.assertEqual(len(_AudioHandler.requested_ranges), 4)
+        self.assertEqual(os.listdir(self.tmp_dir.name), ['episode.mp3'])
+        self.assertIn(f"127.0.0.1:{self.server.server_port}", audio_downloader.get_download_stats())
+
+    def test_resume_skips_finished_ranges(self):
+        """Ranges recorded in the sidecar are not downloaded again."""
+        part_path, sidecar_path = audio_downloader._partial_paths(self.url)
+        probe = audio_downloader.probe_audio(self.url)
+        chunk = 256 * 1024
+        with open(part_path, 'wb') as f:
+            f.write(AUDIO[:2 * chunk])
+            f.truncate(len(AUDIO))
+        audio_downloader._save_sidecar(sidecar_path, probe, {0, 1})
+
+        audio_downloader.download_audio(self.url, self.dest)
+
+        self.assertEqual(self._read_dest(), AUDIO)
+        self.assertEqual(sorted(_AudioHandler.requested_ranges), [(2 * chunk, 3 * chunk - 1), (3 * chunk, 4 * chunk - 1)])
+
+    def test_failed_range_cancels_the_others(self):
+        """A range that fails for good stops the download instead of fetching the rest of the file first."""
+        _AudioHandler.failing_start = 0
+        _AudioHandler.range_delay = 0.2
+
+        with patch('audio_downloader.DOWNLOAD_CHUNK_MB', 1 / 16), patch('audio_downloader.DOWNLOAD_RETRIES', 0):
+            with self.assertRaises(requests.exceptions.HTTPError):
+                audio_downloader.download_audio(self.url, self.dest)
+
+        # Only about the ranges already in flight were requested, not the 16 of the whole file.
+        self.assertLess(len(_AudioHandler.requested_ranges), 2 * audio_downloader.DOWNLOAD_CONNECTIONS)
+        self.assertFalse(os.path.exists(self.dest))
+
+    def test_falls_back_when_range_is_ignored(self):
+        """A server that answers 200 to a Range request still yields the complete file."""
+        _AudioHandler.honor_ranges = False
+
+        audio_downloader.download_audio(self.url, self.dest)
+
+        self.assertEqual(self._read_dest(), AUDIO)
+
+    def test_stream_audio_into_buffer(self):
+        """The whole file is streamed into a file object without touching the partial-download directory."""
+        buffer = io.BytesIO()
+        audio_downloader.stream_audio(self.url, buffer)
+        self.assertEqual(buffer.getvalue(), AUDIO)
+        self.assertEqual(os.listdir(self.tmp_dir.name), [])
+
+    def test_fetch_leading_bytes(self):
+        """Only the requested prefix is read, with or without Range support."""
+        self.assertEqual(audio_downloader.fetch_leading_bytes(self.url, 1000), AUDIO[:1000])
+        _AudioHandler.honor_ranges = False
+        self.assertEqual(audio_downloader.fetch_leading_bytes(self.url, 1000), AUDIO[:1000])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+import unittest
+from unittest.mock import MagicMock, patch
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import numpy as np
+import audio_preprocessor
+
+# --- Test Configuration ---
+logging.basicConfig(level=logging.ERROR)
+
+RATE = 16000
+
+
+def _tone(seconds, amplitude=8000):
+    t = np.arange(int(seconds * RATE)) / RATE
+    return (amplitude * np.sin(2 * np.pi * 220 * t)).astype(np.int16)
+
+
+def _silence(seconds, amplitude=20):
+    rng = np.random.default_rng(0)
+    return rng.integers(-amplitude, amplitude, int(seconds * RATE)).astype(np.int16)
+
+
+def _fake_decoder(blocks, returncode=0):
+    """A stand-in for the ffmpeg decoder whose stdout returns `blocks` (bytes, or an exception to raise)."""
+    process = MagicMock()
+    process.stdout.read.side_effect = list(blocks) + [b'']
+    process.poll.return_value = None
+    process.wait.return_value = returncode
+    process.returncode = returncode
+    return process
+
+
+class TestAudioPreprocessor(unittest.TestCase):
+    """
+    Tests the NumPy silence detection and the time map back to the original audio.
+    """
+
+    def _intervals(self, samples):
+        frame_length = audio_preprocessor._frame_length(RATE)
+        energies = audio_preprocessor.frame_energies_db(samples, frame_length)
+        return audio_preprocessor.speech_intervals(
+            energies, frame_length / RATE, min_silence_seconds=1.0, pad_seconds=0.24, margin_db=10
+        )
+
+    def test_long_silence_is_cut_with_padding(self):
+        samples = np.concatenate([_tone(3), _silence(5), _tone(3)])
+        time_map = audio_preprocessor.build_time_map(self._intervals(samples))
+
+        self.assertEqual(len(time_map), 2)
+        kept = sum(duration for _, _, duration in time_map)
+        # 6 seconds of speech plus 0.24 s of padding on each side of the cut.
+        self.assertAlmostEqual(kept, 6.48, delta=0.1)
+        self.assertAlmostEqual(time_map[1][1], 7.76, delta=0.1)
+
+    def test_short_pauses_are_kept(self):
+        samples = np.concatenate([_tone(2), _silence(0.5), _tone(2), _silence(0.5), _tone(2)])
+        intervals = self._intervals(samples)
+        self.assertEqual(len(intervals), 1)
+
+    def test_leading_and_trailing_silence_is_cut_completely(self):
+        samples = np.concatenate([_silence(4), _tone(3), _silence(4)])
+        time_map = audio_preprocessor.build_time_map(self._intervals(samples))
+        self.assertEqual(len(time_map), 1)
+        self.assertAlmostEqual(time_map[0][1], 3.76, delta=0.1)
+        self.assertAlmostEqual(time_map[0][2], 3.48, delta=0.1)
+
+    def test_decoder_failing_midway_stops_the_encoder(self):
+        """The encoder is killed and reaped instead of waiting forever for the rest of its input."""
+        audio = np.concatenate([_tone(2), _silence(3), _tone(2)]).tobytes()
+        first_pass = _fake_decoder([audio])
+        second_pass = _fake_decoder([audio[:RATE], OSError("decoder died")])
+        # Like ffmpeg reading from a pipe, this process only exits once its stdin is closed.
+        encoder = subprocess.Popen([sys.executable, '-c', 'import sys; sys.stdin.buffer.read()'], stdin=subprocess.PIPE)
+
+        with tempfile.TemporaryDirectory() as tmp_dir, \
+             patch.object(audio_preprocessor, '_decode', side_effect=[first_pass, second_pass]), \
+             patch.object(audio_preprocessor.subprocess, 'Popen', return_value=encoder):
+            audio_path = os.path.join(tmp_dir, 'episode.mp3')
+            open(audio_path, 'wb').close()
+            with self.assertRaises(OSError):
+                audio_preprocessor.preprocess_audio(audio_path, os.path.join(tmp_dir, 'out.ogg'))
+
+        self.assertIsNotNone(encoder.returncode)
+        self.assertTrue(encoder.stdin.closed)
+        second_pass.kill.assert_called_once()
+        second_pass.wait.assert_called()
+
+    def test_to_original_time(self):
+        time_map = [(0.0, 0.0, 10.0), (10.0, 25.0, 5.0), (15.0, 40.0, 20.0)]
+        self.assertEqual(audio_preprocessor.to_original_time(4.0, time_map), 4.0)
+        self.assertEqual(audio_preprocessor.to_original_time(12.0, time_map), 27.0)
+        self.assertEqual(audio_preprocessor.to_original_time(20.0, time_map), 45.0)
+        self.assertEqual(audio_preprocessor.to_original_time(12.0, None), 12.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,141 @@
+import unittest
+import logging
+import os
+import tempfile
+import subprocess
+import time
+from unittest.mock import patch
+import chunked_transcription
+
+# --- Test Configuration ---
+logging.basicConfig(level=logging.ERROR)
+
+
+class TestChunkedTranscription(unittest.TestCase):
+    """
+    Tests segment planning, overlap stitching and the per-segment retry and cache.
+    """
+
+    def test_plan_segments_overlap(self):
+        segments = chunked_transcription.plan_segments(3000, segment_seconds=1200, overlap_seconds=15)
+        self.assertEqual(segments, [(0.0, 1215.0), (1200.0, 1215.0), (2400.0, 600.0)])
+
+    def test_plan_segments_folds_tiny_tail(self):
+        segments = chunked_transcription.plan_segments(2410, segment_seconds=1200, overlap_seconds=15)
+        self.assertEqual(segments, [(0.0, 1215.0), (1200.0, 1210.0)])
+
+    def test_stitch_removes_overlap_and_keeps_labels(self):
+        first = (
+            "Nilay: Welcome back to the show, today we are talking about batteries.\n"
+            "David: I have been waiting all week to talk about this one.\n"
+            "Nilay: So the big news is that solid state cells are finally shipping in cars.\n"
+            "David: And the range numbers are"
+        )
+        second = (
+            "Speaker 1: So the big news is that solid-state cells are finally shipping in cars.\n"
+            "Speaker 2: And the range numbers are honestly pretty wild this time.\n"
+            "Speaker 1: Let's get into the details after the break."
+        )
+        stitched = chunked_transcription.stitch_transcripts([first, second])
+        lines = stitched.split('\n\n')
+
+        self.assertEqual(len(lines), 5)
+        self.assertEqual(sum('shipping in cars' in line for line in lines), 1)
+        self.assertEqual(lines[3], "David: And the range numbers are honestly pretty wild this time.")
+        self.assertEqual(lines[4], "Nilay: Let's get into the details after the break.")
+
+    def test_stitch_without_overlap_concatenates(self):
+        stitched = chunked_transcription.stitch_transcripts(["Host: The first part of the show ends here.", "Host: A completely different topic starts now."])
+        self.assertEqual(stitched.split('\n\n'), ["Host: The first part of the show ends here.", "Host: A completely different topic starts now."])
+
+    def test_reencoded_segment_gets_an_mp3_extension(self):
+        """If copying the stream fails, the MP3 re-encode isn't written under the source's extension."""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            out_path = os.path.join(tmp_dir, 'segment_000.ogg')
+
+            def fake_ffmpeg(command, **kwargs):
+                if 'copy' in command:
+                    open(command[-1], 'w').close()
+                    raise subprocess.CalledProcessError(1, command)
+                open(command[-1], 'w').close()
+
+            with patch('chunked_transcription.subprocess.run', side_effect=fake_ffmpeg) as mock_run:
+                segment_path = chunked_transcription._cut_segment('episode.speech.ogg', 0, 60, out_path)
+
+            self.assertEqual(segment_path, os.path.join(tmp_dir, 'segment_000.mp3'))
+            self.assertIn('libmp3lame', mock_run.call_args.args[0])
+            self.assertEqual(os.listdir(tmp_dir), ['segment_000.mp3'])
+
+    def test_failed_segment_is_retried_and_others_are_cached(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            audio_path = os.path.join(tmp_dir, 'episode.mp3')
+            with open(audio_path, 'wb') as f:
+                f.write(b'audio')
+
+            def fake_cut(source, start, length, out_path):
+                with open(out_path, 'w') as f:
+                    f.write(str(start))
+                return out_path
+
+            calls = []
+
+            def flaky_transcribe(path, prompt, upload_key=None, models=None):
+                with open(path) as f:
+                    start = f.read()
+                calls.append(start)
+                if start == '1200.0':
+                    raise RuntimeError("segment failed")
+                return {'0.0': "Host: Welcome to the show.", '2400.0': "Host: Thanks for listening."}[start]
+
+            cache_dir = os.path.join(tmp_dir, 'cache')
+            with patch.object(chunked_transcription, 'TRANSCRIPT_SEGMENT_CACHE_DIR', cache_dir), \
+                 patch.object(chunked_transcription, 'TRANSCRIBE_SEGMENT_MINUTES', 20), \
+                 patch.object(chunked_transcription, 'TRANSCRIBE_SEGMENT_RETRIES', 1), \
+                 patch('chunked_transcription._cut_segment', side_effect=fake_cut), \
+                 patch('chunked_transcription.time.sleep'):
+                with self.assertRaises(RuntimeError):
+                    chunked_transcription.transcribe_in_segments(audio_path, 'https://example.com/a.mp3', 3000, flaky_transcribe, 'prompt')
+                # Only the failing segment was retried.
+                self.assertEqual(sorted(calls), ['0.0', '1200.0', '1200.0', '2400.0'])
+                # The finished segments are kept for the rerun.
+                episode_dir = chunked_transcription._episode_cache_dir('https://example.com/a.mp3')
+                self.assertEqual(len(os.listdir(episode_dir)), 2)
+
+                calls.clear()
+
+                def recovered_transcribe(path, prompt, upload_key=None, models=None):
+                    with open(path) as f:
+                        calls.append(f.read())
+                    return "Host: Here is the interview."
+
+                transcript = chunked_transcription.transcribe_in_segments(
+                    audio_path, 'https://example.com/a.mp3', 3000, recovered_transcribe, 'prompt'
+                )
+                # The rerun only transcribed the segment that was missing.
+                self.assertEqual(calls, ['1200.0'])
+
+            self.assertEqual(
+                transcript.split('\n\n'),
+                ["Host: Welcome to the show.", "Host: Here is the interview.", "Host: Thanks for listening."]
+            )
+            # The cache is cleared once the whole episode is stitched.
+            self.assertEqual(os.listdir(cache_dir), [])
+
+    def test_stale_segment_caches_are_removed(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            stale = os.path.join(cache_dir, 'stale')
+            recent = os.path.join(cache_dir, 'recent')
+            os.makedirs(stale)
+            os.makedirs(recent)
+            eight_days_ago = time.time() - 8 * 86400
+            os.utime(stale, (eight_days_ago, eight_days_ago))
+
+            with patch.object(chunked_transcription, 'TRANSCRIPT_SEGMENT_CACHE_DIR', cache_dir), \
+                 patch.object(chunked_transcription, 'TRANSCRIPT_SEGMENT_CACHE_DAYS', 7):
+                chunked_transcription._remove_stale_segment_caches()
+
+            self.assertEqual(os.listdir(cache_dir), ['recent'])
+
+
+if __name__ == '__main__':
+    unittest.main()
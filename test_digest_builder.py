@@ -0,0 +1,146 @@
+import unittest
+from unittest.mock import patch
+import logging
+import os
+import shutil
+import tempfile
+import zipfile
+from xml.dom import minidom
+import episode_document
+import digest_builder
+import main
+
+# --- Test Configuration ---
+logging.basicConfig(level=logging.ERROR)
+
+
+class TestDigestBuilder(unittest.TestCase):
+    """
+    Tests rendering episode fragments once and assembling and publishing the digest from them.
+    """
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        for patcher in (
+            patch.object(digest_builder, 'DIGEST_DIR', self.test_dir),
+            patch.object(digest_builder, 'DIGEST_MODE', 'daily'),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def _add(self, episode_id, title, period='2024-05-17'):
+        document = episode_document.build_document(
+            title, "The Show", "A summary.", ["A point"], ['A "quoted" line'], [], "Host: Hello.\nGuest: Hi & bye."
+        )
+        fragment_dir = digest_builder.fragment_path(episode_id, period)
+        self.assertTrue(digest_builder.render_fragment(document, fragment_dir))
+        digest_builder.add_episode(fragment_dir, episode_id)
+
+    def test_weekly_period(self):
+        with patch.object(digest_builder, 'DIGEST_MODE', 'weekly'):
+            self.assertRegex(digest_builder.current_period(), r'^\d{4}-W\d{2}$')
+        self.assertRegex(digest_builder.current_period(), r'^\d{4}-\d{2}-\d{2}$')
+
+    def test_digest_is_assembled_from_cached_fragments(self):
+        self._add('ep-1', "First Episode")
+        self._add('ep-2', "Second Episode")
+        # Building the digest must not render the episodes again.
+        with patch('digest_builder.epub_generator.summary_body', side_effect=AssertionError("re-rendered")):
+            path = digest_builder.build_digest('2024-05-17')
+        with zipfile.ZipFile(path) as archive:
+            names = archive.namelist()
+            nav = archive.read('EPUB/nav.xhtml').decode('utf-8')
+            transcript = archive.read('EPUB/episode_002_transcript_001.xhtml').decode('utf-8')
+        self.assertIn('EPUB/episode_001_overview.xhtml', names)
+        self.assertIn("The Show: First Episode", nav)
+        self.assertIn("The Show: Second Episode", nav)
+        self.assertIn("<p>Guest: Hi &amp; bye.</p>", transcript)
+
+    def test_every_digest_document_is_well_formed_xml(self):
+        self._add('ep-1', "First Episode")
+        path = digest_builder.build_digest('2024-05-17')
+        with zipfile.ZipFile(path) as archive:
+            names = [name for name in archive.namelist() if name.endswith(('.xhtml', '.opf', '.ncx'))]
+            for name in names:
+                with self.subTest(name=name):
+                    minidom.parseString(archive.read(name))
+            overview = archive.read('EPUB/episode_001_overview.xhtml').decode('utf-8')
+        self.assertIn("&#8220;A \"quoted\" line&#8221;", overview)
+
+    def test_reprocessed_episode_keeps_its_place(self):
+        self._add('ep-1', "First Episode")
+        self._add('ep-2', "Second Episode")
+        self._add('ep-1', "First Episode, Fixed")
+        manifest = digest_builder._read_manifest(os.path.join(self.test_dir, '2024-05-17'))
+        self.assertEqual([entry['episode_id'] for entry in manifest['episodes']], ['ep-1', 'ep-2'])
+
+    @patch('digest_builder.google_drive_uploader.replace_file_on_drive')
+    def test_publish_uploads_once_per_run_and_updates_the_drive_copy(self, mock_replace):
+        mock_replace.return_value = 'drive-id'
+        self._add('ep-1', "First Episode")
+        self._add('ep-2', "Second Episode")
+        self.assertTrue(digest_builder.publish_digests('folder'))
+        self.assertEqual(mock_replace.call_count, 1)
+        self.assertIsNone(mock_replace.call_args[0][2])
+
+        # Nothing new, nothing to upload.
+        self.assertTrue(digest_builder.publish_digests('folder'))
+        self.assertEqual(mock_replace.call_count, 1)
+
+        self._add('ep-3', "Third Episode")
+        self.assertTrue(digest_builder.publish_digests('folder'))
+        self.assertEqual(mock_replace.call_count, 2)
+        self.assertEqual(mock_replace.call_args[0][2], 'drive-id')
+
+    @patch('digest_builder.google_drive_uploader.replace_file_on_drive', return_value=None)
+    def test_failed_upload_is_retried_next_run(self, mock_replace):
+        self._add('ep-1', "First Episode")
+        self.assertFalse(digest_builder.publish_digests('folder'))
+        self.assertFalse(digest_builder.publish_digests('folder'))
+        self.assertEqual(mock_replace.call_count, 2)
+
+    @patch('digest_builder.google_drive_uploader.replace_file_on_drive', return_value='drive-id')
+    def test_digest_built_without_drive_is_uploaded_later(self, mock_replace):
+        self._add('ep-1', "First Episode")
+        self.assertTrue(digest_builder.publish_digests())
+        self.assertTrue(os.path.exists(digest_builder.digest_path('2024-05-17')))
+        mock_replace.assert_not_called()
+
+        # Drive is configured on a later run: the digest built locally is uploaded, not rebuilt.
+        with patch('digest_builder.build_digest', side_effect=AssertionError("rebuilt")):
+            self.assertTrue(digest_builder.publish_digests('folder'))
+        mock_replace.assert_called_once()
+        self.assertTrue(digest_builder.publish_digests('folder'))
+        mock_replace.assert_called_once()
+
+    @patch('main._log_processed_episode')
+    @patch('main._record_stage')
+    @patch('main.digest_builder.add_episode')
+    def test_episode_joins_the_digest_only_once_published(self, mock_add, mock_stage, mock_logged):
+        job = {'episode': {'id': 'ep-1', 'title': "First Episode"}, 'canonical_id': None,
+               'epub': 'a.epub', 'markdown': 'a.md', 'digest': 'fragment-dir'}
+        results = {'epub': True, 'markdown': True, 'digest': True}
+        with patch.object(main, 'GOOGLE_DRIVE_FOLDER_ID', 'folder'), patch.object(main, 'GOOGLE_DRIVE_MD_FOLDER_ID', ''):
+            with patch('main.google_drive_uploader.upload_file_to_drive', return_value=False):
+                main._upload_episode(job, results)
+            mock_add.assert_not_called()
+            mock_logged.assert_not_called()
+
+            with patch('main.google_drive_uploader.upload_file_to_drive', return_value=True):
+                main._upload_episode(job, results)
+            mock_add.assert_called_once_with('fragment-dir', 'ep-1')
+            mock_logged.assert_called_once()
+
+    def test_old_periods_are_removed(self):
+        for day in range(1, 5):
+            self._add('ep', "Episode", period=f"2024-05-0{day}")
+        with patch.object(digest_builder, 'DIGEST_KEEP_PERIODS', 2):
+            digest_builder.publish_digests()
+        self.assertEqual(sorted(os.listdir(self.test_dir)), ['2024-05-03', '2024-05-04'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,124 @@
+import unittest
+import logging
+import os
+import tempfile
+from unittest.mock import ANY, patch
+import episode_store
+import transcript_cache
+import episode_dedupe
+
+# --- Test Configuration ---
+logging.basicConfig(level=logging.ERROR)
+
+
+def _episode(episode_id, podcast_title, audio_url, title='Big Interview', length=None, duration=None):
+    return {
+        'id': episode_id,
+        'title': title,
+        'podcast_title': podcast_title,
+        'published': '2026-01-01T00:00:00+00:00',
+        'audio_url': audio_url,
+        'enclosure_length': length,
+        'duration': duration,
+    }
+
+
+class TestEpisodeDedupe(unittest.TestCase):
+    """
+    Tests that the same episode syndicated in several feeds, or republished
+    under a new GUID, is only transcribed once.
+    """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.store = episode_store.EpisodeStore(
+            path=os.path.join(self.tmp_dir.name, 'processed.db'),
+            legacy_log_path=os.path.join(self.tmp_dir.name, 'processed.log')
+        )
+
+    def tearDown(self):
+        self.store.close()
+        self.tmp_dir.cleanup()
+
+    def test_tracking_prefixes_are_stripped(self):
+        """Chained analytics redirects, scheme and query string don't change the identity."""
+        tracked = 'https://dts.podtrac.com/redirect.mp3/chtbl.com/track/ABC12/Traffic.Megaphone.fm/VMP123.mp3?updated=1'
+        plain = 'http://traffic.megaphone.fm/VMP123.mp3'
+        self.assertEqual(episode_dedupe.normalize_enclosure_url(tracked), 'traffic.megaphone.fm/VMP123.mp3')
+        self.assertEqual(episode_dedupe.normalize_enclosure_url(tracked), episode_dedupe.normalize_enclosure_url(plain))
+
+    def test_query_identified_enclosures_stay_distinct(self):
+        """Only tracking parameters are dropped; a query naming the file is part of its identity."""
+        first = _episode('a-1', 'Show A', 'https://host.com/play?id=111&utm_source=rss', title='Episode One')
+        second = _episode('a-2', 'Show A', 'https://host.com/play?id=222', title='Episode Two')
+        self.assertEqual(episode_dedupe.normalize_enclosure_url(first['audio_url']), 'host.com/play?id=111')
+        self.assertTrue(set(episode_dedupe.fingerprint_keys(first)).isdisjoint(episode_dedupe.fingerprint_keys(second)))
+
+        collapsed = episode_dedupe.collapse_duplicates([first, second], self.store)
+        self.assertEqual([e['id'] for e in collapsed], ['a-1', 'a-2'])
+
+    def test_url_alone_does_not_skip_across_runs(self):
+        """An earlier episode with the same URL but another title and length is not enough to skip."""
+        original = _episode('old', 'Show A', 'https://cdn.example.com/latest.mp3', title='Part One', length=5000)
+        self.store.mark_processed(original['id'])
+        self.store.add_fingerprints(original['id'], episode_dedupe.fingerprint_keys(original))
+
+        newer = _episode('new', 'Show A', 'https://cdn.example.com/latest.mp3', title='Part Two', length=7000)
+        collapsed = episode_dedupe.collapse_duplicates([newer], self.store)
+
+        self.assertEqual([e['id'] for e in collapsed], ['new'])
+        self.assertNotIn('duplicate_of', collapsed[0])
+        self.assertNotIn('new', self.store)
+
+    def test_duplicates_in_one_run_become_aliases(self):
+        """The first copy is kept and later copies are attached to it as aliases."""
+        episodes = [
+            _episode('a-1', 'Show A', 'https://pdst.fm/e/cdn.example.com/ep.mp3'),
+            _episode('b-1', 'Show B', 'https://cdn.example.com/ep.mp3?src=rss'),
+            _episode('c-1', 'Show C', 'https://cdn.example.com/other.mp3', title='Something Else'),
+        ]
+
+        collapsed = episode_dedupe.collapse_duplicates(episodes, self.store)
+
+        self.assertEqual([e['id'] for e in collapsed], ['a-1', 'c-1'])
+        self.assertEqual([alias['id'] for alias in collapsed[0]['aliases']], ['b-1'])
+
+    def test_republished_episode_is_matched_across_runs(self):
+        """A new GUID and URL with the same title and length matches an earlier processed episode."""
+        original = _episode('old-guid', 'Show A', 'https://cdn.example.com/v1.mp3', length=5000)
+        self.store.mark_processed(original['id'])
+        self.store.add_fingerprints(original['id'], episode_dedupe.fingerprint_keys(original))
+
+        republished = _episode('new-guid', 'Show A', 'https://cdn.example.com/v2.mp3', title='Big Interview!', length=5000)
+        collapsed = episode_dedupe.collapse_duplicates([republished], self.store)
+
+        # It's only marked processed once its own files are published.
+        self.assertEqual([(e['id'], e['duplicate_of']) for e in collapsed], [('new-guid', 'old-guid')])
+        self.assertNotIn('new-guid', self.store)
+
+    def test_republished_episode_is_published_from_the_cache(self):
+        """main publishes the repeat from the earlier episode's content, without transcribing it."""
+        import main
+        cache = transcript_cache.TranscriptCache(path=os.path.join(self.tmp_dir.name, 'cache'))
+        content = {'summary': 'S', 'major_points': [], 'quotes': [], 'sources': []}
+        republished = _episode('new-guid', 'Show A', 'https://cdn.example.com/v2.mp3')
+        republished['duplicate_of'] = 'old-guid'
+
+        with patch('main.transcript_cache.get_cache', return_value=cache), \
+             patch.object(main, 'OUTPUT_DIR', self.tmp_dir.name), \
+             patch.object(main, 'OUTPUT_MD_DIR', self.tmp_dir.name), \
+             patch.object(main, 'GOOGLE_DRIVE_FOLDER_ID', 'YOUR_GOOGLE_DRIVE_FOLDER_ID'), \
+             patch('main.digest_builder.is_enabled', return_value=False), \
+             patch('main.podcast_fetcher.get_new_episodes', return_value=[republished]), \
+             patch('main.render_executor.RenderExecutor'), \
+             patch('main.transcriber.transcribe_episode') as mock_transcribe, \
+             patch('main._publish_episode') as mock_publish:
+            main._cache_published_content('old-guid', content, 'Transcript')
+            main.process_podcasts(feed_urls=['https://example.com/feed'])
+
+        mock_transcribe.assert_not_called()
+        mock_publish.assert_called_once_with(ANY, republished, content, 'Transcript', canonical_id='old-guid')
+
+
+if __name__ == '__main__':
+    unittest.main()
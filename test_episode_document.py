@@ -0,0 +1,115 @@
+import unittest
+from unittest.mock import patch
+import logging
+import os
+import shutil
+import tempfile
+import zipfile
+from xml.dom import minidom
+import episode_document
+import epub_generator
+import md_generator
+
+# --- Test Configuration ---
+logging.basicConfig(level=logging.ERROR)
+
+
+class TestEpisodeDocument(unittest.TestCase):
+    """
+    Tests building the episode document once and rendering it as ePub and Markdown.
+    """
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.document = episode_document.build_document(
+            "Episode 1", "The Show", "First line.\nSecond line.", ["A point"], ["A quote"], [],
+            "Host: Hello & welcome.\nGuest: <laughs> Thanks.", date="2024-01-02"
+        )
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_iter_lines(self):
+        self.assertEqual(list(episode_document.iter_lines("a\nb\n\nc")), ["a", "b", "", "c"])
+        self.assertEqual(list(episode_document.iter_lines("")), [""])
+        self.assertEqual(list(episode_document.iter_lines("a\n")), ["a", ""])
+
+    def test_markdown_matches_the_previous_layout(self):
+        path = os.path.join(self.test_dir, 'out', 'episode.md')
+        self.assertTrue(md_generator.render_markdown(self.document, path))
+        with open(path, encoding='utf-8') as f:
+            content = f.read()
+        self.assertTrue(content.startswith("# Episode 1\n**Podcast:** The Show\n**Date Processed:** 2024-01-02\n\n"))
+        self.assertIn("## Major Takeaways\n- A point\n\n## Notable Quotes\n> A quote\n\n", content)
+        self.assertIn("## Sources Referenced\nNo sources were referenced.\n\n", content)
+        self.assertTrue(content.endswith("## Full Transcript\nHost: Hello & welcome.\nGuest: <laughs> Thanks.\n"))
+
+    def test_epub_chapters_are_escaped_xhtml(self):
+        path = os.path.join(self.test_dir, 'episode.epub')
+        self.assertTrue(epub_generator.render_epub(self.document, path))
+        with zipfile.ZipFile(path) as archive:
+            names = archive.namelist()
+            transcript = archive.read('EPUB/chap_05.xhtml').decode('utf-8')
+            summary = archive.read('EPUB/chap_01.xhtml').decode('utf-8')
+        self.assertIn('EPUB/nav.xhtml', names)
+        self.assertIn("<p>Host: Hello &amp; welcome.</p>\n<p>Guest: &lt;laughs&gt; Thanks.</p>", transcript)
+        self.assertIn("<p>First line.<br/>Second line.</p>", summary)
+
+    def test_every_epub_document_is_well_formed_xml(self):
+        """The chapters are written as they are rendered, so each must parse as XML on its own."""
+        document = dict(self.document, quotes=['He said "no" & <left>', 'Another one'])
+        path = os.path.join(self.test_dir, 'episode.epub')
+        self.assertTrue(epub_generator.render_epub(document, path))
+        with zipfile.ZipFile(path) as archive:
+            names = [name for name in archive.namelist() if name.endswith(('.xhtml', '.opf', '.ncx'))]
+            for name in names:
+                with self.subTest(name=name):
+                    minidom.parseString(archive.read(name))
+            quotes = archive.read('EPUB/chap_03.xhtml').decode('utf-8')
+        self.assertIn('chap_05.xhtml', ' '.join(names))
+        self.assertIn("&#8220;He said \"no\" &amp; &lt;left&gt;&#8221;", quotes)
+
+    def test_transcript_parts_break_at_speaker_turns(self):
+        turns = [f"[00:{minute:02d}:00] {'Host' if minute % 2 else 'Guest'}: " + "word " * 30 for minute in range(12)]
+        # A turn continued over several lines stays in one part.
+        turns[5] += "\n" + "\n".join("more " * 30 for _ in range(2))
+        transcript = "\n".join(turns)
+        parts = epub_generator.plan_transcript_parts(transcript, max_chars=700)
+
+        self.assertEqual(parts[0][0], 0)
+        self.assertEqual(parts[-1][1], len(transcript))
+        for (_, end, _), (start, _, _) in zip(parts, parts[1:]):
+            self.assertEqual(end, start)
+            self.assertTrue(transcript[start:].startswith("[00:"))
+        self.assertEqual(parts[0][2], "00:00:00 Guest")
+        self.assertGreater(len(parts), 3)
+        self.assertTrue(all(end - start <= 700 for start, end, _ in parts))
+
+    def test_long_transcript_is_written_in_parts(self):
+        transcript = "\n".join(f"Speaker {i % 3}: " + "text " * 40 for i in range(200))
+        document = dict(self.document, transcript=transcript)
+        path = os.path.join(self.test_dir, 'long.epub')
+        with patch.object(epub_generator, 'EPUB_TRANSCRIPT_PART_KB', 4):
+            self.assertTrue(epub_generator.render_epub(document, path))
+        with zipfile.ZipFile(path) as archive:
+            parts = sorted(name for name in archive.namelist() if name.startswith('EPUB/chap_05'))
+            nav = archive.read('EPUB/nav.xhtml').decode('utf-8')
+            text = ''.join(archive.read(name).decode('utf-8') for name in parts)
+        self.assertGreater(len(parts), 5)
+        self.assertIn("2. Speaker", nav)
+        self.assertEqual(text.count("<p>Speaker"), 200)
+
+    def test_render_document_uses_registered_renderers(self):
+        outputs = {
+            'epub': os.path.join(self.test_dir, 'a.epub'),
+            'markdown': os.path.join(self.test_dir, 'a.md'),
+            'pdf': os.path.join(self.test_dir, 'a.pdf'),
+        }
+        results = episode_document.render_document(self.document, outputs)
+        self.assertEqual(results, {'epub': True, 'markdown': True, 'pdf': False})
+        self.assertTrue(os.path.exists(outputs['epub']))
+        self.assertFalse(os.path.exists(outputs['pdf']))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+import unittest
+import logging
+import os
+import tempfile
+import episode_store
+
+# --- Test Configuration ---
+logging.basicConfig(level=logging.ERROR)
+
+
+class TestEpisodeStore(unittest.TestCase):
+    """
+    Tests the SQLite episode store: the one-time import of the legacy log,
+    membership checks, stage statuses and the unsynced queue for Drive.
+    """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp_dir.name, 'processed.db')
+        self.log_path = os.path.join(self.tmp_dir.name, 'processed_episodes.log')
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_legacy_log_is_imported_once(self):
+        """IDs from the flat log become processed episodes, and the import isn't repeated."""
+        with open(self.log_path, 'w') as f:
+            f.write("ep-1\nep-2\n\n")
+
+        store = episode_store.EpisodeStore(path=self.db_path, legacy_log_path=self.log_path)
+        self.assertIn('ep-1', store)
+        self.assertIn('ep-2', store)
+        self.assertNotIn('ep-3', store)
+        self.assertEqual(store.get_unsynced_ids(), ['ep-1', 'ep-2'])
+        store.mark_synced(['ep-1', 'ep-2'])
+        store.close()
+
+        with open(self.log_path, 'a') as f:
+            f.write("ep-3\n")
+        reopened = episode_store.EpisodeStore(path=self.db_path, legacy_log_path=self.log_path)
+        self.assertNotIn('ep-3', reopened)
+        self.assertEqual(reopened.get_unsynced_ids(), [])
+        reopened.close()
+
+    def test_stages_and_sync_queue(self):
+        """Only fully processed episodes count as done and are queued for Drive."""
+        store = episode_store.EpisodeStore(path=self.db_path, legacy_log_path=self.log_path)
+        store.set_status('ep-1', episode_store.STATUS_TRANSCRIBED, feed_url='http://feed', published='2026-01-01T00:00:00+00:00')
+        self.assertNotIn('ep-1', store)
+        self.assertEqual(store.get_unsynced_ids(), [])
+
+        store.mark_processed('ep-1')
+        self.assertIn('ep-1', store)
+        self.assertEqual(store.get_unsynced_ids(), ['ep-1'])
+
+        # Remote IDs arrive already synced, and a processed episode never moves back a stage.
+        self.assertEqual(store.merge_processed_ids(['ep-1', 'ep-2']), 1)
+        store.set_status('ep-1', episode_store.STATUS_TRANSCRIBED)
+        self.assertEqual(store.get_status('ep-1'), episode_store.STATUS_PROCESSED)
+        self.assertEqual(store.get_unsynced_ids(), ['ep-1'])
+        self.assertEqual(list(store.iter_processed_ids()), ['ep-1', 'ep-2'])
+        store.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
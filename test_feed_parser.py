@@ -0,0 +1,72 @@
+import unittest
+import logging
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+from unittest.mock import patch
+import feed_parser
+
+# --- Test Configuration ---
+logging.basicConfig(level=logging.ERROR)
+
+NOW = datetime(2026, 1, 10, 12, 0, tzinfo=timezone.utc)
+
+def _item(guid, hours_ago, extra=""):
+    pub_date = format_datetime(NOW - timedelta(hours=hours_ago))
+    return f"<item><title>Episode {guid}</title><guid>{guid}</guid><pubDate>{pub_date}</pubDate>{extra}</item>"
+
+def _rss(items):
+    return (
+        '<?xml version="1.0"?><rss version="2.0" xmlns:itunes="http://www.itunes.com/dtds/podcast-1.0.dtd">'
+        f'<channel><title>My Show</title>{"".join(items)}</channel></rss>'
+    ).encode('utf-8')
+
+
+class TestFeedParser(unittest.TestCase):
+    """
+    Tests the streaming feed parser: compact records, early termination and
+    the feedparser fallback for feeds it can't read.
+    """
+
+    def test_compact_record(self):
+        """An item is reduced to the handful of fields the pipeline uses."""
+        body = _rss([_item('ep-1', 1, '<enclosure url="http://cdn/ep-1.mp3" length="1234" type="audio/mpeg"/>'
+                                     '<itunes:duration>1:02:03</itunes:duration>')])
+
+        episodes = feed_parser.parse_recent_episodes('http://feed', body, NOW - timedelta(hours=36))
+
+        self.assertEqual(episodes, [{
+            'id': 'ep-1',
+            'title': 'Episode ep-1',
+            'podcast_title': 'My Show',
+            'published': (NOW - timedelta(hours=1)).isoformat(),
+            'audio_url': 'http://cdn/ep-1.mp3',
+            'audio_type': 'audio/mpeg',
+            'enclosure_length': 1234,
+            'duration': 3723,
+        }])
+
+    def test_stops_after_run_of_old_entries(self):
+        """The scan stops once enough consecutive items are older than the cutoff."""
+        items = [_item('new', 1)] + [_item(f'old-{i}', 100 + i) for i in range(50)]
+        body = _rss(items)
+
+        with patch('feed_parser._read_item', wraps=feed_parser._read_item) as mock_read_item:
+            episodes = feed_parser.parse_recent_episodes('http://feed', body, NOW - timedelta(hours=36), max_stale=3)
+
+        self.assertEqual([e['id'] for e in episodes], ['new'])
+        self.assertEqual(mock_read_item.call_count, 4)
+
+    def test_malformed_feed_falls_back_to_feedparser(self):
+        """A feed that isn't well-formed XML is still read through feedparser."""
+        body = _rss([_item('ep-1', 1, '<enclosure url="http://cdn/ep-1.mp3" type="audio/mpeg"/>')]).replace(b'</channel>', b'')
+
+        with patch('feed_parser._parse_with_feedparser', wraps=feed_parser._parse_with_feedparser) as mock_fallback:
+            episodes = feed_parser.parse_recent_episodes('http://feed', body, NOW - timedelta(hours=36))
+
+        mock_fallback.assert_called_once()
+        self.assertEqual([e['id'] for e in episodes], ['ep-1'])
+        self.assertEqual(episodes[0]['audio_url'], 'http://cdn/ep-1.mp3')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+import unittest
+import logging
+import os
+import tempfile
+from datetime import datetime, timedelta, timezone
+import feed_scheduler
+
+# --- Test Configuration ---
+logging.basicConfig(level=logging.ERROR)
+
+NOW = datetime(2026, 3, 1, 12, 0, tzinfo=timezone.utc)
+
+
+class TestFeedScheduler(unittest.TestCase):
+    """
+    Tests that feed_scheduler polls frequent publishers more often than
+    infrequent ones and keeps its due times in order.
+    """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, 'schedule.json')
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_interval_follows_publish_cadence(self):
+        """A daily show is polled more often than a weekly one, and both within the bounds."""
+        scheduler = feed_scheduler.FeedScheduler(['daily', 'weekly'], path=self.path)
+        observations = {
+            'daily': [NOW - timedelta(days=d) for d in range(5)],
+            'weekly': [NOW - timedelta(weeks=w) for w in range(5)],
+        }
+        scheduler.record_poll(['daily', 'weekly'], observations, now=NOW)
+
+        self.assertEqual(scheduler.poll_interval('daily', NOW), timedelta(hours=6))
+        self.assertEqual(scheduler.poll_interval('weekly', NOW), timedelta(hours=feed_scheduler.MAX_POLL_HOURS))
+
+    def test_pop_due_returns_only_due_feeds_and_state_survives_restart(self):
+        """New feeds are due immediately; after a poll they wait, and the schedule is reloaded from disk."""
+        scheduler = feed_scheduler.FeedScheduler(['a', 'b'], path=self.path)
+        due = scheduler.pop_due(now=datetime.now(timezone.utc))
+        self.assertEqual(sorted(due), ['a', 'b'])
+
+        scheduler.record_poll(due, {'a': [NOW - timedelta(days=1), NOW]}, now=NOW)
+        self.assertEqual(scheduler.pop_due(now=NOW + timedelta(minutes=1)), [])
+        scheduler.save()
+
+        reloaded = feed_scheduler.FeedScheduler(['a', 'b'], path=self.path)
+        schedule = {item['feed_url']: item for item in reloaded.get_schedule(now=NOW)}
+        self.assertEqual(sorted(schedule), ['a', 'b'])
+        self.assertEqual(schedule['a']['cadence_hours'], 24.0)
+        self.assertEqual(schedule['a']['last_polled'], NOW.isoformat())
+
+
+if __name__ == '__main__':
+    unittest.main()
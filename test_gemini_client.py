@@ -0,0 +1,103 @@
+import unittest
+from unittest.mock import patch, MagicMock
+import logging
+import threading
+from google.api_core import exceptions as google_exceptions
+import gemini_client
+
+# --- Test Configuration ---
+logging.basicConfig(level=logging.ERROR)
+
+
+class TestGeminiClient(unittest.TestCase):
+    """
+    Tests the shared token buckets, the jittered retries and the metrics.
+    """
+
+    def setUp(self):
+        gemini_client._models.clear()
+        self.limiter = gemini_client.RateLimiter(requests_per_minute=60, tokens_per_minute=6000)
+        patcher = patch.object(gemini_client, '_limiters', {'model': self.limiter})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_bucket_waits_once_empty(self):
+        bucket = gemini_client.TokenBucket(60)
+        self.assertEqual(bucket.reserve(60, now=bucket.updated), 0.0)
+        # One token per second refills, so the next request waits a second.
+        self.assertAlmostEqual(bucket.reserve(1, now=bucket.updated), 1.0)
+        self.assertAlmostEqual(bucket.reserve(1, now=bucket.updated + 1.0), 1.0)
+
+    def test_token_bucket_limits_large_requests(self):
+        with patch('gemini_client.time.sleep') as mock_sleep:
+            self.limiter.acquire(6000)
+            self.limiter.acquire(3000)
+        self.assertEqual(mock_sleep.call_count, 1)
+        self.assertAlmostEqual(mock_sleep.call_args[0][0], 30.0, delta=0.5)
+        metrics = self.limiter.get_metrics()
+        self.assertEqual((metrics['requests'], metrics['waits'], metrics['max_queue_depth']), (2, 1, 1))
+
+    def test_retry_hint_is_respected(self):
+        self.assertEqual(gemini_client._retry_hint(google_exceptions.ResourceExhausted("Quota exceeded. Please retry in 17.5s.")), 17.5)
+        self.assertEqual(gemini_client._retry_hint(Exception("429 retry_delay {\n  seconds: 12\n}")), 12.0)
+        self.assertIsNone(gemini_client._retry_hint(Exception("boom")))
+        for attempt in range(5):
+            self.assertGreaterEqual(gemini_client._backoff_delay(attempt, hint=17.5), 17.5)
+
+    @patch('gemini_client.time.sleep')
+    @patch('gemini_client.genai.GenerativeModel')
+    def test_rate_limit_is_retried_and_counted(self, mock_model, mock_sleep):
+        response = MagicMock()
+        response.usage_metadata.total_token_count = 100
+        mock_model.return_value.generate_content.side_effect = [
+            google_exceptions.ResourceExhausted("Please retry in 2s."),
+            google_exceptions.ServiceUnavailable("overloaded"),
+            response,
+        ]
+
+        self.assertIs(gemini_client.generate_content('model', 'prompt'), response)
+
+        metrics = self.limiter.get_metrics()
+        self.assertEqual(metrics['rate_limited'], 1)
+        self.assertEqual(metrics['retries'], 2)
+        self.assertEqual(metrics['requests'], 3)
+        # The 429 held the limiter back for at least the hinted 2 seconds.
+        self.assertGreaterEqual(max(call.args[0] for call in mock_sleep.call_args_list), 2.0)
+
+    @patch('gemini_client.genai.GenerativeModel')
+    def test_stream_settles_tokens_after_the_last_chunk(self, mock_model):
+        chunks = [MagicMock(text='{"a": '), MagicMock(text='1}')]
+        final_chunk = MagicMock()
+        type(final_chunk).text = property(lambda self: (_ for _ in ()).throw(ValueError("no parts")))
+        response = MagicMock()
+        response.__iter__.return_value = iter(chunks + [final_chunk])
+        response.usage_metadata.total_token_count = 500
+        mock_model.return_value.generate_content.return_value = response
+
+        with patch.object(self.limiter, 'settle') as mock_settle:
+            stream = gemini_client.stream_content('model', 'prompt', estimated_tokens=100)
+            self.assertEqual(next(stream), '{"a": ')
+            mock_settle.assert_not_called()
+            self.assertEqual(list(stream), ['1}'])
+        mock_settle.assert_called_once_with(100, 500)
+        self.assertTrue(mock_model.return_value.generate_content.call_args.kwargs['stream'])
+
+    @patch('gemini_client.genai.GenerativeModel')
+    def test_other_errors_are_not_retried(self, mock_model):
+        mock_model.return_value.generate_content.side_effect = ValueError("bad request")
+        with self.assertRaises(ValueError):
+            gemini_client.generate_content('model', 'prompt')
+        self.assertEqual(mock_model.return_value.generate_content.call_count, 1)
+
+    @patch('gemini_client.genai.GenerativeModel')
+    def test_model_is_shared_between_threads(self, mock_model):
+        threads = [threading.Thread(target=gemini_client.get_model, args=('model',)) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        mock_model.assert_called_once_with('model')
+
+
+if __name__ == '__main__':
+    unittest.main()
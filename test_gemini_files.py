@@ -0,0 +1,80 @@
+import unittest
+from unittest.mock import patch, MagicMock
+import logging
+import os
+import tempfile
+from datetime import datetime, timedelta, timezone
+import gemini_files
+
+# --- Test Configuration ---
+logging.basicConfig(level=logging.ERROR)
+
+
+def _file(name, state):
+    audio_file = MagicMock()
+    audio_file.name = name
+    audio_file.state.name = state
+    return audio_file
+
+
+class TestGeminiFiles(unittest.TestCase):
+    """
+    Tests the adaptive readiness polling and the registry of reusable uploads.
+    """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.registry = gemini_files.UploadRegistry(path=os.path.join(self.tmp_dir.name, 'uploads.json'))
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    @patch('gemini_files.time.sleep')
+    @patch('gemini_files.genai.get_file')
+    def test_polling_starts_fast_and_backs_off(self, mock_get_file, mock_sleep):
+        mock_get_file.side_effect = [_file('files/a', 'PROCESSING')] * 5 + [_file('files/a', 'ACTIVE')]
+        with patch.object(gemini_files, 'FILE_POLL_FIRST_SECONDS', 0.5), patch.object(gemini_files, 'FILE_POLL_MAX_SECONDS', 4):
+            audio_file = gemini_files.wait_until_active(_file('files/a', 'PROCESSING'))
+
+        self.assertEqual(audio_file.state.name, 'ACTIVE')
+        self.assertEqual([call.args[0] for call in mock_sleep.call_args_list], [0.5, 1.0, 2.0, 4, 4, 4])
+
+    @patch('gemini_files.genai.get_file')
+    def test_polling_deadline(self, mock_get_file):
+        mock_get_file.return_value = _file('files/a', 'PROCESSING')
+        with patch.object(gemini_files, 'FILE_POLL_FIRST_SECONDS', 0.01):
+            with self.assertRaises(TimeoutError):
+                gemini_files.wait_until_active(_file('files/a', 'PROCESSING'), timeout=0.05)
+
+    def test_failed_processing_raises(self):
+        with self.assertRaises(ValueError):
+            gemini_files.wait_until_active(_file('files/a', 'FAILED'))
+
+    @patch('gemini_files.genai.get_file')
+    def test_registered_upload_is_reused_across_instances(self, mock_get_file):
+        mock_get_file.return_value = _file('files/a', 'ACTIVE')
+        self.registry.put('audio-key', _file('files/a', 'ACTIVE'))
+
+        reloaded = gemini_files.UploadRegistry(path=self.registry.path)
+        self.assertEqual(reloaded.get('audio-key').name, 'files/a')
+        self.assertIsNone(reloaded.get('other-key'))
+
+    @patch('gemini_files.genai.get_file', side_effect=Exception("404 not found"))
+    def test_vanished_upload_is_forgotten(self, mock_get_file):
+        self.registry.put('audio-key', _file('files/a', 'ACTIVE'))
+        self.assertIsNone(self.registry.get('audio-key'))
+        self.assertEqual(self.registry._entries, {})
+
+    @patch('gemini_files.genai.delete_file')
+    def test_expired_uploads_are_deleted(self, mock_delete_file):
+        self.registry.put('old', _file('files/old', 'ACTIVE'))
+        self.registry.put('new', _file('files/new', 'ACTIVE'))
+        self.registry._entries['old']['expires_at'] = (datetime.now(timezone.utc) - timedelta(minutes=1)).isoformat()
+
+        self.assertEqual(self.registry.cleanup_expired(), 1)
+        mock_delete_file.assert_called_once_with('files/old')
+        self.assertEqual(list(self.registry._entries), ['new'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+import unittest
+from unittest.mock import MagicMock, patch
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+import google_drive_uploader
+
+# --- Test Configuration ---
+logging.basicConfig(level=logging.ERROR)
+
+
+def _credentials(expires_in):
+    creds = MagicMock()
+    creds.token = 'token'
+    creds.refresh_token = 'refresh'
+    creds.expiry = datetime.utcnow() + expires_in
+    creds.apply.side_effect = lambda headers, token=None: headers.update(authorization=f"Bearer {token or creds.token}")
+    return creds
+
+
+class TestDriveClient(unittest.TestCase):
+    """
+    Tests that the Drive credentials are loaded once and refreshed only near
+    expiry, and that the service is built once per thread.
+    """
+
+    def setUp(self):
+        for patcher in (
+            patch.object(google_drive_uploader, '_credentials', None),
+            patch.object(google_drive_uploader, '_thread_services', threading.local()),
+            patch.object(google_drive_uploader, '_get_auth_request', return_value='request'),
+            patch.object(google_drive_uploader, '_save_token'),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_credentials_are_loaded_once(self):
+        creds = _credentials(timedelta(hours=1))
+        with patch.object(google_drive_uploader, '_load_credentials', return_value=creds) as load:
+            self.assertIs(google_drive_uploader.get_credentials(), creds)
+            self.assertIs(google_drive_uploader.get_credentials(), creds)
+        load.assert_called_once()
+        creds.refresh.assert_not_called()
+        google_drive_uploader._save_token.assert_not_called()
+
+    def test_token_is_refreshed_only_near_expiry(self):
+        creds = _credentials(timedelta(minutes=2))
+        with patch.object(google_drive_uploader, '_load_credentials', return_value=creds):
+            google_drive_uploader.get_credentials()
+            google_drive_uploader.get_credentials()
+        creds.refresh.assert_called_once_with('request')
+        google_drive_uploader._save_token.assert_called_once_with(creds)
+
+    def test_no_credentials(self):
+        with patch.object(google_drive_uploader, '_load_credentials', return_value=None), \
+             patch.object(google_drive_uploader, 'build') as build:
+            self.assertIsNone(google_drive_uploader.get_service())
+        build.assert_not_called()
+
+    @patch('google_drive_uploader.build', side_effect=lambda *args, **kwargs: object())
+    def test_service_is_built_once_per_thread(self, build):
+        creds = _credentials(timedelta(hours=1))
+        with patch.object(google_drive_uploader, '_load_credentials', return_value=creds):
+            service = google_drive_uploader.get_service()
+            self.assertIs(google_drive_uploader.get_service(), service)
+
+            other = []
+            thread = threading.Thread(target=lambda: other.append(google_drive_uploader.get_service()))
+            thread.start()
+            thread.join()
+        self.assertIsNot(other[0], service)
+        self.assertEqual(build.call_count, 2)
+
+    @patch('google_drive_uploader.build', side_effect=lambda *args, **kwargs: kwargs['http'])
+    def test_token_rejected_during_concurrent_uploads_is_refreshed_once(self, build):
+        """Both threads get a 401 for the old token; one refreshes, under the lock, and token.json is saved."""
+        creds = _credentials(timedelta(hours=1))
+        creds.token = 'old'
+
+        def refresh(request):
+            time.sleep(0.05)
+            creds.token = 'new'
+        creds.refresh.side_effect = refresh
+
+        both_rejected = threading.Barrier(2, timeout=5)
+
+        def drive(uri, method, body=None, headers=None, **kwargs):
+            if headers['authorization'] != 'Bearer new':
+                # The token expired early on Drive's side; make sure both uploads see that.
+                both_rejected.wait()
+                return MagicMock(status=401), b''
+            return MagicMock(status=200), b'{}'
+
+        statuses = []
+
+        def upload():
+            http = google_drive_uploader.get_service()
+            http.http = MagicMock(request=MagicMock(side_effect=drive))
+            response, _ = http.request('https://www.googleapis.com/upload/drive/v3/files', 'POST')
+            statuses.append(response.status)
+
+        with patch.object(google_drive_uploader, '_load_credentials', return_value=creds):
+            threads = [threading.Thread(target=upload) for _ in range(2)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(statuses, [200, 200])
+        creds.refresh.assert_called_once()
+        google_drive_uploader._save_token.assert_called_once_with(creds)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,235 @@
+import unittest
+from unittest.mock import patch
+import json
+import logging
+import os
+import tempfile
+import time
+import llm_processor
+import model_router
+import transcript_cache
+
+# --- Test Configuration ---
+logging.basicConfig(level=logging.ERROR)
+
+
+def _stream(text, piece_size=7):
+    """Splits a response into small pieces, the way a streamed response arrives."""
+    return iter([text[i:i + piece_size] for i in range(0, len(text), piece_size)])
+
+
+class TestLlmProcessor(unittest.TestCase):
+    """
+    Tests the streamed, schema-constrained summary, its repair pass and the map-reduce mode for long transcripts.
+    """
+
+    def setUp(self):
+        patcher = patch('llm_processor.gemini_client.configure', return_value=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        # No summary cache unless a test sets one up.
+        patcher = patch.object(llm_processor, '_summary_cache', transcript_cache.TranscriptCache(max_bytes=0))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_split_transcript_cuts_between_speaker_turns(self):
+        turns = [f"Speaker {i % 2 + 1}: " + "word " * 30 + f"turn {i}." for i in range(10)]
+        chunks = llm_processor.split_transcript('\n'.join(turns), max_tokens=100)
+
+        self.assertGreater(len(chunks), 1)
+        # Every turn ends up whole in exactly one chunk, in order.
+        self.assertEqual('\n\n'.join(chunks).split('\n\n'), [turn.strip() for turn in turns])
+        for chunk in chunks:
+            self.assertLessEqual(llm_processor.gemini_client.estimate_text_tokens(chunk), 100)
+
+    def test_split_transcript_splits_an_oversized_turn_at_sentences(self):
+        turn = "Host: " + " ".join(f"This is sentence number {i}." for i in range(40))
+        chunks = llm_processor.split_transcript(turn, max_tokens=50)
+        self.assertGreater(len(chunks), 1)
+        self.assertTrue(all(chunk.rstrip().endswith('.') for chunk in chunks))
+        self.assertEqual(' '.join(chunks), turn)
+
+    def test_streamed_object_yields_fields_as_they_complete(self):
+        parser = llm_processor.StreamedJsonObject()
+        self.assertEqual(parser.feed('```json\n{"summary": "Two {braces} and a \\"quote\\"'), [])
+        self.assertEqual(parser.feed('", "major_points": ["a", "b"'), ['summary'])
+        self.assertEqual(parser.feed('], "count": 12'), ['major_points'])
+        # The completed fields are no longer buffered.
+        self.assertEqual(parser._buffer, ', "count": 12')
+        # The number could still grow until something follows it.
+        self.assertEqual(parser.feed('3}'), ['count'])
+        self.assertTrue(parser.complete)
+        self.assertEqual(parser.fields, {'summary': 'Two {braces} and a "quote"', 'major_points': ['a', 'b'], 'count': 123})
+        self.assertEqual(parser.received, 93)
+
+    @patch('llm_processor.gemini_client.stream_content')
+    def test_short_transcript_uses_one_streamed_call(self, mock_stream):
+        summary = {'summary': 's', 'major_points': ['p'], 'quotes': ['q'], 'sources': []}
+        mock_stream.return_value = _stream(json.dumps(summary))
+        received = []
+
+        result = llm_processor.process_transcript_with_llm("Host: Hello there.", "Episode", on_field=lambda field, value: received.append(field))
+
+        self.assertEqual(result, summary)
+        self.assertEqual(received, ['summary', 'major_points', 'quotes', 'sources'])
+        self.assertEqual(mock_stream.call_count, 1)
+        self.assertEqual(mock_stream.call_args.kwargs['generation_config']['response_schema'], llm_processor.SUMMARY_SCHEMA)
+
+    @patch('llm_processor.gemini_client.stream_content')
+    def test_truncated_response_repairs_only_missing_fields(self, mock_stream):
+        truncated = '{"summary": "s", "major_points": ["p"], "quotes": ["q", "an unfinished qu'
+        mock_stream.side_effect = [_stream(truncated), _stream('{"quotes": ["q"], "sources": ["book"]}')]
+
+        result = llm_processor.process_transcript_with_llm("Host: Hello there.", "Episode")
+
+        self.assertEqual(result, {'summary': 's', 'major_points': ['p'], 'quotes': ['q'], 'sources': ['book']})
+        repair_schema = mock_stream.call_args.kwargs['generation_config']['response_schema']
+        self.assertEqual(repair_schema['required'], ['quotes', 'sources'])
+
+    @patch('llm_processor.gemini_client.stream_content')
+    def test_broken_stream_keeps_received_fields(self, mock_stream):
+        def broken():
+            yield '{"summary": "s", "major_points": ["p"], '
+            raise ConnectionError("stream reset")
+
+        mock_stream.side_effect = [broken(), _stream('{"quotes": [], "sources": []}')]
+        result = llm_processor.process_transcript_with_llm("Host: Hello there.", "Episode")
+        self.assertEqual(result, {'summary': 's', 'major_points': ['p'], 'quotes': [], 'sources': []})
+
+    @patch('llm_processor.gemini_client.stream_content')
+    def test_still_incomplete_after_repair_fails(self, mock_stream):
+        mock_stream.side_effect = [_stream('{"summary": "s"'), _stream('{"major_points": [')]
+        self.assertIsNone(llm_processor.process_transcript_with_llm("Host: Hello there.", "Episode"))
+
+    @patch('llm_processor.gemini_client.stream_content')
+    def test_long_transcript_is_mapped_and_reduced(self, mock_stream):
+        transcript = '\n'.join(f"Speaker {i % 2 + 1}: Part {i} of the story. " + " ".join(f"detail{i}x{j}" for j in range(40)) for i in range(12))
+        final = {'summary': 'whole episode', 'major_points': ['a', 'b'], 'quotes': ['q'], 'sources': ['book']}
+
+        def stream(model, prompt, **kwargs):
+            if 'was analyzed in' in prompt:
+                return _stream(json.dumps(final))
+            return _stream(json.dumps({'summary': 'part', 'major_points': ['a', 'A.'], 'quotes': ['q'], 'sources': ['book']}))
+
+        mock_stream.side_effect = stream
+        with patch.object(llm_processor, 'SUMMARY_MAP_REDUCE_ABOVE_TOKENS', 200), \
+             patch.object(llm_processor, 'SUMMARY_CHUNK_TOKENS', 300):
+            result = llm_processor.process_transcript_with_llm(transcript, "Episode")
+
+        self.assertEqual(result, final)
+        prompts = [call.args[1] for call in mock_stream.call_args_list]
+        map_prompts = [prompt for prompt in prompts if 'Transcript part:' in prompt]
+        self.assertGreater(len(map_prompts), 1)
+        self.assertEqual(len(prompts), len(map_prompts) + 1)
+        # The notes handed to the reduce step were already deduplicated.
+        reduce_prompt = next(prompt for prompt in prompts if 'was analyzed in' in prompt)
+        self.assertIn('"a"', reduce_prompt)
+        self.assertNotIn('"A."', reduce_prompt)
+
+    @patch('llm_processor.gemini_client.stream_content')
+    def test_token_budget_splits_the_transcript(self, mock_stream):
+        transcript = '\n'.join(f"Speaker {i % 2 + 1}: " + " ".join(f"point{i}x{j}" for j in range(100)) for i in range(20))
+        mock_stream.side_effect = lambda model, prompt, **kwargs: _stream(json.dumps(
+            {'summary': 's', 'major_points': [f"p{i}" for i in range(200)], 'quotes': [], 'sources': []}
+        ))
+
+        with patch.object(llm_processor, 'SUMMARY_MAP_REDUCE_ABOVE_TOKENS', 0), \
+             patch.object(llm_processor, 'SUMMARY_TOKEN_BUDGET', 1500):
+            result = llm_processor.process_transcript_with_llm(transcript, "Episode")
+
+        self.assertIsNotNone(result)
+        prompts = [call.args[1] for call in mock_stream.call_args_list]
+        self.assertGreater(len(prompts), 2)
+        for prompt in prompts:
+            self.assertLessEqual(llm_processor.gemini_client.estimate_text_tokens(prompt), 1500)
+
+    @patch('llm_processor.gemini_client.stream_content')
+    def test_failed_reduce_falls_back_to_local_merge(self, mock_stream):
+        def stream(model, prompt, **kwargs):
+            if 'was analyzed in' in prompt:
+                raise RuntimeError("reduce failed")
+            return _stream(json.dumps({'summary': 'part.', 'major_points': ['a'], 'quotes': [], 'sources': ['book', 'Book']}))
+
+        mock_stream.side_effect = stream
+        with patch.object(llm_processor, 'SUMMARY_MAP_REDUCE_ABOVE_TOKENS', 10), \
+             patch.object(llm_processor, 'SUMMARY_CHUNK_TOKENS', 20):
+            result = llm_processor.process_transcript_with_llm("Host: " + "one two three. " * 10 + "\nGuest: " + "four five six. " * 10, "Episode")
+
+        self.assertEqual(result['major_points'], ['a'])
+        self.assertEqual(result['sources'], ['book'])
+        self.assertTrue(result['summary'].startswith('part.'))
+
+
+    @patch('llm_processor.gemini_client.stream_content')
+    def test_summary_cache_skips_repeated_calls(self, mock_stream):
+        summary = {'summary': 's', 'major_points': ['p'], 'quotes': [], 'sources': []}
+        mock_stream.side_effect = lambda model, prompt, **kwargs: _stream(json.dumps(summary))
+
+        with tempfile.TemporaryDirectory() as cache_dir:
+            cache = transcript_cache.TranscriptCache(cache_dir, 1024 * 1024, max_age_seconds=3600, label="Summary cache")
+            with patch.object(llm_processor, '_summary_cache', cache):
+                first = llm_processor.process_transcript_with_llm("Host: Um, hello there.", "Episode")
+                # Fillers are compacted away before hashing, so this is the same transcript.
+                second = llm_processor.process_transcript_with_llm("Host: Hello there.", "Episode")
+                with patch.object(llm_processor, 'SUMMARY_PROMPT_VERSION', 2):
+                    llm_processor.process_transcript_with_llm("Host: Hello there.", "Episode")
+                with patch.object(llm_processor, 'SUMMARY_CACHE_BYPASS', True):
+                    llm_processor.process_transcript_with_llm("Host: Hello there.", "Episode")
+
+                self.assertEqual(first, summary)
+                self.assertEqual(second, summary)
+                # The first call, the new prompt version and the bypass went to Gemini.
+                self.assertEqual(mock_stream.call_count, 3)
+                self.assertEqual((cache.stats['hits'], cache.stats['misses']), (1, 2))
+
+                # Entries that haven't been used within the TTL expire.
+                for name in os.listdir(cache_dir):
+                    old = time.time() - 7200
+                    os.utime(os.path.join(cache_dir, name), (old, old))
+                llm_processor.process_transcript_with_llm("Host: Hello there.", "Episode")
+                self.assertEqual(mock_stream.call_count, 4)
+                self.assertGreaterEqual(cache.stats['evictions'], 1)
+
+    @patch('llm_processor.gemini_client.stream_content')
+    def test_light_model_summary_is_cached_under_its_own_model(self, mock_stream):
+        summary = {'summary': 's', 'major_points': ['p'], 'quotes': [], 'sources': []}
+        mock_stream.side_effect = lambda model, prompt, **kwargs: _stream(json.dumps(summary))
+
+        with tempfile.TemporaryDirectory() as cache_dir:
+            with patch.object(llm_processor, '_summary_cache', transcript_cache.TranscriptCache(cache_dir, 1024 * 1024)):
+                with patch.object(model_router, 'MODEL_ROUTING', True), \
+                     patch('llm_processor.model_router.choose', return_value=model_router.GEMINI_LIGHT_MODEL), \
+                     patch('llm_processor.model_router.observe'):
+                    llm_processor.process_transcript_with_llm("Host: Hello there.", "Episode")
+                    # While routing may pick the light model, its summary is reused.
+                    llm_processor.process_transcript_with_llm("Host: Hello there.", "Episode")
+                self.assertEqual(mock_stream.call_count, 1)
+
+                # With routing off, only a summary by the standard model will do.
+                with patch.object(model_router, 'MODEL_ROUTING', False):
+                    llm_processor.process_transcript_with_llm("Host: Hello there.", "Episode")
+                    llm_processor.process_transcript_with_llm("Host: Hello there.", "Episode")
+                self.assertEqual(mock_stream.call_count, 2)
+                self.assertEqual(mock_stream.call_args.args[0], llm_processor.SUMMARY_MODEL)
+
+                # And once it exists, it's preferred over the light model's, even with routing on.
+                with patch.object(model_router, 'MODEL_ROUTING', True), patch('llm_processor.model_router.observe'):
+                    self.assertEqual(
+                        llm_processor.process_transcript_with_llm("Host: Hello there.", "Episode"), summary
+                    )
+                self.assertEqual(mock_stream.call_count, 2)
+
+    @patch('llm_processor.gemini_client.stream_content')
+    def test_cached_combined_summary_is_reused(self, mock_stream):
+        summary = {'summary': 's', 'major_points': [], 'quotes': [], 'sources': []}
+        with tempfile.TemporaryDirectory() as cache_dir:
+            with patch.object(llm_processor, '_summary_cache', transcript_cache.TranscriptCache(cache_dir, 1024 * 1024)):
+                llm_processor.cache_summary("Host: Hello there.", "Episode", summary)
+                result = llm_processor.process_transcript_with_llm("Host: Hello there.", "Episode")
+
+        self.assertEqual(result, summary)
+        mock_stream.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
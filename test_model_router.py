@@ -0,0 +1,101 @@
+import unittest
+from unittest.mock import patch
+import logging
+import os
+import json
+import shutil
+import tempfile
+import time
+import model_router
+
+# --- Test Configuration ---
+logging.basicConfig(level=logging.ERROR)
+
+STANDARD = 'gemini-2.5-flash'
+LIGHT = model_router.GEMINI_LIGHT_MODEL
+
+
+class TestModelRouter(unittest.TestCase):
+    """
+    Tests the routing by job size, by measured speed and by rate-limit wait,
+    and the ledger that tunes the thresholds.
+    """
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.ledger_path = os.path.join(self.test_dir, 'ledger.json')
+        self.ledger = model_router.ModelLedger(self.ledger_path)
+        for patcher in (
+            patch.object(model_router, 'MODEL_ROUTING', True),
+            patch.object(model_router, '_ledger', self.ledger),
+            patch.object(model_router, '_decisions', model_router.Counter()),
+            patch('model_router.gemini_client.expected_wait', return_value=0.0),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_routes_by_size(self):
+        self.assertEqual(model_router.choose('transcription', STANDARD, audio_seconds=5 * 60), LIGHT)
+        self.assertEqual(model_router.choose('transcription', STANDARD, audio_seconds=180 * 60), STANDARD)
+        self.assertEqual(model_router.choose('summary', STANDARD, tokens=2000), LIGHT)
+        self.assertEqual(model_router.choose('summary', STANDARD, tokens=50000), STANDARD)
+        self.assertEqual(model_router.choose('transcription', STANDARD), STANDARD)
+        self.assertEqual(
+            model_router.get_metrics(),
+            {'summary -> gemini-2.5-flash': 1, f'summary -> {LIGHT}': 1,
+             'transcription -> gemini-2.5-flash': 2, f'transcription -> {LIGHT}': 1}
+        )
+
+    def test_routing_off_keeps_the_default_model(self):
+        with patch.object(model_router, 'MODEL_ROUTING', False):
+            self.assertEqual(model_router.choose('transcription', STANDARD, audio_seconds=60), STANDARD)
+            model_router.observe('transcription', STANDARD, time.monotonic(), 60)
+        self.assertFalse(os.path.exists(self.ledger_path))
+
+    def test_ledger_tunes_the_threshold(self):
+        base = model_router.threshold('summary')
+        self.ledger.record('summary', LIGHT, 2.0, 4000, failed=True)
+        self.assertAlmostEqual(model_router.threshold('summary'), base * model_router.THRESHOLD_SHRINK)
+        for _ in range(50):
+            self.ledger.record('summary', LIGHT, 2.0, 4000)
+        self.assertAlmostEqual(model_router.threshold('summary'), base * model_router.THRESHOLD_MAX_FACTOR)
+        # The standard model's calls don't move the threshold.
+        self.ledger.record('summary', STANDARD, 2.0, 4000, failed=True)
+        self.assertAlmostEqual(model_router.threshold('summary'), base * model_router.THRESHOLD_MAX_FACTOR)
+
+    def test_ledger_persists(self):
+        self.ledger.record('transcription', LIGHT, 30.0, 600, input_tokens=20000, output_tokens=3000)
+        with open(self.ledger_path) as f:
+            data = json.load(f)
+        entry = data['models'][LIGHT]['transcription']
+        self.assertEqual((entry['calls'], entry['input_tokens'], entry['output_tokens']), (1, 20000, 3000))
+        reloaded = model_router.ModelLedger(self.ledger_path)
+        self.assertAlmostEqual(reloaded.factor('transcription'), model_router.THRESHOLD_GROWTH)
+
+    def test_slower_light_model_is_skipped(self):
+        for _ in range(model_router.MIN_SAMPLES):
+            self.ledger.record('summary', LIGHT, 4.0, 1000)
+            self.ledger.record('summary', STANDARD, 2.0, 1000)
+        self.assertEqual(model_router.choose('summary', STANDARD, tokens=1000), STANDARD)
+
+    def test_long_rate_limit_wait_switches_model(self):
+        waits = {LIGHT: 45.0, STANDARD: 1.0}
+        with patch('model_router.gemini_client.expected_wait', side_effect=lambda model, tokens: waits[model]):
+            self.assertEqual(model_router.choose('summary', STANDARD, tokens=1000), STANDARD)
+            waits[STANDARD] = 90.0
+            self.assertEqual(model_router.choose('summary', STANDARD, tokens=1000), LIGHT)
+
+    def test_observe_records_usage(self):
+        response = type('Response', (), {})()
+        response.usage_metadata = type('Usage', (), {'prompt_token_count': 900, 'candidates_token_count': 150})()
+        model_router.observe('summary', STANDARD, time.monotonic(), 1000, response)
+        model_router.observe('summary', STANDARD, time.monotonic(), 1000, usage={'prompt_token_count': 100})
+        entry = self.ledger._data['models'][STANDARD]['summary']
+        self.assertEqual((entry['calls'], entry['input_tokens'], entry['output_tokens']), (2, 1000, 150))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,143 @@
+import unittest
+from unittest.mock import patch, MagicMock
+import logging
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+import tempfile
+import os
+import feed_parser
+import episode_store
+import podcast_fetcher
+
+# --- Test Configuration ---
+logging.basicConfig(level=logging.ERROR)
+
+
+def _make_feed(title, items):
+    """Builds a minimal RSS document. `items` is a list of (guid, title, hours_ago) tuples."""
+    now = datetime.now(timezone.utc)
+    item_xml = ""
+    for guid, item_title, hours_ago in items:
+        pub_date = format_datetime(now - timedelta(hours=hours_ago))
+        item_xml += (
+            f"<item><title>{item_title}</title><guid>{guid}</guid>"
+            f"<pubDate>{pub_date}</pubDate>"
+            f'<enclosure url="http://example.com/{guid}.mp3" length="1000" type="audio/mpeg"/></item>'
+        )
+    return f'<?xml version="1.0"?><rss version="2.0"><channel><title>{title}</title>{item_xml}</channel></rss>'
+
+
+def _make_response(body, status_code=200, headers=None):
+    """Builds a mock requests.Response for a feed body."""
+    response = MagicMock()
+    response.status_code = status_code
+    response.text = body
+    response.content = body.encode('utf-8')
+    response.headers = headers or {}
+    return response
+
+
+class TestPodcastFetcher(unittest.TestCase):
+    """
+    Tests podcast_fetcher.get_new_episodes with the network mocked out, so the
+    feed merging and duplicate handling can be checked offline.
+    """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.feeds_file = os.path.join(self.tmp_dir.name, 'feeds.txt')
+        self.store = episode_store.EpisodeStore(
+            path=os.path.join(self.tmp_dir.name, 'processed.db'),
+            legacy_log_path=os.path.join(self.tmp_dir.name, 'processed.log')
+        )
+        self.store_patch = patch('episode_store._store', self.store)
+        self.store_patch.start()
+        self.cache_patch = patch('feed_cache.FEED_CACHE_FILE', os.path.join(self.tmp_dir.name, 'feed_cache.json'))
+        self.cache_patch.start()
+
+    def tearDown(self):
+        self.cache_patch.stop()
+        self.store_patch.stop()
+        self.store.close()
+        self.tmp_dir.cleanup()
+
+    def _write_feeds(self, urls):
+        with open(self.feeds_file, 'w') as f:
+            f.write("\n".join(urls))
+
+    @patch('podcast_fetcher.requests.get')
+    def test_results_follow_feed_order_and_are_deduplicated(self, mock_requests_get):
+        """
+        Episodes are returned in feed-file order no matter which response
+        arrives first, and an episode shared by two feeds is only returned once.
+        """
+        feeds = {
+            'http://a.example.com/rss': _make_feed('Show A', [('a-1', 'A One', 1), ('shared', 'Shared', 2)]),
+            'http://b.example.com/rss': _make_feed('Show B', [('shared', 'Shared', 2), ('b-1', 'B One', 3)]),
+            'http://a.example.com/other': _make_feed('Show C', [('c-old', 'Too Old', 100)]),
+        }
+
+        def fake_get(url, headers=None, timeout=None):
+            return _make_response(feeds[url])
+
+        mock_requests_get.side_effect = fake_get
+        self._write_feeds(list(feeds))
+
+        episodes = podcast_fetcher.get_new_episodes(self.feeds_file)
+
+        self.assertEqual([e['id'] for e in episodes], ['a-1', 'shared', 'b-1'])
+        self.assertEqual(episodes[1]['podcast_title'], 'Show A')
+        self.assertEqual(mock_requests_get.call_count, 3)
+
+    @patch('podcast_fetcher.requests.get')
+    def test_processed_ids_are_skipped(self, mock_requests_get):
+        """Episodes already in the episode store are not returned again."""
+        mock_requests_get.return_value = _make_response(_make_feed('Show A', [('a-1', 'A One', 1), ('a-2', 'A Two', 2)]))
+        self._write_feeds(['http://a.example.com/rss'])
+        self.store.mark_processed('a-1')
+
+        episodes = podcast_fetcher.get_new_episodes(self.feeds_file)
+
+        self.assertEqual([e['id'] for e in episodes], ['a-2'])
+
+    @patch('podcast_fetcher.feed_parser.parse_recent_episodes', wraps=feed_parser.parse_recent_episodes)
+    @patch('podcast_fetcher.requests.get')
+    def test_not_modified_feed_reuses_cached_episodes(self, mock_requests_get, mock_parse):
+        """
+        The second poll sends the stored ETag, and a 304 answer returns the
+        cached episodes without parsing the feed again.
+        """
+        body = _make_feed('Show A', [('a-1', 'A One', 1)])
+        self._write_feeds(['http://a.example.com/rss'])
+
+        mock_requests_get.return_value = _make_response(body, headers={'ETag': '"v1"'})
+        first = podcast_fetcher.get_new_episodes(self.feeds_file)
+
+        mock_requests_get.return_value = _make_response('', status_code=304)
+        second = podcast_fetcher.get_new_episodes(self.feeds_file)
+
+        self.assertEqual([e['id'] for e in first], ['a-1'])
+        self.assertEqual([e['id'] for e in second], ['a-1'])
+        self.assertEqual(mock_parse.call_count, 1)
+        sent_headers = mock_requests_get.call_args.kwargs['headers']
+        self.assertEqual(sent_headers['If-None-Match'], '"v1"')
+
+    @patch('podcast_fetcher.requests.get')
+    def test_changed_feed_keeps_episodes_below_high_water_mark(self, mock_requests_get):
+        """
+        When a feed gains a new episode, the scan stops at the high-water mark,
+        but the older unprocessed episode from the last run is still returned.
+        """
+        self._write_feeds(['http://a.example.com/rss'])
+        mock_requests_get.return_value = _make_response(_make_feed('Show A', [('a-1', 'A One', 5)]))
+        podcast_fetcher.get_new_episodes(self.feeds_file)
+
+        mock_requests_get.return_value = _make_response(_make_feed('Show A', [('a-2', 'A Two', 1), ('a-1', 'A One', 5)]))
+        episodes = podcast_fetcher.get_new_episodes(self.feeds_file)
+
+        self.assertEqual([e['id'] for e in episodes], ['a-2', 'a-1'])
+        self.assertEqual(episodes[0]['audio_url'], 'http://example.com/a-2.mp3')
+
+
+if __name__ == '__main__':
+    unittest.main()
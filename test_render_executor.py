@@ -0,0 +1,74 @@
+import unittest
+from unittest.mock import patch
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import episode_document
+import render_executor
+
+# --- Test Configuration ---
+logging.basicConfig(level=logging.CRITICAL)
+
+
+class TestRenderExecutor(unittest.TestCase):
+    """
+    Tests rendering in worker processes, the upload queue and per-file failure isolation.
+    """
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.uploads = []
+        self.document = episode_document.build_document(
+            "Episode", "Show", "Summary.", ["Point"], ["Quote"], ["Source"], "Host: Hello.\nGuest: Hi."
+        )
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def _outputs(self, name):
+        return {'epub': os.path.join(self.test_dir, f"{name}.epub"), 'markdown': os.path.join(self.test_dir, f"{name}.md")}
+
+    def test_renders_in_worker_processes_and_uploads_in_order(self):
+        executor = render_executor.RenderExecutor(upload=lambda job, results: self.uploads.append((job, results)), workers=2)
+        for name in ('first', 'second', 'third'):
+            executor.submit(self.document, self._outputs(name), name)
+        executor.close()
+
+        self.assertEqual([job for job, _ in self.uploads], ['first', 'second', 'third'])
+        for job, results in self.uploads:
+            self.assertEqual(results, {'epub': True, 'markdown': True})
+            for path in self._outputs(job).values():
+                self.assertTrue(os.path.getsize(path) > 0)
+        metrics = executor.get_metrics()
+        self.assertEqual((metrics['epub']['rendered'], metrics['markdown']['rendered']), (3, 3))
+        self.assertGreater(metrics['epub']['seconds'], 0)
+
+    def test_failing_renderer_only_fails_its_file(self):
+        def broken(document, file_path):
+            raise RuntimeError("boom")
+
+        with patch.dict(episode_document.RENDERERS, {'epub': broken}):
+            executor = render_executor.RenderExecutor(upload=lambda job, results: self.uploads.append(results), workers=0)
+            executor.submit(self.document, self._outputs('episode'), 'episode')
+            executor.close()
+        self.assertEqual(self.uploads, [{'epub': False, 'markdown': True}])
+        self.assertEqual(executor.get_metrics()['epub']['failed'], 1)
+
+    def test_full_upload_queue_holds_back_rendering(self):
+        release = threading.Event()
+        executor = render_executor.RenderExecutor(upload=lambda job, results: release.wait(5), workers=0, queue_size=1)
+        executor.submit(self.document, self._outputs('a'), 'a')  # taken by the upload thread, which blocks
+        executor.submit(self.document, self._outputs('b'), 'b')  # fills the queue
+        submitted = threading.Event()
+        thread = threading.Thread(target=lambda: (executor.submit(self.document, self._outputs('c'), 'c'), submitted.set()))
+        thread.start()
+        self.assertFalse(submitted.wait(0.3))
+        release.set()
+        self.assertTrue(submitted.wait(5))
+        executor.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
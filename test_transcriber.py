@@ -3,6 +3,13 @@ from unittest.mock import patch, MagicMock
 import os
 import logging
 import string
+import tempfile
+import threading
+import transcript_cache
+import transcriber
+import gemini_client
+import gemini_files
+import model_router
 from transcriber import transcribe_episode
 import requests # We need to import this to mock its exceptions
 
@@ -16,13 +23,19 @@ class TestTranscriber(unittest.TestCase):
     This makes the tests fast, reliable, and able to run offline.
     """
 
+    def setUp(self):
+        # Models are shared per process; drop them so each test gets its mocked GenerativeModel.
+        gemini_client._models.clear()
+
     # We use the @patch decorator to replace functions with mock objects.
     @patch('transcriber.genai.GenerativeModel')
     @patch('transcriber.genai.delete_file')
     @patch('transcriber.genai.upload_file')
-    @patch('transcriber.requests.get')
+    @patch('transcriber.audio_downloader.stream_audio')
+    @patch('transcriber._needs_local_file', return_value=False)
+    @patch('transcriber.transcript_cache.audio_key', return_value=None)
     @patch('transcriber.os.getenv', return_value="fake_api_key")
-    def test_successful_transcription(self, mock_getenv, mock_requests_get, mock_upload_file, mock_delete_file, mock_generative_model):
+    def test_successful_transcription(self, mock_getenv, mock_audio_key, mock_needs_file, mock_stream_audio, mock_upload_file, mock_delete_file, mock_generative_model):
         """
         Tests the entire transcription process by mocking the download and Gemini API steps.
         This is our new, reliable "happy path" test.
@@ -30,10 +43,11 @@ class TestTranscriber(unittest.TestCase):
         print("\n--- Running Test: Successful Transcription (with Mocks) ---")
 
         # --- 1. Setup the Mocks ---
-        # Mock requests.get for audio download
-        mock_response = MagicMock()
-        mock_response.__enter__.return_value.iter_content.return_value = [b"fake_audio_chunk"]
-        mock_requests_get.return_value = mock_response
+        # The audio download is mocked out entirely (see audio_downloader.py).
+        def fake_stream(url, buffer):
+            buffer.write(b"fake audio")
+            return "audio/mpeg"
+        mock_stream_audio.side_effect = fake_stream
 
         # Mock the Gemini File Upload object
         mock_file = MagicMock()
@@ -62,22 +76,29 @@ class TestTranscriber(unittest.TestCase):
         self.assertEqual(transcript, "Hello world", "FAIL: Transcript did not match the mocked output.")
         
         # Verify that our mocks were actually called
-        mock_requests_get.assert_called_once_with('http://fake-audio-url.com/episode.mp3', stream=True, headers=unittest.mock.ANY)
-        mock_upload_file.assert_called_once_with(path="temp_episode.mp3")
+        # The audio went from the download to the upload through a buffer, not a file in the working directory.
+        mock_stream_audio.assert_called_once()
+        self.assertEqual(mock_stream_audio.call_args[0][0], 'http://fake-audio-url.com/episode.mp3')
+        mock_upload_file.assert_called_once()
+        self.assertEqual(mock_upload_file.call_args.kwargs['mime_type'], "audio/mpeg")
+        self.assertFalse(os.path.exists("temp_episode.mp3"))
         mock_model_instance.generate_content.assert_called_once()
         mock_delete_file.assert_called_once_with("files/test-file-123")
         
         print("--- SUCCESS: Function correctly handled mocked download and Gemini API calls. ---")
 
-    @patch('transcriber.requests.get')
-    def test_download_failure(self, mock_requests_get):
+    @patch('transcriber.audio_downloader.stream_audio')
+    @patch('transcriber._needs_local_file', return_value=False)
+    @patch('transcriber.transcript_cache.audio_key', return_value=None)
+    @patch('transcriber.os.getenv', return_value="fake_api_key")
+    def test_download_failure(self, mock_getenv, mock_audio_key, mock_needs_file, mock_download_audio):
         """
         Tests that the function handles a network error during download.
         """
         print("\n--- Running Test: Handles Download Failure ---")
         
         # 1. Setup: Configure the mock to raise a network error.
-        mock_requests_get.side_effect = requests.exceptions.RequestException("Test network error")
+        mock_download_audio.side_effect = requests.exceptions.RequestException("Test network error")
         
         mock_episode = {
             'title': 'Test Download Failure',
@@ -90,6 +111,293 @@ class TestTranscriber(unittest.TestCase):
         
         print("--- SUCCESS: Function correctly handled a download failure. ---")
 
+    @patch('transcriber.genai.GenerativeModel')
+    @patch('transcriber.genai.delete_file')
+    @patch('transcriber.genai.upload_file')
+    @patch('transcriber.chunked_transcription.get_audio_duration', return_value=None)
+    @patch('transcriber.audio_downloader.download_audio')
+    @patch('transcriber._needs_local_file', return_value=True)
+    @patch('transcriber.transcript_cache.audio_key', return_value=None)
+    @patch('transcriber.os.getenv', return_value="fake_api_key")
+    def test_file_path_uses_unique_temp_file(self, mock_getenv, mock_audio_key, mock_needs_file, mock_download_audio,
+                                             mock_duration, mock_upload_file, mock_delete_file, mock_generative_model):
+        """
+        Tests that audio needed on disk (for ffmpeg) goes to a unique temp file that is removed afterwards.
+        """
+        mock_download_audio.side_effect = lambda url, path: open(path, 'wb').write(b"fake audio")
+        mock_upload_file.return_value = MagicMock(name="files/test-file-123", state=MagicMock())
+        mock_upload_file.return_value.state.name = "ACTIVE"
+        mock_generative_model.return_value.generate_content.return_value.text = "Hello world"
+
+        transcript = transcribe_episode({'title': 'File Episode', 'audio_url': 'http://fake-audio-url.com/episode.m4a'})
+
+        self.assertEqual(transcript, "Hello world")
+        audio_path = mock_download_audio.call_args[0][1]
+        self.assertNotEqual(audio_path, "temp_episode.mp3")
+        self.assertTrue(os.path.basename(audio_path).startswith("episode_"))
+        self.assertTrue(audio_path.endswith(".m4a"))
+        self.assertEqual(mock_upload_file.call_args.kwargs['path'], audio_path)
+        self.assertFalse(os.path.exists(audio_path))
+
+    @patch('transcriber.genai.GenerativeModel')
+    @patch('transcriber.genai.delete_file')
+    @patch('transcriber.genai.upload_file')
+    @patch('transcriber.audio_downloader.stream_audio')
+    @patch('transcriber._needs_local_file', return_value=False)
+    @patch('transcriber.transcript_cache.audio_key', return_value=None)
+    @patch('transcriber.os.getenv', return_value="fake_api_key")
+    def test_concurrent_transcriptions_use_separate_buffers(self, mock_getenv, mock_audio_key, mock_needs_file, mock_stream_audio,
+                                                           mock_upload_file, mock_delete_file, mock_generative_model):
+        """
+        Tests that two episodes transcribed at the same time never see each other's audio.
+        """
+        barrier = threading.Barrier(2)
+
+        def fake_stream(url, buffer):
+            buffer.write(url.encode())
+            # Both downloads are in flight at the same time.
+            barrier.wait(timeout=5)
+            return "audio/mpeg"
+
+        def fake_upload(path, mime_type):
+            uploaded = MagicMock()
+            uploaded.name = f"files/{path.read().decode().rsplit('/', 1)[1]}"
+            uploaded.state.name = "ACTIVE"
+            return uploaded
+
+        mock_stream_audio.side_effect = fake_stream
+        mock_upload_file.side_effect = fake_upload
+        mock_generative_model.return_value.generate_content.side_effect = lambda parts: MagicMock(text=parts[0].name)
+
+        results = {}
+        def run(name):
+            results[name] = transcribe_episode({'title': name, 'audio_url': f'http://fake-audio-url.com/{name}'})
+        threads = [threading.Thread(target=run, args=(name,)) for name in ('one.mp3', 'two.mp3')]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results, {'one.mp3': 'files/one.mp3', 'two.mp3': 'files/two.mp3'})
+
+    @patch('transcriber.genai.upload_file')
+    @patch('transcriber.audio_downloader.download_audio')
+    @patch('transcriber.transcript_cache.audio_key', return_value="audio-key")
+    def test_cached_transcript_skips_download(self, mock_audio_key, mock_download_audio, mock_upload_file):
+        """
+        Tests that a transcript cached by an earlier run is returned before the audio is downloaded.
+        """
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            cache = transcript_cache.TranscriptCache(path=tmp_dir, max_bytes=1024 * 1024)
+            cache.put(transcript_cache.derive_key("audio-key", transcriber.TRANSCRIPTION_MODEL, transcriber.TRANSCRIPTION_PROMPT_VERSION), "Host: Cached transcript.")
+            with patch('transcriber.transcript_cache.get_cache', return_value=cache):
+                transcript = transcribe_episode({'title': 'Cached Episode', 'audio_url': 'http://fake-audio-url.com/episode.mp3'})
+
+        self.assertEqual(transcript, "Host: Cached transcript.")
+        self.assertEqual(cache.stats['hits'], 1)
+        mock_download_audio.assert_not_called()
+        mock_upload_file.assert_not_called()
+
+    @patch('transcriber.transcript_cache.audio_key', return_value="audio-key")
+    def test_light_model_transcript_only_answers_while_routing_is_on(self, mock_audio_key):
+        """
+        Tests that a transcript is cached under the model that made it, so a light-model
+        transcript doesn't stand in for the standard model once routing is off.
+        """
+        def light_transcribe(episode, audio_url, audio_key, models):
+            models.append(model_router.GEMINI_LIGHT_MODEL)
+            return "Host: Quick transcript."
+
+        def standard_transcribe(episode, audio_url, audio_key, models):
+            models.append(transcriber.TRANSCRIPTION_MODEL)
+            return "Host: Careful transcript."
+
+        episode = {'title': 'Routed', 'audio_url': 'http://fake-audio-url.com/episode.mp3'}
+        with tempfile.TemporaryDirectory() as tmp_dir, \
+             patch.object(transcriber, 'TRANSCRIPTION_BACKENDS', ['gemini']), \
+             patch('transcriber.transcript_cache.get_cache', return_value=transcript_cache.TranscriptCache(tmp_dir)):
+            with patch.object(model_router, 'MODEL_ROUTING', True):
+                with patch.dict(transcriber.BACKENDS['gemini'], transcribe=light_transcribe):
+                    self.assertEqual(transcribe_episode(episode), "Host: Quick transcript.")
+                backend = MagicMock()
+                with patch.dict(transcriber.BACKENDS['gemini'], transcribe=backend):
+                    self.assertEqual(transcribe_episode(episode), "Host: Quick transcript.")
+                backend.assert_not_called()
+            with patch.object(model_router, 'MODEL_ROUTING', False), \
+                 patch.dict(transcriber.BACKENDS['gemini'], transcribe=standard_transcribe):
+                self.assertEqual(transcribe_episode(episode), "Host: Careful transcript.")
+
+    @patch('transcriber.genai.GenerativeModel')
+    @patch('transcriber.genai.delete_file')
+    @patch('transcriber.genai.upload_file')
+    @patch('transcriber.audio_downloader.stream_audio')
+    @patch('transcriber._needs_local_file', return_value=False)
+    @patch('transcriber.transcript_cache.audio_key', return_value="audio-key")
+    @patch('transcriber.os.getenv', return_value="fake_api_key")
+    def test_registered_upload_skips_download(self, mock_getenv, mock_audio_key, mock_needs_file, mock_stream_audio,
+                                              mock_upload_file, mock_delete_file, mock_generative_model):
+        """
+        Tests that audio Gemini still has from an earlier attempt is neither downloaded nor uploaded again.
+        """
+        uploaded = MagicMock()
+        uploaded.name = "files/earlier-upload"
+        uploaded.state.name = "ACTIVE"
+        registry = MagicMock()
+        registry.get.return_value = uploaded
+        mock_generative_model.return_value.generate_content.return_value.text = "Hello again"
+
+        with patch('transcriber.gemini_files.get_registry', return_value=registry), \
+             patch('transcriber.transcript_cache.get_cache', return_value=transcript_cache.TranscriptCache(max_bytes=0)):
+            transcript = transcribe_episode({'title': 'Retry', 'audio_url': 'http://fake-audio-url.com/episode.mp3'})
+
+        self.assertEqual(transcript, "Hello again")
+        # The upload found before skipping the download is used as is, without asking Gemini again.
+        registry.get.assert_called_once_with("audio-key:original")
+        mock_stream_audio.assert_not_called()
+        mock_upload_file.assert_not_called()
+        # Once the audio is transcribed, the upload is deleted and forgotten.
+        mock_delete_file.assert_called_once_with("files/earlier-upload")
+        registry.forget.assert_called_once_with("audio-key:original")
+
+    @patch('transcriber.genai.GenerativeModel')
+    @patch('transcriber.genai.delete_file')
+    @patch('transcriber.genai.upload_file')
+    @patch('transcriber.audio_downloader.stream_audio', return_value='audio/mpeg')
+    @patch('transcriber._needs_local_file', return_value=False)
+    @patch('transcriber.transcript_cache.audio_key', return_value="audio-key")
+    @patch('transcriber.os.getenv', return_value="fake_api_key")
+    def test_upload_is_kept_for_a_retry_only_after_a_failure(self, mock_getenv, mock_audio_key, mock_needs_file,
+                                                             mock_stream_audio, mock_upload_file, mock_delete_file,
+                                                             mock_generative_model):
+        """
+        Tests that a failed transcription keeps the registered upload for the retry, which then deletes it.
+        """
+        uploaded = mock_upload_file.return_value
+        uploaded.name = "files/new-upload"
+        uploaded.state.name = "ACTIVE"
+        registry_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(registry_dir.cleanup)
+        registry = gemini_files.UploadRegistry(path=os.path.join(registry_dir.name, 'uploads.json'))
+        generate = mock_generative_model.return_value.generate_content
+        generate.side_effect = [RuntimeError("500 Internal error"), MagicMock(text="Second try")]
+        episode = {'title': 'Retry', 'audio_url': 'http://fake-audio-url.com/episode.mp3'}
+
+        with patch('transcriber.gemini_files.get_registry', return_value=registry), \
+             patch('transcriber.gemini_files.genai.get_file', return_value=uploaded), \
+             patch('transcriber.transcript_cache.get_cache', return_value=transcript_cache.TranscriptCache(max_bytes=0)):
+            self.assertIsNone(transcribe_episode(episode))
+            mock_delete_file.assert_not_called()
+            self.assertIs(registry.get("audio-key:original"), uploaded)
+
+            self.assertEqual(transcribe_episode(episode), "Second try")
+
+        mock_upload_file.assert_called_once()
+        mock_delete_file.assert_called_once_with("files/new-upload")
+        self.assertIsNone(registry.get("audio-key:original"))
+
+    @patch('transcriber.genai.GenerativeModel')
+    @patch('transcriber.genai.delete_file')
+    @patch('transcriber.genai.upload_file')
+    @patch('transcriber.audio_downloader.stream_audio', return_value='audio/mpeg')
+    @patch('transcriber._needs_local_file', return_value=False)
+    @patch('transcriber.transcript_cache.audio_key', return_value="audio-key")
+    @patch('transcriber.os.getenv', return_value="fake_api_key")
+    def test_expired_registered_upload_falls_back_to_download(self, mock_getenv, mock_audio_key, mock_needs_file,
+                                                              mock_stream_audio, mock_upload_file, mock_delete_file,
+                                                              mock_generative_model):
+        """
+        Tests that audio is downloaded and uploaded again if the registered upload disappears before it's used.
+        """
+        expired = MagicMock()
+        expired.name = "files/expired-upload"
+        mock_upload_file.return_value.state.name = "ACTIVE"
+        registry = MagicMock()
+        # Found when deciding to skip the download, gone by the time it's used (and forgotten).
+        registry.get.side_effect = [expired, None, None]
+        generate = mock_generative_model.return_value.generate_content
+        generate.side_effect = [RuntimeError("403 File expired"), MagicMock(text="Fresh transcript")]
+
+        with patch('transcriber.gemini_files.get_registry', return_value=registry), \
+             patch('transcriber.transcript_cache.get_cache', return_value=transcript_cache.TranscriptCache(max_bytes=0)):
+            transcript = transcribe_episode({'title': 'Expired', 'audio_url': 'http://fake-audio-url.com/episode.mp3'})
+
+        self.assertEqual(transcript, "Fresh transcript")
+        mock_stream_audio.assert_called_once()
+        mock_upload_file.assert_called_once()
+        self.assertIsNotNone(mock_upload_file.call_args.kwargs['path'])
+
+    @patch('transcriber.genai.GenerativeModel')
+    @patch('transcriber.genai.delete_file')
+    @patch('transcriber.genai.upload_file')
+    @patch('transcriber.audio_downloader.stream_audio', return_value='audio/mpeg')
+    @patch('transcriber._needs_local_file', return_value=False)
+    @patch('transcriber.transcript_cache.audio_key', return_value="audio-key")
+    @patch('transcriber.os.getenv', return_value="fake_api_key")
+    def test_combined_transcript_and_summary(self, mock_getenv, mock_audio_key, mock_needs_file, mock_stream_audio,
+                                             mock_upload_file, mock_delete_file, mock_generative_model):
+        """
+        Tests that the combined mode returns the transcript and the summary from one schema-constrained request.
+        """
+        mock_upload_file.return_value.state.name = "ACTIVE"
+        mock_generative_model.return_value.generate_content.return_value.text = (
+            '{"transcript": "Host: Hello.", "summary": "A greeting.", "major_points": ["Hello"], "quotes": [], "sources": []}'
+        )
+        registry = MagicMock()
+        registry.get.return_value = None
+
+        with tempfile.TemporaryDirectory() as cache_dir, \
+             patch('transcriber.gemini_files.get_registry', return_value=registry), \
+             patch('transcriber.transcript_cache.get_cache', return_value=transcript_cache.TranscriptCache(cache_dir)):
+            transcript, summary = transcriber.transcribe_and_summarize_episode(
+                {'title': 'Combined', 'audio_url': 'http://fake-audio-url.com/episode.mp3'}
+            )
+            cache = transcript_cache.TranscriptCache(cache_dir)
+            cached = cache.get(transcript_cache.derive_key(
+                "audio-key", transcriber.TRANSCRIPTION_MODEL, transcriber.COMBINED_PROMPT_VERSION
+            ))
+            # It comes from another prompt, so it doesn't count as a plain transcript.
+            plain = cache.get(transcript_cache.derive_key(
+                "audio-key", transcriber.TRANSCRIPTION_MODEL, transcriber.TRANSCRIPTION_PROMPT_VERSION
+            ))
+            # A rerun reuses it and leaves the summary to the (cached) separate call.
+            rerun = transcriber.transcribe_and_summarize_episode(
+                {'title': 'Combined', 'audio_url': 'http://fake-audio-url.com/episode.mp3'}
+            )
+
+        self.assertEqual(transcript, "Host: Hello.")
+        self.assertEqual(summary, {'summary': "A greeting.", 'major_points': ["Hello"], 'quotes': [], 'sources': []})
+        self.assertEqual(cached, "Host: Hello.")
+        self.assertIsNone(plain)
+        self.assertEqual(rerun, ("Host: Hello.", None))
+        generate = mock_generative_model.return_value.generate_content
+        generate.assert_called_once()
+        self.assertEqual(generate.call_args.kwargs['generation_config']['response_schema'], transcriber.COMBINED_SCHEMA)
+        # The upload was registered in case a fallback to separate calls needed it, and released once it didn't.
+        registry.put.assert_called_once()
+        mock_delete_file.assert_called_once_with(mock_upload_file.return_value.name)
+        registry.forget.assert_called_once_with("audio-key:original")
+
+    @patch('transcriber.genai.GenerativeModel')
+    @patch('transcriber.genai.upload_file')
+    @patch('transcriber.audio_downloader.stream_audio', return_value='audio/mpeg')
+    @patch('transcriber._needs_local_file', return_value=False)
+    @patch('transcriber.transcript_cache.audio_key', return_value=None)
+    @patch('transcriber.os.getenv', return_value="fake_api_key")
+    def test_combined_falls_back_on_incomplete_response(self, mock_getenv, mock_audio_key, mock_needs_file,
+                                                        mock_stream_audio, mock_upload_file, mock_generative_model):
+        """
+        Tests that an incomplete combined response sends the episode back to the separate calls.
+        """
+        mock_upload_file.return_value.state.name = "ACTIVE"
+        mock_generative_model.return_value.generate_content.return_value.text = '{"transcript": "Host: Hello.", "summary": "Cut off'
+
+        with patch('transcriber.genai.delete_file'), \
+             patch('transcriber.transcript_cache.get_cache', return_value=transcript_cache.TranscriptCache(max_bytes=0)):
+            result = transcriber.transcribe_and_summarize_episode(
+                {'title': 'Combined', 'audio_url': 'http://fake-audio-url.com/episode.mp3'}
+            )
+
+        self.assertEqual(result, (None, None))
 
     def test_failure_with_no_audio_url(self):
         """
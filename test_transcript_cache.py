@@ -0,0 +1,70 @@
+import unittest
+from unittest.mock import patch
+import logging
+import os
+import tempfile
+import transcript_cache
+
+# --- Test Configuration ---
+logging.basicConfig(level=logging.ERROR)
+
+
+class TestTranscriptCache(unittest.TestCase):
+    """
+    Tests the content-addressed transcript cache: key construction, hits and
+    misses, and least-recently-used eviction.
+    """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_key_ignores_tracking_prefixes_but_not_content(self):
+        fingerprint = {'etag': '"abc"', 'size': 1000, 'head_hash': 'h1'}
+        plain = transcript_cache.make_key('https://cdn.example.com/ep1.mp3', 'model', 1, fingerprint)
+        tracked = transcript_cache.make_key('https://dts.podtrac.com/redirect.mp3/cdn.example.com/ep1.mp3?utm_source=rss', 'model', 1, fingerprint)
+        self.assertEqual(plain, tracked)
+
+        replaced = transcript_cache.make_key('https://cdn.example.com/ep1.mp3', 'model', 1, dict(fingerprint, etag='"new"'))
+        new_prompt = transcript_cache.make_key('https://cdn.example.com/ep1.mp3', 'model', 2, fingerprint)
+        self.assertNotEqual(plain, replaced)
+        self.assertNotEqual(plain, new_prompt)
+
+    @patch('transcript_cache.audio_downloader.fetch_leading_bytes', return_value=None)
+    @patch('transcript_cache.audio_downloader.probe_audio')
+    def test_unidentifiable_audio_has_no_key(self, mock_probe, mock_leading):
+        mock_probe.return_value = {'url': 'https://cdn.example.com/ep1.mp3', 'size': None, 'ranges': False, 'etag': None, 'last_modified': None}
+        self.assertIsNone(transcript_cache.make_key('https://cdn.example.com/ep1.mp3', 'model', 1))
+
+    def test_hit_and_miss_stats(self):
+        cache = transcript_cache.TranscriptCache(path=self.tmp_dir.name, max_bytes=1024)
+        self.assertIsNone(cache.get('a'))
+        cache.put('a', 'transcript a')
+        self.assertEqual(cache.get('a'), 'transcript a')
+        self.assertEqual(cache.stats, {'hits': 1, 'misses': 1, 'stores': 1, 'evictions': 0})
+
+    def test_least_recently_used_is_evicted(self):
+        cache = transcript_cache.TranscriptCache(path=self.tmp_dir.name, max_bytes=250)
+        for index, key in enumerate(['a', 'b']):
+            cache.put(key, key * 100)
+            os.utime(os.path.join(self.tmp_dir.name, f"{key}.txt"), (1000 + index, 1000 + index))
+        # Reading 'a' makes 'b' the least recently used entry.
+        cache.get('a')
+        cache.put('c', 'c' * 100)
+
+        self.assertEqual(cache.get('b'), None)
+        self.assertEqual(cache.get('a'), 'a' * 100)
+        self.assertEqual(cache.get('c'), 'c' * 100)
+        self.assertEqual(cache.stats['evictions'], 1)
+
+    def test_disabled_cache_stores_nothing(self):
+        cache = transcript_cache.TranscriptCache(path=self.tmp_dir.name, max_bytes=0)
+        cache.put('a', 'transcript a')
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(os.listdir(self.tmp_dir.name), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+import unittest
+import logging
+import transcript_compactor
+
+# --- Test Configuration ---
+logging.basicConfig(level=logging.ERROR)
+
+
+class TestTranscriptCompactor(unittest.TestCase):
+    """
+    Tests whitespace normalization, speaker label merging, filler removal and sponsor read rules.
+    """
+
+    def test_compaction_merges_turns_and_strips_fillers(self):
+        transcript = (
+            "**Nilay:** Um, so  welcome back to the show.\n\n"
+            "\n"
+            "**Nilay:** Today we're, uh, talking about the, the batteries.\n"
+            "[00:01:05] David: I, I, I think that's   great.\n"
+            "David: Mm-hmm.\n"
+            "   \n"
+            "Nilay: Right."
+        )
+        result = transcript_compactor.compact_transcript(transcript, drop_sponsor_reads=False)
+
+        self.assertEqual(result['text'], (
+            "Nilay: So welcome back to the show. Today we're talking about the batteries.\n"
+            "David: I think that's great. Mm-hmm.\n"
+            "Nilay: Right."
+        ))
+        self.assertLess(result['compacted_tokens'], result['original_tokens'])
+        self.assertAlmostEqual(result['ratio'], result['compacted_tokens'] / result['original_tokens'])
+
+    def test_meant_repetitions_are_kept(self):
+        """Only short false starts marked by a comma or dash are collapsed, not repeats that carry meaning."""
+        transcript = "Host: I had had enough. It is is what it is. Bye bye now. That was very, very good."
+        self.assertEqual(transcript_compactor.compact_transcript(transcript)['text'], transcript)
+        self.assertEqual(
+            transcript_compactor.compact_transcript("Host: I I think the- the answer is, is no.")['text'],
+            "Host: I think the answer is no."
+        )
+
+    def test_sponsor_reads_are_dropped_only_when_asked(self):
+        transcript = (
+            "Host: This episode is brought to you by Acme. Go to acme.com/vergecast and use code VERGE.\n"
+            "Host: Back to the news.\n"
+            "Guest: Their sponsorship deal with the league was huge."
+        )
+        kept = transcript_compactor.compact_transcript(transcript, drop_sponsor_reads=False)
+        dropped = transcript_compactor.compact_transcript(transcript, drop_sponsor_reads=True)
+
+        self.assertIn("Acme", kept['text'])
+        self.assertEqual(dropped['text'], "Host: Back to the news.\nGuest: Their sponsorship deal with the league was huge.")
+        self.assertEqual(dropped['sponsor_reads_dropped'], 1)
+
+    def test_text_without_labels_is_kept(self):
+        result = transcript_compactor.compact_transcript("just some words\nand more words")
+        self.assertEqual(result['text'], "Just some words and more words")
+
+    def test_token_estimate_counts_words_and_punctuation(self):
+        estimate = transcript_compactor.gemini_client.estimate_text_tokens
+        self.assertEqual(estimate("Hello, world!"), 4)
+        self.assertEqual(estimate("   \n\n  "), 0)
+        # Long words count as several tokens.
+        self.assertEqual(estimate("internationalization"), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+import unittest
+from unittest.mock import patch, MagicMock
+import logging
+import numpy as np
+import transcript_cache
+import transcriber
+import whisper_transcriber
+
+# --- Test Configuration ---
+logging.basicConfig(level=logging.ERROR)
+
+
+class FakeWhisperModel:
+    """Returns one segment every 10 seconds of audio, named after the chunk it came from."""
+
+    def __init__(self):
+        self.languages = []
+
+    def transcribe(self, audio, language=None, vad_filter=False):
+        self.languages.append(language)
+        chunk_start = int(audio[0])
+        seconds = len(audio) / whisper_transcriber.SAMPLE_RATE
+        segments = [MagicMock(start=s, end=s + 8, text=f" at {chunk_start + s:.0f} ") for s in np.arange(0, seconds, 10)]
+        return iter(segments), MagicMock(language='en')
+
+
+class TestWhisperTranscriber(unittest.TestCase):
+    """
+    Tests the chunked offline transcription, the worker sizing and the backend fallback in transcriber.py.
+    """
+
+    def _fake_chunk(self, audio_path, start, length):
+        # The first sample carries the chunk's start, so the fake model can label its segments.
+        samples = np.zeros(int(length * whisper_transcriber.SAMPLE_RATE), dtype=np.float32)
+        samples[0] = start
+        return samples
+
+    def test_overlapping_chunks_keep_each_segment_once(self):
+        model = FakeWhisperModel()
+        with patch('whisper_transcriber.get_model', return_value=model), \
+             patch('whisper_transcriber._load_chunk', side_effect=self._fake_chunk), \
+             patch('whisper_transcriber.shutil.which', return_value='/usr/bin/ffmpeg'), \
+             patch.object(whisper_transcriber, 'WHISPER_CHUNK_SECONDS', 100), \
+             patch.object(whisper_transcriber, 'WHISPER_LANGUAGE', None):
+            transcript = whisper_transcriber.transcribe_file('episode.mp3', 300)
+
+        # Pauses of 2 seconds between segments start new paragraphs.
+        starts = [int(line.split()[1]) for line in transcript.split('\n')]
+        self.assertEqual(starts, sorted(set(starts)))
+        self.assertEqual(starts[0], 0)
+        self.assertGreaterEqual(starts[-1], 290)
+        # The language found in the first chunk is used for all the others.
+        self.assertEqual(model.languages[0], None)
+        self.assertEqual(set(model.languages[1:]), {'en'})
+
+    def test_short_pauses_stay_in_one_paragraph(self):
+        segments = [(0.0, 2.0, "Hello"), (2.5, 4.0, "there."), (7.0, 9.0, "New thought.")]
+        self.assertEqual(whisper_transcriber.format_transcript(segments), "Hello there.\nNew thought.")
+
+    def test_worker_count_respects_memory_cap(self):
+        with patch.object(whisper_transcriber, 'WHISPER_WORKERS', 8), \
+             patch.object(whisper_transcriber, 'WHISPER_CHUNK_SECONDS', 300), \
+             patch.object(whisper_transcriber, 'WHISPER_MAX_MEMORY_MB', 1000):
+            # About 168 MB per worker next to a 250 MB model.
+            self.assertEqual(whisper_transcriber.worker_count('base'), 4)
+            self.assertEqual(whisper_transcriber.worker_count('large-v3'), 1)
+        with patch.object(whisper_transcriber, 'WHISPER_WORKERS', 3), \
+             patch.object(whisper_transcriber, 'WHISPER_MAX_MEMORY_MB', 0):
+            self.assertEqual(whisper_transcriber.worker_count('base'), 3)
+
+    @patch('transcriber.audio_downloader.download_audio')
+    @patch('transcriber.transcript_cache.audio_key', return_value="audio-key")
+    def test_falls_back_to_whisper_when_gemini_fails(self, mock_audio_key, mock_download_audio):
+        with patch.object(transcriber, 'TRANSCRIPTION_BACKENDS', ['gemini', 'whisper']), \
+             patch.dict(transcriber.BACKENDS['gemini'], transcribe=MagicMock(side_effect=RuntimeError("503"))), \
+             patch('transcriber.whisper_transcriber.is_available', return_value=True), \
+             patch('transcriber.whisper_transcriber.transcribe_file', return_value="Offline transcript.") as mock_whisper, \
+             patch('transcriber.transcript_cache.get_cache', return_value=transcript_cache.TranscriptCache(max_bytes=0)):
+            transcript = transcriber.transcribe_episode({'title': 'Outage', 'audio_url': 'http://fake-audio-url.com/episode.mp3', 'duration': 60})
+
+        self.assertEqual(transcript, "Offline transcript.")
+        mock_download_audio.assert_called_once()
+        self.assertEqual(mock_whisper.call_args.args[1], 60.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,9 +1,70 @@
 import logging
+import json
 import requests
 import os
 import google.generativeai as genai
 import time
-from dotenv import load_dotenv
+import shutil
+import tempfile
+import mimetypes
+import threading
+import functools
+from urllib.parse import urlparse
+import audio_downloader
+import chunked_transcription
+import audio_preprocessor
+import transcript_cache
+import gemini_files
+import gemini_client
+import llm_processor
+import whisper_transcriber
+import model_router
+
+# --- Configuration ---
+# Audio that doesn't need ffmpeg is downloaded into a buffer and uploaded to Gemini from
+# there. Buffers are kept in memory up to this size, then spill to a private temp file.
+AUDIO_SPOOL_MAX_MB = float(os.environ.get("AUDIO_SPOOL_MAX_MB", "64").strip("'\""))
+# Where spilled buffers and downloads for ffmpeg go. Empty means the system temp directory.
+AUDIO_SPOOL_DIR = os.environ.get("AUDIO_SPOOL_DIR", "").strip("'\"") or None
+# How many episodes may hold audio at the same time. Peak memory is at most this many
+# buffers of AUDIO_SPOOL_MAX_MB, and disk use at most this many episodes.
+AUDIO_BUFFER_SLOTS = int(os.environ.get("AUDIO_BUFFER_SLOTS", "2").strip("'\""))
+
+# Set TRANSCRIBE_WITH_SUMMARY="on" to get the transcript and the summary from one Gemini request on
+# the uploaded audio, instead of sending the whole transcript back in for a second call. Episodes
+# that are transcribed in segments, or whose transcript is cached, still use the two calls.
+TRANSCRIBE_WITH_SUMMARY = os.environ.get("TRANSCRIBE_WITH_SUMMARY", "off").strip("'\"").lower() in ('1', 'true', 'yes', 'on')
+
+# The transcription backends to use, in order: "gemini" (the File API) and "whisper" (offline on
+# the CPU, see whisper_transcriber.py). The next one is tried if one fails, so "gemini,whisper"
+# keeps the backlog moving during a Gemini outage, and "whisper" alone never uploads audio.
+TRANSCRIPTION_BACKENDS = [name.strip().lower() for name in os.environ.get("TRANSCRIPTION_BACKENDS", "gemini").strip("'\"").split(',') if name.strip()]
+
+_buffer_slots = threading.BoundedSemaphore(AUDIO_BUFFER_SLOTS)
+
+# Use gemini-2.5-flash (paid account upgraded)
+TRANSCRIPTION_MODEL = 'gemini-2.5-flash'
+
+# Bump this whenever TRANSCRIPTION_PROMPT changes, so cached transcripts are not reused.
+TRANSCRIPTION_PROMPT_VERSION = 1
+# Bump this whenever COMBINED_PROMPT or COMBINED_SCHEMA changes. Transcripts from the combined
+# request are cached under it, apart from those made with TRANSCRIPTION_PROMPT.
+COMBINED_PROMPT_VERSION = 'combined-1'
+TRANSCRIPTION_PROMPT = """
+        Transcribe the following audio recording. Identify and label the speakers (e.g., Nilay, Host, Guest 1, etc.) from context, formatting the output as a script with each speaker's dialogue on a new line. Do not summarize or omit any conversation.
+        """
+
+# The transcript and summary in one response, constrained to COMBINED_SCHEMA.
+COMBINED_PROMPT = """
+        Transcribe the following audio recording of the podcast episode titled "{episode_title}" and analyze it.
+        In "transcript", identify and label the speakers (e.g., Nilay, Host, Guest 1, etc.) from context, formatting the transcript as a script with each speaker's dialogue on a new line. Do not summarize or omit any conversation in the transcript.
+        Then, as an expert podcast analyst, fill in "summary" with a concise, one-paragraph summary of the entire episode, "major_points" with its key takeaways (each a separate idea), "quotes" with important quotes (complete sentences or memorable phrases) and "sources" with the books, people or other sources mentioned (an empty list if there are none).
+        """
+COMBINED_SCHEMA = {
+    'type': 'OBJECT',
+    'properties': {'transcript': {'type': 'STRING'}, **llm_processor.SUMMARY_SCHEMA['properties']},
+    'required': ['transcript', *llm_processor.SUMMARY_SCHEMA['required']],
+}
 
 def _find_audio_url(episode):
     """
@@ -16,7 +77,13 @@ def _find_audio_url(episode):
     Returns:
         str: The found audio URL, or None.
     """
-    # Method 1: Look for the standard 'enclosure' link, which is the most reliable.
+    # Method 1: Use the audio URL resolved by the feed parser. Compact episode
+    # records from podcast_fetcher already carry it.
+    if episode.get('audio_url'):
+        logging.info("Found audio URL in the episode record.")
+        return episode['audio_url']
+
+    # Method 2: Look for the standard 'enclosure' link, which is the most reliable.
     try:
         url = next(link['href'] for link in episode.get('links', []) if link.get('rel') == 'enclosure')
         if url:
@@ -25,7 +92,7 @@ def _find_audio_url(episode):
     except (StopIteration, KeyError):
         pass  # If not found, we'll try the next method.
 
-    # Method 2: If no enclosure is found, look for any link ending in a common audio format.
+    # Method 3: If no enclosure is found, look for any link ending in a common audio format.
     # This is an excellent fallback for non-standard RSS feeds.
     try:
         audio_extensions = ['.mp3', '.m4a', '.wav', '.aac', '.ogg']
@@ -37,7 +104,7 @@ def _find_audio_url(episode):
     except (StopIteration, KeyError):
         pass  # If still not found, we'll try the next method.
         
-    # Method 3: Check for the 'media_content' key. This is a powerful fallback
+    # Method 4: Check for the 'media_content' key. This is a powerful fallback
     # for feeds (like Cal Newport's) that embed media differently.
     try:
         media_contents = episode.get('media_content', [])
@@ -53,15 +120,260 @@ def _find_audio_url(episode):
     logging.warning(f"Could not find audio URL. Available keys in episode data: {list(episode.keys())}")
     return None
 
+def _audio_mime_type(episode, audio_url, content_type=None):
+    """Works out the MIME type to upload with: the feed's, the server's, or a guess from the URL."""
+    for candidate in (episode.get('audio_type'), content_type):
+        if candidate and candidate.split(';')[0].strip().startswith('audio/'):
+            return candidate.split(';')[0].strip()
+    guessed, _ = mimetypes.guess_type(urlparse(audio_url).path)
+    return guessed if guessed and guessed.startswith('audio/') else 'audio/mpeg'
+
+def _transcribe_audio_file(audio, prompt=TRANSCRIPTION_PROMPT, mime_type=None, upload_key=None, generation_config=None,
+                           audio_seconds=None, models=None, audio_file=None, parse=None):
+    """
+    Uploads audio to the Gemini File API, waits for it to become active and
+    asks Gemini to transcribe it.
+
+    With an `upload_key` (an audio fingerprint), an earlier upload of the same
+    audio is reused if it's still active, and a new upload is registered so a
+    retry after a failure can reuse it (see gemini_files.py). Once the audio is
+    transcribed, the upload is deleted and forgotten. Without an `upload_key`,
+    it's deleted right afterwards either way.
+
+    Args:
+        audio (str or file object): A local audio file, or a buffer positioned at the start.
+        prompt (str): The transcription instructions.
+        mime_type (str): Required for buffers; guessed from the extension for paths.
+        upload_key (str): Identifies the audio in the upload registry.
+        generation_config (dict): Passed on to Gemini, e.g. to ask for JSON matching a schema.
+        audio_seconds (float): The length of the audio, which decides the model (see model_router.py).
+        models (list): If given, the model that answered is appended to it.
+        audio_file: An upload the caller already found in the registry, used as is.
+        parse (callable): Turns the response text into the result, raising if it's unusable.
+            A response it rejects counts as a failure, so the upload is kept.
+
+    Returns:
+        str: The transcript text (or whatever `parse` made of the response).
+
+    Raises:
+        Exception: If the upload, processing, generation or `parse` fails.
+    """
+    registry = gemini_files.get_registry()
+    if audio_file is None:
+        audio_file = registry.get(upload_key)
+    keep_upload = audio_file is not None
+    try:
+        if audio_file is None:
+            logging.info("Uploading audio file to Gemini File API...")
+            audio_file = genai.upload_file(path=audio, mime_type=mime_type)
+            logging.info(f"File uploaded successfully. Name: {audio_file.name}. State: {audio_file.state.name}")
+
+            # Poll the upload status until the file is active.
+            audio_file = gemini_files.wait_until_active(audio_file)
+            if upload_key:
+                registry.put(upload_key, audio_file)
+                keep_upload = True
+
+        logging.info("Audio file is active. Requesting Gemini transcription and diarization...")
+        
+        # Rate limiting and retries are handled by the shared client.
+        kwargs = {'generation_config': generation_config} if generation_config else {}
+        model_name = model_router.choose('transcription', TRANSCRIPTION_MODEL, audio_seconds=audio_seconds)
+        if models is not None:
+            models.append(model_name)
+        started = time.monotonic()
+        try:
+            response = gemini_client.generate_content(model_name, [audio_file, prompt], **kwargs)
+        except Exception:
+            model_router.observe('transcription', model_name, started, audio_seconds, failed=True)
+            raise
+        text = response.text if response else None
+        model_router.observe('transcription', model_name, started, audio_seconds, response, failed=not text)
+        result = parse(text) if parse and text else text
+        if result:
+            # Done with this audio; only a retry after a failure reuses the upload.
+            keep_upload = False
+        return result
+
+    finally:
+        # Delete the file from Google Gemini storage, unless it's registered for a retry
+        if audio_file is not None and not keep_upload:
+            gemini_files.delete_remote_file(audio_file.name)
+            if upload_key:
+                registry.forget(upload_key)
+
+def _needs_local_file(episode):
+    """Preprocessing and segmenting run ffmpeg, which needs the audio as a file on disk."""
+    if audio_preprocessor.is_available():
+        return True
+    if chunked_transcription.TRANSCRIBE_CHUNK_ABOVE_MINUTES <= 0 or not shutil.which('ffmpeg'):
+        return False
+    # Without a duration in the feed we only find out with ffprobe after the download.
+    return not episode.get('duration') or chunked_transcription.should_segment(episode['duration'])
+
+def _transcribe_streamed(episode, audio_url, audio_key, prompt=TRANSCRIPTION_PROMPT, generation_config=None, models=None,
+                         parse=None):
+    """
+    Downloads the audio into a spooled buffer and uploads it to Gemini from
+    there. Nothing is written to the working directory, and the buffer only
+    touches the disk (as an unnamed temp file) past AUDIO_SPOOL_MAX_MB. If
+    Gemini still has an upload of the same audio, nothing is downloaded.
+    """
+    upload_key = f"{audio_key}:original" if audio_key else None
+    audio_file = gemini_files.get_registry().get(upload_key)
+    if audio_file is not None:
+        # Gemini still has this audio from an earlier attempt, so there's nothing to download.
+        try:
+            return _transcribe_audio_file(
+                None, prompt, upload_key=upload_key, generation_config=generation_config,
+                audio_seconds=episode.get('duration'), models=models, audio_file=audio_file, parse=parse
+            )
+        except Exception as e:
+            # The upload may have expired or been cleaned up since; get() then forgets it.
+            if gemini_files.get_registry().get(upload_key) is not None:
+                raise
+            logging.warning(f"The earlier upload of this audio is gone ({e}). Downloading it again.")
+
+    max_size = int(AUDIO_SPOOL_MAX_MB * 1024 * 1024)
+    with _buffer_slots, tempfile.SpooledTemporaryFile(max_size=max_size, dir=AUDIO_SPOOL_DIR) as buffer:
+        content_type = audio_downloader.stream_audio(audio_url, buffer)
+        logging.info(f"Audio downloaded into a spooled buffer ({buffer.tell() / 1024 / 1024:.1f} MB).")
+        buffer.seek(0)
+        return _transcribe_audio_file(
+            buffer, prompt, mime_type=_audio_mime_type(episode, audio_url, content_type),
+            upload_key=upload_key, generation_config=generation_config, audio_seconds=episode.get('duration'),
+            models=models, parse=parse
+        )
+
+def _temp_audio_path(audio_url):
+    """Creates a unique temp file for an episode's audio, with the extension of its URL."""
+    extension = os.path.splitext(urlparse(audio_url).path)[1].lower()
+    if extension not in ('.mp3', '.m4a', '.wav', '.aac', '.ogg'):
+        extension = '.mp3'
+    fd, audio_path = tempfile.mkstemp(prefix='episode_', suffix=extension, dir=AUDIO_SPOOL_DIR)
+    os.close(fd)
+    return audio_path
+
+def _remove_temp_files(*paths):
+    for path in paths:
+        if os.path.exists(path):
+            try:
+                os.remove(path)
+                logging.info(f"Cleaned up local temporary audio file: {path}")
+            except Exception as e:
+                logging.error(f"Failed to delete local temp audio file: {e}")
+
+def _transcribe_from_file(episode, audio_url, audio_key, prompt=TRANSCRIPTION_PROMPT, generation_config=None, models=None,
+                          parse=None):
+    """
+    Downloads the audio to a unique temp file, so ffmpeg can preprocess or
+    segment it, and transcribes it. The files are removed afterwards.
+
+    Segmented transcription always uses TRANSCRIPTION_PROMPT, so a request with
+    a `generation_config` (the combined mode) raises ValueError for audio that
+    needs segmenting.
+    """
+    with _buffer_slots:
+        audio_path = _temp_audio_path(audio_url)
+        preprocessed_path = os.path.splitext(audio_path)[0] + '.speech.ogg'
+        try:
+            # Large files are fetched as parallel byte ranges and resume after a failure.
+            audio_downloader.download_audio(audio_url, audio_path)
+            logging.info(f"Audio downloaded successfully to {audio_path}")
+
+            # Optionally upload a compact mono copy with the long silences cut (see audio_preprocessor.py).
+            upload_path, mime_type, variant = audio_path, _audio_mime_type(episode, audio_url), 'original'
+            audio_seconds, time_map = None, None
+            if audio_preprocessor.is_available():
+                try:
+                    result = audio_preprocessor.preprocess_audio(audio_path, preprocessed_path)
+                    audio_preprocessor.log_savings(result)
+                    upload_path, mime_type, variant = result['path'], 'audio/ogg', 'speech'
+                    audio_seconds, time_map = result['processed_seconds'], result['time_map']
+                except Exception as e:
+                    logging.warning(f"Audio preprocessing failed ({e}). Uploading the original audio.")
+            if audio_seconds is None:
+                audio_seconds = chunked_transcription.get_audio_duration(audio_path, episode)
+
+            if chunked_transcription.should_segment(audio_seconds):
+                if generation_config:
+                    raise ValueError("the episode is too long to transcribe and summarize in one request")
+                # Each segment is routed by the segment length, not the episode's.
+                transcribe_segment = functools.partial(
+                    _transcribe_audio_file, audio_seconds=chunked_transcription.TRANSCRIBE_SEGMENT_MINUTES * 60
+                )
+                return chunked_transcription.transcribe_in_segments(
+                    upload_path, audio_url, audio_seconds, transcribe_segment, TRANSCRIPTION_PROMPT,
+                    cache_tags=model_router.cache_models(TRANSCRIPTION_MODEL), time_map=time_map, models=models
+                )
+            upload_key = f"{audio_key}:{variant}" if audio_key else None
+            return _transcribe_audio_file(
+                upload_path, prompt, mime_type=mime_type, upload_key=upload_key, generation_config=generation_config,
+                audio_seconds=audio_seconds, models=models, parse=parse
+            )
+        finally:
+            # Remove local temporary files
+            _remove_temp_files(audio_path, preprocessed_path)
+
+def _transcribe_with_gemini(episode, audio_url, audio_key, models=None):
+    """The "gemini" backend: uploads the audio to the File API and has Gemini transcribe and diarize it."""
+    if not gemini_client.configure():
+        return None
+    gemini_files.get_registry().cleanup_expired()
+    if _needs_local_file(episode):
+        return _transcribe_from_file(episode, audio_url, audio_key, models=models)
+    return _transcribe_streamed(episode, audio_url, audio_key, models=models)
+
+def _gemini_cache_tags(prompt_version=TRANSCRIPTION_PROMPT_VERSION):
+    # Transcripts of the light model only answer for the standard model while routing may use it.
+    return [(model, prompt_version) for model in model_router.cache_models(TRANSCRIPTION_MODEL)]
+
+def _gemini_result_tag(models, prompt_version=TRANSCRIPTION_PROMPT_VERSION):
+    return (model_router.result_model(TRANSCRIPTION_MODEL, models), prompt_version)
+
+def _transcribe_with_whisper(episode, audio_url, audio_key, models=None):
+    """The "whisper" backend: downloads the audio and transcribes it offline on the CPU."""
+    if not whisper_transcriber.is_available():
+        return None
+    with _buffer_slots:
+        audio_path = _temp_audio_path(audio_url)
+        try:
+            audio_downloader.download_audio(audio_url, audio_path)
+            logging.info(f"Audio downloaded successfully to {audio_path}")
+            audio_seconds = chunked_transcription.get_audio_duration(audio_path, episode)
+            return whisper_transcriber.transcribe_file(audio_path, audio_seconds)
+        finally:
+            _remove_temp_files(audio_path)
+
+# Each backend takes (episode, audio URL, audio key, models) and returns the transcript or None,
+# appending the models that answered to `models`. Cache tags identify its transcripts in the
+# transcript cache: 'cache_tags' gives the tags a cached transcript may have, best first, and
+# 'result_tag' the tag of a new transcript, given the models that made it.
+BACKENDS = {
+    'gemini': {'transcribe': _transcribe_with_gemini, 'cache_tags': _gemini_cache_tags, 'result_tag': _gemini_result_tag},
+    'whisper': {
+        'transcribe': _transcribe_with_whisper,
+        'cache_tags': lambda: [whisper_transcriber.cache_tag()],
+        'result_tag': lambda models: whisper_transcriber.cache_tag(),
+    },
+}
+
 def transcribe_episode(episode):
     """
-    Downloads an episode's audio and transcribes it natively using the Gemini API.
+    Downloads an episode's audio and transcribes it with the first of the
+    TRANSCRIPTION_BACKENDS that succeeds.
+
+    With Gemini, the audio usually goes straight from the download into the
+    upload through a spooled buffer. When ffmpeg has work to do (preprocessing,
+    or splitting a long episode into segments, see chunked_transcription.py),
+    it's downloaded to a unique temp file instead. Either way, several
+    episodes can be transcribed at once.
 
     Args:
         episode (dict): The episode dictionary containing the audio URL.
 
     Returns:
-        str: The transcribed and diarized text of the episode, or None if transcription fails.
+        str: The transcribed text of the episode, or None if transcription fails.
     """
     
     # --- 1. Find the Audio URL using our robust helper function ---
@@ -70,106 +382,125 @@ def transcribe_episode(episode):
         logging.error("Could not find a usable audio URL in the episode data after trying multiple methods.")
         return None
 
-    logging.info(f"Downloading audio from: {audio_url[:50]}...")
-
-    # --- 2. Download the Audio File ---
-    temp_audio_path = "temp_episode.mp3" 
-    try:
-        # We'll use a user-agent header to appear like a standard browser, which can help prevent getting blocked.
-        headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3'}
-        with requests.get(audio_url, stream=True, headers=headers) as r:
-            r.raise_for_status()
-            with open(temp_audio_path, 'wb') as f:
-                for chunk in r.iter_content(chunk_size=8192):
-                    f.write(chunk)
-        logging.info(f"Audio downloaded successfully to {temp_audio_path}")
-    except requests.exceptions.RequestException as e:
-        logging.error(f"Failed to download audio file: {e}")
+    backends = [name for name in TRANSCRIPTION_BACKENDS if name in BACKENDS]
+    if not backends:
+        logging.error(f"No known transcription backend in TRANSCRIPTION_BACKENDS={','.join(TRANSCRIPTION_BACKENDS)}.")
         return None
 
-    # --- 3. Transcribe and Diarize with Gemini API ---
-    audio_file = None
-    transcript_text = None
-    try:
-        load_dotenv()
-        api_key = os.getenv("GEMINI_API_KEY")
-        if not api_key:
-            logging.error("GEMINI_API_KEY environment variable not found.")
-            return None
+    # --- 2. Reuse a transcript from an earlier run of the same audio, made by any of the backends ---
+    # The audio key also finds uploads of the same audio that Gemini still has (see gemini_files.py).
+    audio_key = transcript_cache.audio_key(audio_url)
+    cache = transcript_cache.get_cache()
+    if cache.enabled:
+        for name in backends:
+            for tag in BACKENDS[name]['cache_tags']():
+                cached_transcript = cache.get(transcript_cache.derive_key(audio_key, *tag))
+                if cached_transcript:
+                    logging.info("Found a cached transcript for this audio. Skipping download and transcription.")
+                    return cached_transcript
 
-        genai.configure(api_key=api_key)
+    # --- 3. Download and Transcribe, falling back to the next backend on failure ---
+    for name in backends:
+        logging.info(f"Downloading audio from: {audio_url[:50]}...")
+        try:
+            start_time = time.time()
+            models = []
+            transcript_text = BACKENDS[name]['transcribe'](episode, audio_url, audio_key, models)
+            if not transcript_text:
+                continue
+            cache.put(transcript_cache.derive_key(audio_key, *BACKENDS[name]['result_tag'](models)), transcript_text)
 
-        logging.info("Uploading audio file to Gemini File API...")
-        audio_file = genai.upload_file(path=temp_audio_path)
-        logging.info(f"File uploaded successfully. Name: {audio_file.name}. State: {audio_file.state.name}")
+            duration = time.time() - start_time
+            logging.info(f"Transcription with {name} completed successfully in {duration:.2f} seconds.")
+            return transcript_text
 
-        # Poll the upload status until the file is active.
-        # Audio is usually quick, but polling guarantees safety.
-        while audio_file.state.name == "PROCESSING":
-            logging.info("Waiting for audio file to be processed by Gemini...")
-            time.sleep(5)
-            audio_file = genai.get_file(audio_file.name)
+        except requests.exceptions.RequestException as e:
+            logging.error(f"Failed to download audio file: {e}")
+        except Exception as e:
+            logging.error(f"An unexpected error occurred during {name} transcription: {e}", exc_info=True)
 
-        if audio_file.state.name != "ACTIVE":
-            raise ValueError(f"Gemini file processing failed (state is {audio_file.state.name})")
+    return None
 
-        logging.info("Audio file is active. Requesting Gemini transcription and diarization...")
-        
-        # Use gemini-2.5-flash (paid account upgraded)
-        model = genai.GenerativeModel('gemini-2.5-flash')
-        
-        prompt = """
-        Transcribe the following audio recording. Identify and label the speakers (e.g., Nilay, Host, Guest 1, etc.) from context, formatting the output as a script with each speaker's dialogue on a new line. Do not summarize or omit any conversation.
-        """
-        
-        start_time = time.time()
-        
-        # Call Gemini with basic retry logic to handle potential 429 Rate Limits
-        max_retries = 3
-        delay = 5
-        response = None
-        for attempt in range(max_retries):
-            try:
-                response = model.generate_content([audio_file, prompt])
-                break
-            except Exception as e:
-                if "429" in str(e) or "ResourceExhausted" in type(e).__name__:
-                    if attempt == max_retries - 1:
-                        raise
-                    logging.warning(f"Gemini API rate limit hit (429). Retrying in {delay} seconds...")
-                    time.sleep(delay)
-                    delay *= 2
-                else:
-                    raise
-
-        if response:
-            transcript_text = response.text
-        
-        end_time = time.time()
-        duration = end_time - start_time
-        logging.info(f"Transcription and diarization completed successfully in {duration:.2f} seconds.")
+def _parse_combined_response(response_text):
+    """
+    Splits a combined response into the transcript and the summary dict.
 
+    Raises:
+        ValueError: If the response isn't JSON or misses the transcript or a summary field.
+    """
+    combined = json.loads(response_text)
+    transcript_text = combined.pop('transcript', None) if isinstance(combined, dict) else None
+    missing = llm_processor.missing_fields(combined)
+    if not transcript_text or missing:
+        raise ValueError(f"the response is missing {', '.join(missing) or 'the transcript'}")
+    return transcript_text, combined
+
+def transcribe_and_summarize_episode(episode, models=None):
+    """
+    Transcribes and summarizes an episode with a single Gemini request.
+
+    The uploaded audio is sent with COMBINED_PROMPT and a response schema, so
+    the answer holds the diarized transcript and the same summary dict that
+    llm_processor.process_transcript_with_llm() returns. That saves the second
+    request, which would send the whole transcript back in as input tokens.
+    The transcript is cached under COMBINED_PROMPT_VERSION, apart from the
+    transcripts of transcribe_episode(), since it comes from another prompt.
+    If the response is unusable, the upload stays registered, so falling back
+    to the two calls doesn't upload the audio again.
+
+    Args:
+        episode (dict): The episode dictionary containing the audio URL.
+        models (list): If given, the model that answered is appended to it.
+
+    Returns:
+        tuple: (transcript text, summary dict), or (None, None) if the episode
+               should go through transcribe_episode() and the LLM processor instead.
+               A transcript cached by an earlier combined request comes back as
+               (transcript text, None), to be summarized separately (the summary
+               is usually cached too).
+    """
+    if TRANSCRIPTION_BACKENDS[:1] != ['gemini']:
+        return None, None
+    audio_url = _find_audio_url(episode)
+    if not audio_url:
+        return None, None
+    if chunked_transcription.should_segment(episode.get('duration')):
+        logging.info("This episode is transcribed in segments, so it's summarized in a separate call.")
+        return None, None
+
+    audio_key = transcript_cache.audio_key(audio_url)
+    cache = transcript_cache.get_cache()
+    if cache.enabled:
+        for tag in _gemini_cache_tags(COMBINED_PROMPT_VERSION):
+            cached_transcript = cache.get(transcript_cache.derive_key(audio_key, *tag))
+            if cached_transcript:
+                logging.info("Found a transcript cached by an earlier combined request. Summarizing it separately.")
+                return cached_transcript, None
+        if any(cache.get(transcript_cache.derive_key(audio_key, *tag)) for tag in _gemini_cache_tags()):
+            logging.info("Found a cached transcript for this audio. Summarizing it in a separate call.")
+            return None, None
+
+    if not gemini_client.configure():
+        return None, None
+    gemini_files.get_registry().cleanup_expired()
+
+    prompt = COMBINED_PROMPT.format(episode_title=episode.get('title', ''))
+    generation_config = {'response_mime_type': 'application/json', 'response_schema': COMBINED_SCHEMA}
+    logging.info(f"Downloading audio from: {audio_url[:50]}...")
+    used_models = []
+    try:
+        start_time = time.time()
+        # An unusable response counts as a failure, so the upload is kept for the separate calls.
+        transcribe = _transcribe_from_file if _needs_local_file(episode) else _transcribe_streamed
+        transcript_text, combined = transcribe(
+            episode, audio_url, audio_key, prompt, generation_config, used_models, parse=_parse_combined_response
+        )
     except Exception as e:
-        logging.error(f"An unexpected error occurred during Gemini transcription: {e}", exc_info=True)
-        return None
-        
-    # --- 4. Clean Up ---
-    finally:
-        # 1. Remove local temporary file
-        if os.path.exists(temp_audio_path):
-            try:
-                os.remove(temp_audio_path)
-                logging.info(f"Cleaned up local temporary audio file: {temp_audio_path}")
-            except Exception as e:
-                logging.error(f"Failed to delete local temp audio file: {e}")
-                
-        # 2. Delete the file from Google Gemini storage
-        if audio_file is not None:
-            try:
-                genai.delete_file(audio_file.name)
-                logging.info(f"Cleaned up remote Gemini File API upload: {audio_file.name}")
-            except Exception as e:
-                logging.error(f"Failed to delete remote Gemini file: {e}")
-            
-    return transcript_text
+        logging.warning(f"Transcribing and summarizing in one request failed ({e}). Falling back to separate calls.")
+        return None, None
 
+    cache.put(transcript_cache.derive_key(audio_key, *_gemini_result_tag(used_models, COMBINED_PROMPT_VERSION)), transcript_text)
+    if models is not None:
+        models.extend(used_models)
+    logging.info(f"Transcription and summary completed in one request in {time.time() - start_time:.2f} seconds.")
+    return transcript_text, combined
@@ -0,0 +1,190 @@
+import os
+import json
+import time
+import logging
+import hashlib
+import threading
+import audio_downloader
+import episode_dedupe
+
+# --- Configuration ---
+# Where finished transcripts are kept, so an episode that fails after transcription
+# (summary, ePub or upload) doesn't pay for the transcription again on the next run.
+# On Railway, put this on the persistent volume too (e.g. /data/transcript_cache).
+TRANSCRIPT_CACHE_DIR = os.environ.get("TRANSCRIPT_CACHE_DIR", "transcript_cache").strip("'\"")
+# The cache is trimmed to this size, least recently used transcripts first. "0" disables it.
+TRANSCRIPT_CACHE_MAX_MB = float(os.environ.get("TRANSCRIPT_CACHE_MAX_MB", "200").strip("'\""))
+# How much of the start of the audio file is hashed into the cache key.
+TRANSCRIPT_CACHE_PROBE_BYTES = 64 * 1024
+
+def audio_fingerprint(audio_url):
+    """
+    Identifies the audio behind a URL without downloading it: the validators
+    and size from a HEAD request and a hash of the file's first bytes.
+
+    Returns:
+        dict: {'etag', 'size', 'head_hash'}, or None if the file can't be identified.
+    """
+    probe = audio_downloader.probe_audio(audio_url)
+    leading_bytes = audio_downloader.fetch_leading_bytes(probe['url'], TRANSCRIPT_CACHE_PROBE_BYTES)
+    if leading_bytes is None and not probe['etag'] and not probe['size']:
+        return None
+    return {
+        'etag': probe['etag'],
+        'size': probe['size'],
+        'head_hash': hashlib.sha256(leading_bytes).hexdigest() if leading_bytes is not None else None,
+    }
+
+def audio_key(audio_url, fingerprint=None):
+    """
+    Builds the content address of the audio behind a URL.
+
+    The key combines the enclosure URL (without tracking prefixes, see
+    episode_dedupe.py), the ETag or size of the file and a hash of its first
+    bytes, so it changes if the publisher replaces the audio.
+
+    Args:
+        audio_url (str): The episode's audio URL.
+        fingerprint (dict): The result of audio_fingerprint(); fetched if not given.
+
+    Returns:
+        str: A hex key, or None if the audio can't be identified.
+    """
+    if fingerprint is None:
+        fingerprint = audio_fingerprint(audio_url)
+        if fingerprint is None:
+            return None
+    identity = [
+        episode_dedupe.normalize_enclosure_url(audio_url),
+        fingerprint.get('etag') or fingerprint.get('size'),
+        fingerprint.get('head_hash'),
+    ]
+    return hashlib.sha256(json.dumps(identity).encode('utf-8')).hexdigest()
+
+def derive_key(base_key, *parts):
+    """Combines an audio key with whatever else changes the output (model, prompt version...)."""
+    if not base_key:
+        return None
+    return hashlib.sha256(json.dumps([base_key, *parts]).encode('utf-8')).hexdigest()
+
+def make_key(audio_url, model, prompt_version, fingerprint=None):
+    """
+    Builds the cache key of a transcript: the audio key plus the model and
+    prompt version used to transcribe it. If we change how we transcribe, the
+    key changes too.
+
+    Returns:
+        str: A hex key, or None if the audio can't be identified.
+    """
+    return derive_key(audio_key(audio_url, fingerprint), model, prompt_version)
+
+class TranscriptCache:
+    """
+    A disk-backed, content-addressed store of transcripts.
+
+    Each transcript is one file named after its key. Reading a transcript
+    touches its modification time, so when the cache grows past its size limit
+    the least recently used files are removed first. With `max_age_seconds`,
+    entries that haven't been read or written for that long expire as well.
+    Hit, miss and eviction counts are kept per instance, i.e. per process.
+
+    The store holds any text, so other caches (like the summary cache in
+    llm_processor.py) use it too, with their own directory and `label`.
+    """
+
+    def __init__(self, path=None, max_bytes=None, max_age_seconds=0, label="Transcript cache"):
+        self.path = path or TRANSCRIPT_CACHE_DIR
+        self.max_bytes = int(TRANSCRIPT_CACHE_MAX_MB * 1024 * 1024) if max_bytes is None else max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.label = label
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0}
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0
+
+    def _entry_path(self, key):
+        return os.path.join(self.path, f"{key}.txt")
+
+    def _expired(self, mtime, now):
+        return self.max_age_seconds > 0 and now - mtime > self.max_age_seconds
+
+    def get(self, key):
+        """Returns the cached transcript for a key, or None on a miss."""
+        if not self.enabled or not key:
+            return None
+        entry_path = self._entry_path(key)
+        with self._lock:
+            try:
+                if self._expired(os.path.getmtime(entry_path), time.time()):
+                    os.remove(entry_path)
+                    self.stats['evictions'] += 1
+                    raise FileNotFoundError(entry_path)
+                with open(entry_path, 'r', encoding='utf-8') as f:
+                    transcript = f.read()
+                os.utime(entry_path)
+            except FileNotFoundError:
+                self.stats['misses'] += 1
+                return None
+            self.stats['hits'] += 1
+        return transcript
+
+    def put(self, key, transcript):
+        """Stores a transcript and evicts the least recently used ones if the cache is over its limit."""
+        if not self.enabled or not key or not transcript:
+            return
+        try:
+            with self._lock:
+                os.makedirs(self.path, exist_ok=True)
+                entry_path = self._entry_path(key)
+                tmp_path = f"{entry_path}.tmp"
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    f.write(transcript)
+                os.replace(tmp_path, entry_path)
+                self.stats['stores'] += 1
+                self._evict()
+        except Exception as e:
+            logging.error(f"Failed to cache transcript in {self.path}: {e}")
+
+    def _evict(self):
+        entries = []
+        now = time.time()
+        for name in os.listdir(self.path):
+            if not name.endswith('.txt'):
+                continue
+            stat = os.stat(os.path.join(self.path, name))
+            if self._expired(stat.st_mtime, now):
+                os.remove(os.path.join(self.path, name))
+                self.stats['evictions'] += 1
+                continue
+            entries.append((stat.st_mtime, stat.st_size, name))
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            os.remove(os.path.join(self.path, name))
+            total -= size
+            self.stats['evictions'] += 1
+
+    def log_stats(self):
+        """Logs how often the cache saved a call."""
+        if not self.enabled:
+            return
+        lookups = self.stats['hits'] + self.stats['misses']
+        hit_rate = f" ({self.stats['hits'] / lookups * 100:.0f}% hit rate)" if lookups else ""
+        logging.info(
+            f"{self.label}: {self.stats['hits']} hit(s), {self.stats['misses']} miss(es){hit_rate}, "
+            f"{self.stats['stores']} stored, {self.stats['evictions']} evicted."
+        )
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_cache():
+    """Returns the process-wide transcript cache."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = TranscriptCache()
+        return _cache
@@ -0,0 +1,119 @@
+import os
+import re
+import logging
+import gemini_client
+
+# --- Configuration ---
+# Transcripts are compacted before they are sent to the LLM for the summary: whitespace is
+# normalized, consecutive turns of one speaker are merged under one label and filler words
+# ("um", "uh", false starts like "I, I") are removed. The published transcript is left untouched. "off" disables it.
+TRANSCRIPT_COMPACTION = os.environ.get("TRANSCRIPT_COMPACTION", "on").strip("'\"").lower() in ('1', 'true', 'yes', 'on')
+# Set to "on" to also drop sponsor reads (turns with "promo code", "brought to you by" and the like).
+# A turn that merely discusses a sponsor can be caught too, so this is off by default.
+COMPACT_DROP_SPONSOR_READS = os.environ.get("COMPACT_DROP_SPONSOR_READS", "off").strip("'\"").lower() in ('1', 'true', 'yes', 'on')
+
+# "Nilay:", "**Speaker 2:**" or "[00:12:34] Host:" at the start of a line.
+SPEAKER_LABEL = re.compile(r'^\s*(?:\[[\d:.]+\]\s*)?\**\s*([^:*\[\]\n]{1,40}?)\s*\**\s*:\s*\**\s*(.*)$')
+TIMESTAMP = re.compile(r'\[\d{1,2}:\d{2}(?::\d{2})?(?:\.\d+)?\]\s*')
+# Fillers that carry no meaning in a summary, with the comma or dots around them.
+DISFLUENCY = re.compile(r'(?:,\s*)?(?:(?<=\s)|^)(?:u+m+|u+h+|e+r+m+|a+h+|h+m+|m+h*m+)(?:,|\.\.\.|…)?(?=\s|$)', re.IGNORECASE)
+# A false start: a short word repeated after a comma, dash or dots ("I, I, I think", "the- the").
+# Plain repeats ("I had had enough", "bye bye") are often meant, so they are left alone, and so
+# are longer words ("very, very good").
+STUTTER = re.compile(r'\b([^\W\d_]{1,3})\b(?:(?:\s*(?:,|-|–|—|\.\.\.|…))\s*\1\b)+', re.IGNORECASE)
+# A single letter said twice in a row ("I I think").
+LETTER_STUTTER = re.compile(r'\b([^\W\d_])(?:\s+\1\b)+')
+SPONSOR_READ = re.compile(
+    r'brought to you by|(?:episode|show|podcast) is (?:sponsored|supported|presented) by|'
+    r'thanks to our sponsor|promo code|(?:use|enter) (?:the )?code\b|offer code|'
+    r'\bgo to \S+\.(?:com|co|io)/\w+|%\s*off your first',
+    re.IGNORECASE
+)
+
+def _clean_text(text):
+    text = TIMESTAMP.sub('', text)
+    text = DISFLUENCY.sub(' ', text)
+    text = STUTTER.sub(r'\1', text)
+    text = LETTER_STUTTER.sub(r'\1', text)
+    text = re.sub(r'\s+', ' ', text).strip()
+    # Removing a filler can leave a stray comma or a lowercase start behind: "so we" -> "So we".
+    text = re.sub(r'\s+([,.!?;:])', r'\1', text)
+    text = re.sub(r'^[,;:\s]+', '', text)
+    return text[:1].upper() + text[1:]
+
+def split_turns(transcript_text):
+    """
+    Splits a transcript into speaker turns.
+
+    Lines without a speaker label are added to the turn before them.
+
+    Returns:
+        list: [speaker label or None, text] pairs, in order.
+    """
+    turns = []
+    for line in transcript_text.splitlines():
+        if not line.strip():
+            continue
+        match = SPEAKER_LABEL.match(line)
+        if match:
+            turns.append([match.group(1).strip(), match.group(2).strip()])
+        elif turns:
+            turns[-1][1] = f"{turns[-1][1]} {line.strip()}"
+        else:
+            turns.append([None, line.strip()])
+    return turns
+
+def is_sponsor_read(text):
+    """Checks a turn against the sponsor read patterns."""
+    return SPONSOR_READ.search(text) is not None
+
+def compact_transcript(transcript_text, drop_sponsor_reads=None):
+    """
+    Shrinks a transcript for the LLM without losing what's said.
+
+    Whitespace and blank lines are normalized, timestamps and filler words are
+    removed, and consecutive turns of the same speaker are merged so the label
+    is written once. Optionally, sponsor reads are dropped.
+
+    Args:
+        transcript_text (str): The diarized transcript.
+        drop_sponsor_reads (bool): Drop turns that look like ads (COMPACT_DROP_SPONSOR_READS by default).
+
+    Returns:
+        dict: The compacted 'text', the 'original_tokens' and 'compacted_tokens'
+              (estimated), the 'ratio' of the two and the 'sponsor_reads_dropped'.
+    """
+    if drop_sponsor_reads is None:
+        drop_sponsor_reads = COMPACT_DROP_SPONSOR_READS
+
+    turns = []
+    sponsor_reads = 0
+    for speaker, text in split_turns(transcript_text):
+        if drop_sponsor_reads and is_sponsor_read(text):
+            sponsor_reads += 1
+            continue
+        text = _clean_text(text)
+        if not text:
+            continue
+        if turns and turns[-1][0] == speaker:
+            turns[-1][1] = f"{turns[-1][1]} {text}"
+        else:
+            turns.append([speaker, text])
+
+    compacted = '\n'.join(f"{speaker}: {text}" if speaker else text for speaker, text in turns)
+    original_tokens = gemini_client.estimate_tokens(transcript_text)
+    compacted_tokens = gemini_client.estimate_tokens(compacted)
+    return {
+        'text': compacted,
+        'original_tokens': original_tokens,
+        'compacted_tokens': compacted_tokens,
+        'ratio': compacted_tokens / original_tokens if original_tokens else 1.0,
+        'sponsor_reads_dropped': sponsor_reads,
+    }
+
+def log_reduction(result):
+    """Logs how much smaller compaction made one episode's transcript."""
+    logging.info(
+        f"Compacted transcript: {result['original_tokens']} -> {result['compacted_tokens']} tokens "
+        f"({(1 - result['ratio']) * 100:.0f}% smaller, {result['sponsor_reads_dropped']} sponsor read(s) dropped)."
+    )
@@ -0,0 +1,188 @@
+import os
+import time
+import shutil
+import logging
+import threading
+import subprocess
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+import chunked_transcription
+
+# --- Configuration ---
+# The Whisper model for offline transcription on the CPU: tiny, base, small, medium or large-v3.
+# Bigger models are more accurate but slower and need more memory (see MODEL_MEMORY_MB).
+WHISPER_MODEL = os.environ.get("WHISPER_MODEL", "base").strip("'\"")
+# int8 weights are the fastest and smallest choice on a CPU. "float32" is slightly more accurate.
+WHISPER_COMPUTE_TYPE = os.environ.get("WHISPER_COMPUTE_TYPE", "int8").strip("'\"")
+# The language spoken, e.g. "en". Empty means Whisper detects it from the first chunk.
+WHISPER_LANGUAGE = os.environ.get("WHISPER_LANGUAGE", "").strip("'\"") or None
+# Episodes are decoded and transcribed in chunks of this length, WHISPER_WORKERS at a time
+# ("0" means one per CPU core), but never more than fit in WHISPER_MAX_MEMORY_MB next to the model.
+WHISPER_CHUNK_SECONDS = float(os.environ.get("WHISPER_CHUNK_SECONDS", "300").strip("'\""))
+WHISPER_WORKERS = int(os.environ.get("WHISPER_WORKERS", "0").strip("'\""))
+WHISPER_MAX_MEMORY_MB = float(os.environ.get("WHISPER_MAX_MEMORY_MB", "0").strip("'\""))
+
+# Bump this whenever the transcript format changes, so cached transcripts are not reused.
+WHISPER_TRANSCRIPT_VERSION = 1
+SAMPLE_RATE = 16000
+# Chunks overlap by this much, so a word cut at a boundary is heard whole in one of them.
+CHUNK_OVERLAP_SECONDS = 5.0
+# A pause this long between two segments starts a new paragraph.
+PARAGRAPH_PAUSE_SECONDS = 1.5
+# Roughly the resident memory of each model with int8 weights, and what each worker needs on
+# top of its chunk of samples. Used to size the worker pool under WHISPER_MAX_MEMORY_MB.
+MODEL_MEMORY_MB = {'tiny': 150, 'base': 250, 'small': 600, 'medium': 1500, 'large': 3200}
+WORKER_OVERHEAD_MB = 150
+
+_model = None
+_model_workers = None
+_model_lock = threading.Lock()
+
+def is_available():
+    """Checks if faster-whisper is installed."""
+    try:
+        import faster_whisper  # noqa: F401
+    except ImportError:
+        logging.error("Offline transcription needs faster-whisper. Install it with: pip install faster-whisper")
+        return False
+    return True
+
+def cache_tag():
+    """What identifies a transcript made with the current settings, for the transcript cache."""
+    return ('whisper', WHISPER_MODEL, WHISPER_COMPUTE_TYPE, WHISPER_TRANSCRIPT_VERSION)
+
+def _model_memory_mb(model_name):
+    for size, memory_mb in MODEL_MEMORY_MB.items():
+        if model_name.startswith(size) or model_name.startswith(f"distil-{size}"):
+            return memory_mb
+    return MODEL_MEMORY_MB['large']
+
+def worker_count(model_name=None):
+    """
+    How many chunks are transcribed at once: WHISPER_WORKERS (or one per core),
+    capped so the model and the chunks in flight fit in WHISPER_MAX_MEMORY_MB.
+    """
+    workers = WHISPER_WORKERS if WHISPER_WORKERS > 0 else (os.cpu_count() or 1)
+    if WHISPER_MAX_MEMORY_MB > 0:
+        chunk_mb = WHISPER_CHUNK_SECONDS * SAMPLE_RATE * 4 / 1024 / 1024 + WORKER_OVERHEAD_MB
+        fitting = int((WHISPER_MAX_MEMORY_MB - _model_memory_mb(model_name or WHISPER_MODEL)) // chunk_mb)
+        workers = min(workers, fitting)
+    return max(1, workers)
+
+def get_model():
+    """
+    Returns the process-wide Whisper model, loading it the first time.
+
+    The model is loaded once with as many workers as worker_count(), so that
+    many chunks can be transcribed in parallel, and the CPU cores are shared
+    between them.
+    """
+    global _model, _model_workers
+    with _model_lock:
+        if _model is None:
+            from faster_whisper import WhisperModel
+            workers = worker_count()
+            cpu_threads = max(1, (os.cpu_count() or 1) // workers)
+            started = time.time()
+            _model = WhisperModel(
+                WHISPER_MODEL, device='cpu', compute_type=WHISPER_COMPUTE_TYPE,
+                cpu_threads=cpu_threads, num_workers=workers
+            )
+            _model_workers = workers
+            logging.info(
+                f"Loaded Whisper model '{WHISPER_MODEL}' ({WHISPER_COMPUTE_TYPE}) in {time.time() - started:.1f} seconds "
+                f"with {workers} worker(s) of {cpu_threads} thread(s)."
+            )
+        return _model
+
+def _load_chunk(audio_path, start, length):
+    """Decodes one time range of the audio to 16 kHz mono float samples with ffmpeg."""
+    result = subprocess.run(
+        ['ffmpeg', '-nostdin', '-v', 'error', '-ss', f"{start:.3f}", '-t', f"{length:.3f}", '-i', audio_path,
+         '-vn', '-ac', '1', '-ar', str(SAMPLE_RATE), '-f', 's16le', '-'],
+        capture_output=True, timeout=600, check=True
+    )
+    return np.frombuffer(result.stdout, dtype=np.int16).astype(np.float32) / 32768.0
+
+def _transcribe_chunk(model, audio, language):
+    """Returns the (start, end, text) segments of one chunk, in seconds from the start of the chunk, and the language."""
+    segments, info = model.transcribe(audio, language=language, vad_filter=True)
+    return [(segment.start, segment.end, segment.text.strip()) for segment in segments], info.language
+
+def _owned_range(chunks, index):
+    """
+    The part of chunk `index` whose segments it keeps. Neighbouring chunks
+    overlap, and each keeps the segments centred in its half of the overlap.
+    """
+    start, length = chunks[index]
+    owned_start = start + CHUNK_OVERLAP_SECONDS / 2 if index > 0 else float('-inf')
+    owned_end = chunks[index + 1][0] + CHUNK_OVERLAP_SECONDS / 2 if index + 1 < len(chunks) else float('inf')
+    return owned_start, owned_end
+
+def format_transcript(segments):
+    """Joins (start, end, text) segments into paragraphs, one per line, breaking at longer pauses."""
+    paragraphs = []
+    previous_end = None
+    for start, end, text in segments:
+        if not text:
+            continue
+        if paragraphs and start - previous_end < PARAGRAPH_PAUSE_SECONDS:
+            paragraphs[-1] = f"{paragraphs[-1]} {text}"
+        else:
+            paragraphs.append(text)
+        previous_end = end
+    return '\n'.join(paragraphs)
+
+def transcribe_file(audio_path, audio_seconds=None):
+    """
+    Transcribes an audio file offline on the CPU with faster-whisper.
+
+    The audio is decoded and transcribed in overlapping chunks of
+    WHISPER_CHUNK_SECONDS, up to worker_count() at a time, so only the chunks
+    in flight are held in memory. Without ffmpeg, or if the length is unknown,
+    the file is transcribed in one pass. Whisper doesn't tell speakers apart,
+    so the transcript is plain paragraphs without labels.
+
+    Args:
+        audio_path (str): The downloaded episode.
+        audio_seconds (float): The length of the audio, if known.
+
+    Returns:
+        str: The transcript.
+    """
+    model = get_model()
+    started = time.time()
+    if not audio_seconds or not shutil.which('ffmpeg'):
+        segments, _ = _transcribe_chunk(model, audio_path, WHISPER_LANGUAGE)
+        transcript = format_transcript(segments)
+        logging.info(f"Whisper transcribed the episode in {time.time() - started:.1f} seconds.")
+        return transcript
+
+    chunks = chunked_transcription.plan_segments(audio_seconds, WHISPER_CHUNK_SECONDS, CHUNK_OVERLAP_SECONDS)
+    workers = min(_model_workers or 1, len(chunks))
+    logging.info(
+        f"Transcribing {audio_seconds / 60:.0f} minutes offline with Whisper '{WHISPER_MODEL}' "
+        f"as {len(chunks)} chunk(s), {workers} at a time..."
+    )
+
+    def transcribe(index, language):
+        start, length = chunks[index]
+        chunk_segments, detected = _transcribe_chunk(model, _load_chunk(audio_path, start, length), language)
+        owned_start, owned_end = _owned_range(chunks, index)
+        kept = [(start + s, start + e, text) for s, e, text in chunk_segments
+                if owned_start <= start + (s + e) / 2 < owned_end]
+        return kept, detected
+
+    # The first chunk settles the language, so every chunk is transcribed in the same one.
+    first_segments, language = transcribe(0, WHISPER_LANGUAGE)
+    language = WHISPER_LANGUAGE or language
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(lambda index: transcribe(index, language)[0], range(1, len(chunks))))
+
+    segments = first_segments + [segment for result in results for segment in result]
+    elapsed = time.time() - started
+    logging.info(
+        f"Whisper transcribed {audio_seconds / 60:.0f} minutes in {elapsed:.0f} seconds "
+        f"(real-time factor {elapsed / audio_seconds:.2f})."
+    )
+    return format_transcript(segments)